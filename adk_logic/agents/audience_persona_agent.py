@@ -1,19 +1,29 @@
 from google.adk.agents import LlmAgent
-from utils.config_loader import get_prompt_fragment
+from utils.config_loader import render_agent_instruction
 from adk_logic.prompts.base_prompts import AUDIENCE_PERSONA_BASE_PROMPT
+from adk_logic.document_serializer import DEFAULT_DOCUMENT_FORMAT, bind_document_context
 from adk_logic.state_models import PresentaAiState
-from adk_logic.callbacks import before_agent_callback
+from adk_logic.rate_governor import governed_model
+from adk_logic.callbacks import (
+    before_agent_callback,
+    create_document_context_callback,
+    keep_only_user_message_callback,
+    use_shared_context_cache_callback,
+)
 
-def create_audience_persona_agent(selection_id: str) -> LlmAgent:
+def create_audience_persona_agent(selection_id: str, document_format: str = DEFAULT_DOCUMENT_FORMAT) -> LlmAgent:
     """ユーザーの選択に基づいてAudiencePersonaAgentを生成する"""
-    prompt_fragment = get_prompt_fragment('audience_persona', selection_id)
-    final_instruction = f"{AUDIENCE_PERSONA_BASE_PROMPT}\n\n# あなたの今回のレビュー方針\n{prompt_fragment}"
+    base_prompt = bind_document_context(AUDIENCE_PERSONA_BASE_PROMPT, document_format)
+    final_instruction = render_agent_instruction('audience_persona', selection_id, base_prompt)
     
     return LlmAgent(
         name="AudiencePersonaAgent",
-        model="gemini-2.5-pro",
+        model=governed_model("gemini-2.5-pro"),
         instruction=final_instruction,
         input_schema=PresentaAiState,
         output_key="audience_persona_review_text",
-        before_agent_callback=before_agent_callback
+        before_agent_callback=[before_agent_callback, create_document_context_callback(document_format)],
+        # 資料情報はプロンプトの共通部分で渡すため、会話履歴は含めない
+        include_contents="none",
+        before_model_callback=[keep_only_user_message_callback, use_shared_context_cache_callback],
     )
\ No newline at end of file
@@ -0,0 +1,242 @@
+import asyncio
+import logging
+from typing import AsyncGenerator, ClassVar, Dict, List, Optional, Set, Tuple, Any
+
+from google.adk.agents import BaseAgent, LlmAgent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event, EventActions
+
+from utils.config_loader import get_prompt_fragment
+from adk_logic.prompts.base_prompts import CHUNK_REVIEWER_BASE_PROMPT, REPORT_REDUCER_BASE_PROMPT
+from adk_logic.document_serializer import build_slide_outline
+from adk_logic.state_models import ChunkReview, ReportOverview, FinalReport
+from adk_logic.rate_governor import governed_model
+from adk_logic.slide_review_store import REUSED_SLIDE_REVIEWS_KEY, find_reusable_slide_reviews, save_slide_reviews
+from adk_logic.tracing import get_trace_recorder
+from adk_logic.callbacks import (
+    before_agent_callback,
+    enable_result_memoization,
+    enable_stage_checkpoints,
+    instrument_agent_tree,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def split_slides_into_windows(
+    slides: List[Dict[str, Any]], chunk_size: int, overlap: int, target_numbers: Optional[Set[int]] = None
+) -> List[Tuple[List[int], List[Dict[str, Any]]]]:
+    """
+    スライドを一定枚数ごとのウィンドウに分割する。
+
+    Args:
+        slides: DocumentAnalysisResult.slides に対応する辞書のリスト。
+        chunk_size: 1チャンクでレビュー対象とするスライド数。
+        overlap: 文脈として前後に含めるスライド数。
+        target_numbers: レビュー対象とするスライド番号。Noneの場合はすべてのスライドを対象とする。
+            対象外のスライドも、対象のスライドの前後 overlap 枚以内であれば文脈として含める。
+
+    Returns:
+        (レビュー対象のスライド番号, 文脈を含むスライドのリスト) のタプルのリスト。
+    """
+    chunk_size = max(1, chunk_size)
+    overlap = max(0, overlap)
+    target_positions = [
+        position for position, slide in enumerate(slides)
+        if target_numbers is None or slide["slide_number"] in target_numbers
+    ]
+    windows = []
+    for start in range(0, len(target_positions), chunk_size):
+        positions = target_positions[start:start + chunk_size]
+        context_positions = sorted({
+            context_position
+            for position in positions
+            for context_position in range(max(0, position - overlap), min(len(slides), position + overlap + 1))
+        })
+        windows.append((
+            [slides[position]["slide_number"] for position in positions],
+            [slides[position] for position in context_positions],
+        ))
+    return windows
+
+
+class ChunkedReviewAgent(BaseAgent):
+    """
+    長い資料をスライドのウィンドウに分割してレビューし、1つのFinalReportに統合するエージェント。
+
+    1. document_analysis をチャンクに分割し、チャンクごとにStateへ書き込む (map)
+    2. チャンクごとのレビューエージェントを、同時実行数を max_concurrency 以下に抑えながら並行に実行する
+    3. スライドごとのレビューを連結し、チャンクごとの気付きから総評を生成する (reduce)
+
+    過去にレビューしたスライドとほぼ同じスライドは、保存済みのレビューを再利用してチャンクに含めない。
+    """
+
+    # ワークフロー構築時の依存関係の推定に使用する (参照: adk_logic/workflow_builder.py)
+    state_reads: ClassVar[Tuple[str, ...]] = ("document_analysis", "presentation_goal", "audience_profile")
+    state_writes: ClassVar[Tuple[str, ...]] = ("final_report",)
+
+    selected_configs: Dict[str, str]
+    chunk_size: int = 20
+    chunk_overlap: int = 2
+    max_concurrency: int = 4
+    model: str = "gemini-2.5-pro"
+
+    def _create_chunk_reviewer(self, index: int) -> LlmAgent:
+        logic_fragment = get_prompt_fragment('logic_critic', self.selected_configs.get("logic_critic", "supportive"))
+        audience_fragment = get_prompt_fragment('audience_persona', self.selected_configs.get("audience_persona", "newbie"))
+        instruction = CHUNK_REVIEWER_BASE_PROMPT.replace("{{review_chunk}}", f"{{{{review_chunk_{index}}}}}")
+        instruction = (
+            f"{instruction}\n\n# あなたの今回のレビュー方針（論理構成）\n{logic_fragment}"
+            f"\n\n# あなたの今回のレビュー方針（聴衆視点）\n{audience_fragment}"
+        )
+        return LlmAgent(
+            name=f"ChunkReviewerAgent_{index}",
+            model=governed_model(self.model),
+            instruction=instruction,
+            output_schema=ChunkReview,
+            output_key=f"chunk_review_{index}",
+            # 会話履歴には資料全体の解析結果が含まれるため、チャンク以外の文脈は渡さない
+            include_contents="none",
+            before_agent_callback=before_agent_callback,
+        )
+
+    def _create_reducer(self) -> LlmAgent:
+        return LlmAgent(
+            name="ReportReducerAgent",
+            model=governed_model(self.model),
+            instruction=REPORT_REDUCER_BASE_PROMPT,
+            output_schema=ReportOverview,
+            output_key="report_overview",
+            include_contents="none",
+            before_agent_callback=before_agent_callback,
+        )
+
+    def _state_event(self, ctx: InvocationContext, state_delta: Dict[str, Any]) -> Event:
+        return Event(
+            invocation_id=ctx.invocation_id,
+            author=self.name,
+            branch=ctx.branch,
+            actions=EventActions(state_delta=state_delta),
+        )
+
+    async def _run_chunk_reviewers(
+        self, ctx: InvocationContext, reviewers: List[LlmAgent]
+    ) -> AsyncGenerator[Event, None]:
+        """
+        チャンクのレビューエージェントを、asyncio.Semaphore で同時実行数を制限して並行に実行し、イベントを順に返す。
+        各エージェントは個別のブランチで実行し、返したイベントが処理されてから次のイベントを生成させる (ParallelAgent と同じ)。
+        いずれかのエージェントが失敗した場合は、残りのエージェントを取り消して例外を送出する。
+        """
+        semaphore = asyncio.Semaphore(max(1, self.max_concurrency))
+        queue: asyncio.Queue = asyncio.Queue()
+        finished = object()
+
+        async def run_reviewer(reviewer: LlmAgent) -> None:
+            error: Optional[BaseException] = None
+            try:
+                async with semaphore:
+                    branch_ctx = ctx.model_copy()
+                    branch_name = f"{self.name}.{reviewer.name}"
+                    branch_ctx.branch = f"{ctx.branch}.{branch_name}" if ctx.branch else branch_name
+                    async for event in reviewer.run_async(branch_ctx):
+                        consumed = asyncio.Event()
+                        await queue.put((event, consumed))
+                        await consumed.wait()
+            except Exception as e:
+                error = e
+            finally:
+                await queue.put((finished, error))
+
+        tasks = [asyncio.create_task(run_reviewer(reviewer)) for reviewer in reviewers]
+        try:
+            remaining = len(tasks)
+            while remaining:
+                event, payload = await queue.get()
+                if event is finished:
+                    remaining -= 1
+                    if payload is not None:
+                        raise payload
+                    continue
+                yield event
+                payload.set()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run_async_impl(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        analysis = ctx.session.state.get("document_analysis") or {}
+        slides = analysis.get("slides") or []
+        # 0. 過去の資料とほぼ同じスライドは保存済みのレビューを再利用し、残りのスライドだけをレビューする
+        reused_reviews = await find_reusable_slide_reviews(ctx.session.state, slides)
+        windows = split_slides_into_windows(
+            slides,
+            self.chunk_size,
+            self.chunk_overlap,
+            target_numbers={slide["slide_number"] for slide in slides} - set(reused_reviews) if reused_reviews else None,
+        )
+        logger.info(f"Chunked review: {len(slides)} slides ({len(reused_reviews)} reused) -> {len(windows)} chunks")
+        trace = get_trace_recorder().get(ctx.session.id)
+        if trace is not None:
+            trace.annotate_agent(self.name, reused_slide_reviews=len(reused_reviews))
+
+        # 1. チャンクをStateに書き込み、プロンプトのプレースホルダから参照できるようにする
+        yield self._state_event(ctx, {
+            REUSED_SLIDE_REVIEWS_KEY: [reused_reviews[number] for number in sorted(reused_reviews)],
+            **{
+                f"review_chunk_{i}": {"review_target_slides": target_numbers, "slides": context_slides}
+                for i, (target_numbers, context_slides) in enumerate(windows)
+            },
+        })
+
+        # 2. 同時実行数を max_concurrency 以下に抑えながらチャンクを並行レビューする
+        #    空いた枠から順に次のチャンクを開始するため、遅いチャンクが他のチャンクの開始を待たせない
+        chunk_reviewers = [self._create_chunk_reviewer(i) for i in range(len(windows))]
+        for reviewer in chunk_reviewers:
+            # 実行時に生成するエージェントは create_root_agent の計装の対象外のため、ここで計装する
+            # 再開時は、前回レビュー済みのチャンクをスキップする
+            instrument_agent_tree(enable_result_memoization(enable_stage_checkpoints(reviewer)), self.name)
+        async for event in self._run_chunk_reviewers(ctx, chunk_reviewers):
+            yield event
+
+        # 3. スライドごとのレビューを、担当チャンクの結果を優先して連結する
+        new_reviews: Dict[int, Dict[str, Any]] = {}
+        digest_lines = []
+        for i, (target_numbers, _) in enumerate(windows):
+            chunk_review = ctx.session.state.get(f"chunk_review_{i}") or {}
+            for review in chunk_review.get("slide_by_slide_reviews", []):
+                if review.get("slide_number") in target_numbers:
+                    new_reviews[review["slide_number"]] = review
+            if target_numbers:
+                digest_lines.append(
+                    f"## スライド{target_numbers[0]}〜{target_numbers[-1]}\n{chunk_review.get('storyline_notes', '')}"
+                )
+        if reused_reviews:
+            # 再利用したスライドはチャンクの気付きに含まれないため、評価を総評の材料として渡す
+            digest_lines.append("## 過去のレビューを再利用したスライド\n" + "\n".join(
+                f"- スライド{number}: {reused_reviews[number]['evaluation']}" for number in sorted(reused_reviews)
+            ))
+        await save_slide_reviews(ctx.session.state, slides, list(new_reviews.values()))
+        reviews_by_slide = {**reused_reviews, **new_reviews}
+        yield self._state_event(ctx, {
+            "chunk_review_outline": build_slide_outline(analysis),
+            "chunk_review_digest": "\n\n".join(digest_lines),
+        })
+
+        reducer = self._create_reducer()
+        reducer = instrument_agent_tree(enable_result_memoization(enable_stage_checkpoints(reducer)), self.name)
+        async for event in reducer.run_async(ctx):
+            yield event
+
+        overview = ctx.session.state.get("report_overview") or {}
+        final_report = FinalReport(
+            summary_review=overview.get("summary_review", ""),
+            storyline_review=overview.get("storyline_review", ""),
+            slide_by_slide_reviews=[reviews_by_slide[number] for number in sorted(reviews_by_slide)],
+        )
+        # 中間生成物は最終レポートに統合済みのため、Stateから取り除く
+        cleanup = {REUSED_SLIDE_REVIEWS_KEY: None}
+        cleanup.update({f"review_chunk_{i}": None for i in range(len(windows))})
+        cleanup.update({f"chunk_review_{i}": None for i in range(len(windows))})
+        yield self._state_event(ctx, {"final_report": final_report.model_dump(), **cleanup})
@@ -3,22 +3,47 @@ from google.adk.tools import FunctionTool
 from adk_logic.prompts.base_prompts import DOCUMENT_ANALYZER_INSTRUCTION
 from adk_logic.tools.document_parser_tool import parse_presentation_document
 from adk_logic.state_models import DocumentAnalysisResult
-from adk_logic.callbacks import before_agent_callback, add_document_to_request_callback
+from adk_logic.rate_governor import governed_model
+from adk_logic.callbacks import (
+    before_agent_callback,
+    add_document_to_request_callback,
+    restore_cached_analysis_callback,
+    attach_prefetched_analysis_callback,
+    store_analysis_in_cache_callback,
+    revision_analysis_callback,
+    local_analysis_callback,
+    restrict_analysis_pages_callback,
+    merge_hybrid_analysis_callback,
+)
 
 
-def create_document_analyzer_agent() -> LlmAgent:
+def create_document_analyzer_agent(use_prefetched_analysis: bool = True) -> LlmAgent:
     """
     アップロードされた資料をLLMに直接解析させ、結果をStateに保存するエージェントを生成。
     ファイルはbefore_model_callback経由でLLMリクエストに追加される。
+    同一ファイルの解析結果がキャッシュにある場合、LLMは呼び出さずにキャッシュからStateを復元する。
+    レビューの開始前に始めた先行解析があれば、その完了を待って結果を使う。
+    analysis_modeが local / hybrid の場合はローカル抽出を先に行い、必要なページのみLLMに解析させる。
+    改訂版の資料のレビューでは、改訂前から変更のあったスライドのみを解析し、それ以外は改訂前の解析結果を引き継ぐ。
     参照: docs/callbacks/types-of-callbacks.md (before_model_callback)
+
+    Args:
+        use_prefetched_analysis: 先行解析の結果を待って使うかどうか。先行解析そのものを実行するエージェントではFalseにする。
     """
     return LlmAgent(
         name="DocumentAnalyzerAgent",
-        model="gemini-2.5-pro", # ツール利用に適したモデル
+        model=governed_model("gemini-2.5-pro"), # ツール利用に適したモデル
         instruction=DOCUMENT_ANALYZER_INSTRUCTION,
         # tools=[FunctionTool(parse_presentation_document)],
         output_key="document_analysis", # 結果をStateの 'document_analysis' に保存
-        before_agent_callback=before_agent_callback,
-        before_model_callback=add_document_to_request_callback,
+        before_agent_callback=[
+            before_agent_callback,
+            restore_cached_analysis_callback,
+            *([attach_prefetched_analysis_callback] if use_prefetched_analysis else []),
+            revision_analysis_callback,
+            local_analysis_callback,
+        ],
+        after_agent_callback=[merge_hybrid_analysis_callback, store_analysis_in_cache_callback],
+        before_model_callback=[add_document_to_request_callback, restrict_analysis_pages_callback],
         output_schema=DocumentAnalysisResult,
     )
\ No newline at end of file
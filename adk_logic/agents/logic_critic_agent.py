@@ -1,19 +1,29 @@
 from google.adk.agents import LlmAgent
-from utils.config_loader import get_prompt_fragment
+from utils.config_loader import render_agent_instruction
 from adk_logic.prompts.base_prompts import LOGIC_CRITIC_BASE_PROMPT
+from adk_logic.document_serializer import DEFAULT_DOCUMENT_FORMAT, bind_document_context
 from adk_logic.state_models import PresentaAiState
-from adk_logic.callbacks import before_agent_callback
+from adk_logic.rate_governor import governed_model
+from adk_logic.callbacks import (
+    before_agent_callback,
+    create_document_context_callback,
+    keep_only_user_message_callback,
+    use_shared_context_cache_callback,
+)
 
-def create_logic_critic_agent(selection_id: str) -> LlmAgent:
+def create_logic_critic_agent(selection_id: str, document_format: str = DEFAULT_DOCUMENT_FORMAT) -> LlmAgent:
     """ユーザーの選択に基づいてLogicCriticAgentを生成する"""
-    prompt_fragment = get_prompt_fragment('logic_critic', selection_id)
-    final_instruction = f"{LOGIC_CRITIC_BASE_PROMPT}\n\n# あなたの今回のレビュー方針\n{prompt_fragment}"
+    base_prompt = bind_document_context(LOGIC_CRITIC_BASE_PROMPT, document_format)
+    final_instruction = render_agent_instruction('logic_critic', selection_id, base_prompt)
 
     return LlmAgent(
         name="LogicCriticAgent",
-        model="gemini-2.5-pro",
+        model=governed_model("gemini-2.5-pro"),
         instruction=final_instruction,
         input_schema=PresentaAiState, # Stateから値を取得するためのスキーマ
         output_key="logic_critic_review_text",
-        before_agent_callback=before_agent_callback
+        before_agent_callback=[before_agent_callback, create_document_context_callback(document_format)],
+        # 資料情報はプロンプトの共通部分で渡すため、会話履歴は含めない
+        include_contents="none",
+        before_model_callback=[keep_only_user_message_callback, use_shared_context_cache_callback],
     )
@@ -1,26 +1,62 @@
-from google.adk.agents import LlmAgent
-from adk_logic.prompts.base_prompts import QNA_GENERATOR_BASE_PROMPT
-from adk_logic.state_models import PresentaAiState, QnAPair, FinalReport
-from typing import List
-from adk_logic.callbacks import before_agent_callback
+from google.adk.agents import BaseAgent, LlmAgent, SequentialAgent
+from google.adk.tools import FunctionTool
+from adk_logic.prompts.base_prompts import QNA_FORMATTER_PROMPT, QNA_GENERATOR_BASE_PROMPT, QNA_GENERATOR_RETRIEVAL_PROMPT
+from adk_logic.document_serializer import DEFAULT_DOCUMENT_FORMAT, bind_document_context
+from adk_logic.state_models import PresentaAiState, QnAList
+from adk_logic.rate_governor import governed_model
+from adk_logic.tools.slide_search_tool import search_slides
+from adk_logic.callbacks import (
+    before_agent_callback,
+    create_document_context_callback,
+    keep_only_user_message_callback,
+    keep_user_message_and_tool_turns_callback,
+    prepare_slide_outline_callback,
+    use_shared_context_cache_callback,
+)
+
+def create_qna_generator_agent(document_format: str = DEFAULT_DOCUMENT_FORMAT, slide_search: bool = False) -> BaseAgent:
+    """
+    資料と各レビューから想定問答集を生成するエージェント。
+    最終レポートには依存しないため、レポート統合エージェントと並行して実行できる。
+    生成結果はStateの 'qna_result' に保存され、レビュー完了時に最終レポートへ統合される。
+
+    slide_search が True の場合は資料全体をプロンプトに含めず、スライド一覧のみを渡して、
+    質問ごとに必要なスライドを search_slides ツールで検索させる（長い資料でプロンプトを小さく保つ）。
+    ツールと出力スキーマを同じエージェントに指定すると、最終応答がJSONでない場合に検証エラーで失敗するため、
+    検索しながら下書きを作るエージェントと、下書きをスキーマに整形するだけのエージェントに分けて順に実行する。
+    """
+    if slide_search:
+        drafter = LlmAgent(
+            name="QnaGeneratorAgent",
+            model=governed_model("gemini-2.5-pro"),
+            instruction=QNA_GENERATOR_RETRIEVAL_PROMPT,
+            input_schema=PresentaAiState,
+            output_key="qna_draft",
+            tools=[FunctionTool(search_slides)],
+            before_agent_callback=[before_agent_callback, prepare_slide_outline_callback],
+            include_contents="none",
+            before_model_callback=keep_user_message_and_tool_turns_callback,
+        )
+        formatter = LlmAgent(
+            name="QnaFormatterAgent",
+            model=governed_model("gemini-2.5-flash"),
+            instruction=QNA_FORMATTER_PROMPT,
+            output_schema=QnAList,
+            output_key="qna_result",
+            include_contents="none",
+            before_model_callback=keep_only_user_message_callback,
+        )
+        return SequentialAgent(name="QnaRetrievalAgent", sub_agents=[drafter, formatter])
 
-def create_qna_generator_agent() -> LlmAgent:
-    """最終レポートから想定問答集を生成するエージェント"""
-    
-    # # このエージェントは最終レポートにQ&Aリストを追記する
-    # async def update_final_report_with_qna(ctx, qna_list: List[QnAPair]):
-    #     final_report_dict = ctx.session.state.get("final_report")
-    #     if final_report_dict:
-    #         final_report = FinalReport.model_validate(final_report_dict)
-    #         final_report.qna_list = qna_list
-    #         ctx.session.state["final_report"] = final_report.model_dump()
-    
     return LlmAgent(
         name="QnaGeneratorAgent",
-        model="gemini-2.5-pro",
-        instruction=QNA_GENERATOR_BASE_PROMPT,
+        model=governed_model("gemini-2.5-pro"),
+        instruction=bind_document_context(QNA_GENERATOR_BASE_PROMPT, document_format),
         input_schema=PresentaAiState,
-        output_schema=QnAPair,
-        # output_keyを使わず、カスタム関数でStateを更新する
-        before_agent_callback=before_agent_callback,
-    )
\ No newline at end of file
+        output_schema=QnAList,
+        output_key="qna_result",
+        before_agent_callback=[before_agent_callback, create_document_context_callback(document_format)],
+        # 資料情報はプロンプトの共通部分で渡すため、会話履歴は含めない
+        include_contents="none",
+        before_model_callback=[keep_only_user_message_callback, use_shared_context_cache_callback],
+    )
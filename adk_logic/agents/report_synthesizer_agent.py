@@ -1,16 +1,36 @@
 from google.adk.agents import LlmAgent
 from adk_logic.prompts.base_prompts import REPORT_SYNTHESIZER_BASE_PROMPT
+from adk_logic.document_serializer import DEFAULT_DOCUMENT_FORMAT, bind_document_context
 from adk_logic.state_models import PresentaAiState, FinalReport
-from adk_logic.callbacks import before_agent_callback
+from adk_logic.rate_governor import governed_model
+from adk_logic.callbacks import (
+    before_agent_callback,
+    create_document_context_callback,
+    keep_only_user_message_callback,
+    match_reusable_slide_reviews_callback,
+    merge_reused_slide_reviews_callback,
+    use_shared_context_cache_callback,
+)
 
-def create_report_synthesizer_agent() -> LlmAgent:
-    """2つのレビューを統合して最終レポートを生成するエージェント"""
+def create_report_synthesizer_agent(document_format: str = DEFAULT_DOCUMENT_FORMAT) -> LlmAgent:
+    """
+    2つのレビューを統合して最終レポートを生成するエージェント。
+    過去の資料とほぼ同じスライドは保存済みのレビューを再利用し、LLMにはそれ以外のスライドのレビューのみを生成させる。
+    """
     return LlmAgent(
         name="ReportSynthesizerAgent",
-        model="gemini-2.5-pro",
-        instruction=REPORT_SYNTHESIZER_BASE_PROMPT,
+        model=governed_model("gemini-2.5-pro"),
+        instruction=bind_document_context(REPORT_SYNTHESIZER_BASE_PROMPT, document_format),
         input_schema=PresentaAiState,
         output_schema=FinalReport,
-        before_agent_callback=before_agent_callback,
-        output_key="final_report"
+        before_agent_callback=[
+            before_agent_callback,
+            create_document_context_callback(document_format),
+            match_reusable_slide_reviews_callback,
+        ],
+        output_key="final_report",
+        after_agent_callback=merge_reused_slide_reviews_callback,
+        # 資料情報はプロンプトの共通部分で渡すため、会話履歴は含めない
+        include_contents="none",
+        before_model_callback=[keep_only_user_message_callback, use_shared_context_cache_callback],
     )
\ No newline at end of file
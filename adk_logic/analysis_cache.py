@@ -0,0 +1,38 @@
+import hashlib
+import os
+import tempfile
+from typing import Optional, Union
+
+from utils.persistent_cache import PersistentLRUCache
+from adk_logic.prompts.base_prompts import DOCUMENT_ANALYZER_INSTRUCTION
+
+# NOTE: Cloud Runではインスタンスローカルのディスクになるため、永続化したい場合は
+# マウントしたボリュームを ANALYSIS_CACHE_DIR に指定する
+ANALYSIS_CACHE_DIR = os.environ.get(
+    "ANALYSIS_CACHE_DIR",
+    os.path.join(tempfile.gettempdir(), "presenta-ai", "analysis_cache"),
+)
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.environ.get("ANALYSIS_CACHE_MAX_ENTRIES", "256"))
+
+# 解析プロンプトが変われば解析結果も変わるため、プロンプト本文のハッシュをキーに含める
+ANALYZER_PROMPT_VERSION = hashlib.sha256(DOCUMENT_ANALYZER_INSTRUCTION.encode("utf-8")).hexdigest()[:12]
+
+_analysis_cache: Optional[PersistentLRUCache] = None
+
+
+def compute_document_hash(blob: Union[bytes, memoryview]) -> str:
+    """アップロードされたファイルのバイト列（またはバッファ）からSHA-256ハッシュを計算する"""
+    return hashlib.sha256(blob).hexdigest()
+
+
+def build_analysis_cache_key(document_sha256: str, analysis_mode: str = "llm") -> str:
+    """ファイルハッシュ・解析方式・解析プロンプトのバージョンからキャッシュキーを生成する"""
+    return f"{document_sha256}:{analysis_mode}:{ANALYZER_PROMPT_VERSION}"
+
+
+def get_analysis_cache() -> PersistentLRUCache:
+    """プロセス内で共有する解析結果キャッシュを返す"""
+    global _analysis_cache
+    if _analysis_cache is None:
+        _analysis_cache = PersistentLRUCache(ANALYSIS_CACHE_DIR, ANALYSIS_CACHE_MAX_ENTRIES)
+    return _analysis_cache
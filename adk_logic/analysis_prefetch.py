@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional
+
+from adk_logic.analysis_cache import build_analysis_cache_key
+
+logger = logging.getLogger(__name__)
+
+# 資料のアップロード直後に、チーム編成の入力を待たずに資料の解析を始めるかどうか
+# 解析方式が llm の場合、編成の途中でやめた資料の解析にもLLMの料金がかかる
+ANALYSIS_PREFETCH_ENABLED = os.environ.get("ANALYSIS_PREFETCH_ENABLED", "true").lower() == "true"
+# 完了した先行解析の結果を保持する件数
+ANALYSIS_PREFETCH_MAX_ENTRIES = int(os.environ.get("ANALYSIS_PREFETCH_MAX_ENTRIES", "32"))
+
+
+class AnalysisPrefetcher:
+    """
+    レビューの開始前にバックグラウンドで始めた資料の解析（先行解析）を、資料のハッシュと解析方式ごとに管理する。
+
+    資料の解析はチーム編成に依存しないため、ユーザーが編成を選んでいる間に済ませておき、
+    レビューの DocumentAnalyzerAgent は実行中または完了済みの先行解析の結果を待って使う。
+    解析の実行自体は main_runner.prefetch_document_analysis が行う。
+    """
+
+    def __init__(self, max_entries: int = ANALYSIS_PREFETCH_MAX_ENTRIES):
+        self.max_entries = max(1, max_entries)
+        self._lock = threading.Lock()
+        self._futures: "OrderedDict[str, Future]" = OrderedDict()
+        self.attached = 0
+
+    def start(self, document_sha256: str, analysis_mode: str, start_analysis: Callable[[], Future]) -> bool:
+        """
+        先行解析を始める。同じ資料・解析方式の先行解析が既にあれば何もしない。
+
+        Args:
+            document_sha256: 資料のSHA-256ハッシュ。
+            analysis_mode: 資料解析の方式 ("llm", "hybrid", "local")。
+            start_analysis: 解析を始め、解析結果（失敗した場合はNone）を返す Future を返す関数。
+
+        Returns:
+            新たに解析を始めた場合はTrue。
+        """
+        if not ANALYSIS_PREFETCH_ENABLED:
+            return False
+        key = build_analysis_cache_key(document_sha256, analysis_mode)
+        with self._lock:
+            if key in self._futures:
+                self._futures.move_to_end(key)
+                return False
+            self._futures[key] = start_analysis()
+            # 完了した古い結果から捨てる（実行中の解析は待っているレビューがあり得るため残す）
+            for old_key in [old_key for old_key, future in self._futures.items() if future.done()]:
+                if len(self._futures) <= self.max_entries:
+                    break
+                del self._futures[old_key]
+        return True
+
+    async def wait(self, document_sha256: str, analysis_mode: str) -> Optional[Dict[str, Any]]:
+        """
+        先行解析の完了を待ち、解析結果を返す。先行解析がない、または失敗した場合はNone。
+        呼び出し元がキャンセルされても、先行解析自体は止めない（同じ資料を待つ他のレビューのため）。
+        """
+        with self._lock:
+            future = self._futures.get(build_analysis_cache_key(document_sha256, analysis_mode))
+        if future is None:
+            return None
+        try:
+            analysis = await asyncio.shield(asyncio.wrap_future(future))
+        except Exception as e:
+            logger.warning(f"Analysis prefetch failed: {e}")
+            return None
+        if analysis is not None:
+            self.attached += 1
+        return analysis
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            running = sum(1 for future in self._futures.values() if not future.done())
+            return {"entries": len(self._futures), "running": running, "attached": self.attached}
+
+
+_analysis_prefetcher: Optional[AnalysisPrefetcher] = None
+_analysis_prefetcher_lock = threading.Lock()
+
+
+def get_analysis_prefetcher() -> AnalysisPrefetcher:
+    """プロセス内で共有する AnalysisPrefetcher を返す"""
+    global _analysis_prefetcher
+    with _analysis_prefetcher_lock:
+        if _analysis_prefetcher is None:
+            _analysis_prefetcher = AnalysisPrefetcher()
+    return _analysis_prefetcher
@@ -0,0 +1,236 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import unicodedata
+from typing import Any, Dict, List, Optional
+
+from google.genai import types
+
+from utils.config_loader import get_config_version, load_config_options, validate_selected_configs
+from utils.persistent_cache import PersistentLRUCache
+from adk_logic.prompts.auto_compose_prompt import get_auto_compose_prompt
+from adk_logic.genai_client import get_genai_client_pool
+from adk_logic.rate_governor import get_rate_governor
+
+logger = logging.getLogger(__name__)
+
+# キーワードで決められなかったエージェントの編成を問い合わせるモデル。選択肢から選ぶだけなので軽量なモデルを使う
+AUTO_COMPOSE_MODEL = os.environ.get("AUTO_COMPOSE_MODEL", "gemini-2.5-flash")
+AUTO_COMPOSE_CACHE_DIR = os.environ.get(
+    "AUTO_COMPOSE_CACHE_DIR",
+    os.path.join(tempfile.gettempdir(), "presenta-ai", "auto_compose_cache"),
+)
+AUTO_COMPOSE_CACHE_MAX_ENTRIES = int(os.environ.get("AUTO_COMPOSE_CACHE_MAX_ENTRIES", "1024"))
+
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def normalize_compose_text(text: str) -> str:
+    """キーワードの照合とキャッシュのキーに使うため、全角・半角、大文字・小文字、空白の違いを無視した文字列を返す"""
+    return _WHITESPACE_PATTERN.sub("", unicodedata.normalize("NFKC", text or "").lower())
+
+
+def build_auto_compose_cache_key(presentation_goal: str, audience_profile: Dict[str, str]) -> str:
+    """
+    正規化したプレゼン目的・聴衆情報と設定ファイルの版から、キャッシュのキーを生成する。
+    推定コストはレビューのたびに変わるため、キーには含めない。
+    """
+    material = [
+        normalize_compose_text(presentation_goal),
+        normalize_compose_text(audience_profile.get("role", "")),
+        normalize_compose_text(audience_profile.get("interests", "")),
+        get_config_version(),
+    ]
+    return hashlib.sha256(json.dumps(material, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def classify_by_keywords(text: str, agent_options: Dict[str, Any]) -> Dict[str, str]:
+    """
+    プレゼン目的・聴衆情報に含まれる、設定ファイルの選択肢ごとのキーワードの数で編成を決める。
+
+    一致したキーワードが最も多い選択肢が1つに決まるエージェントはその選択肢を、
+    どのキーワードも一致しないエージェントは default_option を選ぶ。
+    他の選択肢と同数になったり、default_option がないエージェントは結果に含めない。
+
+    Args:
+        text: normalize_compose_text で正規化したプレゼン目的と聴衆情報。
+        agent_options: 設定ファイルの agent_options。
+
+    Returns:
+        エージェントの種類をキー、選択肢のIDを値とした、決められたエージェントのみの辞書。
+    """
+    decided: Dict[str, str] = {}
+    for agent_type, details in agent_options.items():
+        matched = {
+            option["id"]: [
+                keyword for keyword in map(normalize_compose_text, option.get("keywords") or []) if keyword and keyword in text
+            ]
+            for option in details["options"]
+        }
+        # 「質疑なし」のように、他のキーワード（「質疑」）を含む長いキーワードが一致した場合は、長い方のみを数える
+        all_matched = [keyword for keywords in matched.values() for keyword in keywords]
+        scores = {
+            option_id: sum(
+                1 for keyword in keywords
+                if not any(keyword != other and keyword in other for other in all_matched)
+            )
+            for option_id, keywords in matched.items()
+        }
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        if ranked[0][1] == 0:
+            if details.get("default_option"):
+                decided[agent_type] = details["default_option"]
+        elif len(ranked) == 1 or ranked[0][1] > ranked[1][1]:
+            decided[agent_type] = ranked[0][0]
+    return decided
+
+
+def _format_agent_options(agent_options: Dict[str, Any]) -> str:
+    """LLMに選ばせるエージェントの選択肢を、IDと説明（推定コストがあれば推定コスト）だけの短い一覧にする"""
+    lines: List[str] = []
+    for agent_type, details in agent_options.items():
+        lines.append(f"## {agent_type}: {details['name']} - {details.get('description', '')}")
+        for option in details["options"]:
+            cost = f" (推定コスト ${option['estimated_cost_usd']:.3f})" if "estimated_cost_usd" in option else ""
+            lines.append(f"- {option['id']}: {option['label']} - {option.get('description', '')}{cost}")
+    return "\n".join(lines)
+
+
+def _build_response_schema(agent_options: Dict[str, Any]) -> types.Schema:
+    """回答をエージェントの種類ごとに、選択肢のIDのいずれかに制約するスキーマ"""
+    return types.Schema(
+        type=types.Type.OBJECT,
+        properties={
+            agent_type: types.Schema(type=types.Type.STRING, enum=[option["id"] for option in details["options"]])
+            for agent_type, details in agent_options.items()
+        },
+        required=list(agent_options),
+    )
+
+
+class AutoComposer:
+    """
+    「AIにおまかせ編成」のチーム編成を決める。
+
+    1. 正規化したプレゼン目的・聴衆情報が同じであれば、前回の編成をキャッシュから返す。
+    2. 設定ファイルのキーワードで決められるエージェントは、LLMを呼び出さずに決める。
+    3. 残りのエージェントのみを、軽量なモデルに選択肢のIDに制約したスキーマで問い合わせる。
+
+    返す編成は、常に設定ファイルの選択肢のIDであることを検証済み。
+    """
+
+    def __init__(self, model: str = AUTO_COMPOSE_MODEL, cache: Optional[PersistentLRUCache] = None):
+        self.model = model
+        self.cache = cache or PersistentLRUCache(AUTO_COMPOSE_CACHE_DIR, AUTO_COMPOSE_CACHE_MAX_ENTRIES)
+        self.rule_hits = 0
+        self.llm_calls = 0
+
+    async def compose(
+        self,
+        presentation_goal: str,
+        audience_profile: Dict[str, str],
+        agent_options: Optional[Dict[str, Any]] = None,
+    ) -> Optional[Dict[str, str]]:
+        """
+        プレゼン目的と聴衆情報に適したチーム編成を返す。
+
+        Args:
+            presentation_goal: プレゼンの目的。
+            audience_profile: 聴衆のプロファイル (role, interests)。
+            agent_options: 選択肢の一覧。選択肢に estimated_cost_usd があれば、LLMへの問い合わせ時にコストも考慮させる。
+                省略した場合は設定ファイルの agent_options を使う。
+
+        Returns:
+            エージェントの種類をキー、選択肢のIDを値とした辞書。編成を決められなかった場合はNone。
+        """
+        agent_options = agent_options or load_config_options()["agent_options"]
+        cache_key = build_auto_compose_cache_key(presentation_goal, audience_profile)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            try:
+                return validate_selected_configs(cached)
+            except ValueError as e:
+                logger.warning(f"Ignoring invalid cached team composition: {e}")
+
+        text = normalize_compose_text(
+            f"{presentation_goal}\n{audience_profile.get('role', '')}\n{audience_profile.get('interests', '')}"
+        )
+        selected_configs = classify_by_keywords(text, agent_options)
+        undecided = {agent_type: details for agent_type, details in agent_options.items() if agent_type not in selected_configs}
+        if not undecided:
+            self.rule_hits += 1
+            logger.info(f"Auto-composed team by keywords: {selected_configs}")
+        else:
+            llm_configs = await self._ask_model(presentation_goal, audience_profile, undecided)
+            if llm_configs is None:
+                return None
+            selected_configs.update(llm_configs)
+            logger.info(f"Auto-composed team with {self.model} for {list(undecided)}: {selected_configs}")
+
+        missing = [agent_type for agent_type in agent_options if agent_type not in selected_configs]
+        if missing:
+            logger.warning(f"Auto-compose left agents undecided: {missing}")
+            return None
+        try:
+            selected_configs = validate_selected_configs(selected_configs)
+        except ValueError as e:
+            logger.warning(f"Auto-composed team is invalid: {e}")
+            return None
+        try:
+            self.cache.put(cache_key, selected_configs)
+        except OSError as e:
+            logger.warning(f"Failed to store auto-composed team: {e}")
+        return selected_configs
+
+    async def _ask_model(
+        self, presentation_goal: str, audience_profile: Dict[str, str], agent_options: Dict[str, Any]
+    ) -> Optional[Dict[str, str]]:
+        """指定したエージェントの選択肢を、IDのいずれかに制約したスキーマでLLMに選ばせる"""
+        prompt = get_auto_compose_prompt(presentation_goal, audience_profile, _format_agent_options(agent_options))
+        client = get_genai_client_pool().get()
+        self.llm_calls += 1
+        try:
+            # レビューのエージェントと同じ流量制御を通し、混雑時は順番待ち・リトライする
+            response = await get_rate_governor().call(self.model, lambda: client.aio.models.generate_content(
+                model=self.model,
+                contents=prompt,
+                config=types.GenerateContentConfig(
+                    temperature=0.0,
+                    response_mime_type="application/json",
+                    response_schema=_build_response_schema(agent_options),
+                    # 選択肢から選ぶだけなので、思考は省いて応答を速くする
+                    thinking_config=types.ThinkingConfig(thinking_budget=0),
+                ),
+            ))
+            answer = json.loads(response.text)
+        except Exception as e:
+            logger.warning(f"Auto-compose request to {self.model} failed: {e}")
+            return None
+        if not isinstance(answer, dict):
+            logger.warning(f"Unexpected auto-compose response: {response.text}")
+            return None
+        return {agent_type: answer[agent_type] for agent_type in agent_options if agent_type in answer}
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "cache_hits": self.cache.hits,
+            "rule_hits": self.rule_hits,
+            "llm_calls": self.llm_calls,
+        }
+
+
+_auto_composer: Optional[AutoComposer] = None
+_auto_composer_lock = threading.Lock()
+
+
+def get_auto_composer() -> AutoComposer:
+    """プロセス内で共有する AutoComposer を返す"""
+    global _auto_composer
+    with _auto_composer_lock:
+        if _auto_composer is None:
+            _auto_composer = AutoComposer()
+    return _auto_composer
@@ -0,0 +1,278 @@
+import abc
+import asyncio
+import io
+import json
+import logging
+import os
+import uuid
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from google.adk.models import LlmRequest, LlmResponse, LLMRegistry
+from google.genai import types
+from pydantic import BaseModel
+
+from utils.storage import get_storage_backend, storage_for_uri
+from adk_logic.genai_client import get_genai_client_pool
+
+logger = logging.getLogger(__name__)
+
+# 生成設定のうち、バッチ予測のリクエストでは generationConfig に含めるフィールド
+_GENERATION_CONFIG_FIELDS = (
+    set(types.GenerationConfig.model_fields) & set(types.GenerateContentConfig.model_fields)
+) - {"response_schema"}
+# 生成設定のうち、リクエストの最上位に含めるフィールド
+_REQUEST_FIELDS = {
+    "safety_settings": "safetySettings",
+    "tools": "tools",
+    "tool_config": "toolConfig",
+    "labels": "labels",
+    "cached_content": "cachedContent",
+}
+_TERMINAL_JOB_STATES = {
+    types.JobState.JOB_STATE_SUCCEEDED,
+    types.JobState.JOB_STATE_PARTIALLY_SUCCEEDED,
+    types.JobState.JOB_STATE_FAILED,
+    types.JobState.JOB_STATE_CANCELLED,
+    types.JobState.JOB_STATE_EXPIRED,
+}
+
+PredictionResult = Union[LlmResponse, Exception]
+
+
+class BatchPredictionError(RuntimeError):
+    """バッチ予測のジョブ、またはジョブ内の個別のリクエストの失敗"""
+
+
+def to_generate_content_request(llm_request: LlmRequest) -> Dict[str, Any]:
+    """LlmRequest を、バッチ予測の入力ファイル1行分の GenerateContentRequest (JSON) に変換する"""
+    config = llm_request.config or types.GenerateContentConfig()
+    request: Dict[str, Any] = {
+        "contents": [content.model_dump(mode="json", exclude_none=True, by_alias=True) for content in llm_request.contents],
+    }
+    if config.system_instruction:
+        system_instruction = config.system_instruction
+        if isinstance(system_instruction, str):
+            system_instruction = types.Content(parts=[types.Part(text=system_instruction)])
+        request["systemInstruction"] = system_instruction.model_dump(mode="json", exclude_none=True, by_alias=True)
+
+    generation = {name: getattr(config, name) for name in _GENERATION_CONFIG_FIELDS if getattr(config, name) is not None}
+    # 出力スキーマはエージェントにPydanticモデルで指定されているため、JSON Schemaとして渡す
+    schema = config.response_schema
+    if isinstance(schema, type) and issubclass(schema, BaseModel):
+        generation["response_json_schema"] = schema.model_json_schema()
+    elif schema is not None:
+        generation["response_schema"] = schema
+    if generation:
+        request["generationConfig"] = types.GenerationConfig(**generation).model_dump(
+            mode="json", exclude_none=True, by_alias=True
+        )
+
+    for field_name, key in _REQUEST_FIELDS.items():
+        value = getattr(config, field_name)
+        if not value:
+            continue
+        if isinstance(value, list):
+            value = [item.model_dump(mode="json", exclude_none=True, by_alias=True) for item in value]
+        elif isinstance(value, BaseModel):
+            value = value.model_dump(mode="json", exclude_none=True, by_alias=True)
+        request[key] = value
+    return request
+
+
+class BatchPredictionBackend(abc.ABC):
+    """複数のリクエストをまとめて推論するバックエンドの共通インターフェース"""
+
+    @abc.abstractmethod
+    async def predict(self, model: str, requests: List[LlmRequest]) -> List[PredictionResult]:
+        """
+        リクエストをまとめて推論し、リクエストと同じ順序で応答を返す。
+        個別のリクエストが失敗した場合、その位置には例外を入れる。
+        """
+
+
+class VertexBatchPredictionBackend(BatchPredictionBackend):
+    """
+    Vertex AIのバッチ予測でまとめて推論するバックエンド。
+    入力ファイル (JSON Lines) をGCSに保存してバッチジョブを作成し、完了まで待ってから出力ファイルを読み込む。
+    オンラインの呼び出しより安価だが、完了までに数分〜数時間かかる。
+    """
+
+    def __init__(self, poll_interval_seconds: float = 30.0):
+        self.poll_interval_seconds = poll_interval_seconds
+
+    async def predict(self, model: str, requests: List[LlmRequest]) -> List[PredictionResult]:
+        client = get_genai_client_pool().get()
+        storage = get_storage_backend("gcs")
+        job_id = uuid.uuid4().hex
+        lines = [
+            json.dumps({"key": str(index), "request": to_generate_content_request(request)}, ensure_ascii=False)
+            for index, request in enumerate(requests)
+        ]
+        input_uri = await asyncio.to_thread(
+            storage.upload,
+            io.BytesIO("\n".join(lines).encode("utf-8")),
+            f"batch_prediction/{job_id}/input.jsonl",
+            "application/jsonl",
+        )
+        job = await client.aio.batches.create(
+            model=model,
+            src=input_uri,
+            config=types.CreateBatchJobConfig(
+                dest=storage.uri_for(f"batch_prediction/{job_id}/output"),
+                display_name=f"presenta-ai-{job_id}",
+            ),
+        )
+        logger.info(f"Created batch prediction job {job.name} for {len(requests)} {model} request(s)")
+        while job.state not in _TERMINAL_JOB_STATES:
+            await asyncio.sleep(self.poll_interval_seconds)
+            job = await client.aio.batches.get(name=job.name)
+        if job.state not in (types.JobState.JOB_STATE_SUCCEEDED, types.JobState.JOB_STATE_PARTIALLY_SUCCEEDED):
+            raise BatchPredictionError(f"Batch prediction job {job.name} ended with {job.state}: {job.error}")
+
+        output_dir = (job.output_info.gcs_output_directory if job.output_info else None) or job.dest.gcs_uri
+        output_uri = f"{output_dir.rstrip('/')}/predictions.jsonl"
+        buffer = io.BytesIO()
+        await asyncio.to_thread(storage_for_uri(output_uri).download_to_file, output_uri, buffer)
+
+        results: List[PredictionResult] = [
+            BatchPredictionError(f"Batch prediction job {job.name} returned no response for request {index}.")
+            for index in range(len(requests))
+        ]
+        for line in buffer.getvalue().decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            prediction = json.loads(line)
+            index = int(prediction.get("key", -1))
+            if not 0 <= index < len(requests):
+                continue
+            if prediction.get("status") or not prediction.get("response"):
+                results[index] = BatchPredictionError(f"Batch prediction failed: {prediction.get('status')}")
+                continue
+            results[index] = LlmResponse.create(
+                types.GenerateContentResponse.model_validate(prediction["response"])
+            )
+        return results
+
+
+class LocalBatchPredictionBackend(BatchPredictionBackend):
+    """
+    バッチ予測の代わりに、LLMRegistry で解決したモデルを1件ずつ呼び出すバックエンド（検証用）。
+    LLMスタブを登録すれば、Vertex AIに接続せずにバッチ予測の経路を確認できる。
+    """
+
+    async def predict(self, model: str, requests: List[LlmRequest]) -> List[PredictionResult]:
+        # rate_governor はこのモジュールを import するため、循環importを避けてここで読み込む
+        from adk_logic.rate_governor import get_rate_governor
+
+        llm = LLMRegistry.new_llm(model)
+
+        async def generate(request: LlmRequest) -> LlmResponse:
+            final_response = None
+            async for response in llm.generate_content_async(request, stream=False):
+                final_response = response
+            return final_response
+
+        return await asyncio.gather(
+            *(get_rate_governor().call(model, lambda request=request: generate(request)) for request in requests),
+            return_exceptions=True,
+        )
+
+
+BATCH_PREDICTION_BACKENDS = {
+    "vertex": VertexBatchPredictionBackend,
+    "local": LocalBatchPredictionBackend,
+}
+
+
+class BatchPredictor:
+    """
+    並行実行中のレビューのLLM呼び出しをモデルごとに集め、まとめてバッチ予測に投入する。
+
+    最初のリクエストから window_seconds が経過するか、max_requests 件が集まった時点でバッチを投入し、
+    各呼び出しはバッチの完了後に自分の応答を受け取る。
+    同じ段階のエージェントは資料が違っても同じ頃に呼び出されるため、多数の資料を同時にレビューすると
+    段階ごとに1つのバッチにまとまる。1つのイベントループから使うことを前提とする。
+    """
+
+    def __init__(self, backend: BatchPredictionBackend, max_requests: int = 500, window_seconds: float = 30.0):
+        self.backend = backend
+        self.max_requests = max(1, max_requests)
+        self.window_seconds = window_seconds
+        self._pending: Dict[str, List[Tuple[LlmRequest, asyncio.Future]]] = defaultdict(list)
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._tasks: set = set()
+        self.submitted_batches = 0
+
+    @classmethod
+    def from_env(cls, backend: str) -> "BatchPredictor":
+        """環境変数の設定値でインスタンスを生成する"""
+        if backend not in BATCH_PREDICTION_BACKENDS:
+            raise ValueError(f"Unknown batch prediction backend: {backend}")
+        backend_options = {}
+        if backend == "vertex":
+            backend_options["poll_interval_seconds"] = float(os.environ.get("BATCH_PREDICTION_POLL_SECONDS", "30"))
+        return cls(
+            BATCH_PREDICTION_BACKENDS[backend](**backend_options),
+            max_requests=int(os.environ.get("BATCH_PREDICTION_MAX_REQUESTS", "500")),
+            window_seconds=float(os.environ.get("BATCH_PREDICTION_WINDOW_SECONDS", "30")),
+        )
+
+    async def generate(self, model: str, llm_request: LlmRequest) -> LlmResponse:
+        """リクエストをバッチに加え、バッチの完了後に応答を返す"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        pending = self._pending[model]
+        pending.append((llm_request, future))
+        if len(pending) >= self.max_requests:
+            self._flush(model)
+        elif len(pending) == 1:
+            self._timers[model] = loop.call_later(self.window_seconds, self._flush, model)
+        return await future
+
+    def _flush(self, model: str) -> None:
+        timer = self._timers.pop(model, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(model, [])
+        if not batch:
+            return
+        self.submitted_batches += 1
+        task = asyncio.get_running_loop().create_task(self._submit(model, batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _submit(self, model: str, batch: List[Tuple[LlmRequest, asyncio.Future]]) -> None:
+        logger.info(f"Submitting a batch of {len(batch)} {model} request(s)")
+        try:
+            results = await self.backend.predict(model, [request for request, _ in batch])
+        except Exception as e:
+            logger.exception(f"Batch prediction for {model} failed.")
+            results = [e] * len(batch)
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+_batch_predictor: Optional[BatchPredictor] = None
+
+
+def configure_batch_prediction(backend: Optional[str]) -> Optional[BatchPredictor]:
+    """
+    以降のLLM呼び出しをバッチ予測に切り替える。backend に None を指定するとオンラインの呼び出しに戻す。
+
+    Args:
+        backend: "vertex" (Vertex AIのバッチ予測) または "local" (ローカルで1件ずつ呼び出す検証用の代替)。
+    """
+    global _batch_predictor
+    _batch_predictor = BatchPredictor.from_env(backend) if backend else None
+    return _batch_predictor
+
+
+def get_batch_predictor() -> Optional[BatchPredictor]:
+    """バッチ予測が有効な場合はそのインスタンスを、無効な場合はNoneを返す"""
+    return _batch_predictor
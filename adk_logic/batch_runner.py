@@ -0,0 +1,268 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+from utils.config_loader import load_config_options
+from adk_logic.main_runner import run_review_process, DEFAULT_ANALYSIS_MODE
+from adk_logic.root_agent_factory import DEFAULT_REVIEW_MODE
+from adk_logic.document_store import MIME_TYPES, get_document_store
+from adk_logic.state_models import AudienceProfile, FinalReport
+from adk_logic.context_cache import CONTEXT_CACHE_MODE
+from adk_logic.batch_prediction import configure_batch_prediction
+
+logger = logging.getLogger(__name__)
+
+# 1つのイベントループで同時に実行するレビューの数
+BATCH_REVIEW_CONCURRENCY = int(os.environ.get("BATCH_REVIEW_CONCURRENCY", "8"))
+BATCH_SUMMARY_FILE_NAME = "batch_summary.json"
+
+_UNSAFE_FILE_NAME_CHARS = re.compile(r"[^\w.\-]+")
+
+
+def default_selected_configs() -> Dict[str, str]:
+    """各エージェントの最初の選択肢からなるチーム編成（画面の初期選択と同じ）を返す"""
+    agent_options = load_config_options()["agent_options"]
+    return {agent_type: details["options"][0]["id"] for agent_type, details in agent_options.items()}
+
+
+class BatchReviewItem(BaseModel):
+    """バッチレビューの1件分の入力"""
+    file_path: str = Field(description="レビューする資料 (.pptx, .pdf) のローカルのパス。")
+    presentation_goal: str
+    audience_profile: AudienceProfile
+    selected_configs: Dict[str, str] = Field(default_factory=default_selected_configs)
+    output_name: Optional[str] = Field(default=None, description="レポートのファイル名（拡張子なし）。省略時は資料のファイル名。")
+
+
+class BatchReviewOutcome(BaseModel):
+    """バッチレビューの1件分の結果"""
+    file_path: str
+    status: str = Field(description="succeeded / failed / skipped (レポートが既に存在する)")
+    output_path: Optional[str] = None
+    error: Optional[str] = None
+    session_id: Optional[str] = Field(default=None, description="失敗したレビューのセッションID。同じ入力で再実行すると続きから再開する。")
+    duplicate_of: Optional[str] = Field(default=None, description="同じ入力のレビュー結果を使い回した場合の、実際にレビューした資料のパス。")
+    duration_seconds: float = 0.0
+    llm_calls: int = 0
+    cost_usd: float = 0.0
+
+
+class BatchReviewSummary(BaseModel):
+    """バッチレビュー全体の結果とスループット"""
+    total: int
+    succeeded: int
+    failed: int
+    skipped: int
+    deduplicated: int = Field(description="同じ入力の資料があったため、レビューを実行しなかった件数。")
+    wall_seconds: float
+    throughput_per_min: float = Field(description="1分あたりにレポートを出力した資料の数。")
+    llm_calls: int
+    cost_usd: float
+    outcomes: List[BatchReviewOutcome]
+
+
+def load_manifest(manifest_path: str, defaults: Optional[Dict[str, Any]] = None) -> List[BatchReviewItem]:
+    """
+    JSON Lines形式のマニフェストを読み込む。1行が BatchReviewItem の1件に対応する。
+    file_path の相対パスはマニフェストのディレクトリを基準に解決し、行に無い項目は defaults の値を使う。
+    """
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    items = []
+    with open(manifest_path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = {**(defaults or {}), **json.loads(line)}
+            entry["file_path"] = os.path.join(base_dir, entry["file_path"])
+            items.append(BatchReviewItem.model_validate(entry))
+    return items
+
+
+def items_from_directory(
+    directory: str,
+    presentation_goal: str,
+    audience_profile: Dict[str, str],
+    selected_configs: Optional[Dict[str, str]] = None,
+) -> List[BatchReviewItem]:
+    """ディレクトリ以下の資料をすべて、同じ目的・聴衆・チーム編成でレビューする入力を作る"""
+    items = []
+    for root, _, file_names in os.walk(directory):
+        for file_name in file_names:
+            if os.path.splitext(file_name.lower())[1] not in MIME_TYPES:
+                continue
+            file_path = os.path.join(root, file_name)
+            relative_path = os.path.splitext(os.path.relpath(file_path, directory))[0]
+            items.append(BatchReviewItem(
+                file_path=file_path,
+                presentation_goal=presentation_goal,
+                audience_profile=AudienceProfile(**audience_profile),
+                selected_configs=selected_configs or default_selected_configs(),
+                output_name=relative_path.replace(os.sep, "__"),
+            ))
+    return sorted(items, key=lambda item: item.file_path)
+
+
+def _review_key(item: BatchReviewItem, analysis_mode: str, review_mode: str) -> str:
+    """資料の内容とレビューの条件から、同じレビューになる入力を判定するキーを生成する"""
+    with open(item.file_path, "rb") as f:
+        document_sha256 = hashlib.file_digest(f, "sha256").hexdigest()
+    material = {
+        "document_sha256": document_sha256,
+        "presentation_goal": item.presentation_goal,
+        "audience_profile": item.audience_profile.model_dump(),
+        "selected_configs": item.selected_configs,
+        "analysis_mode": analysis_mode,
+        "review_mode": review_mode,
+    }
+    return hashlib.sha256(json.dumps(material, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _output_paths(items: List[BatchReviewItem], output_dir: str) -> List[str]:
+    """資料ごとのレポートの出力先を、重複しないように決める"""
+    used = set()
+    paths = []
+    for item in items:
+        base_name = item.output_name or os.path.splitext(os.path.basename(item.file_path))[0]
+        base_name = _UNSAFE_FILE_NAME_CHARS.sub("_", base_name) or "report"
+        name, suffix = base_name, 1
+        while name in used:
+            suffix += 1
+            name = f"{base_name}-{suffix}"
+        used.add(name)
+        paths.append(os.path.join(output_dir, f"{name}.json"))
+    return paths
+
+
+def _write_json(path: str, data: Dict[str, Any]) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+async def run_batch_review(
+    items: List[BatchReviewItem],
+    output_dir: str,
+    concurrency: int = BATCH_REVIEW_CONCURRENCY,
+    analysis_mode: str = DEFAULT_ANALYSIS_MODE,
+    review_mode: str = DEFAULT_REVIEW_MODE,
+    skip_existing: bool = False,
+    batch_prediction: Optional[str] = None,
+) -> BatchReviewSummary:
+    """
+    複数の資料を、1つのイベントループ上で同時実行数を制限しながらレビューし、資料ごとのFinalReportをJSONで書き出す。
+
+    資料の内容・目的・聴衆・チーム編成がすべて同じ入力は1度だけレビューし、結果を各出力先に書き出す。
+    セッションIDは入力から決まるため、失敗したレビューは同じ入力で再実行すると完了済みの段階を飛ばして再開する。
+
+    Args:
+        items: レビューする資料と条件のリスト。
+        output_dir: レポートと batch_summary.json を書き出すディレクトリ。
+        concurrency: 同時に実行するレビューの数。
+        analysis_mode: 資料解析の方式 ("llm", "hybrid", "local")。
+        review_mode: レビューの方式 ("standard", "chunked")。
+        skip_existing: レポートが既に出力先にある資料をレビューしない。
+        batch_prediction: LLM呼び出しをバッチ予測にまとめる場合のバックエンド ("vertex", "local")。
+            オンラインの呼び出しより安価だが、段階ごとにバッチジョブの完了を待つため時間がかかる。
+
+    Returns:
+        資料ごとの結果と、全体の件数・スループット・LLM呼び出し回数・コスト。
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    if batch_prediction and CONTEXT_CACHE_MODE == "explicit":
+        logger.warning("Explicit context caches may expire before batch prediction jobs finish.")
+    configure_batch_prediction(batch_prediction)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    output_paths = _output_paths(items, output_dir)
+    keys = await asyncio.gather(
+        *(asyncio.to_thread(_review_key, item, analysis_mode, review_mode) for item in items)
+    )
+
+    async def review(item: BatchReviewItem, key: str) -> Dict[str, Any]:
+        async with semaphore:
+            with open(item.file_path, "rb") as f:
+                blob = await asyncio.to_thread(f.read)
+            document = get_document_store().register(blob, os.path.basename(item.file_path))
+            del blob
+            logger.info(f"Batch review started: {item.file_path}")
+            start = time.perf_counter()
+            result = await run_review_process(
+                gcs_file_path=document.uri,
+                presentation_goal=item.presentation_goal,
+                audience_profile=item.audience_profile.model_dump(),
+                selected_configs=item.selected_configs,
+                progress_callback=lambda message: logger.debug(f"[{item.file_path}] {message}"),
+                analysis_mode=analysis_mode,
+                review_mode=review_mode,
+                document=document.model_dump(),
+                session_id=f"batch-{key[:32]}",
+            )
+            return {**result, "duration_seconds": time.perf_counter() - start}
+
+    wall_start = time.perf_counter()
+    skipped = [skip_existing and os.path.exists(output_path) for output_path in output_paths]
+    reviews: Dict[str, asyncio.Task] = {}
+    reviewed_by: Dict[str, str] = {}
+    for item, key, skip in zip(items, keys, skipped):
+        if not skip and key not in reviews:
+            reviews[key] = asyncio.create_task(review(item, key))
+            reviewed_by[key] = item.file_path
+
+    outcomes = []
+    try:
+        for item, key, output_path, skip in zip(items, keys, output_paths, skipped):
+            if skip:
+                outcomes.append(BatchReviewOutcome(file_path=item.file_path, status="skipped", output_path=output_path))
+                continue
+            result = await reviews[key]
+            duplicate_of = reviewed_by[key] if reviewed_by[key] != item.file_path else None
+            if result.get("error"):
+                outcomes.append(BatchReviewOutcome(
+                    file_path=item.file_path, status="failed", error=result["error"],
+                    session_id=result.get("session_id"), duplicate_of=duplicate_of,
+                ))
+                continue
+            report = FinalReport.model_validate(result).model_dump()
+            await asyncio.to_thread(_write_json, output_path, report)
+            totals = (result.get("trace") or {}).get("totals") or {}
+            outcomes.append(BatchReviewOutcome(
+                file_path=item.file_path,
+                status="succeeded",
+                output_path=output_path,
+                duplicate_of=duplicate_of,
+                # 使い回した結果の時間・呼び出し回数・コストは、実際にレビューした資料にのみ計上する
+                duration_seconds=0.0 if duplicate_of else result["duration_seconds"],
+                llm_calls=0 if duplicate_of else totals.get("llm_calls", 0),
+                cost_usd=0.0 if duplicate_of else totals.get("cost_usd", 0.0),
+            ))
+    finally:
+        for task in reviews.values():
+            task.cancel()
+        configure_batch_prediction(None)
+    wall_seconds = time.perf_counter() - wall_start
+
+    succeeded = sum(1 for outcome in outcomes if outcome.status == "succeeded")
+    summary = BatchReviewSummary(
+        total=len(items),
+        succeeded=succeeded,
+        failed=sum(1 for outcome in outcomes if outcome.status == "failed"),
+        skipped=sum(1 for outcome in outcomes if outcome.status == "skipped"),
+        deduplicated=sum(1 for outcome in outcomes if outcome.duplicate_of),
+        wall_seconds=wall_seconds,
+        throughput_per_min=succeeded / wall_seconds * 60 if wall_seconds > 0 else 0.0,
+        llm_calls=sum(outcome.llm_calls for outcome in outcomes),
+        cost_usd=sum(outcome.cost_usd for outcome in outcomes),
+        outcomes=outcomes,
+    )
+    await asyncio.to_thread(_write_json, os.path.join(output_dir, BATCH_SUMMARY_FILE_NAME), summary.model_dump())
+    logger.info(
+        f"Batch review finished: {summary.succeeded}/{summary.total} succeeded, {summary.failed} failed, "
+        f"{summary.skipped} skipped, {summary.deduplicated} deduplicated in {wall_seconds:.1f}s "
+        f"({summary.throughput_per_min:.1f} decks/min, {summary.llm_calls} LLM calls, ${summary.cost_usd:.4f})"
+    )
+    return summary
@@ -1,11 +1,51 @@
 # presenta_ai/adk_logic/callbacks.py (修正版)
 
-from typing import Callable, Optional, Awaitable
+import asyncio
+import json
+from typing import Callable, List, Optional, Awaitable, Tuple
+from google.adk.agents import BaseAgent, LlmAgent
 from google.adk.agents.callback_context import CallbackContext
 from google.adk.models import LlmResponse, LlmRequest
 from google import genai
 from google.genai import types
 from logging import getLogger
+from adk_logic.analysis_cache import get_analysis_cache, build_analysis_cache_key
+from adk_logic.analysis_prefetch import get_analysis_prefetcher
+from adk_logic.result_cache import RESULT_CACHE_ENABLED, build_result_cache_key, get_result_cache
+from adk_logic.context_cache import (
+    CONTEXT_CACHE_MODE,
+    CONTEXT_CACHE_MIN_CHARS,
+    get_shared_context_caches,
+)
+from adk_logic.tracing import RunTrace, get_trace_recorder
+from adk_logic.rate_governor import RATE_GOVERNOR_METADATA_KEY
+from adk_logic.prompts.base_prompts import SHARED_CONTEXT_END_MARKER
+from adk_logic.document_store import (
+    INLINE_DOCUMENT_MAX_BYTES,
+    LLM_SUPPORTED_MIME_TYPES,
+    detect_mime_type,
+    get_document_store,
+)
+from adk_logic.document_serializer import (
+    SLIDE_OUTLINE_KEY,
+    build_slide_outline,
+    document_context_key,
+    serialize_document_analysis,
+    estimate_tokens,
+)
+from adk_logic.slide_index import get_slide_index
+from adk_logic.revision import align_revised_slides, build_revised_analysis
+from adk_logic.slide_review_store import (
+    REUSED_SLIDE_NUMBERS_KEY,
+    REUSED_SLIDE_REVIEWS_KEY,
+    find_reusable_slide_reviews,
+    save_slide_reviews,
+)
+from adk_logic.tools.document_parser_tool import (
+    parse_presentation_document,
+    find_sparse_slides,
+    merge_analysis_results,
+)
 logger = getLogger(__name__)
 
 # ADKが要求するコールバック関数の型エイリアスを定義
@@ -22,8 +62,8 @@ def before_agent_callback(callback_context: CallbackContext) -> None:
 
     if agent_name == "DocumentAnalyzerAgent":
         message = "プレゼン資料の解析を開始します... 📄"
-    elif agent_name == "ReviewerParallelAgent":
-        message = "各専門家による並行レビューを開始します... 👥"
+    elif agent_name.startswith("ParallelStage"):
+        message = "複数のエージェントが並行して作業を開始します... 👥"
     elif agent_name == "LogicCriticAgent":
         selection = selected_configs.get("logic_critic")
         mode = "辛口モード" if selection == "strict" else "寄り添いモード"
@@ -36,6 +76,12 @@ def before_agent_callback(callback_context: CallbackContext) -> None:
         message = "各レビューを統合し、最終レポートを作成しています... 📝"
     elif agent_name == "QnaGeneratorAgent":
         message = "想定問答集を生成しています... 💬"
+    elif agent_name == "ChunkedReviewAgent":
+        message = "資料をいくつかのパートに分けて並行レビューを開始します... 📚"
+    elif agent_name.startswith("ChunkReviewerAgent_"):
+        message = f"パート{int(agent_name.rsplit('_', 1)[1]) + 1} をレビュー中です... 🔍"
+    elif agent_name == "ReportReducerAgent":
+        message = "各パートのレビューを統合し、総評を作成しています... 📝"
     
     if message:
         # UIへの通知は同期待ち受けしない
@@ -45,29 +91,39 @@ def before_agent_callback(callback_context: CallbackContext) -> None:
 
 
 
-def add_document_to_request_callback(
+async def add_document_to_request_callback(
     callback_context: CallbackContext, llm_request: LlmRequest
 ) -> Optional[LlmResponse]:
     """
-    StateからGCSファイルパスを取得し、LLMリクエストにファイルパートとして追加する。
+    Stateの資料ハンドルから資料を取得し、LLMリクエストにファイルパートとして追加する。
     このコールバックは before_model_callback として使用される。
     戻り値としてNoneを返すと、変更が適用されたllm_requestで処理が続行される。
+
+    資料がプロセス内に保持されていて十分小さい場合は、ストレージへの保存完了を待たずにリクエストへ直接埋め込む。
+    それ以外の場合は保存の完了を待ってから、正しいMIMEタイプとともにURIで渡す。
     """
     logger.info("Executing add_document_to_request_callback...")
-    gcs_file_path = callback_context.state.get("gcs_file_path")
+    document = callback_context.state.get("document")
+    gcs_file_path = document["uri"] if document else callback_context.state.get("gcs_file_path")
 
     if not gcs_file_path or not isinstance(gcs_file_path, str):
         logger.warning(
-            "gcs_file_path not found or invalid in state. Skipping file attachment. "
+            "Document not found or invalid in state. Skipping file attachment. "
             f"State: {callback_context.state}"
         )
         return None  # 何もせず処理を続行
 
-    logger.info(f"Found gcs_file_path: {gcs_file_path}")
-
     try:
-        # GCS URIからファイルパートを作成
-        file_part = types.Part.from_uri(file_uri=gcs_file_path, mime_type="application/pdf")
+        mime_type = document["mime_type"] if document else (detect_mime_type(gcs_file_path) or "application/pdf")
+        blob = get_document_store().get_bytes(document["sha256"]) if document else None
+        if blob is not None and len(blob) <= INLINE_DOCUMENT_MAX_BYTES:
+            file_part = types.Part.from_bytes(data=blob, mime_type=mime_type)
+            logger.info(f"Attaching document inline: {len(blob)} bytes ({mime_type})")
+        else:
+            # バックグラウンドでの保存が終わるまで待つ（別スレッドで待ち、イベントループは塞がない）
+            gcs_file_path = await asyncio.to_thread(get_document_store().wait_until_stored, gcs_file_path)
+            file_part = types.Part.from_uri(file_uri=gcs_file_path, mime_type=mime_type)
+            logger.info(f"Attaching document by URI: {gcs_file_path} ({mime_type})")
 
         # LlmRequestのpartsリストにファイルパートを追加
         # 既存のプロンプトにファイルを追加
@@ -79,4 +135,618 @@ def add_document_to_request_callback(
         # エラー発生時は何もしない（あるいはエラーをStateに記録する）
 
     # `None`を返すことで、変更された`llm_request`で処理が続行される
-    return None
\ No newline at end of file
+    return None
+
+
+def restore_cached_analysis_callback(callback_context: CallbackContext) -> Optional[types.Content]:
+    """
+    同一ファイルの解析結果がキャッシュにあれば、DocumentAnalyzerAgentの実行をスキップする。
+    このコールバックは before_agent_callback として使用される。
+    Contentを返すとエージェント本体は実行されず、その内容がoutput_keyに保存される。
+    """
+    document_sha256 = callback_context.state.get("document_sha256")
+    if not document_sha256:
+        return None
+
+    analysis_mode = callback_context.state.get("analysis_mode", "llm")
+    cache = get_analysis_cache()
+    cached_analysis = cache.get(build_analysis_cache_key(document_sha256, analysis_mode))
+    if cached_analysis is None:
+        logger.info(f"Analysis cache miss: {document_sha256[:12]} stats={cache.stats()}")
+        return None
+
+    logger.info(f"Analysis cache hit: {document_sha256[:12]} stats={cache.stats()}")
+    _end_skipped_agent_span(callback_context, cache_hit="analysis_cache")
+    return types.Content(
+        role="model",
+        parts=[types.Part(text=json.dumps(cached_analysis, ensure_ascii=False))],
+    )
+
+
+async def attach_prefetched_analysis_callback(callback_context: CallbackContext) -> Optional[types.Content]:
+    """
+    レビューの開始前に始めた同じ資料・解析方式の先行解析があれば、その完了を待って結果を使い、
+    DocumentAnalyzerAgentの実行をスキップする。先行解析がない、または失敗した場合は通常どおり解析する。
+    このコールバックは before_agent_callback として使用される。
+    """
+    document_sha256 = callback_context.state.get("document_sha256")
+    if not document_sha256:
+        return None
+    analysis = await get_analysis_prefetcher().wait(
+        document_sha256, callback_context.state.get("analysis_mode", "llm")
+    )
+    if analysis is None:
+        return None
+    logger.info(f"Attached prefetched analysis: {document_sha256[:12]} stats={get_analysis_prefetcher().stats()}")
+    _end_skipped_agent_span(callback_context, cache_hit="prefetch")
+    return types.Content(
+        role="model",
+        parts=[types.Part(text=json.dumps(analysis, ensure_ascii=False))],
+    )
+
+
+def store_analysis_in_cache_callback(callback_context: CallbackContext) -> Optional[types.Content]:
+    """
+    DocumentAnalyzerAgentの解析結果をキャッシュに保存する。
+    このコールバックは after_agent_callback として使用される。
+    """
+    document_sha256 = callback_context.state.get("document_sha256")
+    analysis = callback_context.state.get("document_analysis")
+    if not document_sha256 or not isinstance(analysis, dict):
+        return None
+    if analysis.get("error"):
+        # 解析に失敗した結果はキャッシュしない
+        return None
+
+    try:
+        analysis_mode = callback_context.state.get("analysis_mode", "llm")
+        get_analysis_cache().put(build_analysis_cache_key(document_sha256, analysis_mode), analysis)
+    except OSError as e:
+        logger.warning(f"Failed to store analysis cache: {e}")
+    return None
+
+
+def _effective_analysis_mode(callback_context: CallbackContext) -> str:
+    """Stateの analysis_mode を返す。LLMが読み込めない形式（PPTXなど）の資料は、指定にかかわらず local とする。"""
+    document = callback_context.state.get("document")
+    if document and document["mime_type"] not in LLM_SUPPORTED_MIME_TYPES:
+        return "local"
+    return callback_context.state.get("analysis_mode", "llm")
+
+
+async def _extract_document_locally(document: Optional[dict], gcs_file_path: str) -> dict:
+    """
+    資料からテキストをローカル抽出する。
+    ダウンロードと抽出は同期処理のため、イベントループを塞がないよう別スレッドで実行する。
+    資料がプロセス内に保持されていれば、ストレージからは読み込まない。
+    ファイル名は、アップロードごとに異なる保存先のオブジェクト名ではなく元のファイル名を記録する
+    (プロンプトに含まれるため、同じ資料なら同じプロンプトになり、エージェントの応答のキャッシュが効く)。
+    """
+    blob = get_document_store().get_bytes(document["sha256"]) if document else None
+    return await asyncio.to_thread(
+        parse_presentation_document, gcs_file_path, blob, document["file_name"] if document else None
+    )
+
+
+async def revision_analysis_callback(callback_context: CallbackContext) -> Optional[types.Content]:
+    """
+    改訂版の資料のレビュー (Stateに previous_review がある場合) で、変更のあったスライドのみを解析する。
+    このコールバックは before_agent_callback として使用される。
+
+    改訂前後の資料をローカル抽出したテキストでスライドを対応付け、変更のないスライドは改訂前の解析結果を引き継ぐ。
+    変更・追加されたスライドは analysis_mode に従って解析する（llm: LLMで解析、hybrid: テキストが不足する場合のみLLMで解析、
+    local: ローカル抽出の結果を使う）。LLMで解析するページがなければ、エージェント本体の実行をスキップする。
+    LLMで解析する場合は、hybridモードと同様に local_document_analysis と llm_analysis_pages をStateに記録し、
+    merge_hybrid_analysis_callback でマージする。
+    """
+    previous_review = callback_context.state.get("previous_review")
+    if not previous_review:
+        return None
+
+    document = callback_context.state.get("document")
+    gcs_file_path = document["uri"] if document else callback_context.state.get("gcs_file_path")
+    local_result = await _extract_document_locally(document, gcs_file_path)
+    if local_result.get("error"):
+        logger.warning(f"Local extraction of the revised document failed, analyzing all slides: {local_result['error']}")
+        return None
+
+    # 改訂前の資料も同じ方式で抽出し、抽出方法の違い（LLMによる解析結果との差）を変更と見なさないようにする
+    # 改訂前の資料を読み込めない場合は、改訂前の解析結果と比較する
+    previous_slides = previous_review["document_analysis"]["slides"]
+    previous_document = previous_review.get("document")
+    if previous_document:
+        previous_local = await _extract_document_locally(previous_document, previous_document["uri"])
+        if previous_local.get("error"):
+            logger.warning(f"Local extraction of the previous document failed: {previous_local['error']}")
+        else:
+            previous_slides = previous_local["slides"]
+
+    slide_map = align_revised_slides(previous_slides, local_result["slides"])
+    revised_analysis = build_revised_analysis(previous_review["document_analysis"], local_result, slide_map)
+    changed_slide_numbers = [
+        slide["slide_number"] for slide in local_result["slides"] if slide["slide_number"] not in slide_map
+    ]
+    logger.info(
+        f"Revision diff: {len(slide_map)} unchanged, {len(changed_slide_numbers)} changed or added "
+        f"(previous: {len(previous_review['document_analysis']['slides'])} slides)"
+    )
+    trace = _get_run_trace(callback_context)
+    if trace is not None:
+        trace.annotate_agent(
+            callback_context.agent_name,
+            revision_unchanged_slides=len(slide_map),
+            revision_changed_slides=len(changed_slide_numbers),
+        )
+
+    analysis_mode = _effective_analysis_mode(callback_context)
+    if analysis_mode == "llm":
+        llm_analysis_pages = changed_slide_numbers
+    elif analysis_mode == "hybrid":
+        changed_slides = [slide for slide in local_result["slides"] if slide["slide_number"] not in slide_map]
+        llm_analysis_pages = find_sparse_slides(changed_slides)
+    else:
+        llm_analysis_pages = []
+
+    if not llm_analysis_pages:
+        _end_skipped_agent_span(callback_context, analysis_mode=analysis_mode, revision=True)
+        return types.Content(role="model", parts=[types.Part(text=json.dumps(revised_analysis, ensure_ascii=False))])
+
+    callback_context.state["local_document_analysis"] = revised_analysis
+    callback_context.state["llm_analysis_pages"] = llm_analysis_pages
+    return None
+
+
+async def local_analysis_callback(callback_context: CallbackContext) -> Optional[types.Content]:
+    """
+    analysis_modeが local / hybrid の場合、LLMを使わずに資料からテキストをローカル抽出する。
+    このコールバックは before_agent_callback として使用される。
+
+    - local: 抽出結果をそのまま解析結果とし、エージェント本体の実行をスキップする。
+    - hybrid: テキストが不足するページのみをLLMの解析対象としてStateに記録し、エージェント本体を実行する。
+      全ページから十分なテキストが取れた場合はlocalと同様にスキップする。
+    - LLMが読み込めない形式（PPTX）の資料は、analysis_modeにかかわらず local として扱う。
+    """
+    if callback_context.state.get("llm_analysis_pages"):
+        # revision_analysis_callback がLLMで解析するページを決めている
+        return None
+    analysis_mode = _effective_analysis_mode(callback_context)
+    if analysis_mode == "llm":
+        return None
+
+    document = callback_context.state.get("document")
+    gcs_file_path = document["uri"] if document else callback_context.state.get("gcs_file_path")
+    local_result = await _extract_document_locally(document, gcs_file_path)
+
+    if local_result.get("error"):
+        if analysis_mode == "local":
+            logger.warning(f"Local extraction failed: {local_result['error']}")
+            _end_skipped_agent_span(callback_context, analysis_mode="local", error=local_result["error"])
+            return types.Content(role="model", parts=[types.Part(text=json.dumps(local_result, ensure_ascii=False))])
+        # hybridの場合は資料全体をLLMで解析する
+        logger.warning(f"Local extraction failed, falling back to LLM analysis: {local_result['error']}")
+        return None
+
+    sparse_slide_numbers = find_sparse_slides(local_result["slides"]) if analysis_mode == "hybrid" else []
+    if not sparse_slide_numbers:
+        logger.info(f"Local extraction completed: {local_result['total_slides']} slides ({analysis_mode})")
+        _end_skipped_agent_span(callback_context, analysis_mode=analysis_mode)
+        return types.Content(role="model", parts=[types.Part(text=json.dumps(local_result, ensure_ascii=False))])
+
+    logger.info(
+        f"Local extraction completed: {local_result['total_slides']} slides, "
+        f"LLM analysis required for slides {sparse_slide_numbers}"
+    )
+    callback_context.state["local_document_analysis"] = local_result
+    callback_context.state["llm_analysis_pages"] = sparse_slide_numbers
+    return None
+
+
+def restrict_analysis_pages_callback(
+    callback_context: CallbackContext, llm_request: LlmRequest
+) -> Optional[LlmResponse]:
+    """
+    hybridモードや改訂版の資料のレビューでLLMに解析させるページが指定されている場合、対象ページをリクエストに追記する。
+    このコールバックは before_model_callback として使用される。
+    """
+    llm_analysis_pages = callback_context.state.get("llm_analysis_pages")
+    if not llm_analysis_pages:
+        return None
+
+    pages = ", ".join(str(page) for page in llm_analysis_pages)
+    llm_request.contents[0].parts.append(types.Part(text=(
+        f"今回はスライド番号 {pages} のみを解析対象とし、それ以外のスライドは出力に含めないでください。"
+        "slide_numberには資料全体での通し番号をそのまま使用してください。"
+    )))
+    return None
+
+
+def merge_hybrid_analysis_callback(callback_context: CallbackContext) -> Optional[types.Content]:
+    """
+    hybridモードや改訂版の資料のレビューで、ローカル抽出（または改訂前から引き継いだ）結果と
+    LLMによる解析結果を1つのDocumentAnalysisResultにマージする。
+    このコールバックは after_agent_callback として使用される。
+    """
+    local_result = callback_context.state.get("local_document_analysis")
+    llm_analysis_pages = callback_context.state.get("llm_analysis_pages")
+    llm_result = callback_context.state.get("document_analysis")
+    if not local_result or not llm_analysis_pages or not isinstance(llm_result, dict):
+        return None
+
+    if llm_result.get("error"):
+        # LLMでの解析に失敗しても、ローカル抽出できたページの結果は活かす
+        logger.warning(f"LLM analysis for sparse slides failed: {llm_result['error']}")
+        callback_context.state["document_analysis"] = local_result
+    else:
+        callback_context.state["document_analysis"] = merge_analysis_results(
+            local_result, llm_result, llm_analysis_pages
+        )
+    callback_context.state["local_document_analysis"] = None
+    callback_context.state["llm_analysis_pages"] = None
+    return None
+
+
+def create_document_context_callback(document_format: str) -> Callable[[CallbackContext], None]:
+    """
+    document_analysis を指定した形式でシリアライズし、プロンプトから参照できるようにStateへ書き込む
+    before_agent_callback を生成する。同じ形式を使う他のエージェントが書き込み済みであれば再利用する。
+    """
+    state_key = document_context_key(document_format)
+
+    def prepare_document_context_callback(callback_context: CallbackContext) -> None:
+        analysis = callback_context.state.get("document_analysis")
+        if callback_context.state.get(state_key) is not None or not isinstance(analysis, dict):
+            return None
+        document_context = serialize_document_analysis(analysis, document_format)
+        callback_context.state[state_key] = document_context
+        logger.info(f"Serialized document analysis as {document_format}: ~{estimate_tokens(document_context)} tokens")
+        return None
+
+    return prepare_document_context_callback
+
+
+def keep_only_user_message_callback(
+    callback_context: CallbackContext, llm_request: LlmRequest
+) -> Optional[LlmResponse]:
+    """
+    リクエストの会話履歴を、ユーザーからの依頼メッセージのみにする。
+    レビューエージェントは資料情報や他エージェントの出力をプロンプトのプレースホルダで受け取るため、
+    include_contents="none" でも残る直前のエージェントの出力（資料解析結果など）を重複して送らないようにする。
+    このコールバックは before_model_callback として使用される。
+    """
+    if callback_context.user_content is not None:
+        llm_request.contents = [callback_context.user_content]
+    return None
+
+
+def keep_user_message_and_tool_turns_callback(
+    callback_context: CallbackContext, llm_request: LlmRequest
+) -> Optional[LlmResponse]:
+    """
+    keep_only_user_message_callback と同様に会話履歴をユーザーからの依頼メッセージのみにするが、
+    このエージェントのツールの呼び出しとその結果は残す。ツールを使うエージェントで使用する。
+    このコールバックは before_model_callback として使用される。
+    """
+    if callback_context.user_content is None:
+        return None
+    tool_names = set(llm_request.tools_dict)
+    tool_turns = [
+        content for content in llm_request.contents
+        if any(
+            (part.function_call and part.function_call.name in tool_names)
+            or (part.function_response and part.function_response.name in tool_names)
+            for part in content.parts or []
+        )
+    ]
+    llm_request.contents = [callback_context.user_content, *tool_turns]
+    return None
+
+
+async def prepare_slide_outline_callback(callback_context: CallbackContext) -> None:
+    """
+    資料全体の代わりにプロンプトへ埋め込むスライド一覧をStateへ書き込み、スライドの検索インデックスを作成しておく
+    before_agent_callback。search_slides ツールを使うエージェントで使用する。
+    """
+    analysis = callback_context.state.get("document_analysis")
+    if not isinstance(analysis, dict):
+        return None
+    if callback_context.state.get(SLIDE_OUTLINE_KEY) is None:
+        callback_context.state[SLIDE_OUTLINE_KEY] = build_slide_outline(analysis)
+    # 最初の検索でインデックスの作成を待たないよう、ここで作成する（プロセス内で使い回される）
+    await asyncio.to_thread(get_slide_index, analysis)
+    return None
+
+
+async def match_reusable_slide_reviews_callback(callback_context: CallbackContext) -> None:
+    """
+    過去の資料とほぼ同じスライドを探し、保存済みのレビューと、プロンプトに埋め込むスライド番号の一覧をStateへ書き込む
+    before_agent_callback。レポート統合エージェントで使用し、再利用するスライドのレビューは生成させない。
+    """
+    analysis = callback_context.state.get("document_analysis")
+    if not isinstance(analysis, dict):
+        return None
+    reused_reviews = await find_reusable_slide_reviews(callback_context.state, analysis.get("slides") or [])
+    callback_context.state[REUSED_SLIDE_REVIEWS_KEY] = [reused_reviews[number] for number in sorted(reused_reviews)]
+    callback_context.state[REUSED_SLIDE_NUMBERS_KEY] = ", ".join(str(number) for number in sorted(reused_reviews)) or "なし"
+    trace = _get_run_trace(callback_context)
+    if trace is not None:
+        trace.annotate_agent(callback_context.agent_name, reused_slide_reviews=len(reused_reviews))
+    return None
+
+
+async def merge_reused_slide_reviews_callback(callback_context: CallbackContext) -> None:
+    """
+    match_reusable_slide_reviews_callback で再利用したレビューを最終レポートに加え、
+    LLMが新たに生成したスライドごとのレビューを以降のレビューで再利用できるように保存する after_agent_callback。
+    """
+    final_report = callback_context.state.get("final_report")
+    analysis = callback_context.state.get("document_analysis")
+    if not isinstance(final_report, dict) or not isinstance(analysis, dict):
+        return None
+    reused_reviews = {review["slide_number"]: review for review in callback_context.state.get(REUSED_SLIDE_REVIEWS_KEY) or []}
+    generated_reviews = final_report.get("slide_by_slide_reviews") or []
+    await save_slide_reviews(
+        callback_context.state,
+        analysis.get("slides") or [],
+        [review for review in generated_reviews if review.get("slide_number") not in reused_reviews],
+    )
+    if reused_reviews:
+        # 指示に反して再利用するスライドのレビューも生成された場合は、新しいレビューを優先する
+        reviews_by_slide = {**reused_reviews, **{review["slide_number"]: review for review in generated_reviews}}
+        callback_context.state["final_report"] = {
+            **final_report,
+            "slide_by_slide_reviews": [reviews_by_slide[number] for number in sorted(reviews_by_slide)],
+        }
+    callback_context.state[REUSED_SLIDE_REVIEWS_KEY] = None
+    callback_context.state[REUSED_SLIDE_NUMBERS_KEY] = None
+    return None
+
+
+async def use_shared_context_cache_callback(
+    callback_context: CallbackContext, llm_request: LlmRequest
+) -> Optional[LlmResponse]:
+    """
+    CONTEXT_CACHE_MODE が explicit の場合、システム指示の先頭にある全エージェント共通の資料情報を
+    セッションごとの明示的なコンテキストキャッシュに置き換える。
+    このコールバックは before_model_callback として使用される。
+
+    キャッシュを使うリクエストではシステム指示を指定できないため、エージェント固有の指示はユーザーメッセージの先頭に移す。
+    キャッシュを作成できない場合は何もせず、通常のリクエスト（暗黙キャッシュ）として続行する。
+    """
+    if CONTEXT_CACHE_MODE != "explicit":
+        return None
+
+    system_instruction = llm_request.config.system_instruction if llm_request.config else None
+    if not isinstance(system_instruction, str) or SHARED_CONTEXT_END_MARKER not in system_instruction:
+        return None
+    shared_prefix, agent_instruction = system_instruction.split(SHARED_CONTEXT_END_MARKER, 1)
+    shared_prefix += SHARED_CONTEXT_END_MARKER
+    if len(shared_prefix) < CONTEXT_CACHE_MIN_CHARS:
+        return None
+
+    try:
+        cache_name = await get_shared_context_caches().get_or_create(
+            callback_context.session.id, llm_request.model, shared_prefix
+        )
+    except Exception as e:
+        logger.warning(f"Failed to create context cache, sending the full prompt instead: {e}")
+        return None
+
+    llm_request.config.system_instruction = None
+    llm_request.config.cached_content = cache_name
+    llm_request.contents.insert(0, types.Content(role="user", parts=[types.Part(text=agent_instruction.strip())]))
+    return None
+
+
+def _get_run_trace(callback_context: CallbackContext) -> Optional[RunTrace]:
+    """実行中のレビューのタイムラインを返す。run_review_process 以外から実行された場合はNone。"""
+    return get_trace_recorder().get(callback_context.session.id)
+
+
+def _end_skipped_agent_span(callback_context: CallbackContext, **attributes) -> None:
+    """before_agent_callback でエージェントの実行をスキップする場合に、エージェントのスパンを閉じる"""
+    trace = _get_run_trace(callback_context)
+    if trace is not None:
+        trace.end_agent(callback_context.agent_name, status="skipped", **attributes)
+
+
+def create_agent_trace_callbacks(
+    parent_agent_name: Optional[str] = None,
+) -> Tuple[Callable[[CallbackContext], None], Callable[[CallbackContext], None]]:
+    """
+    エージェントの開始・終了をタイムラインに記録する before_agent_callback / after_agent_callback の組を生成する。
+    親エージェントの名前は、スパンの親子関係を記録するために使う。
+    """
+
+    def trace_agent_start_callback(callback_context: CallbackContext) -> None:
+        trace = _get_run_trace(callback_context)
+        if trace is not None:
+            trace.start_agent(callback_context.agent_name, parent_agent_name)
+        return None
+
+    def trace_agent_end_callback(callback_context: CallbackContext) -> None:
+        trace = _get_run_trace(callback_context)
+        if trace is not None:
+            trace.end_agent(callback_context.agent_name)
+        return None
+
+    return trace_agent_start_callback, trace_agent_end_callback
+
+
+def trace_model_start_callback(
+    callback_context: CallbackContext, llm_request: LlmRequest
+) -> Optional[LlmResponse]:
+    """
+    LLM呼び出しの開始をタイムラインに記録する。
+    他のコールバックによるリクエストの準備時間を含めないよう、before_model_callback の最後に設定する。
+    """
+    trace = _get_run_trace(callback_context)
+    if trace is not None:
+        trace.start_model(callback_context.agent_name, llm_request.model)
+    return None
+
+
+def trace_model_end_callback(
+    callback_context: CallbackContext, llm_response: LlmResponse
+) -> Optional[LlmResponse]:
+    """
+    LLM呼び出しの終了と、応答に含まれるトークン使用量（キャッシュ済み / 新規の入力トークン、出力トークン）を記録する。
+    流量制御を経由した呼び出しでは、順番待ちの時間と試行回数も記録する。
+    このコールバックは after_model_callback として使用される。
+    """
+    trace = _get_run_trace(callback_context)
+    if trace is None or llm_response.partial:
+        return None
+    governor_metadata = (llm_response.custom_metadata or {}).get(RATE_GOVERNOR_METADATA_KEY) or {}
+    trace.end_model(callback_context.agent_name, usage=llm_response.usage_metadata, **governor_metadata)
+    return None
+
+
+def trace_model_error_callback(
+    callback_context: CallbackContext, llm_request: LlmRequest, error: Exception
+) -> Optional[LlmResponse]:
+    """
+    LLM呼び出しの失敗を記録する。同じエージェントの次の呼び出しはリトライとして記録される。
+    このコールバックは on_model_error_callback として使用される。Noneを返すため、エラーはそのまま送出される。
+    """
+    trace = _get_run_trace(callback_context)
+    if trace is not None:
+        trace.end_model(callback_context.agent_name, error=error)
+    return None
+
+
+def _as_callback_list(callback) -> List[Callable]:
+    if callback is None:
+        return []
+    return list(callback) if isinstance(callback, list) else [callback]
+
+
+def instrument_agent_tree(agent: BaseAgent, parent_agent_name: Optional[str] = None) -> BaseAgent:
+    """
+    エージェントとそのサブエージェントすべてに、タイムラインを記録するコールバックを追加する。
+    既存のコールバックより外側で計測するよう、開始の記録は先頭に、終了の記録は末尾に追加する。
+    """
+    trace_agent_start_callback, trace_agent_end_callback = create_agent_trace_callbacks(parent_agent_name)
+    agent.before_agent_callback = [trace_agent_start_callback] + _as_callback_list(agent.before_agent_callback)
+    agent.after_agent_callback = _as_callback_list(agent.after_agent_callback) + [trace_agent_end_callback]
+    if isinstance(agent, LlmAgent):
+        agent.before_model_callback = _as_callback_list(agent.before_model_callback) + [trace_model_start_callback]
+        agent.after_model_callback = [trace_model_end_callback] + _as_callback_list(agent.after_model_callback)
+        agent.on_model_error_callback = [trace_model_error_callback] + _as_callback_list(agent.on_model_error_callback)
+    for sub_agent in agent.sub_agents:
+        instrument_agent_tree(sub_agent, agent.name)
+    return agent
+
+
+def _is_completed_output(value) -> bool:
+    # 資料解析に失敗した結果 ({"error": ...}) は完了とみなさない
+    return value is not None and not (isinstance(value, dict) and value.get("error"))
+
+
+def create_checkpoint_callback(output_keys: Tuple[str, ...]) -> Callable[[CallbackContext], Optional[types.Content]]:
+    """
+    エージェントの成果物がすべてStateに保存済みであれば、エージェントの実行をスキップする before_agent_callback を生成する。
+    失敗・中断したレビューを同じセッションで再開する際に、完了済みの段階を再計算しないために使う。
+    """
+
+    def restore_checkpoint_callback(callback_context: CallbackContext) -> Optional[types.Content]:
+        values = [callback_context.state.get(key) for key in output_keys]
+        if not all(_is_completed_output(value) for value in values):
+            return None
+        logger.info(f"Checkpoint hit: {callback_context.agent_name} ({', '.join(output_keys)})")
+        _end_skipped_agent_span(callback_context, cache_hit="checkpoint")
+        # output_key を持つエージェントでは、返した内容がそのまま output_key に保存し直される
+        value = values[0]
+        return types.Content(
+            role="model",
+            parts=[types.Part(text=value if isinstance(value, str) else json.dumps(value, ensure_ascii=False))],
+        )
+
+    return restore_checkpoint_callback
+
+
+def enable_stage_checkpoints(agent: BaseAgent) -> BaseAgent:
+    """
+    Stateに成果物を書き込むエージェント（LlmAgent の output_key、カスタムエージェントの state_writes）に、
+    保存済みの成果物があれば実行をスキップするコールバックを追加する。ワークフローエージェントはサブエージェントに追加する。
+    """
+    if isinstance(agent, LlmAgent):
+        output_keys: Tuple[str, ...] = (agent.output_key,) if agent.output_key else ()
+    else:
+        output_keys = tuple(getattr(agent, "state_writes", ()) or ())
+    if output_keys:
+        agent.before_agent_callback = [create_checkpoint_callback(output_keys)] + _as_callback_list(agent.before_agent_callback)
+        return agent
+    for sub_agent in agent.sub_agents:
+        enable_stage_checkpoints(sub_agent)
+    return agent
+
+
+def _result_cache_state_key(agent_name: str) -> str:
+    # 並行実行されるエージェント同士で衝突しないよう、エージェント名ごとの一時的なStateに記録する
+    return f"temp:result_cache_key_{agent_name}"
+
+
+def restore_memoized_result_callback(
+    callback_context: CallbackContext, llm_request: LlmRequest
+) -> Optional[LlmResponse]:
+    """
+    レンダリング済みのリクエストが以前の実行と同一であれば、LLMを呼び出さずに前回の応答を返す。
+    チーム編成の一部のみを変えて再実行した場合、入力の変わらないエージェントはLLMを呼び出さない。
+    このコールバックは before_model_callback として使用される。
+    """
+    key = build_result_cache_key(llm_request)
+    if key is None:
+        return None
+    cache = get_result_cache()
+    cached = cache.get(key)
+    if cached is None:
+        callback_context.state[_result_cache_state_key(callback_context.agent_name)] = key
+        return None
+
+    logger.info(f"Result cache hit: {callback_context.agent_name} stats={cache.stats()}")
+    trace = _get_run_trace(callback_context)
+    if trace is not None:
+        trace.annotate_agent(callback_context.agent_name, cache_hit="result_cache")
+    return LlmResponse(content=types.Content(role="model", parts=[types.Part(text=cached["text"])]))
+
+
+def store_memoized_result_callback(
+    callback_context: CallbackContext, llm_response: LlmResponse
+) -> Optional[LlmResponse]:
+    """
+    LLMの最終的な応答を、restore_memoized_result_callback で求めたキーで保存する。
+    このコールバックは after_model_callback として使用される。
+    """
+    if llm_response.partial or llm_response.error_code or not llm_response.content:
+        return None
+    key = callback_context.state.get(_result_cache_state_key(callback_context.agent_name))
+    parts = llm_response.content.parts or []
+    if not key or not parts or any(part.text is None or part.thought for part in parts):
+        return None
+    try:
+        get_result_cache().put(key, {
+            "agent_name": callback_context.agent_name,
+            "text": "".join(part.text for part in parts),
+        })
+    except OSError as e:
+        logger.warning(f"Failed to store result cache: {e}")
+    return None
+
+
+def enable_result_memoization(agent: BaseAgent) -> BaseAgent:
+    """
+    エージェントとそのサブエージェントのLlmAgentすべてに、応答をキャッシュするコールバックを追加する。
+    キーはリクエストを組み立てるコールバックの後、明示的なコンテキストキャッシュへの置き換えの前に求める。
+    RESULT_CACHE_ENABLED が false の場合は何もしない。
+    """
+    if not RESULT_CACHE_ENABLED:
+        return agent
+    if isinstance(agent, LlmAgent):
+        callbacks = _as_callback_list(agent.before_model_callback)
+        index = callbacks.index(use_shared_context_cache_callback) if use_shared_context_cache_callback in callbacks else len(callbacks)
+        callbacks.insert(index, restore_memoized_result_callback)
+        agent.before_model_callback = callbacks
+        agent.after_model_callback = _as_callback_list(agent.after_model_callback) + [store_memoized_result_callback]
+    for sub_agent in agent.sub_agents:
+        enable_result_memoization(sub_agent)
+    return agent
@@ -0,0 +1,77 @@
+import asyncio
+import hashlib
+import logging
+import os
+from collections import defaultdict
+from typing import Dict, Tuple
+
+from google.genai import types
+
+from adk_logic.genai_client import get_genai_client_pool
+from adk_logic.rate_governor import get_rate_governor
+
+logger = logging.getLogger(__name__)
+
+# 共通の資料情報のキャッシュ方式
+# - implicit: プロンプトの先頭を揃えるのみで、Geminiの暗黙キャッシュに任せる
+# - explicit: レビューごとに明示的なコンテキストキャッシュを作成し、全エージェントで再利用する
+CONTEXT_CACHE_MODE = os.environ.get("CONTEXT_CACHE_MODE", "implicit")
+CONTEXT_CACHE_TTL_SECONDS = int(os.environ.get("CONTEXT_CACHE_TTL_SECONDS", "900"))
+# 明示キャッシュには最小トークン数があるため、共通部分がこの文字数未満なら暗黙キャッシュに任せる
+CONTEXT_CACHE_MIN_CHARS = int(os.environ.get("CONTEXT_CACHE_MIN_CHARS", "4096"))
+
+CacheKey = Tuple[str, str]
+
+
+class SharedContextCacheRegistry:
+    """
+    セッション（レビュー1回）ごとに作成した明示的なコンテキストキャッシュを管理する。
+    並行実行されるエージェントが同時に要求しても、キャッシュは (モデル, 共通部分) ごとに1つだけ作成する。
+    """
+
+    def __init__(self):
+        self._caches: Dict[str, Dict[CacheKey, str]] = defaultdict(dict)
+        self._locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+    async def get_or_create(self, session_id: str, model: str, shared_prefix: str) -> str:
+        """共通部分を格納したキャッシュの名前を返す（初回のみ作成する）"""
+        key: CacheKey = (model, hashlib.sha256(shared_prefix.encode("utf-8")).hexdigest())
+        async with self._locks[session_id]:
+            cache_name = self._caches[session_id].get(key)
+            if cache_name is None:
+                client = get_genai_client_pool().get()
+                # キャッシュの作成もモデルのクォータを消費するため、LLM呼び出しと同じ流量制御を通す
+                cached_content = await get_rate_governor().call(model, lambda: client.aio.caches.create(
+                    model=model,
+                    config=types.CreateCachedContentConfig(
+                        contents=[types.Content(role="user", parts=[types.Part(text=shared_prefix)])],
+                        ttl=f"{CONTEXT_CACHE_TTL_SECONDS}s",
+                        display_name=f"presenta-ai-{session_id}"[:128],
+                    ),
+                ))
+                cache_name = cached_content.name
+                self._caches[session_id][key] = cache_name
+                logger.info(f"Created context cache {cache_name} for session {session_id} ({len(shared_prefix)} chars)")
+            return cache_name
+
+    async def release(self, session_id: str) -> None:
+        """セッションで作成したキャッシュを削除する。TTLで自動的に失効するため、削除の失敗は無視する。"""
+        caches = self._caches.pop(session_id, {})
+        self._locks.pop(session_id, None)
+        if not caches:
+            return
+        client = get_genai_client_pool().get()
+        for cache_name in caches.values():
+            try:
+                await client.aio.caches.delete(name=cache_name)
+            except Exception:
+                logger.warning(f"Failed to delete context cache {cache_name}.", exc_info=True)
+
+
+_shared_context_caches = SharedContextCacheRegistry()
+
+
+def get_shared_context_caches() -> SharedContextCacheRegistry:
+    """プロセス内で共有するコンテキストキャッシュのレジストリを返す"""
+    return _shared_context_caches
+
@@ -0,0 +1,170 @@
+import re
+import threading
+from typing import Any, Dict, List, Optional
+
+from utils.config_loader import get_cost_estimation_settings, get_model_pricing, load_config_options
+
+# 見積もりに使うモデル。レビューエージェントはすべてこのモデルで実行される
+ESTIMATION_MODEL = "gemini-2.5-pro"
+# 計測したトークン数を見積もりに反映する際の重み（指数移動平均）。大きいほど直近の実行を重視する
+OBSERVATION_WEIGHT = 0.3
+
+# チーム編成の設定項目と、その選択肢で実行されるエージェントの対応
+AGENT_TYPE_TO_AGENT = {
+    "logic_critic": "LogicCriticAgent",
+    "audience_persona": "AudiencePersonaAgent",
+    "qna_generator": "QnaGeneratorAgent",
+}
+
+_AGENT_INDEX_SUFFIX = re.compile(r"_\d+$")
+
+
+def agent_profile_key(agent_name: str) -> str:
+    """チャンクごとに生成されるエージェント名 (ChunkReviewerAgent_3 など) から、番号を除いた種別名を返す"""
+    return _AGENT_INDEX_SUFFIX.sub("", agent_name)
+
+
+def compute_cost_usd(
+    model: Optional[str],
+    fresh_input_tokens: float,
+    cached_input_tokens: float,
+    output_tokens: float,
+) -> float:
+    """
+    LLM呼び出し1回分のトークン数から、料金表に基づくコスト (USD) を計算する。
+    料金表に無いモデルの場合は0を返す。
+    """
+    pricing = get_model_pricing(model) if model else {}
+    if not pricing:
+        return 0.0
+    threshold = pricing.get("long_context_threshold")
+    suffix = "_long" if threshold and fresh_input_tokens + cached_input_tokens > threshold else ""
+    input_price = pricing.get(f"input{suffix}", pricing["input"])
+    cached_input_price = pricing.get(f"cached_input{suffix}", input_price)
+    output_price = pricing.get(f"output{suffix}", pricing["output"])
+    return (
+        fresh_input_tokens * input_price
+        + cached_input_tokens * cached_input_price
+        + output_tokens * output_price
+    ) / 1_000_000
+
+
+def review_agents(selected_configs: Dict[str, str], review_mode: str = "standard") -> List[str]:
+    """チーム編成とレビュー方式から、実行されるエージェントの種別名を返す（create_root_agent と同じ構成）"""
+    agents = ["DocumentAnalyzerAgent"]
+    if review_mode == "chunked":
+        agents += ["ChunkReviewerAgent", "ReportReducerAgent"]
+    else:
+        agents += ["LogicCriticAgent", "AudiencePersonaAgent", "ReportSynthesizerAgent"]
+    if selected_configs.get("qna_generator") == "enabled":
+        agents.append("QnaGeneratorAgent")
+    return agents
+
+
+class CostEstimator:
+    """
+    レビュー実行前のコスト見積もり。
+    設定ファイルのトークン数の目安から始め、レビューを実行するたびに計測したスライドあたりのトークン数とコストで更新する。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # エージェントの種別ごとの、スライドあたりの計測値（指数移動平均）
+        self._observed: Dict[str, Dict[str, float]] = {}
+
+    def observe(self, trace: Dict[str, Any], total_slides: int) -> None:
+        """
+        完了したレビューのタイムライン (RunTrace.to_dict()) から、エージェントごとの計測値を取り込む。
+        キャッシュの利用などでLLMを呼び出さなかったエージェントは取り込まない。
+        """
+        if total_slides <= 0:
+            return
+        per_agent: Dict[str, Dict[str, float]] = {}
+        for agent_name, entry in trace.get("agents", {}).items():
+            if not entry.get("llm_calls") or entry.get("errors"):
+                continue
+            totals = per_agent.setdefault(agent_profile_key(agent_name), {})
+            for key in ("fresh_input_tokens", "cached_input_tokens", "output_tokens", "cost_usd"):
+                totals[key] = totals.get(key, 0) + entry.get(key, 0)
+
+        with self._lock:
+            for profile_key, totals in per_agent.items():
+                per_slide = {key: value / total_slides for key, value in totals.items()}
+                previous = self._observed.get(profile_key)
+                self._observed[profile_key] = per_slide if previous is None else {
+                    key: previous[key] * (1 - OBSERVATION_WEIGHT) + value * OBSERVATION_WEIGHT
+                    for key, value in per_slide.items()
+                }
+
+    def estimate_agent(self, profile_key: str, total_slides: int) -> Dict[str, Any]:
+        """エージェント1種類分のトークン数とコストを見積もる"""
+        with self._lock:
+            observed = self._observed.get(profile_key)
+        if observed is not None:
+            estimate = {key: value * total_slides for key, value in observed.items()}
+            estimate["source"] = "measured"
+            return estimate
+
+        profile = get_cost_estimation_settings().get("token_profiles", {}).get(profile_key, {})
+        input_tokens = profile.get("base_input_tokens", 0) + profile.get("input_tokens_per_slide", 0) * total_slides
+        output_tokens = profile.get("base_output_tokens", 0) + profile.get("output_tokens_per_slide", 0) * total_slides
+        # 目安の値ではキャッシュは考慮せず、すべて新規の入力トークンとして見積もる（上限寄りの見積もり）
+        return {
+            "fresh_input_tokens": input_tokens,
+            "cached_input_tokens": 0,
+            "output_tokens": output_tokens,
+            "cost_usd": compute_cost_usd(ESTIMATION_MODEL, input_tokens, 0, output_tokens),
+            "source": "profile",
+        }
+
+    def estimate_review(
+        self,
+        selected_configs: Dict[str, str],
+        total_slides: Optional[int] = None,
+        review_mode: str = "standard",
+        analysis_mode: str = "llm",
+    ) -> Dict[str, Any]:
+        """
+        チーム編成ごとのレビュー全体のコストを見積もる。
+
+        Args:
+            selected_configs: ユーザーが選択したチーム編成設定。
+            total_slides: 資料のスライド数。不明な場合は設定ファイルの default_slides を使う。
+            review_mode: レビューの方式 ("standard", "chunked")。
+            analysis_mode: 資料解析の方式。"local" の場合、資料解析にはLLMを使わない。
+
+        Returns:
+            エージェントごとの見積もり (agents) と、合計のコスト (total_cost_usd) を含む辞書。
+        """
+        total_slides = total_slides or get_cost_estimation_settings().get("default_slides", 20)
+        agents = {
+            profile_key: self.estimate_agent(profile_key, total_slides)
+            for profile_key in review_agents(selected_configs, review_mode)
+            if not (profile_key == "DocumentAnalyzerAgent" and analysis_mode == "local")
+        }
+        return {
+            "total_slides": total_slides,
+            "agents": agents,
+            "total_cost_usd": sum(agent["cost_usd"] for agent in agents.values()),
+        }
+
+    def estimate_option_costs(self, total_slides: Optional[int] = None) -> Dict[str, Dict[str, float]]:
+        """チーム編成の選択肢ごとに、その選択肢で実行されるエージェントのコストを見積もる"""
+        total_slides = total_slides or get_cost_estimation_settings().get("default_slides", 20)
+        option_costs: Dict[str, Dict[str, float]] = {}
+        for agent_type, details in load_config_options()["agent_options"].items():
+            agent_cost = self.estimate_agent(AGENT_TYPE_TO_AGENT[agent_type], total_slides)["cost_usd"]
+            option_costs[agent_type] = {
+                # Q&A生成は "enabled" の場合のみ実行される
+                option["id"]: 0.0 if agent_type == "qna_generator" and option["id"] != "enabled" else agent_cost
+                for option in details["options"]
+            }
+        return option_costs
+
+
+_cost_estimator = CostEstimator()
+
+
+def get_cost_estimator() -> CostEstimator:
+    """プロセス内で共有するコスト見積もりを返す"""
+    return _cost_estimator
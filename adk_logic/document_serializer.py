@@ -0,0 +1,139 @@
+import json
+import os
+import re
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, List, Literal, Set, Union
+
+from adk_logic.state_models import DocumentAnalysisResult
+
+# レビューエージェントのプロンプトに埋め込む資料情報の形式
+# - json: DocumentAnalysisResult をそのままJSONにしたもの（従来の形式）
+# - compact: スライドごとの簡潔な行形式。空白の正規化と、全スライド共通のヘッダー・フッターの省略を行う
+# - compact_no_notes: compact から発表者ノートを除いたもの
+DocumentFormat = Literal["json", "compact", "compact_no_notes"]
+DOCUMENT_FORMATS = ("json", "compact", "compact_no_notes")
+DEFAULT_DOCUMENT_FORMAT = os.environ.get("DOCUMENT_CONTEXT_FORMAT", "compact")
+
+# プロンプト中のこのプレースホルダは、エージェントの生成時に形式ごとのStateキーに置き換えられる
+DOCUMENT_CONTEXT_PLACEHOLDER = "{{document_context}}"
+DOCUMENT_CONTEXT_KEY_PREFIX = "document_context_"
+
+# スライド番号とタイトルの一覧を保持するStateキー。資料全体を渡さず、必要なスライドを検索させるエージェントが参照する
+SLIDE_OUTLINE_KEY = "slide_outline"
+
+# この割合以上のスライドに現れる行は、ヘッダー・フッターとみなして1度だけ記載する
+REPEATED_LINE_MIN_RATIO = 0.5
+REPEATED_LINE_MIN_SLIDES = 3
+
+_WHITESPACE_PATTERN = re.compile(r"[ \t　\r\f\v]+")
+_ALL_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def document_context_key(document_format: str) -> str:
+    """形式に対応する、シリアライズ済みの資料情報を保持するStateキーを返す"""
+    if document_format not in DOCUMENT_FORMATS:
+        raise ValueError(f"Unsupported document format: {document_format}")
+    return f"{DOCUMENT_CONTEXT_KEY_PREFIX}{document_format}"
+
+
+def bind_document_context(prompt: str, document_format: str) -> str:
+    """プロンプト中の {{document_context}} を、指定した形式のStateキーのプレースホルダに置き換える"""
+    return prompt.replace(DOCUMENT_CONTEXT_PLACEHOLDER, f"{{{{{document_context_key(document_format)}}}}}")
+
+
+def _normalize_lines(text: str) -> List[str]:
+    """連続する空白を1つにまとめ、空行を取り除いた行のリストを返す"""
+    lines = (_WHITESPACE_PATTERN.sub(" ", line).strip() for line in (text or "").splitlines())
+    return [line for line in lines if line]
+
+
+def find_repeated_lines(slides: List[Dict[str, Any]]) -> Set[str]:
+    """多くのスライドに共通して現れる行（ヘッダー・フッター・コピーライト表記など）を返す"""
+    if len(slides) < REPEATED_LINE_MIN_SLIDES:
+        return set()
+    counts = Counter(line for slide in slides for line in set(_normalize_lines(slide.get("text", ""))))
+    threshold = max(REPEATED_LINE_MIN_SLIDES, len(slides) * REPEATED_LINE_MIN_RATIO)
+    return {line for line, count in counts.items() if count >= threshold}
+
+
+def _serialize_compact(analysis: Dict[str, Any], include_notes: bool) -> str:
+    slides = analysis.get("slides") or []
+    repeated_lines = find_repeated_lines(slides)
+    lines = [f"資料: {analysis.get('file_name', '')} (全{analysis.get('total_slides', len(slides))}枚)"]
+    if analysis.get("error"):
+        lines.append(f"解析エラー: {analysis['error']}")
+    if repeated_lines:
+        lines.append("全スライド共通の記載（各スライドからは省略）: " + " / ".join(sorted(repeated_lines)))
+
+    for slide in slides:
+        title = " ".join(_normalize_lines(slide.get("title") or ""))
+        lines.append(f"[{slide['slide_number']}] {title}".rstrip())
+        # 抽出方法によっては本文にもタイトルが含まれるため、タイトルと同じ行は省略する
+        lines.extend(
+            line for line in _normalize_lines(slide.get("text", ""))
+            if line not in repeated_lines and line != title
+        )
+        if include_notes:
+            notes = " ".join(_normalize_lines(slide.get("notes") or ""))
+            if notes:
+                lines.append(f"ノート: {notes}")
+    return "\n".join(lines)
+
+
+def serialize_document_analysis(
+    analysis: Union[DocumentAnalysisResult, Dict[str, Any]],
+    document_format: DocumentFormat = "compact",
+) -> str:
+    """
+    資料の解析結果を、プロンプトに埋め込むための文字列に変換する。
+
+    Args:
+        analysis: DocumentAnalysisResult またはそれに対応する辞書。
+        document_format: 出力形式 ("json", "compact", "compact_no_notes")。
+
+    Returns:
+        シリアライズされた資料情報。
+    """
+    if isinstance(analysis, DocumentAnalysisResult):
+        analysis = analysis.model_dump()
+    if document_format == "json":
+        return json.dumps(analysis, ensure_ascii=False, indent=2)
+    if document_format == "compact":
+        return _serialize_compact(analysis, include_notes=True)
+    if document_format == "compact_no_notes":
+        return _serialize_compact(analysis, include_notes=False)
+    raise ValueError(f"Unsupported document format: {document_format}")
+
+
+def slide_heading(slide: Dict[str, Any]) -> str:
+    """スライドのタイトル、なければ本文の1行目を返す"""
+    if slide.get("title"):
+        return slide["title"]
+    text_lines = (slide.get("text") or "").strip().splitlines()
+    return text_lines[0] if text_lines else ""
+
+
+def build_slide_outline(analysis: Union[DocumentAnalysisResult, Dict[str, Any]]) -> str:
+    """資料の構成を、1行に1枚ずつ「スライド番号. タイトル」の形式で返す"""
+    if isinstance(analysis, DocumentAnalysisResult):
+        analysis = analysis.model_dump()
+    return "\n".join(f"{slide['slide_number']}. {slide_heading(slide)}" for slide in analysis.get("slides") or [])
+
+
+def normalize_slide_text(slide: Dict[str, Any]) -> str:
+    """
+    スライドのタイトルと本文を、比較用に正規化した文字列を返す。
+    全角・半角、大文字・小文字、空白と改行の違いは無視する。発表者ノートは含めない。
+    """
+    text = f"{slide.get('title') or ''}\n{slide.get('text') or ''}"
+    return _ALL_WHITESPACE_PATTERN.sub(" ", unicodedata.normalize("NFKC", text).lower()).strip()
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    文字列のおおよそのトークン数を見積もる。
+    日本語などの非ASCII文字は1文字あたり約1トークン、ASCII文字は約4文字で1トークンとして計算する。
+    """
+    ascii_chars = sum(1 for char in text if ord(char) < 128)
+    return (len(text) - ascii_chars) + (ascii_chars + 3) // 4
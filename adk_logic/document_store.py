@@ -0,0 +1,125 @@
+import io
+import logging
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Optional
+
+from utils.storage import get_storage_backend
+from adk_logic.analysis_cache import compute_document_hash
+from adk_logic.state_models import DocumentHandle
+
+logger = logging.getLogger(__name__)
+
+MIME_TYPES = {
+    ".pdf": "application/pdf",
+    ".pptx": "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+}
+# Geminiがファイルとして直接読み込める形式。PPTXは読み込めないため、ローカル抽出で解析する
+LLM_SUPPORTED_MIME_TYPES = {"application/pdf"}
+
+# プロセス内に保持する資料の合計サイズの上限。超えた場合は古い資料から破棄し、以降はストレージから読み込む
+DOCUMENT_STORE_MAX_BYTES = int(os.environ.get("DOCUMENT_STORE_MAX_MB", "512")) * 1024 * 1024
+# このサイズ以下の資料は、ストレージのURIではなくリクエストに直接埋め込んでLLMに渡す
+INLINE_DOCUMENT_MAX_BYTES = int(os.environ.get("INLINE_DOCUMENT_MAX_MB", "15")) * 1024 * 1024
+# ストレージへの保存を並行して行うスレッド数
+DOCUMENT_UPLOAD_WORKERS = int(os.environ.get("DOCUMENT_UPLOAD_WORKERS", "4"))
+
+
+def detect_mime_type(file_name: str) -> Optional[str]:
+    """ファイル名の拡張子からMIMEタイプを判定する"""
+    return MIME_TYPES.get(os.path.splitext(file_name.lower())[1])
+
+
+class DocumentStore:
+    """
+    アップロードされた資料のバイト列をプロセス内に保持し、ストレージへの保存をバックグラウンドで行う。
+
+    資料はアップロード直後から DocumentHandle 経由で解析に使え、ストレージへの保存完了を待つ必要はない。
+    保存先のURIは保存の開始前に決まるため、Stateには最初から最終的なURIを記録できる。
+    """
+
+    def __init__(self, max_bytes: int = DOCUMENT_STORE_MAX_BYTES, upload_workers: int = DOCUMENT_UPLOAD_WORKERS):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._documents: "OrderedDict[str, bytes]" = OrderedDict()
+        self._total_bytes = 0
+        self._uploads: Dict[str, Future] = {}
+        self._executor = ThreadPoolExecutor(max_workers=max(1, upload_workers), thread_name_prefix="document-upload")
+
+    def register(self, blob: bytes, file_name: str) -> DocumentHandle:
+        """
+        資料をプロセス内に登録し、ストレージへの保存をバックグラウンドで開始する。
+
+        Args:
+            blob: 資料のバイト列。
+            file_name: アップロードされたファイル名。
+
+        Returns:
+            資料のハンドル。uri には保存先のURIが設定される（保存は完了していない場合がある）。
+        """
+        object_name = f"uploads/{uuid.uuid4()}-{file_name}"
+        handle = DocumentHandle(
+            sha256=compute_document_hash(blob),
+            file_name=file_name,
+            mime_type=detect_mime_type(file_name) or "application/octet-stream",
+            size_bytes=len(blob),
+            uri=get_storage_backend().uri_for(object_name),
+        )
+        with self._lock:
+            self._remember(handle.sha256, blob)
+            # 保存に成功したものは待つ必要がないため、記録から取り除く
+            for uri in [uri for uri, upload in self._uploads.items() if upload.done() and not upload.exception()]:
+                del self._uploads[uri]
+            self._uploads[handle.uri] = self._executor.submit(self._upload, blob, object_name, handle)
+        return handle
+
+    def _remember(self, sha256: str, blob: bytes) -> None:
+        if sha256 in self._documents:
+            self._documents.move_to_end(sha256)
+            return
+        self._documents[sha256] = blob
+        self._total_bytes += len(blob)
+        while self._total_bytes > self.max_bytes and len(self._documents) > 1:
+            _, evicted = self._documents.popitem(last=False)
+            self._total_bytes -= len(evicted)
+
+    @staticmethod
+    def _upload(blob: bytes, object_name: str, handle: DocumentHandle) -> str:
+        uri = get_storage_backend().upload(io.BytesIO(blob), object_name, content_type=handle.mime_type)
+        logger.info(f"Stored document {handle.file_name} ({handle.size_bytes} bytes) at {uri}")
+        return uri
+
+    def get_bytes(self, sha256: str) -> Optional[bytes]:
+        """プロセス内に保持している資料のバイト列を返す。破棄済み・別プロセスで登録された場合はNone。"""
+        with self._lock:
+            blob = self._documents.get(sha256)
+            if blob is not None:
+                self._documents.move_to_end(sha256)
+            return blob
+
+    def wait_until_stored(self, uri: str, timeout: Optional[float] = None) -> str:
+        """
+        資料のストレージへの保存完了を待ち、URIを返す。このプロセスで保存していない場合はそのまま返す。
+        保存に失敗していた場合は例外を送出する。
+        """
+        with self._lock:
+            upload = self._uploads.get(uri)
+        if upload is None:
+            return uri
+        return upload.result(timeout=timeout)
+
+
+_document_store: Optional[DocumentStore] = None
+_document_store_lock = threading.Lock()
+
+
+def get_document_store() -> DocumentStore:
+    """プロセス内で共有する資料ストアを返す"""
+    global _document_store
+    with _document_store_lock:
+        if _document_store is None:
+            _document_store = DocumentStore()
+    return _document_store
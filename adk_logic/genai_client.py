@@ -0,0 +1,108 @@
+import asyncio
+import logging
+import os
+import threading
+import weakref
+from typing import List, Optional
+
+import httpx
+from google import genai
+from google.genai import types
+from google.adk.models import Gemini
+
+logger = logging.getLogger(__name__)
+
+# genaiクライアントのHTTPコネクションプールの上限
+GENAI_MAX_CONNECTIONS = int(os.environ.get("GENAI_MAX_CONNECTIONS", "32"))
+GENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("GENAI_MAX_KEEPALIVE_CONNECTIONS", "16"))
+
+
+def create_genai_client() -> genai.Client:
+    """コネクションプールの上限を設定した、Vertex AIのgenaiクライアントを生成する"""
+    limits = httpx.Limits(
+        max_connections=GENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=GENAI_MAX_KEEPALIVE_CONNECTIONS,
+    )
+    # app.py では load_dotenv() がモジュールのimport後に呼ばれるため、環境変数は生成時に読む
+    return genai.Client(
+        vertexai=True,
+        project=os.environ.get("GCP_PROJECT_ID"),
+        location=os.environ.get("GCP_LOCATION", "us-central1"),
+        http_options=types.HttpOptions(
+            client_args={"limits": limits},
+            async_client_args={"limits": limits},
+        ),
+    )
+
+
+class GenaiClientPool:
+    """
+    イベントループごとに1つのgenaiクライアントを共有する。
+
+    非同期クライアント (client.aio) のコネクションプールは最初に使ったイベントループに結び付くため、
+    同じループで動くエージェントのモデル・コンテキストキャッシュ・自動編成・バッチ予測は同じクライアントを使い、
+    別のループ（CLIの asyncio.run など）では別のクライアントを生成する。
+    Streamlitアプリでは、レビュージョブ・先行解析・自動編成がすべて ResourceRegistry のバックグラウンドのループで動くため、
+    非同期のクライアントは1つになる。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, genai.Client]" = weakref.WeakKeyDictionary()
+        # イベントループの外（同期APIのみ）で使うクライアント
+        self._sync_client: Optional[genai.Client] = None
+
+    def get(self) -> genai.Client:
+        """実行中のイベントループのクライアントを返す（ループごとに初回のみ生成する）"""
+        try:
+            loop: Optional[asyncio.AbstractEventLoop] = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        with self._lock:
+            if loop is None:
+                if self._sync_client is None:
+                    self._sync_client = create_genai_client()
+                return self._sync_client
+            client = self._clients.get(loop)
+            if client is None:
+                client = create_genai_client()
+                self._clients[loop] = client
+            return client
+
+    def close(self) -> None:
+        """生成したクライアントをすべて閉じる。以降の呼び出しでは必要に応じて再生成される。"""
+        with self._lock:
+            clients: List[genai.Client] = list(self._clients.values())
+            if self._sync_client is not None:
+                clients.append(self._sync_client)
+            self._clients = weakref.WeakKeyDictionary()
+            self._sync_client = None
+        for client in clients:
+            try:
+                client.close()
+            except Exception:
+                logger.warning("Failed to close genai client.", exc_info=True)
+
+
+class PooledGemini(Gemini):
+    """
+    APIクライアントに GenaiClientPool の共有クライアントを使うGeminiモデル。
+    ADKの Gemini はモデルのインスタンスごとにクライアントを生成するため、エージェントごとにコネクションプールができてしまう。
+    """
+
+    @property
+    def api_client(self) -> genai.Client:
+        return get_genai_client_pool().get()
+
+
+_genai_client_pool: Optional[GenaiClientPool] = None
+_genai_client_pool_lock = threading.Lock()
+
+
+def get_genai_client_pool() -> GenaiClientPool:
+    """プロセス内で共有する GenaiClientPool を返す"""
+    global _genai_client_pool
+    with _genai_client_pool_lock:
+        if _genai_client_pool is None:
+            _genai_client_pool = GenaiClientPool()
+    return _genai_client_pool
@@ -0,0 +1,412 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from pydantic import BaseModel, Field
+
+from adk_logic.main_runner import run_review_process
+from adk_logic.resources import get_resource_registry
+
+logger = logging.getLogger(__name__)
+
+JOB_DB_PATH = os.environ.get(
+    "JOB_DB_PATH",
+    os.path.join(tempfile.gettempdir(), "presenta-ai", "jobs.sqlite3"),
+)
+# 1プロセスで同時に実行するレビューの数
+JOB_WORKER_CONCURRENCY = int(os.environ.get("JOB_WORKER_CONCURRENCY", "4"))
+# この秒数ハートビートが途絶えた実行中ジョブは、プロセスが落ちたものとみなして再実行する
+JOB_STALE_SECONDS = int(os.environ.get("JOB_STALE_SECONDS", "120"))
+# ジョブを実行できる回数。実行中にプロセスが落ち続けるジョブは、この回数を超えたら失敗にする
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+# LLMの応答をストリーミングで受け取り、レポートの途中経過を画面に表示するかどうか
+STREAM_PARTIAL_RESULTS = os.environ.get("STREAM_PARTIAL_RESULTS", "true").lower() == "true"
+_HEARTBEAT_INTERVAL_SECONDS = 15
+_POLL_INTERVAL_SECONDS = 1.0
+
+
+class JobStatus:
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+class ReviewJob(BaseModel):
+    """レビュージョブ1件の状態"""
+    job_id: str
+    status: str
+    request: Dict[str, Any] = Field(description="run_review_processに渡す引数（progress_callbackを除く）。")
+    progress_message: Optional[str] = None
+    partial_result: Optional[Dict[str, Any]] = Field(default=None, description="実行中のレポートの途中経過。")
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    attempts: int = Field(default=0, description="ジョブの実行を始めた回数。")
+    created_at: float
+    updated_at: float
+
+
+class JobStore:
+    """SQLiteに永続化されたレビュージョブのキュー"""
+
+    def __init__(self, db_path: str = JOB_DB_PATH):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS review_jobs (
+                    job_id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    request TEXT NOT NULL,
+                    progress_message TEXT,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_review_jobs_status ON review_jobs (status, created_at)")
+            # 途中経過の列が無い既存のデータベースには列を追加する
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(review_jobs)")}
+            if "partial_result" not in columns:
+                conn.execute("ALTER TABLE review_jobs ADD COLUMN partial_result TEXT")
+            if "attempts" not in columns:
+                conn.execute("ALTER TABLE review_jobs ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # 複数スレッドから利用するため、操作ごとに接続を開いて閉じる
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.row_factory = sqlite3.Row
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _to_job(row: sqlite3.Row) -> ReviewJob:
+        return ReviewJob(
+            job_id=row["job_id"],
+            status=row["status"],
+            request=json.loads(row["request"]),
+            progress_message=row["progress_message"],
+            partial_result=json.loads(row["partial_result"]) if row["partial_result"] else None,
+            result=json.loads(row["result"]) if row["result"] else None,
+            error=row["error"],
+            attempts=row["attempts"],
+            created_at=row["created_at"],
+            updated_at=row["updated_at"],
+        )
+
+    def submit(self, request: Dict[str, Any]) -> str:
+        """ジョブをキューに追加し、ジョブIDを返す"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO review_jobs (job_id, status, request, progress_message, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, JobStatus.QUEUED, json.dumps(request, ensure_ascii=False),
+                 "レビューの順番待ちです...", now, now),
+            )
+        return job_id
+
+    def get(self, job_id: str) -> Optional[ReviewJob]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM review_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._to_job(row) if row else None
+
+    def claim_next(self) -> Optional[ReviewJob]:
+        """最も古い待機中のジョブを実行中にして返す。複数のワーカーが同じジョブを取得することはない。"""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT * FROM review_jobs WHERE status = ? ORDER BY created_at LIMIT 1",
+                    (JobStatus.QUEUED,),
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                conn.execute(
+                    "UPDATE review_jobs SET status = ?, attempts = attempts + 1, updated_at = ? WHERE job_id = ?",
+                    (JobStatus.RUNNING, time.time(), row["job_id"]),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        job = self._to_job(row)
+        job.status = JobStatus.RUNNING
+        job.attempts += 1
+        return job
+
+    def update_progress(self, job_id: str, message: str) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE review_jobs SET progress_message = ?, updated_at = ? WHERE job_id = ?",
+                (message, time.time(), job_id),
+            )
+
+    def update_partial_result(self, job_id: str, partial_result: Dict[str, Any]) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE review_jobs SET partial_result = ?, updated_at = ? WHERE job_id = ?",
+                (json.dumps(partial_result, ensure_ascii=False), time.time(), job_id),
+            )
+
+    def heartbeat(self, job_ids: List[str]) -> None:
+        """実行中のジョブが生きていることを記録する"""
+        if not job_ids:
+            return
+        placeholders = ",".join("?" for _ in job_ids)
+        with self._connect() as conn:
+            conn.execute(
+                f"UPDATE review_jobs SET updated_at = ? WHERE job_id IN ({placeholders})",
+                (time.time(), *job_ids),
+            )
+
+    def finish(self, job_id: str, result: Dict[str, Any]) -> None:
+        """ジョブの結果を保存する。run_review_processがエラーを返した場合は失敗として記録する。"""
+        status = JobStatus.FAILED if result.get("error") else JobStatus.SUCCEEDED
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE review_jobs SET status = ?, result = ?, error = ?, updated_at = ? WHERE job_id = ?",
+                (status, json.dumps(result, ensure_ascii=False), result.get("error"), time.time(), job_id),
+            )
+
+    def fail(self, job_id: str, error: str) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE review_jobs SET status = ?, error = ?, updated_at = ? WHERE job_id = ?",
+                (JobStatus.FAILED, error, time.time(), job_id),
+            )
+
+    def requeue_failed_job(self, job_id: str) -> bool:
+        """失敗したジョブを待機中に戻し、実行回数を数え直す。戻せた場合はTrue。"""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE review_jobs SET status = ?, progress_message = ?, partial_result = NULL, result = NULL, "
+                "error = NULL, attempts = 0, updated_at = ? WHERE job_id = ? AND status = ?",
+                (JobStatus.QUEUED, "失敗した段階からレビューを再開します...", time.time(), job_id, JobStatus.FAILED),
+            )
+            return cursor.rowcount > 0
+
+    def requeue_stale_jobs(self, stale_seconds: int = JOB_STALE_SECONDS, max_attempts: int = JOB_MAX_ATTEMPTS) -> int:
+        """
+        ハートビートが途絶えた実行中ジョブを待機中に戻し、戻した件数を返す。
+        実行回数が max_attempts に達したジョブは、同じ原因でプロセスが落ち続けるとみなして失敗にする。
+        """
+        stale_before = time.time() - stale_seconds
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                failed = conn.execute(
+                    "UPDATE review_jobs SET status = ?, error = ?, partial_result = NULL, updated_at = ? "
+                    "WHERE status = ? AND updated_at < ? AND attempts >= ?",
+                    (JobStatus.FAILED, f"レビューの実行中に{max_attempts}回中断されたため、再実行を中止しました。",
+                     time.time(), JobStatus.RUNNING, stale_before, max_attempts),
+                ).rowcount
+                requeued = conn.execute(
+                    "UPDATE review_jobs SET status = ?, progress_message = ?, partial_result = NULL "
+                    "WHERE status = ? AND updated_at < ?",
+                    (JobStatus.QUEUED, "中断されたレビューを再開します...", JobStatus.RUNNING, stale_before),
+                ).rowcount
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        if failed:
+            logger.warning(f"Gave up {failed} review job(s) interrupted {max_attempts} times.")
+        return requeued
+
+
+class JobUpdateWriter:
+    """
+    実行中のジョブの進捗メッセージと途中経過を、専用のスレッド1つでSQLiteに書き込む。
+
+    進捗の通知はイベントループ上で同期的に呼ばれるため、その場で書き込むと、ロック待ちの間
+    同じループで動く他のレビューもすべて止まってしまう。通知は書き込みを予約するだけにし、
+    同じジョブの未書き込みの更新は最新のものだけを書き込む。
+    """
+
+    def __init__(self, store: JobStore):
+        self.store = store
+        self._condition = threading.Condition()
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._writing: Optional[str] = None
+        self._thread = threading.Thread(target=self._run, name="review-job-writer", daemon=True)
+        self._thread.start()
+
+    def update_progress(self, job_id: str, message: str) -> None:
+        self._put(job_id, "progress_message", message)
+
+    def update_partial_result(self, job_id: str, partial_result: Dict[str, Any]) -> None:
+        self._put(job_id, "partial_result", partial_result)
+
+    def flush(self, job_id: str) -> None:
+        """ジョブの予約済みの更新がすべて書き込まれるまで待つ。ジョブの結果を保存する前に呼ぶ。"""
+        with self._condition:
+            self._condition.wait_for(lambda: job_id not in self._pending and self._writing != job_id)
+
+    def _put(self, job_id: str, field: str, value: Any) -> None:
+        with self._condition:
+            self._pending.setdefault(job_id, {})[field] = value
+            self._condition.notify_all()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending)
+                job_id = next(iter(self._pending))
+                updates = self._pending.pop(job_id)
+                self._writing = job_id
+            try:
+                if "progress_message" in updates:
+                    self.store.update_progress(job_id, updates["progress_message"])
+                if "partial_result" in updates:
+                    self.store.update_partial_result(job_id, updates["partial_result"])
+            except Exception:
+                logger.exception(f"Failed to update review job {job_id}.")
+            finally:
+                with self._condition:
+                    self._writing = None
+                    self._condition.notify_all()
+
+
+class ReviewJobWorkerPool:
+    """
+    キューのレビュージョブを、ResourceRegistry のバックグラウンドのイベントループで並行実行するワーカープール。
+    Streamlitのスクリプトスレッドはジョブを投入して状態をポーリングするだけになる。
+    先行解析・自動編成と同じループで実行するため、genaiの非同期クライアントはプロセス内で1つになる。
+    """
+
+    def __init__(self, store: JobStore, concurrency: int = JOB_WORKER_CONCURRENCY):
+        self.store = store
+        self.concurrency = max(1, concurrency)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._running_job_ids: set = set()
+        self._writer = JobUpdateWriter(store)
+
+    def start(self) -> None:
+        if self._loop is not None:
+            return
+        registry = get_resource_registry()
+        registry.run_coroutine(self._start())
+        self._loop = registry.event_loop
+
+    def submit(self, request: Dict[str, Any]) -> str:
+        """ジョブを投入し、ジョブIDを返す"""
+        job_id = self.store.submit(request)
+        self._notify()
+        return job_id
+
+    def get(self, job_id: str) -> Optional[ReviewJob]:
+        return self.store.get(job_id)
+
+    def retry(self, job_id: str) -> bool:
+        """
+        失敗したジョブを再投入する。セッションに保存済みの段階は再実行せず、失敗した段階から再開する。
+        再投入できた場合はTrue。
+        """
+        requeued = self.store.requeue_failed_job(job_id)
+        if requeued:
+            self._notify()
+        return requeued
+
+    def stop(self) -> None:
+        """ワーカーを止める。バックグラウンドのイベントループは他の処理と共有しているため止めない。"""
+        if self._loop is None:
+            return
+        get_resource_registry().run_coroutine(self._stop(), timeout=5)
+        self._loop = None
+
+    def _notify(self) -> None:
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _start(self) -> None:
+        self._wakeup = asyncio.Event()
+        requeued = await asyncio.to_thread(self.store.requeue_stale_jobs)
+        if requeued:
+            logger.info(f"Requeued {requeued} interrupted review job(s).")
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.concurrency)]
+        self._tasks.append(asyncio.create_task(self._heartbeat()))
+
+    async def _stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(_HEARTBEAT_INTERVAL_SECONDS)
+            try:
+                await asyncio.to_thread(self.store.heartbeat, list(self._running_job_ids))
+                # 他のプロセスが落ちて放置されたジョブも拾う
+                if await asyncio.to_thread(self.store.requeue_stale_jobs):
+                    self._wakeup.set()
+            except Exception:
+                logger.exception("Failed to update job heartbeat.")
+
+    async def _worker(self, worker_index: int) -> None:
+        while True:
+            job = await asyncio.to_thread(self.store.claim_next)
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=_POLL_INTERVAL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            logger.info(f"Worker {worker_index} started job {job.job_id}")
+            self._running_job_ids.add(job.job_id)
+            try:
+                # ジョブIDをセッションIDとして使う。再実行されたジョブは、保存済みのセッションの続きから再開される
+                result = await run_review_process(
+                    **job.request,
+                    session_id=job.job_id,
+                    progress_callback=lambda message, job_id=job.job_id: self._writer.update_progress(job_id, message),
+                    partial_result_callback=(
+                        (lambda partial, job_id=job.job_id: self._writer.update_partial_result(job_id, partial))
+                        if STREAM_PARTIAL_RESULTS else None
+                    ),
+                )
+                # 予約済みの途中経過が、保存した結果の後に書き込まれないようにする
+                await asyncio.to_thread(self._writer.flush, job.job_id)
+                await asyncio.to_thread(self.store.finish, job.job_id, result)
+            except Exception as e:
+                logger.exception(f"Review job {job.job_id} failed.")
+                await asyncio.to_thread(self._writer.flush, job.job_id)
+                await asyncio.to_thread(self.store.fail, job.job_id, str(e))
+            finally:
+                self._running_job_ids.discard(job.job_id)
+
+
+_job_pool: Optional[ReviewJobWorkerPool] = None
+_job_pool_lock = threading.Lock()
+
+
+def get_job_pool() -> ReviewJobWorkerPool:
+    """プロセス内で共有するワーカープールを返す（初回呼び出し時に起動する）"""
+    global _job_pool
+    with _job_pool_lock:
+        if _job_pool is None:
+            _job_pool = ReviewJobWorkerPool(JobStore())
+            _job_pool.start()
+    return _job_pool
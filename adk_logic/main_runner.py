@@ -1,29 +1,133 @@
 from typing import Callable, Dict, Any, Optional
 import logging
+import os
+import time
 from google import genai
 from google.genai import types
+from google.adk.agents.run_config import RunConfig, StreamingMode
 
 
-from google.adk.runners import Runner
-from google.adk.sessions import InMemorySessionService
-from adk_logic.root_agent_factory import create_root_agent
-from adk_logic.state_models import PresentaAiState, FinalReport, AudienceProfile
+from adk_logic.root_agent_factory import DEFAULT_REVIEW_MODE
+from adk_logic.resources import get_resource_registry, APP_NAME
+from adk_logic.state_models import PresentaAiState, FinalReport, AudienceProfile, QnAList, DocumentHandle, PreviousReview
+from adk_logic.analysis_cache import get_analysis_cache
+from adk_logic.context_cache import get_shared_context_caches
+from adk_logic.cost_estimator import get_cost_estimator
+from adk_logic.tracing import RunTrace, get_trace_recorder
+from adk_logic.rate_governor import get_rate_governor
+from adk_logic.streaming_report import PartialReportBuilder
+from adk_logic.slide_review_store import build_review_scope
+from adk_logic.analysis_prefetch import get_analysis_prefetcher
 
 # ロギング設定
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# 資料解析の方式 (llm / hybrid / local) の既定値
+DEFAULT_ANALYSIS_MODE = os.environ.get("ANALYSIS_MODE", "llm")
+# セッションのユーザーID（ハッカソン向けに固定）
+SESSION_USER_ID = "default-user"
+# レビューの再開時に、完了済みかどうかをログに出す段階の成果物
+CHECKPOINT_STATE_KEYS = (
+    "document_analysis", "logic_critic_review_text", "audience_persona_review_text", "final_report", "qna_result",
+)
 
 
 
+def _finish_trace(trace: RunTrace) -> Dict[str, Any]:
+    """タイムラインを閉じ、エージェントごとの集計をログに出力して、結果に含める辞書を返す"""
+    trace.finish()
+    trace_data = trace.to_dict()
+    for agent_name, summary in trace_data["agents"].items():
+        logging.info(f"Trace [{agent_name}]: {summary}")
+    totals = trace_data["totals"]
+    logging.info(
+        f"Trace total: {trace_data['duration_ms'] / 1000:.1f}s, {totals['llm_calls']} LLM calls, "
+        f"{totals['prompt_tokens']} input tokens ({totals['cached_input_tokens']} cached), "
+        f"{totals['output_tokens']} output tokens, ${totals['cost_usd']:.4f}, "
+        f"{totals['retries']} retries, {totals['queue_wait_ms'] / 1000:.1f}s queued"
+    )
+    logging.info(f"Rate governor: {get_rate_governor().stats()}")
+    return trace_data
+
+
+async def run_document_analysis(document: Dict[str, Any], analysis_mode: str = DEFAULT_ANALYSIS_MODE) -> Optional[Dict[str, Any]]:
+    """
+    資料の解析 (DocumentAnalyzerAgent) のみを実行し、解析結果を返す。解析に失敗した場合はNone。
+    解析結果は解析結果キャッシュにも保存される。
+
+    Args:
+        document: 資料ストアに登録した資料のハンドル (DocumentHandle)。
+        analysis_mode: 資料解析の方式 ("llm", "hybrid", "local")。
+    """
+    runner = get_resource_registry().get_analysis_runner()
+    started_at = time.perf_counter()
+    session = await runner.session_service.create_session(
+        app_name=APP_NAME,
+        user_id=SESSION_USER_ID,
+        state={
+            "gcs_file_path": document["uri"],
+            "document_sha256": document["sha256"],
+            "document": document,
+            "analysis_mode": analysis_mode,
+        },
+    )
+    try:
+        content = types.Content(role='user', parts=[types.Part(text="プレゼン資料の解析をお願いします。")])
+        async for _ in runner.run_async(user_id=SESSION_USER_ID, session_id=session.id, new_message=content):
+            pass
+        final_session = await runner.session_service.get_session(
+            app_name=APP_NAME, user_id=SESSION_USER_ID, session_id=session.id
+        )
+        analysis = final_session.state.get("document_analysis")
+    except Exception:
+        logging.exception(f"資料の先行解析に失敗しました: {document['file_name']}")
+        return None
+    finally:
+        await runner.session_service.delete_session(app_name=APP_NAME, user_id=SESSION_USER_ID, session_id=session.id)
+
+    if not isinstance(analysis, dict) or analysis.get("error"):
+        logging.warning(f"資料の先行解析で解析結果が得られませんでした: {document['file_name']}")
+        return None
+    logging.info(
+        f"資料の先行解析が完了しました: {document['file_name']} ({analysis_mode}), "
+        f"{analysis.get('total_slides')}枚, {time.perf_counter() - started_at:.1f}s"
+    )
+    return analysis
+
+
+def prefetch_document_analysis(document: Dict[str, Any], analysis_mode: str = DEFAULT_ANALYSIS_MODE) -> bool:
+    """
+    チーム編成の入力を待たずに、資料の解析をバックグラウンドのイベントループで始める。
+    同じ資料・解析方式のレビューの DocumentAnalyzerAgent は、実行中または完了済みの先行解析の結果を待って使う。
+    同じ資料・解析方式の先行解析が既にあれば何もしない。新たに解析を始めた場合はTrue。
+    """
+    started = get_analysis_prefetcher().start(
+        document["sha256"],
+        analysis_mode,
+        lambda: get_resource_registry().submit_coroutine(run_document_analysis(document, analysis_mode)),
+    )
+    if started:
+        logging.info(f"資料の先行解析を開始しました: {document['file_name']} ({analysis_mode})")
+    return started
+
+
 async def run_review_process(
     gcs_file_path: str,
     presentation_goal: str,
     audience_profile: Dict[str, str],
     selected_configs: Dict[str, str],
     progress_callback: Callable[[str], None],
+    document_sha256: Optional[str] = None,
+    analysis_mode: str = DEFAULT_ANALYSIS_MODE,
+    review_mode: str = DEFAULT_REVIEW_MODE,
+    document: Optional[Dict[str, Any]] = None,
+    partial_result_callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+    session_id: Optional[str] = None,
+    previous_review: Optional[Dict[str, Any]] = None,
 ) -> Dict[str, Any]:
     """
     プレゼンレビューの全プロセスを実行する。
+    Stateはエージェントの段階ごとにセッションサービスへ保存され、失敗したレビューのセッションは再開のために残される。
 
     Args:
         gcs_file_path: GCS上のファイルパス。
@@ -31,59 +135,106 @@ async def run_review_process(
         audience_profile: 聴衆のプロファイル。
         selected_configs: ユーザーが選択したチーム編成設定。
         progress_callback: UIに進捗を伝えるコールバック関数。
+        document_sha256: 資料のSHA-256ハッシュ。指定された場合、解析結果キャッシュを利用する。
+        analysis_mode: 資料解析の方式 ("llm", "hybrid", "local")。
+        review_mode: レビューの方式 ("standard", "chunked")。長い資料では "chunked" を推奨。
+        document: アップロード時に資料ストアに登録した資料のハンドル (DocumentHandle)。
+            指定された場合、同一プロセス内ではストレージへの保存完了を待たずに資料を解析する。
+        partial_result_callback: レポートの途中経過をUIに伝えるコールバック関数。
+            指定された場合、LLMの応答をストリーミングで受け取り、総評やスライドごとのレビューが
+            1つ完成するごとに、FinalReport と同じキーを持つ途中経過の辞書を渡して呼び出す。
+        session_id: セッションID。既存のセッションを指定した場合は初期Stateを設定し直さず、
+            成果物がStateに保存済みの段階（資料解析・各レビュー・レポート統合）を飛ばして途中から再開する。
+        previous_review: 改訂前の資料のレビュー結果 (PreviousReview)。build_previous_review で前回の結果から作成する。
+            指定された場合、改訂前から変更のあったスライドのみを解析・レビューし、総評と構成のレビューは資料全体について作り直す。
 
     Returns:
-        レビュー結果を含む辞書。
+        レビュー結果を含む辞書。trace には実行のタイムライン（エージェントごとの実行時間・トークン数・コスト）が含まれる。
+        revision_base には、この資料を改訂して再レビューする際に build_previous_review で使う情報が含まれる。
+        失敗した場合は error と、再開に使える session_id を含む。
     """
-    app_name = "presenta-ai"
-    user_id = "default-user"
-    
-     # ハッカソン向けに固定
+    app_name = APP_NAME
+    user_id = SESSION_USER_ID
 
     # 1. UIの進捗通知コールバックをADKコールバックにラップ
 
         # progress_notifier = create_progress_notifier_callback(progress_callback)
-    # 2. 実行ごとに特化したRootAgentを動的に生成
-    # root_agent = create_root_agent(selected_configs, progress_notifier=progress_notifier)
-    root_agent = create_root_agent(selected_configs)
-    runner = Runner(
-        app_name=app_name, 
-        session_service=InMemorySessionService(),
-        agent=root_agent)
-    runner.agent = root_agent # Runnerに今回のワークフローを設定
+    # 2. チーム編成に対応するRunnerを取得する
+    # エージェントツリーとRunnerは編成の組み合わせごとに1度だけ構築され、以降のレビューで再利用される
+    runner = get_resource_registry().get_runner(selected_configs, review_mode)
 
     # 3. セッションを開始し、初期Stateを設定
     # (参照: docs/sessions/state.md)
+    document_handle = DocumentHandle.model_validate(document) if document else None
     initial_state = PresentaAiState(
-        gcs_file_path=gcs_file_path,
+        gcs_file_path=document_handle.uri if document_handle else gcs_file_path,
+        document_sha256=document_handle.sha256 if document_handle else document_sha256,
+        document=document_handle,
         presentation_goal=presentation_goal,
         audience_profile=AudienceProfile(**audience_profile),
-        selected_configs=selected_configs
+        selected_configs=selected_configs,
+        analysis_mode=analysis_mode,
+        review_mode=review_mode,
+        previous_review=PreviousReview.model_validate(previous_review) if previous_review else None,
     ).model_dump()
     
+    session = None
+    trace: Optional[RunTrace] = None
+    succeeded = False
     try:
-        session = await runner.session_service.create_session(
-            app_name=app_name,
-            user_id=user_id,
-            state=initial_state,
-        )
-        logging.info(f"セッション開始: {session.id}, チーム編成: {selected_configs}")
-        progress_callback("レビューチームの編成が完了しました。レビューを開始します！")
+        if session_id:
+            session = await runner.session_service.get_session(
+                app_name=app_name, user_id=user_id, session_id=session_id
+            )
+        resumed = session is not None
+        if session is None:
+            # 再開されないまま期限を過ぎた、失敗したレビューのセッションを削除する
+            await get_resource_registry().prune_expired_sessions_if_due()
+            session = await runner.session_service.create_session(
+                app_name=app_name,
+                user_id=user_id,
+                state=initial_state,
+                session_id=session_id,
+            )
+        trace = get_trace_recorder().start(session.id)
+        if resumed:
+            completed = [key for key in CHECKPOINT_STATE_KEYS if session.state.get(key) is not None]
+            logging.info(f"セッション再開: {session.id}, 完了済み: {completed}")
+            progress_callback("前回のレビューの続きから再開します。")
+        else:
+            logging.info(f"セッション開始: {session.id}, チーム編成: {selected_configs}")
+            progress_callback("レビューチームの編成が完了しました。レビューを開始します！")
 
         content = types.Content(role='user', parts=[types.Part(text="プレゼン資料のレビューをお願いします。")])
 
+        # 途中経過を伝える場合は、LLMの応答をストリーミング (partialなイベント) で受け取る
+        # (参照: docs/runtime/runconfig.md)
+        report_builder = PartialReportBuilder() if partial_result_callback else None
+        run_options = {"run_config": RunConfig(streaming_mode=StreamingMode.SSE)} if report_builder else {}
+
         # 4. ADK Runnerでエージェントを実行
         async for event in runner.run_async(
             user_id=user_id,
             session_id=session.id,
-            new_message=content
-
+            new_message=content,
+            **run_options,
         ):
+            if report_builder is not None and report_builder.is_streamed_agent(event.author or ""):
+                if event.partial:
+                    parts = event.content.parts if event.content and event.content.parts else []
+                    text = "".join(part.text or "" for part in parts if not part.thought)
+                    if text and report_builder.add_text(event.author, text):
+                        trace.mark("first_partial_result")
+                        partial_result_callback(report_builder.to_dict())
+                else:
+                    report_builder.end_response(event.author)
+            if event.partial:
+                continue
             # イベントごとのロギング（デバッグ用）
-            if event.content and event.content.parts:
-                logging.info(f"Event from {event.author}: {event.content.parts[0].text[:100]}...")
-            elif event.get_function_calls():
+            if event.get_function_calls():
                  logging.info(f"Event from {event.author}: FunctionCall {event.get_function_calls()[0].name}")
+            elif event.content and event.content.parts and event.content.parts[0].text:
+                logging.info(f"Event from {event.author}: {event.content.parts[0].text[:100]}...")
 
 
         # 5. 最終的なStateから結果を取得
@@ -97,14 +248,98 @@ async def run_review_process(
             raise RuntimeError("レビュープロセスの最終結果を生成できませんでした。")
 
         final_report = FinalReport.model_validate(final_report_data)
-        logging.info("レビュープロセス正常終了。")
+        # Q&A生成はレポート統合と並行して実行されるため、ここで最終レポートに統合する
+        qna_result = final_session.state.get("qna_result")
+        if qna_result:
+            final_report.qna_list = QnAList.model_validate(qna_result).qna_list
+        logging.info(f"レビュープロセス正常終了。解析キャッシュ: {get_analysis_cache().stats()}")
         progress_callback("レビューが完了しました！🎉")
-        
-        return final_report.model_dump()
+
+        trace_data = _finish_trace(trace)
+        # 計測したトークン数とコストを、以降のレビューのコスト見積もりに反映する
+        total_slides = (final_session.state.get("document_analysis") or {}).get("total_slides") or 0
+        get_cost_estimator().observe(trace_data, total_slides)
+        succeeded = True
+        revision_base = {
+            "document": final_session.state.get("document"),
+            "document_analysis": final_session.state.get("document_analysis"),
+            "review_scope": build_review_scope(presentation_goal, audience_profile, selected_configs),
+        }
+        return {**final_report.model_dump(), "trace": trace_data, "revision_base": revision_base}
 
     except Exception as e:
         logging.exception("レビュープロセス中に予期せぬエラーが発生しました。")
         progress_callback(f"エラーが発生しました: {e}")
         # UIに返すためのエラー構造
-        return {"error": str(e)}
-    
\ No newline at end of file
+        return {
+            "error": str(e),
+            "trace": _finish_trace(trace) if trace else None,
+            "session_id": session.id if session is not None else None,
+        }
+    finally:
+        if session is not None:
+            get_trace_recorder().pop(session.id)
+            await get_shared_context_caches().release(session.id)
+            # 完了したセッションは破棄する。失敗したセッションは resume_review_process で再開できるよう残し、
+            # 再開されないまま SESSION_TTL_SECONDS を過ぎたものは、以降のレビューの開始時に削除する
+            if succeeded:
+                await runner.session_service.delete_session(
+                    app_name=app_name, user_id=user_id, session_id=session.id
+                )
+
+
+async def resume_review_process(
+    session_id: str,
+    progress_callback: Callable[[str], None],
+    partial_result_callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Dict[str, Any]:
+    """
+    失敗・中断したレビューを、保存済みのStateから再開する。
+    成果物がStateに保存済みの段階は実行せず、失敗した段階とそれ以降のみを実行する。
+
+    Args:
+        session_id: 再開するレビューのセッションID (run_review_process が失敗時に返す session_id)。
+        progress_callback: UIに進捗を伝えるコールバック関数。
+        partial_result_callback: レポートの途中経過をUIに伝えるコールバック関数。
+
+    Returns:
+        run_review_process と同じ形式のレビュー結果。
+    """
+    session = await get_resource_registry().session_service.get_session(
+        app_name=APP_NAME, user_id=SESSION_USER_ID, session_id=session_id
+    )
+    if session is None:
+        return {"error": f"再開できるセッションが見つかりません: {session_id}", "trace": None, "session_id": None}
+
+    # 初期入力はセッションに保存されているため、チーム編成とレビュー方式もStateから復元する
+    state = session.state
+    return await run_review_process(
+        gcs_file_path=state.get("gcs_file_path"),
+        presentation_goal=state.get("presentation_goal"),
+        audience_profile=state.get("audience_profile") or {},
+        selected_configs=state.get("selected_configs") or {},
+        progress_callback=progress_callback,
+        document_sha256=state.get("document_sha256"),
+        analysis_mode=state.get("analysis_mode", DEFAULT_ANALYSIS_MODE),
+        review_mode=state.get("review_mode", DEFAULT_REVIEW_MODE),
+        document=state.get("document"),
+        partial_result_callback=partial_result_callback,
+        session_id=session_id,
+        previous_review=state.get("previous_review"),
+    )
+
+
+def build_previous_review(result: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    run_review_process の結果から、改訂版の資料のレビューに渡す previous_review を作成する。
+    結果に改訂前の資料の解析結果が含まれない場合（失敗したレビューなど）はNoneを返す。
+    """
+    revision_base = result.get("revision_base") or {}
+    if not revision_base.get("document_analysis"):
+        return None
+    return PreviousReview(
+        document=revision_base.get("document"),
+        document_analysis=revision_base["document_analysis"],
+        final_report=FinalReport.model_validate(result),
+        review_scope=revision_base.get("review_scope"),
+    ).model_dump()
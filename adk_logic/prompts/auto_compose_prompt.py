@@ -1,9 +1,9 @@
 def get_auto_compose_prompt(
     presentation_goal: str,
     audience_profile: dict,
-    config_options_yaml_str: str
+    agent_options_text: str
 ) -> str:
-    """「AIにおまかせ編成」のためのプロンプトを生成する。"""
+    """「AIにおまかせ編成」のためのプロンプトを生成する。回答の形式は呼び出し側でスキーマにより制約する。"""
     return f"""
 あなたは賢明なプロジェクトマネージャーです。
 以下のプレゼン目的と聴衆情報に最も適したAIレビューチームの編成を提案してください。
@@ -11,9 +11,9 @@ def get_auto_compose_prompt(
 例えば、経営層向けの重要な意思決定プレゼンなら「辛口批評モード」や「懐疑的な聴衆」が適しているかもしれません。
 逆に、社内の中間報告であれば「寄り添いモード」や「初心者な聴衆」が適切かもしれません。
 目的と聴衆の特性をよく考慮して、最適な組み合わせを選択してください。
+選択肢に推定コスト(USD)が示されている場合、効果が同程度であれば、コストの低い選択肢を優先してください。
 
-回答は必ずJSON形式で、キーはエージェントの種別(YAMLのトップレベルキー)、バリューは選択したoptionの`id`としてください。
-説明や前置きは一切不要です。JSONオブジェクトのみを出力してください。
+回答はJSON形式で、キーはエージェントの種別、バリューは選択した選択肢の`id`としてください。
 
 # プレゼン目的
 {presentation_goal}
@@ -21,15 +21,6 @@ def get_auto_compose_prompt(
 # 聴衆情報
 {audience_profile}
 
-# 設定可能な選択肢 (YAML形式)
-```yaml
-{config_options_yaml_str}
-```
-
-# 回答フォーマット (JSONのみを出力すること)
-{{
-  "logic_critic": "id_of_choice",
-  "audience_persona": "id_of_choice",
-  "qna_generator": "id_of_choice"
-}}
-"""
\ No newline at end of file
+# 設定可能な選択肢
+{agent_options_text}
+"""
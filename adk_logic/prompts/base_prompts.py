@@ -21,15 +21,21 @@ DOCUMENT_ANALYZER_INSTRUCTION = """
         }
 """
 
-LOGIC_CRITIC_BASE_PROMPT = """
-あなたはプレゼンテーションの論理構成をレビューする専門家です。
-以下の資料分析結果、プレゼン目的、聴衆情報を基に、プレゼン全体のストーリーライン、各スライドの主張、それらを支える根拠の論理的な一貫性、主張の説得力について、詳細なレビューを行ってください。
-あなたのレビューは、後続の編集者が最終レポートを作成するために使用します。構造的で分かりやすい文章を心がけてください。
+# --- レビューエージェント共通の資料情報 ---
+# 資料分析結果・プレゼン目的・聴衆情報は全レビューエージェントで共通のため、プロンプトの先頭に同一の文字列として置く。
+# プロンプトの先頭が一致していれば、Geminiのコンテキストキャッシュ（暗黙・明示の両方）で入力トークンを再利用できる。
+# エージェント固有の指示は必ず SHARED_CONTEXT_END_MARKER より後ろに置くこと。
+# {{document_context}} はエージェントの生成時に、資料情報の形式ごとのStateキーに置き換えられる
+# (参照: adk_logic/document_serializer.py)
+
+SHARED_CONTEXT_END_MARKER = "# ここまでが全エージェント共通の資料情報です"
+
+SHARED_REVIEW_CONTEXT_PROMPT = """
+あなたはプレゼンテーションをレビューする専門家チームの一員です。
+以下はチーム全員に共有される、レビュー対象のプレゼン資料に関する情報です。
 
 # 資料分析結果
-```json
-{{document_analysis}}
-```
+{{document_context}}
 
 # プレゼン目的
 {{presentation_goal}}
@@ -38,43 +44,137 @@ LOGIC_CRITIC_BASE_PROMPT = """
 ```json
 {{audience_profile}}
 ```
+
+""" + SHARED_CONTEXT_END_MARKER + "\n"
+
+LOGIC_CRITIC_BASE_PROMPT = SHARED_REVIEW_CONTEXT_PROMPT + """
+# あなたの役割
+あなたはプレゼンテーションの論理構成をレビューする専門家です。
+上記の資料分析結果、プレゼン目的、聴衆情報を基に、プレゼン全体のストーリーライン、各スライドの主張、それらを支える根拠の論理的な一貫性、主張の説得力について、詳細なレビューを行ってください。
+あなたのレビューは、後続の編集者が最終レポートを作成するために使用します。構造的で分かりやすい文章を心がけてください。
 """
 
-AUDIENCE_PERSONA_BASE_PROMPT = """
-あなたは指定された聴衆になりきってプレゼンをレビューする専門家です。
-以下の資料分析結果、プレゼン目的、そしてあなたのペルソナである聴衆情報に基づき、このプレゼンが聴衆にとって分かりやすいか、興味を引くか、納得できるかを評価してください。
+AUDIENCE_PERSONA_BASE_PROMPT = SHARED_REVIEW_CONTEXT_PROMPT + """
+# あなたの役割
+あなたは指定された聴衆になりきってプレゼンをレビューする専門家です。上記の聴衆情報があなたのペルソナです。
+上記の資料分析結果、プレゼン目的、そしてあなたのペルソナである聴衆情報に基づき、このプレゼンが聴衆にとって分かりやすいか、興味を引くか、納得できるかを評価してください。
 あなたのレビューは、後続の編集者が最終レポートを作成するために使用します。聴衆の視点が明確に伝わるように記述してください。
+"""
 
-# 資料分析結果
-```json
-{{document_analysis}}
+REPORT_SYNTHESIZER_BASE_PROMPT = SHARED_REVIEW_CONTEXT_PROMPT + """
+# あなたの役割
+あなたは優秀な編集者です。以下の2つの異なる視点からのレビューコメントと上記の資料情報を統合し、構造化された最終レポートを作成してください。
+
+# レビュー1: 論理批評家からのコメント
+```text
+{{logic_critic_review_text}}
+```
+
+# レビュー2: 聴衆ペルソナからのコメント
+```text
+{{audience_persona_review_text}}
+```
+
+# 過去のレビューを再利用するスライド（ない場合もあります）
+以下のスライド番号のスライドには、過去の資料で同じ内容のスライドに作成したレビューを使用します。
+{{reused_slide_numbers?}}
+
+# 出力形式
+あなたは必ず、指定されたJSONスキーマ(FinalReport)に従って、以下の要素を含む最終レポートを生成しなければなりません。
+- `summary_review`: 全体の総評を3〜5文で簡潔にまとめる。
+- `storyline_review`: ストーリー構成の強みと弱みを具体的に指摘し、改善案を提示する。
+- `slide_by_slide_reviews`: 全てのスライドについて、個別の評価と改善提案をリスト形式で記述する。ただし、過去のレビューを再利用するスライドは含めない。
+
+JSON以外のテキストは絶対に出力しないでください。
+"""
+
+QNA_GENERATOR_BASE_PROMPT = SHARED_REVIEW_CONTEXT_PROMPT + """
+# あなたの役割
+あなたはプレゼンテーションの質疑応答を想定する専門家です。
+上記の資料分析結果、プレゼン目的、聴衆情報と、以下の専門家によるレビューを基に、このプレゼンで聴衆から投げかけられる可能性が高い質問と、それに対する模範的な回答のペアを生成してください。
+特に、レビューで指摘された弱点や、聴衆が疑問に思いそうな点、深掘りしたいであろう点を的確に突いた質問を考えてください。
+
+# レビュー1: 論理批評家からのコメント（ない場合もあります）
+```text
+{{logic_critic_review_text}}
+```
+
+# レビュー2: 聴衆ペルソナからのコメント（ない場合もあります）
+```text
+{{audience_persona_review_text}}
 ```
 
+# 出力形式
+あなたは必ず、指定されたJSONスキーマ(QnAList)に従って、`qna_list`に5〜10個の質疑応答ペアを生成しなければなりません。
+JSON以外のテキストは絶対に出力しないでください。
+"""
+
+# 資料全体をプロンプトに含めず、search_slides ツールで必要なスライドだけを参照させる版（長い資料向け）
+QNA_GENERATOR_RETRIEVAL_PROMPT = """
+あなたはプレゼンテーションの質疑応答を想定する専門家です。
+以下のスライド一覧、プレゼン目的、聴衆情報と、専門家によるレビューを基に、このプレゼンで聴衆から投げかけられる可能性が高い質問と、それに対する模範的な回答のペアを生成してください。
+特に、レビューで指摘された弱点や、聴衆が疑問に思いそうな点、深掘りしたいであろう点を的確に突いた質問を考えてください。
+
+資料の全文は渡されていません。質問や回答を作る際は、`search_slides` ツールで関連するスライドを検索し、資料の記載内容に基づいて回答してください。
+1回の検索では3〜5枚程度を取得し、質問ごとに必要な範囲だけを検索してください。
+
+# スライド一覧（スライド番号とタイトル）
+{{slide_outline}}
+
 # プレゼン目的
 {{presentation_goal}}
 
-# あなたのペルソナ（聴衆情報）
+# 聴衆情報
 ```json
 {{audience_profile}}
 ```
-"""
 
-REPORT_SYNTHESIZER_BASE_PROMPT = """
-あなたは優秀な編集者です。以下の2つの異なる視点からのレビューコメントと元の資料情報を統合し、構造化された最終レポートを作成してください。
-
-# レビュー1: 論理批評家からのコメント
+# レビュー1: 論理批評家からのコメント（ない場合もあります）
 ```text
 {{logic_critic_review_text}}
 ```
 
-# レビュー2: 聴衆ペルソナからのコメント
+# レビュー2: 聴衆ペルソナからのコメント（ない場合もあります）
 ```text
 {{audience_persona_review_text}}
 ```
 
-# 元の資料情報
+# 出力形式
+5〜10個の質疑応答ペアを、以下の形式のテキストで出力してください。
+```
+Q1. （質問）
+A1. （回答）
+```
+"""
+
+# QNA_GENERATOR_RETRIEVAL_PROMPT で作成した質疑応答を、QnAList のJSONに整形する（ツールを使わない整形専用のエージェント向け）
+QNA_FORMATTER_PROMPT = """
+以下は、プレゼンテーションの想定問答集の下書きです。
+下書きの質問と回答を、内容を変えずにそのまま指定されたJSONスキーマ(QnAList)の`qna_list`に整形してください。
+
+# 想定問答集の下書き
+```text
+{{qna_draft}}
+```
+
+# 出力形式
+あなたは必ず、指定されたJSONスキーマ(QnAList)に従って出力しなければなりません。
+JSON以外のテキストは絶対に出力しないでください。
+"""
+
+# --- チャンク分割レビュー（長い資料向け） ---
+# {{review_chunk}} は実行時にチャンクごとのStateキーに置き換えられる
+
+CHUNK_REVIEWER_BASE_PROMPT = """
+あなたはプレゼンテーションをレビューする専門家チームの一員です。
+資料が長いため、全体を複数のチャンクに分けてレビューしています。あなたの担当は以下のチャンクです。
+チャンクには前後の文脈を把握するためのスライドも含まれていますが、`review_target_slides`に含まれるスライドのみをレビュー対象としてください。
+
+論理構成の専門家としての視点と、指定された聴衆になりきった視点の両方から、各スライドの評価と具体的な改善提案を作成してください。
+
+# 担当チャンク
 ```json
-{{document_analysis}}
+{{review_chunk}}
 ```
 
 # プレゼン目的
@@ -86,23 +186,22 @@ REPORT_SYNTHESIZER_BASE_PROMPT = """
 ```
 
 # 出力形式
-あなたは必ず、指定されたJSONスキーマ(FinalReport)に従って、以下の要素を含む最終レポートを生成しなければなりません。
-- `summary_review`: 全体の総評を3〜5文で簡潔にまとめる。
-- `storyline_review`: ストーリー構成の強みと弱みを具体的に指摘し、改善案を提示する。
-- `slide_by_slide_reviews`: 全てのスライドについて、個別の評価と改善提案をリスト形式で記述する。
+あなたは必ず、指定されたJSONスキーマ(ChunkReview)に従って出力しなければなりません。
+- `slide_by_slide_reviews`: `review_target_slides`の全てのスライドについて、個別の評価と改善提案を記述する。
+- `storyline_notes`: このチャンクの範囲での構成・論理展開の強みと弱み、聴衆が感じるであろう疑問を簡潔にまとめる。
 
 JSON以外のテキストは絶対に出力しないでください。
 """
 
-QNA_GENERATOR_BASE_PROMPT = """
-あなたはプレゼンテーションの質疑応答を想定する専門家です。
-以下の最終レポートとプレゼン目的、聴衆情報を基に、このプレゼンで聴衆から投げかけられる可能性が高い質問と、それに対する模範的な回答のペアを生成してください。
-特に、聴衆が疑問に思いそうな点や、深掘りしたいであろう点を的確に突いた質問を考えてください。
+REPORT_REDUCER_BASE_PROMPT = """
+あなたは優秀な編集者です。長いプレゼン資料をチャンクに分けてレビューした結果が以下にあります。
+資料全体の構成と各チャンクでの気付きを統合し、プレゼン全体の総評とストーリーラインのレビューを作成してください。
 
-# 最終レポート
-```json
-{{final_report}}
-```
+# 資料の構成（スライド番号とタイトル）
+{{chunk_review_outline}}
+
+# チャンクごとの気付き
+{{chunk_review_digest}}
 
 # プレゼン目的
 {{presentation_goal}}
@@ -113,6 +212,9 @@ QNA_GENERATOR_BASE_PROMPT = """
 ```
 
 # 出力形式
-あなたは必ず、指定されたJSONスキーマ(QnAPairのリスト)に従って、5〜10個の質疑応答ペアを生成しなければなりません。
+あなたは必ず、指定されたJSONスキーマ(ReportOverview)に従って、以下の要素を出力しなければなりません。
+- `summary_review`: 全体の総評を3〜5文で簡潔にまとめる。
+- `storyline_review`: ストーリー構成の強みと弱みを具体的に指摘し、改善案を提示する。
+
 JSON以外のテキストは絶対に出力しないでください。
-"""
\ No newline at end of file
+"""
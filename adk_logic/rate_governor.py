@@ -0,0 +1,471 @@
+import asyncio
+import contextlib
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, AsyncGenerator, Awaitable, Callable, Deque, Dict, Optional, Tuple, TypeVar
+
+import httpx
+from google.adk.models import BaseLlm, Gemini, LlmCapabilities, LlmRequest, LlmResponse, LLMRegistry
+from pydantic import PrivateAttr
+
+from adk_logic.batch_prediction import get_batch_predictor
+from adk_logic.genai_client import PooledGemini
+
+logger = logging.getLogger(__name__)
+
+# 流量制御の設定を読み込む環境変数と既定値。
+# app.py では load_dotenv() がモジュールのimport後に呼ばれるため、値は流量制御の生成時に読む
+# - MODEL_RATE_LIMIT_RPM: モデルごとのリクエスト数の上限 (1分あたり)。0の場合は制限しない
+# - MODEL_RATE_LIMIT_BURST: 待たずに送信できるリクエスト数（トークンバケットの容量）
+# - MODEL_MAX_CONCURRENCY / MODEL_MIN_CONCURRENCY: モデルごとの同時実行数の上限と、AIMDで下げる際の下限
+# - MODEL_RETRY_MAX_ATTEMPTS: 1回のモデル呼び出しの試行回数の上限（初回を含む）
+# - MODEL_RETRY_BASE_DELAY_SECONDS / MODEL_RETRY_MAX_DELAY_SECONDS: リトライまでの待ち時間の基準値と上限
+# - MODEL_STAGE_DEADLINE_SECONDS: エージェント1段分のモデル呼び出し（順番待ち・リトライを含む）の期限
+RATE_GOVERNOR_ENV_DEFAULTS = {
+    "rate_limit_rpm": ("MODEL_RATE_LIMIT_RPM", float, 120),
+    "burst": ("MODEL_RATE_LIMIT_BURST", int, 20),
+    "max_concurrency": ("MODEL_MAX_CONCURRENCY", int, 16),
+    "min_concurrency": ("MODEL_MIN_CONCURRENCY", int, 1),
+    "max_attempts": ("MODEL_RETRY_MAX_ATTEMPTS", int, 5),
+    "base_delay_seconds": ("MODEL_RETRY_BASE_DELAY_SECONDS", float, 1.0),
+    "max_delay_seconds": ("MODEL_RETRY_MAX_DELAY_SECONDS", float, 30.0),
+    "deadline_seconds": ("MODEL_STAGE_DEADLINE_SECONDS", float, 600.0),
+}
+
+# リトライで回復が見込めるHTTPステータス
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+# レート制限・クォータ超過を表すHTTPステータス
+THROTTLING_STATUS_CODE = 429
+# LlmResponse.custom_metadata に順番待ちの時間と試行回数を記録する際のキー
+RATE_GOVERNOR_METADATA_KEY = "rate_governor"
+# 待ち時間の分布（p95）を計算するために保持する直近の件数
+QUEUE_WAIT_SAMPLES = 1024
+
+T = TypeVar("T")
+
+
+class RateGovernorDeadlineExceeded(TimeoutError):
+    """順番待ちやリトライを含むモデル呼び出しが、期限までに完了しなかった"""
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    # google.genai.errors.APIError は code、httpx.HTTPStatusError は response.status_code を持つ
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code
+    response = getattr(error, "response", None)
+    status_code = getattr(response, "status_code", None)
+    return status_code if isinstance(status_code, int) else None
+
+
+def is_throttling_error(error: BaseException) -> bool:
+    """レート制限・クォータ超過 (429 / RESOURCE_EXHAUSTED) による失敗かどうか"""
+    return _status_code(error) == THROTTLING_STATUS_CODE or "RESOURCE_EXHAUSTED" in str(error)
+
+
+def is_retryable_error(error: BaseException) -> bool:
+    """時間をおいて再実行すれば成功しうる失敗かどうか"""
+    if isinstance(error, RateGovernorDeadlineExceeded):
+        return False
+    if isinstance(error, (httpx.TransportError, asyncio.TimeoutError)):
+        return True
+    return _status_code(error) in RETRYABLE_STATUS_CODES or is_throttling_error(error)
+
+
+class TokenBucket:
+    """
+    一定の速度でトークンが補充されるバケット。呼び出しごとに1トークンを予約し、不足分が補充されるまで待つ。
+    予約順に待ち時間が決まるため、待っている呼び出しは先着順に送信される。
+    """
+
+    def __init__(self, rate_per_second: float, capacity: int):
+        self.rate_per_second = rate_per_second
+        self.capacity = max(1, capacity)
+        self._tokens = float(self.capacity)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    async def acquire(self) -> None:
+        if self.rate_per_second <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate_per_second)
+            self._updated_at = now
+            self._tokens -= 1
+            wait_seconds = -self._tokens / self.rate_per_second if self._tokens < 0 else 0.0
+        if wait_seconds > 0:
+            await asyncio.sleep(wait_seconds)
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMDで上限を調整するセマフォ。
+    レート制限を受けると上限を半分に下げ、成功するたびに 1/上限 ずつ（上限分の呼び出しが成功するごとに1つ）戻す。
+
+    job_queue のワーカーとStreamlitのバックグラウンドループなど、複数のイベントループから共有されるため、
+    状態はスレッドロックで保護し、待っている呼び出しはそれぞれのループ経由で起こす。
+    """
+
+    def __init__(self, max_limit: int, min_limit: int = 1):
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.limit = float(self.max_limit)
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self._waiters: Deque[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = deque()
+        self._last_decrease_at = 0.0
+
+    @property
+    def waiting(self) -> int:
+        with self._lock:
+            return len(self._waiters)
+
+    async def acquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if not self._waiters and self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                queued = waiter in self._waiters
+                if queued:
+                    self._waiters.remove(waiter)
+            if not queued and waiter[1].done() and not waiter[1].cancelled():
+                # 枠を譲られた直後に取り消された。まだ _grant が実行されていない場合は _grant で返却される
+                self.release()
+            raise
+
+    def release(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self._wake_waiters()
+
+    def _wake_waiters(self) -> None:
+        # ロックを保持した状態で呼び出す
+        while self._waiters and self.in_flight < int(self.limit):
+            loop, future = self._waiters.popleft()
+            self.in_flight += 1
+            try:
+                loop.call_soon_threadsafe(self._grant, future)
+            except RuntimeError:
+                # 待っていたループが既に閉じられている
+                self.in_flight -= 1
+
+    def _grant(self, future: asyncio.Future) -> None:
+        if future.done():
+            self.release()
+        else:
+            future.set_result(None)
+
+    def on_success(self) -> None:
+        with self._lock:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._wake_waiters()
+
+    def on_throttled(self, call_started_at: float) -> None:
+        """
+        レート制限を受けた呼び出しを記録する。
+        前回下げた後に開始した呼び出しの失敗のみで下げ、同時に送った呼び出しがまとめて失敗しても1回だけ半分にする。
+        """
+        with self._lock:
+            if call_started_at < self._last_decrease_at:
+                return
+            self.limit = max(self.min_limit, self.limit / 2)
+            self._last_decrease_at = time.monotonic()
+
+
+@dataclass
+class GovernedCallRecord:
+    """1回の呼び出し（リトライを含む）の順番待ちの時間と試行回数"""
+    queue_wait_ms: float = 0.0
+    attempts: int = 0
+
+
+class _ModelLimits:
+    """1つのモデルに対する流量制御の状態と計測値"""
+
+    def __init__(self, governor: "ModelRateGovernor"):
+        self.bucket = TokenBucket(governor.rate_limit_rpm / 60, governor.burst)
+        self.concurrency = AdaptiveConcurrencyLimiter(governor.max_concurrency, governor.min_concurrency)
+        self._lock = threading.Lock()
+        self.counters: Dict[str, int] = {
+            "calls": 0, "succeeded": 0, "failed": 0, "retries": 0, "throttled": 0, "deadline_exceeded": 0,
+        }
+        self.queue_wait_total_seconds = 0.0
+        self.queue_wait_max_seconds = 0.0
+        self._recent_waits: Deque[float] = deque(maxlen=QUEUE_WAIT_SAMPLES)
+
+    def count(self, key: str) -> None:
+        with self._lock:
+            self.counters[key] += 1
+
+    def record_queue_wait(self, seconds: float) -> None:
+        with self._lock:
+            self.queue_wait_total_seconds += seconds
+            self.queue_wait_max_seconds = max(self.queue_wait_max_seconds, seconds)
+            self._recent_waits.append(seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self.counters)
+            recent = sorted(self._recent_waits)
+            waits = counters["calls"] + counters["retries"]
+            queue_wait_avg_ms = self.queue_wait_total_seconds / waits * 1000 if waits else 0.0
+            queue_wait_max_ms = self.queue_wait_max_seconds * 1000
+        return {
+            **counters,
+            "concurrency_limit": int(self.concurrency.limit),
+            "in_flight": self.concurrency.in_flight,
+            "waiting": self.concurrency.waiting,
+            "queue_wait_avg_ms": queue_wait_avg_ms,
+            "queue_wait_p95_ms": recent[int(len(recent) * 0.95)] * 1000 if recent else 0.0,
+            "queue_wait_max_ms": queue_wait_max_ms,
+        }
+
+
+class ModelRateGovernor:
+    """
+    プロセス内のすべてのLLM呼び出しを、モデルごとに流量制御する。
+
+    - トークンバケットで1分あたりのリクエスト数を制限する
+    - 同時実行数の上限をAIMDで調整し、レート制限を受けたら送信を絞る
+    - 一時的な失敗 (429 / 5xx / 通信エラー) は、ジッター付きの指数バックオフでリトライする
+    - 順番待ちとリトライを含めた期限を設け、期限を過ぎたら失敗として返す
+    - 順番待ちの時間・リトライ・レート制限の回数をモデルごとに計測する
+    """
+
+    def __init__(
+        self,
+        rate_limit_rpm: float = 120.0,
+        burst: int = 20,
+        max_concurrency: int = 16,
+        min_concurrency: int = 1,
+        max_attempts: int = 5,
+        base_delay_seconds: float = 1.0,
+        max_delay_seconds: float = 30.0,
+        deadline_seconds: float = 600.0,
+    ):
+        self.rate_limit_rpm = rate_limit_rpm
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay_seconds = base_delay_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self.deadline_seconds = deadline_seconds
+        self._lock = threading.Lock()
+        self._models: Dict[str, _ModelLimits] = {}
+        self._rng = random.Random()
+
+    @classmethod
+    def from_env(cls) -> "ModelRateGovernor":
+        """環境変数の設定から流量制御を生成する"""
+        return cls(**{
+            name: value_type(os.environ.get(env_name, default))
+            for name, (env_name, value_type, default) in RATE_GOVERNOR_ENV_DEFAULTS.items()
+        })
+
+    def _limits(self, model: str) -> _ModelLimits:
+        with self._lock:
+            limits = self._models.get(model)
+            if limits is None:
+                limits = self._models[model] = _ModelLimits(self)
+            return limits
+
+    def backoff_delay(self, attempt: int) -> float:
+        """attempt 回目の失敗の後に待つ時間。上限付きの指数関数の範囲から一様に選ぶ (full jitter)"""
+        return self._rng.uniform(0, min(self.max_delay_seconds, self.base_delay_seconds * 2 ** (attempt - 1)))
+
+    @contextlib.asynccontextmanager
+    async def _slot(self, model: str, limits: _ModelLimits, deadline: float, record: GovernedCallRecord):
+        loop = asyncio.get_running_loop()
+        queued_at = loop.time()
+        try:
+            async with asyncio.timeout_at(deadline):
+                await limits.bucket.acquire()
+                await limits.concurrency.acquire()
+        except TimeoutError as e:
+            limits.count("deadline_exceeded")
+            limits.count("failed")
+            raise RateGovernorDeadlineExceeded(
+                f"Timed out after waiting {loop.time() - queued_at:.1f}s for a {model} call slot."
+            ) from e
+        waited = loop.time() - queued_at
+        record.queue_wait_ms += waited * 1000
+        limits.record_queue_wait(waited)
+        try:
+            yield
+        finally:
+            limits.concurrency.release()
+
+    async def stream(
+        self,
+        model: str,
+        open_stream: Callable[[], AsyncGenerator[T, None]],
+        record: Optional[GovernedCallRecord] = None,
+    ) -> AsyncGenerator[T, None]:
+        """
+        流量制御とリトライを行いながら、open_stream() が返す応答を順に返す。
+
+        応答を1つでも返した後に失敗した場合、呼び出し元に同じ応答が重複して届かないようリトライせずに送出する。
+
+        Args:
+            model: 呼び出すモデルの名前。流量制御はモデルごとに行う。
+            open_stream: 呼び出しを開始し、応答の非同期ジェネレーターを返す関数。リトライのたびに呼び出される。
+            record: 順番待ちの時間と試行回数を書き込む記録（任意）。
+        """
+        record = record if record is not None else GovernedCallRecord()
+        limits = self._limits(model)
+        limits.count("calls")
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline_seconds
+        while True:
+            record.attempts += 1
+            yielded = False
+            error: Optional[Exception] = None
+            async with self._slot(model, limits, deadline, record):
+                started_at = time.monotonic()
+                responses = open_stream()
+                try:
+                    while True:
+                        try:
+                            async with asyncio.timeout_at(deadline):
+                                response = await anext(responses)
+                        except StopAsyncIteration:
+                            break
+                        except Exception as e:
+                            error = e
+                            break
+                        yielded = True
+                        yield response
+                finally:
+                    await responses.aclose()
+
+            if error is None:
+                limits.count("succeeded")
+                limits.concurrency.on_success()
+                return
+            if is_throttling_error(error):
+                limits.count("throttled")
+                limits.concurrency.on_throttled(started_at)
+            if isinstance(error, TimeoutError) and loop.time() >= deadline:
+                limits.count("deadline_exceeded")
+                limits.count("failed")
+                raise RateGovernorDeadlineExceeded(
+                    f"{model} call did not finish within {self.deadline_seconds:.0f}s."
+                ) from error
+            delay = self.backoff_delay(record.attempts)
+            if (
+                yielded
+                or not is_retryable_error(error)
+                or record.attempts >= self.max_attempts
+                or loop.time() + delay >= deadline
+            ):
+                limits.count("failed")
+                raise error
+            limits.count("retries")
+            logger.warning(
+                f"{model} call failed ({type(error).__name__}: {error}); "
+                f"retrying in {delay:.1f}s (attempt {record.attempts + 1}/{self.max_attempts})."
+            )
+            await asyncio.sleep(delay)
+
+    async def call(
+        self,
+        model: str,
+        request: Callable[[], Awaitable[T]],
+        record: Optional[GovernedCallRecord] = None,
+    ) -> T:
+        """流量制御とリトライを行いながら request() を実行し、結果を返す（ストリーミングしない呼び出し用）"""
+        async def single_response() -> AsyncGenerator[T, None]:
+            yield await request()
+
+        responses = [response async for response in self.stream(model, single_response, record)]
+        return responses[0]
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """モデルごとの呼び出し回数・リトライ・レート制限の回数、同時実行数の上限、順番待ちの時間を返す"""
+        with self._lock:
+            models = dict(self._models)
+        return {model: limits.stats() for model, limits in models.items()}
+
+
+class RateGovernedLlm(BaseLlm):
+    """
+    LLMRegistry で解決したモデルの呼び出しを、ModelRateGovernor 経由で行うラッパー。
+    エージェントの model にこのインスタンスを指定すると、そのエージェントのLLM呼び出しがすべて流量制御される。
+
+    最終的な応答の custom_metadata には、順番待ちの時間と試行回数が記録される（タイムラインの記録に使う）。
+    バッチ予測が有効な場合 (adk_logic/batch_prediction.py) は、呼び出しをバッチ予測にまとめて投入する。
+    """
+
+    _inner: Optional[BaseLlm] = PrivateAttr(default=None)
+
+    @property
+    def inner(self) -> BaseLlm:
+        # ベンチマークなどでLLMRegistryに登録したスタブを使えるよう、最初の呼び出し時に解決する
+        if self._inner is None:
+            if LLMRegistry.resolve(self.model) is Gemini:
+                # モデルごとにクライアントを生成せず、コネクションプールを共有する
+                self._inner = PooledGemini(model=self.model)
+            else:
+                self._inner = LLMRegistry.new_llm(self.model)
+        return self._inner
+
+    @property
+    def capabilities(self) -> LlmCapabilities:
+        return self.inner.capabilities
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        batch_predictor = get_batch_predictor()
+        if batch_predictor is not None:
+            # バッチ予測はジョブ単位で処理されるため、流量制御は通さない（完了までの時間も期限の対象外とする）
+            yield await batch_predictor.generate(self.model, llm_request)
+            return
+
+        record = GovernedCallRecord()
+        responses = get_rate_governor().stream(
+            self.model, lambda: self.inner.generate_content_async(llm_request, stream=stream), record
+        )
+        async with contextlib.aclosing(responses):
+            async for response in responses:
+                if not response.partial:
+                    response.custom_metadata = {
+                        **(response.custom_metadata or {}),
+                        RATE_GOVERNOR_METADATA_KEY: {
+                            "queue_wait_ms": record.queue_wait_ms,
+                            "attempts": record.attempts,
+                        },
+                    }
+                yield response
+
+
+def governed_model(model: str) -> RateGovernedLlm:
+    """エージェントの model に指定する、流量制御付きのモデルを返す"""
+    return RateGovernedLlm(model=model)
+
+
+_rate_governor: Optional[ModelRateGovernor] = None
+_rate_governor_lock = threading.Lock()
+
+
+def get_rate_governor() -> ModelRateGovernor:
+    """プロセス内で共有する流量制御を返す"""
+    global _rate_governor
+    with _rate_governor_lock:
+        if _rate_governor is None:
+            _rate_governor = ModelRateGovernor.from_env()
+    return _rate_governor
@@ -0,0 +1,213 @@
+import asyncio
+import atexit
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Coroutine, Dict, Optional, Tuple
+
+from google import genai
+from google.adk.runners import Runner
+from google.adk.sessions import BaseSessionService, InMemorySessionService
+
+from utils.config_loader import get_config_version
+from adk_logic.root_agent_factory import create_root_agent
+from adk_logic.agents.document_analyzer_agent import create_document_analyzer_agent
+from adk_logic.genai_client import get_genai_client_pool
+
+logger = logging.getLogger(__name__)
+
+APP_NAME = "presenta-ai"
+
+RunnerKey = Tuple[Tuple[Tuple[str, str], ...], str]
+
+# 失敗したレビューのセッションを、再開のために保持する期間の既定値（最終更新からの経過時間）
+DEFAULT_SESSION_TTL_SECONDS = 7 * 24 * 3600
+# 期限切れのセッションを削除する間隔の既定値
+DEFAULT_SESSION_PRUNE_INTERVAL_SECONDS = 3600
+
+
+def create_session_service() -> BaseSessionService:
+    """
+    環境変数 SESSION_BACKEND に応じたセッションサービスを生成する。
+
+    - sqlite (既定): SQLiteにStateとイベントを保存する。エージェントの成果物がStateに書き込まれるたびに永続化されるため、
+      プロセスの再起動後や失敗後も、同じセッションで完了済みの段階を飛ばしてレビューを再開できる
+    - memory: プロセス内にのみ保持する
+    """
+    # app.py では load_dotenv() がモジュールのimport後に呼ばれるため、設定は生成時に読む
+    backend = os.environ.get("SESSION_BACKEND", "sqlite")
+    if backend == "memory":
+        return InMemorySessionService()
+    if backend != "sqlite":
+        raise ValueError(f"Unknown SESSION_BACKEND: {backend}")
+    db_path = os.environ.get(
+        "SESSION_DB_PATH",
+        os.path.join(tempfile.gettempdir(), "presenta-ai", "sessions.sqlite3"),
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    # aiosqlite が必要なため、使用する場合のみ読み込む
+    from google.adk.sessions.sqlite_session_service import SqliteSessionService
+
+    logger.info(f"Using SQLite session store at {db_path}")
+    return SqliteSessionService(db_path)
+
+
+class ResourceRegistry:
+    """
+    プロセス全体で共有する、生成コストの高いリソースのレジストリ。
+
+    - genaiクライアント: イベントループごとに1つを、エージェントのモデルを含むすべての呼び出しで共有する (GenaiClientPool)
+    - Runner: チーム編成 (selected_configs) とレビュー方式の組み合わせごとにエージェントツリーごと再利用する
+      （設定ファイルが変更された場合は、新しい設定でエージェントツリーを構築し直す）
+    - 先行解析のRunner: レビューの開始前に資料の解析のみを実行する
+    - バックグラウンドのイベントループ: レビュージョブ・先行解析・自動編成を実行し、非同期クライアントを常に同じループから使うための実行環境
+    - セッションサービス: 失敗したレビューのセッションは再開のために残るため、期限切れのものを定期的に削除する
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._runners: Dict[RunnerKey, Runner] = {}
+        self._runners_config_version: Optional[str] = None
+        self._analysis_runner: Optional[Runner] = None
+        self._session_service: BaseSessionService = create_session_service()
+        # 設定は生成時に読む (create_session_service と同じ理由)
+        self.session_ttl_seconds = float(os.environ.get("SESSION_TTL_SECONDS", DEFAULT_SESSION_TTL_SECONDS))
+        self.session_prune_interval_seconds = float(
+            os.environ.get("SESSION_PRUNE_INTERVAL_SECONDS", DEFAULT_SESSION_PRUNE_INTERVAL_SECONDS)
+        )
+        self._last_session_prune_at: Optional[float] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[threading.Thread] = None
+
+    @property
+    def session_service(self) -> BaseSessionService:
+        return self._session_service
+
+    async def prune_expired_sessions(self, ttl_seconds: Optional[float] = None) -> int:
+        """
+        最終更新から ttl_seconds（省略時は SESSION_TTL_SECONDS）を過ぎたセッションを削除し、削除した数を返す。
+        完了したレビューのセッションは実行後に削除されるため、残っているのは再開されないまま放置された失敗したレビューである。
+        """
+        ttl_seconds = self.session_ttl_seconds if ttl_seconds is None else ttl_seconds
+        cutoff = time.time() - ttl_seconds
+        response = await self._session_service.list_sessions(app_name=APP_NAME)
+        expired = [session for session in response.sessions if session.last_update_time < cutoff]
+        for session in expired:
+            await self._session_service.delete_session(
+                app_name=APP_NAME, user_id=session.user_id, session_id=session.id
+            )
+        if expired:
+            logger.info(f"Pruned {len(expired)} session(s) not updated for {ttl_seconds:.0f}s.")
+        return len(expired)
+
+    async def prune_expired_sessions_if_due(self) -> int:
+        """
+        前回の削除から SESSION_PRUNE_INTERVAL_SECONDS が経過していれば、期限切れのセッションを削除する。
+        新しいレビューの開始前に呼び出す。プロセスの起動後、最初のレビューでは必ず削除する。
+        削除に失敗してもレビューは続行できるため、例外は送出しない。
+        """
+        now = time.monotonic()
+        with self._lock:
+            if (
+                self._last_session_prune_at is not None
+                and now - self._last_session_prune_at < self.session_prune_interval_seconds
+            ):
+                return 0
+            self._last_session_prune_at = now
+        try:
+            return await self.prune_expired_sessions()
+        except Exception:
+            logger.warning("Failed to prune expired sessions.", exc_info=True)
+            return 0
+
+    def get_genai_client(self) -> genai.Client:
+        """実行中のイベントループで共有するVertex AIのgenaiクライアントを返す"""
+        return get_genai_client_pool().get()
+
+    def get_runner(self, selected_configs: Dict[str, str], review_mode: str) -> Runner:
+        """チーム編成とレビュー方式に対応するRunnerを返す。エージェントツリーは組み合わせごとに1度だけ構築する。"""
+        key: RunnerKey = (tuple(sorted(selected_configs.items())), review_mode)
+        config_version = get_config_version()
+        with self._lock:
+            if config_version != self._runners_config_version:
+                # エージェントの指示は構築時の設定で固定されるため、設定が変わったら構築済みのツリーを破棄する
+                if self._runners:
+                    logger.info(f"Agent config changed to {config_version}; discarding {len(self._runners)} cached tree(s).")
+                self._runners.clear()
+                self._runners_config_version = config_version
+            runner = self._runners.get(key)
+            if runner is None:
+                runner = Runner(
+                    app_name=APP_NAME,
+                    session_service=self._session_service,
+                    agent=create_root_agent(selected_configs, review_mode=review_mode),
+                )
+                self._runners[key] = runner
+                logger.info(f"Built agent tree for {dict(key[0])} ({review_mode}). Cached trees: {len(self._runners)}")
+            return runner
+
+    def get_analysis_runner(self) -> Runner:
+        """
+        資料の解析 (DocumentAnalyzerAgent) のみを実行するRunnerを返す。レビューの開始前の先行解析に使う。
+        先行解析のセッションは解析が終われば不要なため、レビューのセッションとは別にメモリ上で管理する。
+        """
+        with self._lock:
+            if self._analysis_runner is None:
+                self._analysis_runner = Runner(
+                    app_name=APP_NAME,
+                    session_service=InMemorySessionService(),
+                    agent=create_document_analyzer_agent(use_prefetched_analysis=False),
+                )
+            return self._analysis_runner
+
+    def submit_coroutine(self, coro: Coroutine[Any, Any, Any]) -> Future:
+        """バックグラウンドのイベントループでコルーチンの実行を始め、完了を待たずに Future を返す"""
+        return asyncio.run_coroutine_threadsafe(coro, self.event_loop)
+
+    def run_coroutine(self, coro: Coroutine[Any, Any, Any], timeout: Optional[float] = None) -> Any:
+        """
+        バックグラウンドのイベントループでコルーチンを実行し、結果を待って返す。
+        Streamlitのスクリプトスレッドから非同期APIを呼び出す際に使用する。
+        """
+        return self.submit_coroutine(coro).result(timeout=timeout)
+
+    @property
+    def event_loop(self) -> asyncio.AbstractEventLoop:
+        """バックグラウンドのイベントループを返す（初回のみ起動する）"""
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._loop_thread = threading.Thread(
+                    target=self._loop.run_forever, name="presenta-resource-loop", daemon=True
+                )
+                self._loop_thread.start()
+            return self._loop
+
+    def close(self) -> None:
+        """保持しているリソースを解放する。以降の呼び出しでは必要に応じて再生成される。"""
+        get_genai_client_pool().close()
+        with self._lock:
+            self._runners.clear()
+            self._analysis_runner = None
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._loop_thread.join(timeout=5)
+                self._loop = None
+                self._loop_thread = None
+
+
+_registry: Optional[ResourceRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_resource_registry() -> ResourceRegistry:
+    """プロセス内で共有するリソースレジストリを返す"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ResourceRegistry()
+            atexit.register(_registry.close)
+    return _registry
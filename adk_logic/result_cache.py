@@ -0,0 +1,64 @@
+import hashlib
+import json
+import os
+import tempfile
+from typing import Any, Dict, Optional
+
+from google.adk.models import LlmRequest
+from pydantic import BaseModel
+
+from utils.persistent_cache import PersistentLRUCache
+
+# エージェントの応答を、レンダリング済みのリクエストごとにキャッシュするかどうか
+RESULT_CACHE_ENABLED = os.environ.get("RESULT_CACHE_ENABLED", "true").lower() == "true"
+RESULT_CACHE_DIR = os.environ.get(
+    "RESULT_CACHE_DIR",
+    os.path.join(tempfile.gettempdir(), "presenta-ai", "result_cache"),
+)
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get("RESULT_CACHE_MAX_ENTRIES", "1024"))
+
+# キーに含めない生成設定。セッションごとに変わる値や、応答の内容に影響しない値
+_EXCLUDED_CONFIG_FIELDS = {"system_instruction", "cached_content", "http_options", "labels", "response_schema"}
+
+_result_cache: Optional[PersistentLRUCache] = None
+
+
+def _schema_fingerprint(schema: Any) -> Optional[Any]:
+    if schema is None:
+        return None
+    if isinstance(schema, type) and issubclass(schema, BaseModel):
+        return schema.model_json_schema()
+    return str(schema)
+
+
+def build_result_cache_key(llm_request: LlmRequest) -> Optional[str]:
+    """
+    モデル・レンダリング済みのシステム指示・会話内容・生成設定・出力スキーマから、応答のキャッシュキーを生成する。
+    エージェントへの入力（資料・目的・聴衆・チーム編成の選択など）はすべてプロンプトに展開されているため、
+    いずれかが変わればキーも変わる。
+
+    ファイルなどテキスト以外のパートを含むリクエストはキャッシュしないため、Noneを返す。
+    """
+    contents = []
+    for content in llm_request.contents:
+        parts = content.parts or []
+        if any(part.text is None for part in parts):
+            return None
+        contents.append({"role": content.role, "text": [part.text for part in parts]})
+
+    config = llm_request.config
+    material: Dict[str, Any] = {"model": llm_request.model, "contents": contents}
+    if config is not None:
+        material["system_instruction"] = config.system_instruction
+        material["response_schema"] = _schema_fingerprint(config.response_schema)
+        material["config"] = config.model_dump(mode="json", exclude_none=True, exclude=_EXCLUDED_CONFIG_FIELDS)
+    serialized = json.dumps(material, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+def get_result_cache() -> PersistentLRUCache:
+    """プロセス内で共有するエージェントの応答のキャッシュを返す"""
+    global _result_cache
+    if _result_cache is None:
+        _result_cache = PersistentLRUCache(RESULT_CACHE_DIR, RESULT_CACHE_MAX_ENTRIES)
+    return _result_cache
@@ -0,0 +1,100 @@
+import hashlib
+from difflib import SequenceMatcher
+from typing import Any, Dict, List, Optional
+
+from adk_logic.document_serializer import normalize_slide_text
+from adk_logic.tools.document_parser_tool import MIN_TEXT_DENSITY_CHARS
+
+
+def slide_content_hash(slide: Dict[str, Any], min_chars: int = MIN_TEXT_DENSITY_CHARS) -> Optional[str]:
+    """
+    改訂前後のスライドを比較するための、タイトル・本文・発表者ノートのハッシュを返す。
+    テキストがほとんどないスライド（画像のみのスライドなど）は、内容が変わっても同じ値になってしまうためNoneを返す。
+    """
+    normalized = normalize_slide_text(slide)
+    if len(normalized.replace(" ", "")) < min_chars:
+        return None
+    notes = normalize_slide_text({"text": slide.get("notes")})
+    return hashlib.sha256(f"{normalized}\0{notes}".encode("utf-8")).hexdigest()
+
+
+def align_revised_slides(old_slides: List[Dict[str, Any]], new_slides: List[Dict[str, Any]]) -> Dict[int, int]:
+    """
+    改訂版の資料のスライドと、内容が変わっていない改訂前のスライドを対応付ける。
+
+    スライドの並びの最長一致で、挿入・削除されたスライドの前後を対応付けた後、
+    残りのスライドを内容のハッシュで対応付ける（移動したスライド）。
+
+    Args:
+        old_slides: 改訂前の資料のスライド (SlideContent に対応する辞書) のリスト。
+        new_slides: 改訂版の資料のスライドのリスト。
+
+    Returns:
+        改訂版のスライド番号から、同じ内容の改訂前のスライド番号への辞書。変更・追加されたスライドは含まない。
+    """
+    old_hashes = [slide_content_hash(slide) for slide in old_slides]
+    new_hashes = [slide_content_hash(slide) for slide in new_slides]
+    # 比較できないスライドは、互いに一致しない値に置き換える
+    old_keys = [value or f"old:{index}" for index, value in enumerate(old_hashes)]
+    new_keys = [value or f"new:{index}" for index, value in enumerate(new_hashes)]
+
+    matched: Dict[int, int] = {}
+    matcher = SequenceMatcher(None, old_keys, new_keys, autojunk=False)
+    for block in matcher.get_matching_blocks():
+        for offset in range(block.size):
+            matched[block.b + offset] = block.a + offset
+
+    # 並びの一致から外れたスライドは、同じ内容の未対応のスライドに対応付ける
+    unmatched_old: Dict[str, List[int]] = {}
+    used_old = set(matched.values())
+    for index, value in enumerate(old_hashes):
+        if value is not None and index not in used_old:
+            unmatched_old.setdefault(value, []).append(index)
+    for index, value in enumerate(new_hashes):
+        if index in matched or value is None or not unmatched_old.get(value):
+            continue
+        matched[index] = unmatched_old[value].pop(0)
+
+    return {
+        new_slides[new_index]["slide_number"]: old_slides[old_index]["slide_number"]
+        for new_index, old_index in matched.items()
+    }
+
+
+def build_revised_analysis(
+    previous_analysis: Dict[str, Any], new_analysis: Dict[str, Any], slide_map: Dict[int, int]
+) -> Dict[str, Any]:
+    """
+    改訂版の資料の解析結果を組み立てる。
+    変更のないスライドは改訂前の解析結果をスライド番号だけ付け替えて引き継ぎ、それ以外は new_analysis のスライドを使う。
+    """
+    previous_slides = {slide["slide_number"]: slide for slide in previous_analysis.get("slides") or []}
+    slides = []
+    for slide in new_analysis["slides"]:
+        previous_slide = previous_slides.get(slide_map.get(slide["slide_number"]))
+        slides.append({**previous_slide, "slide_number": slide["slide_number"]} if previous_slide else slide)
+    return {
+        "file_name": new_analysis["file_name"],
+        "total_slides": len(slides),
+        "slides": slides,
+        "error": None,
+    }
+
+
+def carry_over_slide_reviews(previous_review: Dict[str, Any], slides: List[Dict[str, Any]]) -> Dict[int, Dict[str, Any]]:
+    """
+    改訂前の資料と内容が変わっていないスライドについて、改訂前のスライドごとのレビューを改訂版のスライド番号で返す。
+
+    Args:
+        previous_review: 改訂前のレビュー結果 (PreviousReview に対応する辞書)。
+        slides: 改訂版の資料の解析結果のスライドのリスト。
+    """
+    slide_map = align_revised_slides(previous_review["document_analysis"]["slides"], slides)
+    previous_reviews = {
+        review["slide_number"]: review for review in previous_review["final_report"].get("slide_by_slide_reviews") or []
+    }
+    return {
+        new_number: {**previous_reviews[old_number], "slide_number": new_number}
+        for new_number, old_number in slide_map.items()
+        if old_number in previous_reviews
+    }
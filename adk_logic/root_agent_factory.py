@@ -1,46 +1,84 @@
+import os
 from typing import Dict, List
-from google.adk.agents import BaseAgent, SequentialAgent, ParallelAgent
+from google.adk.agents import BaseAgent, SequentialAgent
 from adk_logic.agents.document_analyzer_agent import create_document_analyzer_agent
 from adk_logic.agents.logic_critic_agent import create_logic_critic_agent
 from adk_logic.agents.audience_persona_agent import create_audience_persona_agent
 from adk_logic.agents.report_synthesizer_agent import create_report_synthesizer_agent
 from adk_logic.agents.qna_generator_agent import create_qna_generator_agent
-from adk_logic.callbacks import before_agent_callback
+from adk_logic.agents.chunked_review_agent import ChunkedReviewAgent
+from adk_logic.callbacks import (
+    before_agent_callback,
+    enable_result_memoization,
+    enable_stage_checkpoints,
+    instrument_agent_tree,
+)
+from adk_logic.workflow_builder import build_dag_workflow
+from utils.config_loader import validate_selected_configs
 
-def create_root_agent(selected_configs: Dict[str, str]) -> SequentialAgent:
+# レビュー方式の既定値。"chunked" は長い資料をスライドのウィンドウに分割してレビューする
+DEFAULT_REVIEW_MODE = os.environ.get("REVIEW_MODE", "standard")
+REVIEW_CHUNK_SIZE = int(os.environ.get("REVIEW_CHUNK_SIZE", "20"))
+REVIEW_CHUNK_OVERLAP = int(os.environ.get("REVIEW_CHUNK_OVERLAP", "2"))
+REVIEW_MAX_CONCURRENCY = int(os.environ.get("REVIEW_MAX_CONCURRENCY", "4"))
+# Q&A生成エージェントへの資料の渡し方
+# - full: 資料全体をプロンプトに含める（レビューエージェントとプロンプトの先頭を共有する）
+# - search: スライド一覧のみを渡し、必要なスライドを search_slides ツールで検索させる
+# - auto (既定): chunked レビュー（長い資料）の場合のみ search にする
+QNA_DOCUMENT_ACCESS = os.environ.get("QNA_DOCUMENT_ACCESS", "auto")
+
+def create_root_agent(selected_configs: Dict[str, str], review_mode: str = DEFAULT_REVIEW_MODE) -> SequentialAgent:
     """
     ユーザーの選択設定に基づき、ワークフロー全体を制御するRootSequentialAgentを動的に生成する。
+    エージェント間の実行順序は、各エージェントが読み書きするStateのキーから自動的に決定される。
+
+    Args:
+        selected_configs: ユーザーが選択したチーム編成設定。
+        review_mode: "standard" は資料全体を一度にレビューする。
+            "chunked" はスライドをウィンドウに分割して並行レビューし、最終レポートに統合する。
+
+    Raises:
+        ValueError: selected_configs に設定ファイルの選択肢にないIDが含まれる場合。
     """
-    sub_agents: List[BaseAgent] = []
+    selected_configs = validate_selected_configs(selected_configs)
+    agents: List[BaseAgent] = []
 
     # 1. 資料解析エージェントは常に実行
-    sub_agents.append(create_document_analyzer_agent())
+    agents.append(create_document_analyzer_agent())
 
-    # 2. 2つのレビューエージェントを並列実行
-    # (参照: docs/agents/workflow-agents/parallel-agents.md)
-    reviewer_agents = [
-        create_logic_critic_agent(selected_configs.get("logic_critic", "supportive")),
-        create_audience_persona_agent(selected_configs.get("audience_persona", "newbie"))
-    ]
-    parallel_reviewer = ParallelAgent(
-        name="ReviewerParallelAgent",
-        sub_agents=reviewer_agents,
-        before_agent_callback=before_agent_callback
-    )
-    sub_agents.append(parallel_reviewer)
+    if review_mode == "chunked":
+        # 2-3. チャンクごとの並行レビューと、最終レポートへの統合
+        agents.append(ChunkedReviewAgent(
+            name="ChunkedReviewAgent",
+            selected_configs=selected_configs,
+            chunk_size=REVIEW_CHUNK_SIZE,
+            chunk_overlap=REVIEW_CHUNK_OVERLAP,
+            max_concurrency=REVIEW_MAX_CONCURRENCY,
+            before_agent_callback=before_agent_callback,
+        ))
+    else:
+        # 2. 2つのレビューエージェント
+        agents.append(create_logic_critic_agent(selected_configs.get("logic_critic", "supportive")))
+        agents.append(create_audience_persona_agent(selected_configs.get("audience_persona", "newbie")))
+        # 3. レポート統合エージェント
+        agents.append(create_report_synthesizer_agent())
 
-    # 3. レポート統合エージェントを実行
-    sub_agents.append(create_report_synthesizer_agent())
-    
     # 4. Q&A生成が有効な場合のみ、Q&A生成エージェントを実行
     if selected_configs.get("qna_generator") == "enabled":
-        sub_agents.append(create_qna_generator_agent())
+        slide_search = QNA_DOCUMENT_ACCESS == "search" or (QNA_DOCUMENT_ACCESS == "auto" and review_mode == "chunked")
+        agents.append(create_qna_generator_agent(slide_search=slide_search))
 
-    # 最終的なワークフローをSequentialAgentとして構築
-    # (参照: docs/agents/workflow-agents/sequential-agents.md)
-    root_agent = SequentialAgent(
-        name="PresentaAiRootAgent",
-        sub_agents=sub_agents
+    # 各エージェントが読み書きするStateのキーから依存関係を求め、独立したエージェントを並行実行する
+    # 例: 2つのレビューは並行、Q&A生成はレポート統合と並行して実行される
+    # (参照: docs/agents/workflow-agents/parallel-agents.md)
+    root_agent = build_dag_workflow(
+        "PresentaAiRootAgent",
+        agents,
+        parallel_stage_callback=before_agent_callback,
     )
-    
-    return root_agent
\ No newline at end of file
+    # 失敗したレビューを再開する際は、成果物がStateに保存済みのエージェントをスキップする
+    enable_stage_checkpoints(root_agent)
+    # 入力（レンダリング済みのプロンプト）が前回と同じエージェントは、LLMを呼び出さずに前回の応答を再利用する
+    enable_result_memoization(root_agent)
+    # すべてのエージェントの実行時間・トークン数をレビューごとのタイムラインに記録する
+    return instrument_agent_tree(root_agent)
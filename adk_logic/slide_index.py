@@ -0,0 +1,163 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List
+
+import numpy as np
+
+# 1チャンクの最大文字数。これより長いスライドの本文は、行の区切りで複数のチャンクに分ける
+SLIDE_INDEX_CHUNK_CHARS = int(os.environ.get("SLIDE_INDEX_CHUNK_CHARS", "600"))
+# プロセス内に保持するインデックスの数
+SLIDE_INDEX_CACHE_SIZE = int(os.environ.get("SLIDE_INDEX_CACHE_SIZE", "32"))
+# BM25のパラメータ
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# 英数字は単語ごと、日本語（かな・漢字）は分かち書きの代わりに文字のbigramをトークンとする
+_TOKEN_PATTERN = re.compile(r"[0-9a-z]+|[\u3040-\u30ff\u3400-\u9fff\uf900-\ufaff]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """検索用のトークン列を返す。全角・半角の違いと大文字・小文字の違いは無視する。"""
+    tokens = []
+    for match in _TOKEN_PATTERN.finditer(unicodedata.normalize("NFKC", text or "").lower()):
+        run = match.group()
+        if run.isascii() or len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+@dataclass
+class SlideChunk:
+    """インデックスの検索単位。スライドの本文の一部、または発表者ノート"""
+    slide_number: int
+    kind: str
+    text: str
+
+
+def chunk_slides(slides: List[Dict[str, Any]], chunk_chars: int = SLIDE_INDEX_CHUNK_CHARS) -> List[SlideChunk]:
+    """
+    スライドを検索単位のチャンクに分ける。本文にはタイトルを含め、chunk_chars を超える場合は行の区切りで分割する。
+    発表者ノートは本文とは別のチャンクにする。
+    """
+    chunks = []
+    for slide in slides:
+        title = slide.get("title") or ""
+        current = title
+        for line in (slide.get("text") or "").splitlines():
+            if current and len(current) + len(line) > chunk_chars:
+                chunks.append(SlideChunk(slide["slide_number"], "body", current))
+                # 分割後のチャンクにもタイトルを含め、どのスライドの内容か分かるようにする
+                current = title
+            current = f"{current}\n{line}" if current else line
+        if current:
+            chunks.append(SlideChunk(slide["slide_number"], "body", current))
+        if slide.get("notes"):
+            chunks.append(SlideChunk(slide["slide_number"], "notes", slide["notes"]))
+    return chunks
+
+
+class SlideIndex:
+    """
+    スライドのBM25検索インデックス。
+
+    トークンごとに、出現するチャンクとBM25の重みを配列（転置インデックス）として保持する。
+    検索時は質問のトークンの配列を足し合わせてチャンクのスコアを求め、スライドごとの最大値で順位付けする。
+    """
+
+    def __init__(self, slides: List[Dict[str, Any]], chunk_chars: int = SLIDE_INDEX_CHUNK_CHARS):
+        self.slides = {slide["slide_number"]: slide for slide in slides}
+        chunks = chunk_slides(slides, chunk_chars)
+        self.num_chunks = len(chunks)
+        self._slide_numbers = np.array(sorted(self.slides), dtype=np.int64)
+        # チャンクが属するスライドの、_slide_numbers 上の位置
+        self._chunk_slide_positions = np.searchsorted(
+            self._slide_numbers, np.array([chunk.slide_number for chunk in chunks], dtype=np.int64)
+        )
+
+        self.vocabulary: Dict[str, int] = {}
+        term_ids: List[int] = []
+        chunk_ids: List[int] = []
+        term_counts: List[int] = []
+        chunk_lengths = np.zeros(self.num_chunks, dtype=np.float32)
+        for chunk_id, chunk in enumerate(chunks):
+            tokens = tokenize(chunk.text)
+            chunk_lengths[chunk_id] = len(tokens)
+            for token, count in Counter(tokens).items():
+                term_ids.append(self.vocabulary.setdefault(token, len(self.vocabulary)))
+                chunk_ids.append(chunk_id)
+                term_counts.append(count)
+
+        terms = np.array(term_ids, dtype=np.int64)
+        postings_chunks = np.array(chunk_ids, dtype=np.int64)
+        tf = np.array(term_counts, dtype=np.float32)
+        document_frequency = np.bincount(terms, minlength=len(self.vocabulary)).astype(np.float32)
+        idf = np.log1p((self.num_chunks - document_frequency + 0.5) / (document_frequency + 0.5))
+        average_length = float(chunk_lengths.mean()) if self.num_chunks else 0.0
+        length_norm = 1 - BM25_B + BM25_B * chunk_lengths[postings_chunks] / max(average_length, 1.0)
+        weights = idf[terms] * tf * (BM25_K1 + 1) / (tf + BM25_K1 * length_norm)
+
+        # トークンIDの順に並べ、トークンごとの範囲を offsets で引けるようにする
+        order = np.argsort(terms, kind="stable")
+        self._postings_chunks = postings_chunks[order]
+        self._postings_weights = weights[order].astype(np.float32)
+        self._offsets = np.concatenate(([0], np.cumsum(document_frequency.astype(np.int64))))
+
+    def search(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+        """
+        質問に関連するスライドを、スコアの高い順に最大 top_k 件返す。
+
+        Returns:
+            スライドの辞書 (SlideContent) に score を加えた辞書のリスト。関連するスライドが無い場合は空のリスト。
+        """
+        chunk_scores = np.zeros(self.num_chunks, dtype=np.float32)
+        for token, count in Counter(tokenize(query)).items():
+            term_id = self.vocabulary.get(token)
+            if term_id is None:
+                continue
+            start, end = self._offsets[term_id], self._offsets[term_id + 1]
+            # 1つのトークンの転置リストには同じチャンクが1度しか現れないため、加算は重複しない
+            chunk_scores[self._postings_chunks[start:end]] += self._postings_weights[start:end] * count
+
+        slide_scores = np.zeros(len(self._slide_numbers), dtype=np.float32)
+        np.maximum.at(slide_scores, self._chunk_slide_positions, chunk_scores)
+        top_k = min(max(1, top_k), int(np.count_nonzero(slide_scores)))
+        if top_k == 0:
+            return []
+        candidates = np.argpartition(-slide_scores, top_k - 1)[:top_k]
+        ranked = candidates[np.argsort(-slide_scores[candidates], kind="stable")]
+        return [
+            {**self.slides[int(self._slide_numbers[position])], "score": round(float(slide_scores[position]), 4)}
+            for position in ranked
+        ]
+
+
+_indexes: "OrderedDict[str, SlideIndex]" = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def get_slide_index(analysis: Dict[str, Any]) -> SlideIndex:
+    """
+    資料解析結果 (DocumentAnalysisResult) のインデックスを返す。
+    同じ内容の解析結果には、プロセス内で1度だけ作成したインデックスを使い回す。
+    """
+    slides = analysis.get("slides") or []
+    key = hashlib.sha256(json.dumps(slides, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is not None:
+            _indexes.move_to_end(key)
+            return index
+    index = SlideIndex(slides)
+    with _indexes_lock:
+        _indexes[key] = index
+        while len(_indexes) > max(1, SLIDE_INDEX_CACHE_SIZE):
+            _indexes.popitem(last=False)
+    return index
@@ -0,0 +1,352 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Mapping, Optional
+
+import numpy as np
+
+from utils.config_loader import get_prompt_fragment
+from adk_logic.document_serializer import normalize_slide_text
+from adk_logic.revision import carry_over_slide_reviews
+from adk_logic.prompts.base_prompts import CHUNK_REVIEWER_BASE_PROMPT, REPORT_SYNTHESIZER_BASE_PROMPT
+
+logger = logging.getLogger(__name__)
+
+# 過去の資料のスライドとほぼ同じスライドに、保存済みのスライドごとのレビューを再利用するかどうか
+SLIDE_REVIEW_REUSE_ENABLED = os.environ.get("SLIDE_REVIEW_REUSE_ENABLED", "true").lower() == "true"
+SLIDE_REVIEW_DB_PATH = os.environ.get(
+    "SLIDE_REVIEW_DB_PATH",
+    os.path.join(tempfile.gettempdir(), "presenta-ai", "slide_reviews.sqlite3"),
+)
+# 再利用するスライドの類似度（文字3-gramのJaccard係数の推定値）の下限
+SLIDE_REVIEW_REUSE_SIMILARITY = float(os.environ.get("SLIDE_REVIEW_REUSE_SIMILARITY", "0.9"))
+# 本文がこの文字数未満のスライド（画像のみのスライドや区切りのスライド）は、内容が違っても一致してしまうため対象外とする
+SLIDE_REVIEW_MIN_CHARS = int(os.environ.get("SLIDE_REVIEW_MIN_CHARS", "30"))
+
+# MinHashの署名の長さと、LSHのバンドの分け方（MINHASH_BANDS × MINHASH_ROWS = MINHASH_PERMUTATIONS）
+# 8行 × 8バンドでは、類似度0.9のスライドは約99%、0.6のスライドは約13%が候補になる
+MINHASH_PERMUTATIONS = 64
+MINHASH_BANDS = 8
+MINHASH_ROWS = MINHASH_PERMUTATIONS // MINHASH_BANDS
+_SHINGLE_CHARS = 3
+# 再利用したレビューを、実行中のレビューのStateに保存するキー
+REUSED_SLIDE_REVIEWS_KEY = "reused_slide_reviews"
+# レポート統合エージェントのプロンプトに埋め込む、再利用したスライドの番号の一覧
+REUSED_SLIDE_NUMBERS_KEY = "reused_slide_numbers"
+# SQLiteのバインド変数の上限より小さい、1回の問い合わせで渡す値の数
+_QUERY_BATCH_SIZE = 500
+
+# レビューのプロンプトが変われば同じスライドでもレビューが変わるため、プロンプト本文のハッシュを再利用の範囲に含める
+SLIDE_REVIEW_PROMPT_VERSION = hashlib.sha256(
+    (CHUNK_REVIEWER_BASE_PROMPT + REPORT_SYNTHESIZER_BASE_PROMPT).encode("utf-8")
+).hexdigest()[:12]
+
+def _mix64(values: np.ndarray) -> np.ndarray:
+    """64bit整数の全単射なハッシュ (splitmix64 の最終段)。uint64の乗算のオーバーフローは剰余として扱う。"""
+    values = values ^ (values >> np.uint64(30))
+    values = values * np.uint64(0xBF58476D1CE4E5B9)
+    values = values ^ (values >> np.uint64(27))
+    values = values * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+# 署名の各要素に使うハッシュ関数の種。プロセスや環境によらず同じ値にする
+_MINHASH_SEEDS = _mix64(np.arange(1, MINHASH_PERMUTATIONS + 1, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15))
+
+
+def compute_minhash(normalized_text: str) -> np.ndarray:
+    """正規化した文字列の、文字3-gramの集合に対するMinHashの署名 (uint64 × MINHASH_PERMUTATIONS) を返す"""
+    codepoints = np.frombuffer(normalized_text.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    if len(codepoints) < _SHINGLE_CHARS:
+        codepoints = np.concatenate([codepoints, np.zeros(_SHINGLE_CHARS - len(codepoints), dtype=np.uint64)])
+    # コードポイントは21bitに収まるため、3文字を1つの63bit整数に重複なく詰められる
+    shingles = np.unique(
+        (codepoints[:-2] << np.uint64(42)) | (codepoints[1:-1] << np.uint64(21)) | codepoints[2:]
+    )
+    return _mix64(shingles[None, :] ^ _MINHASH_SEEDS[:, None]).min(axis=1)
+
+
+def _band_hashes(signature: np.ndarray) -> List[int]:
+    """
+    LSHのバンドごとのハッシュ。いずれかのバンドが一致するスライドを類似度の計算対象にする。
+    バンドの位置もハッシュに含め、別の位置のバンドとは一致しないようにする。
+    """
+    return [
+        int.from_bytes(
+            hashlib.blake2b(
+                bytes([band]) + signature[band * MINHASH_ROWS:(band + 1) * MINHASH_ROWS].tobytes(), digest_size=8
+            ).digest(),
+            "little",
+            signed=True,
+        )
+        for band in range(MINHASH_BANDS)
+    ]
+
+
+def build_review_scope(
+    presentation_goal: str, audience_profile: Dict[str, Any], selected_configs: Dict[str, str]
+) -> str:
+    """
+    レビューを再利用できる範囲のキーを返す。
+    同じスライドでも、プレゼン目的・聴衆・レビュー方針が違えばレビューも変わるため、これらが一致する場合のみ再利用する。
+    """
+    material = {
+        "presentation_goal": (presentation_goal or "").strip(),
+        "audience_profile": {
+            "role": (audience_profile or {}).get("role", "").strip(),
+            "interests": (audience_profile or {}).get("interests", "").strip(),
+        },
+        # 選択肢のIDではなく方針の本文を使い、設定ファイルで方針が書き換えられた場合は別の範囲にする
+        "logic_critic": get_prompt_fragment("logic_critic", selected_configs.get("logic_critic", "supportive")),
+        "audience_persona": get_prompt_fragment("audience_persona", selected_configs.get("audience_persona", "newbie")),
+        "prompt_version": SLIDE_REVIEW_PROMPT_VERSION,
+    }
+    return hashlib.sha256(json.dumps(material, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class SlideReviewStore:
+    """
+    スライドの指紋 (MinHashの署名) と、そのスライドに対するレビューを保存するSQLiteのストア。
+
+    保存済みのスライドとの類似度が similarity_threshold 以上のスライドには、保存済みのレビューを再利用する。
+    候補の絞り込みには、署名をバンドに分けたハッシュの一致 (LSH) を使うため、保存件数が増えても検索は速い。
+    """
+
+    def __init__(self, db_path: str = SLIDE_REVIEW_DB_PATH, similarity_threshold: float = SLIDE_REVIEW_REUSE_SIMILARITY):
+        self.db_path = db_path
+        self.similarity_threshold = similarity_threshold
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS slide_reviews (
+                    review_id INTEGER PRIMARY KEY,
+                    scope TEXT NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    signature BLOB NOT NULL,
+                    evaluation TEXT NOT NULL,
+                    suggestion TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    UNIQUE (scope, content_hash)
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS slide_review_bands (
+                    scope TEXT NOT NULL,
+                    band_hash INTEGER NOT NULL,
+                    review_id INTEGER NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_slide_review_bands ON slide_review_bands (scope, band_hash)"
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # 複数スレッドから利用するため、操作ごとに接続を開いて閉じる
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.row_factory = sqlite3.Row
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _fingerprint(slide: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        normalized = normalize_slide_text(slide)
+        if len(normalized) < SLIDE_REVIEW_MIN_CHARS:
+            return None
+        signature = compute_minhash(normalized)
+        return {
+            "content_hash": hashlib.sha256(normalized.encode("utf-8")).hexdigest(),
+            "signature": signature,
+            "band_hashes": _band_hashes(signature),
+        }
+
+    def find_reusable_reviews(self, scope: str, slides: List[Dict[str, Any]]) -> Dict[int, Dict[str, Any]]:
+        """
+        保存済みのスライドとほぼ同じスライドを探し、保存済みのレビューを返す。
+
+        Args:
+            scope: build_review_scope で求めた再利用の範囲。
+            slides: DocumentAnalysisResult.slides に対応する辞書のリスト。
+
+        Returns:
+            スライド番号をキーとした、SlideReview に対応する辞書。スライド番号は今回の資料の番号に置き換える。
+        """
+        fingerprints = {slide["slide_number"]: self._fingerprint(slide) for slide in slides}
+        fingerprints = {number: fingerprint for number, fingerprint in fingerprints.items() if fingerprint}
+        if not fingerprints:
+            return {}
+
+        with self._connect() as conn:
+            exact: Dict[str, sqlite3.Row] = {}
+            content_hashes = list({fingerprint["content_hash"] for fingerprint in fingerprints.values()})
+            for start in range(0, len(content_hashes), _QUERY_BATCH_SIZE):
+                batch = content_hashes[start:start + _QUERY_BATCH_SIZE]
+                rows = conn.execute(
+                    f"SELECT * FROM slide_reviews WHERE scope = ? AND content_hash IN ({','.join('?' * len(batch))})",
+                    (scope, *batch),
+                ).fetchall()
+                exact.update({row["content_hash"]: row for row in rows})
+
+            # 完全に一致しないスライドは、いずれかのバンドのハッシュが一致する保存済みのスライドを候補とする
+            near_numbers = [number for number, fingerprint in fingerprints.items() if fingerprint["content_hash"] not in exact]
+            band_hashes = list({
+                band_hash for number in near_numbers for band_hash in fingerprints[number]["band_hashes"]
+            })
+            band_pairs: List[tuple] = []
+            for start in range(0, len(band_hashes), _QUERY_BATCH_SIZE):
+                batch = band_hashes[start:start + _QUERY_BATCH_SIZE]
+                band_pairs.extend(conn.execute(
+                    f"SELECT band_hash, review_id FROM slide_review_bands "
+                    f"WHERE scope = ? AND band_hash IN ({','.join('?' * len(batch))})",
+                    (scope, *batch),
+                ))
+            candidate_ids = list({review_id for _, review_id in band_pairs})
+            candidates: List[sqlite3.Row] = []
+            for start in range(0, len(candidate_ids), _QUERY_BATCH_SIZE):
+                batch = candidate_ids[start:start + _QUERY_BATCH_SIZE]
+                candidates.extend(conn.execute(
+                    f"SELECT * FROM slide_reviews WHERE review_id IN ({','.join('?' * len(batch))})", batch
+                ))
+
+        matches = {number: exact[fingerprint["content_hash"]] for number, fingerprint in fingerprints.items() if number not in near_numbers}
+        if near_numbers and candidates:
+            candidate_signatures = np.frombuffer(
+                b"".join(row["signature"] for row in candidates), dtype=np.uint64
+            ).reshape(len(candidates), MINHASH_PERMUTATIONS)
+            # (バンドのハッシュ, 候補の位置) をハッシュの順に並べ、スライドごとの候補を二分探索で引けるようにする
+            row_of = {row["review_id"]: index for index, row in enumerate(candidates)}
+            pair_hashes = np.array([band_hash for band_hash, _ in band_pairs], dtype=np.int64)
+            pair_rows = np.array([row_of[review_id] for _, review_id in band_pairs], dtype=np.int64)
+            order = np.argsort(pair_hashes, kind="stable")
+            pair_hashes, pair_rows = pair_hashes[order], pair_rows[order]
+            for number in near_numbers:
+                fingerprint = fingerprints[number]
+                slide_band_hashes = np.array(fingerprint["band_hashes"], dtype=np.int64)
+                lefts = np.searchsorted(pair_hashes, slide_band_hashes, side="left")
+                rights = np.searchsorted(pair_hashes, slide_band_hashes, side="right")
+                rows = np.unique(np.concatenate([pair_rows[left:right] for left, right in zip(lefts, rights)]))
+                if not len(rows):
+                    continue
+                # 署名の要素が一致する割合が、3-gram集合のJaccard係数の推定値になる
+                agreements = np.count_nonzero(candidate_signatures[rows] == fingerprint["signature"], axis=1)
+                best = int(agreements.argmax())
+                if agreements[best] / MINHASH_PERMUTATIONS >= self.similarity_threshold:
+                    matches[number] = candidates[rows[best]]
+
+        return {
+            number: {"slide_number": number, "evaluation": row["evaluation"], "suggestion": row["suggestion"]}
+            for number, row in matches.items()
+        }
+
+    def save_reviews(self, scope: str, slides: List[Dict[str, Any]], reviews: List[Dict[str, Any]]) -> int:
+        """
+        スライドごとのレビューを、スライドの指紋とともに保存する。同じ内容のスライドが保存済みの場合は上書きしない。
+
+        Returns:
+            新たに保存したレビューの数。
+        """
+        slides_by_number = {slide["slide_number"]: slide for slide in slides}
+        saved = 0
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for review in reviews:
+                    slide = slides_by_number.get(review.get("slide_number"))
+                    fingerprint = self._fingerprint(slide) if slide else None
+                    if fingerprint is None or not review.get("evaluation"):
+                        continue
+                    cursor = conn.execute(
+                        "INSERT OR IGNORE INTO slide_reviews "
+                        "(scope, content_hash, signature, evaluation, suggestion, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                        (scope, fingerprint["content_hash"], fingerprint["signature"].tobytes(),
+                         review["evaluation"], review.get("suggestion") or "", time.time()),
+                    )
+                    if not cursor.rowcount:
+                        continue
+                    conn.executemany(
+                        "INSERT INTO slide_review_bands (scope, band_hash, review_id) VALUES (?, ?, ?)",
+                        [(scope, band_hash, cursor.lastrowid) for band_hash in fingerprint["band_hashes"]],
+                    )
+                    saved += 1
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return saved
+
+
+_slide_review_store: Optional[SlideReviewStore] = None
+_slide_review_store_lock = threading.Lock()
+
+
+def get_slide_review_store() -> SlideReviewStore:
+    """プロセス内で共有するスライドのレビューのストアを返す"""
+    global _slide_review_store
+    with _slide_review_store_lock:
+        if _slide_review_store is None:
+            _slide_review_store = SlideReviewStore()
+    return _slide_review_store
+
+
+async def find_reusable_slide_reviews(state: Mapping[str, Any], slides: List[Dict[str, Any]]) -> Dict[int, Dict[str, Any]]:
+    """
+    レビュー中のセッションのStateの条件（プレゼン目的・聴衆・チーム編成）で、再利用できるスライドごとのレビューを返す。
+
+    改訂版の資料のレビュー (previous_review がある場合) は、改訂前と内容が変わっていないスライドに改訂前のレビューを引き継ぐ。
+    残りのスライドは、ストアに保存された過去の資料のほぼ同じスライドのレビューを探す。
+
+    レビューの再開時は、前回の実行で決めた再利用の結果 (REUSED_SLIDE_REVIEWS_KEY) をそのまま使い、
+    その間にストアが更新されてもレビュー対象のスライドが変わらないようにする。
+    ストアを利用できない場合は、すべてのスライドをレビューするため空の辞書を返す。
+    """
+    reused = state.get(REUSED_SLIDE_REVIEWS_KEY)
+    if reused is not None:
+        return {review["slide_number"]: review for review in reused}
+    scope = build_review_scope(
+        state.get("presentation_goal") or "", state.get("audience_profile") or {}, state.get("selected_configs") or {}
+    )
+    reviews: Dict[int, Dict[str, Any]] = {}
+    previous_review = state.get("previous_review")
+    if previous_review:
+        if previous_review.get("review_scope") in (None, scope):
+            reviews.update(carry_over_slide_reviews(previous_review, slides))
+            logger.info(f"Carried over {len(reviews)} slide review(s) from the previous revision")
+        else:
+            logger.info("Review conditions changed since the previous revision; reviewing all slides")
+    if not SLIDE_REVIEW_REUSE_ENABLED:
+        return reviews
+    remaining_slides = [slide for slide in slides if slide["slide_number"] not in reviews]
+    try:
+        reviews.update(await asyncio.to_thread(get_slide_review_store().find_reusable_reviews, scope, remaining_slides))
+    except sqlite3.Error as e:
+        logger.warning(f"Failed to look up reusable slide reviews: {e}")
+    return reviews
+
+
+async def save_slide_reviews(state: Mapping[str, Any], slides: List[Dict[str, Any]], reviews: List[Dict[str, Any]]) -> None:
+    """LLMが新たに生成したスライドごとのレビューを、以降のレビューで再利用できるように保存する"""
+    if not SLIDE_REVIEW_REUSE_ENABLED or not reviews:
+        return
+    scope = build_review_scope(
+        state.get("presentation_goal") or "", state.get("audience_profile") or {}, state.get("selected_configs") or {}
+    )
+    try:
+        saved = await asyncio.to_thread(get_slide_review_store().save_reviews, scope, slides, reviews)
+    except sqlite3.Error as e:
+        logger.warning(f"Failed to store slide reviews: {e}")
+        return
+    logger.info(f"Stored {saved} new slide review(s) for reuse")
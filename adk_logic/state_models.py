@@ -1,11 +1,22 @@
 from pydantic import BaseModel, Field
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Literal
+
+AnalysisMode = Literal["llm", "hybrid", "local"]
+ReviewMode = Literal["standard", "chunked"]
 
 class AudienceProfile(BaseModel):
     """聴衆のプロファイル"""
     role: str = Field(description="聴衆の役職や立場")
     interests: str = Field(description="聴衆の主な関心事や知識レベル")
 
+class DocumentHandle(BaseModel):
+    """アップロードされた資料のハンドル。資料のバイト列はプロセス内の資料ストアに sha256 をキーとして保持される。"""
+    sha256: str = Field(description="資料のSHA-256ハッシュ。")
+    file_name: str = Field(description="アップロードされたファイル名。")
+    mime_type: str = Field(description="資料のMIMEタイプ。")
+    size_bytes: int = Field(description="資料のサイズ（バイト）。")
+    uri: str = Field(description="資料の保存先のURI。保存はバックグラウンドで行われるため、完了していない場合がある。")
+
 class SlideContent(BaseModel):
     """スライド1枚の内容"""
     slide_number: int
@@ -26,11 +37,25 @@ class SlideReview(BaseModel):
     evaluation: str
     suggestion: str
 
+class ChunkReview(BaseModel):
+    """スライドの一部分（チャンク）に対するレビュー結果"""
+    slide_by_slide_reviews: List[SlideReview] = Field(description="レビュー対象スライドごとの評価と改善案。")
+    storyline_notes: str = Field(description="このチャンクの範囲における構成・論理展開・聴衆視点での気付き。")
+
+class ReportOverview(BaseModel):
+    """チャンクごとのレビューを統合した全体評価"""
+    summary_review: str = Field(description="プレゼン全体に対する総評。")
+    storyline_review: str = Field(description="構成やストーリーラインに対する詳細なレビュー。")
+
 class QnAPair(BaseModel):
     """質疑応答のペア"""
     question: str
     answer: str
 
+class QnAList(BaseModel):
+    """想定問答集"""
+    qna_list: List[QnAPair] = Field(description="想定される質疑応答のリスト。")
+
 class FinalReport(BaseModel):
     """最終的なレビューレポート"""
     summary_review: str = Field(description="プレゼン全体に対する総評。")
@@ -38,21 +63,36 @@ class FinalReport(BaseModel):
     slide_by_slide_reviews: List[SlideReview] = Field(description="各スライドに対する具体的な評価と改善案。")
     qna_list: Optional[List[QnAPair]] = Field(default=None, description="想定される質疑応答のリスト。")
 
+class PreviousReview(BaseModel):
+    """改訂前の資料のレビュー結果。改訂版の資料のレビューで、変更のないスライドの解析結果とレビューを引き継ぐために使う。"""
+    document: Optional[DocumentHandle] = Field(default=None, description="改訂前の資料のハンドル。指定された場合、改訂前後の資料から同じ方式で抽出したテキストでスライドを比較する。")
+    document_analysis: DocumentAnalysisResult = Field(description="改訂前の資料の解析結果。")
+    final_report: FinalReport = Field(description="改訂前の資料のレビュー結果。")
+    review_scope: Optional[str] = Field(default=None, description="改訂前のレビューの条件（プレゼン目的・聴衆・レビュー方針）のハッシュ。条件が変わった場合はレビューを引き継がない。")
+
 class PresentaAiState(BaseModel):
     """ADKセッション全体で共有されるStateの構造"""
     # --- 初期入力 ---
     gcs_file_path: str = Field(description="GCS上のプレゼン資料のパス。")
+    document_sha256: Optional[str] = Field(default=None, description="アップロードされた資料のSHA-256ハッシュ。解析結果キャッシュのキーに使用する。")
+    document: Optional[DocumentHandle] = Field(default=None, description="アップロードされた資料のハンドル。同一プロセス内ではストレージを経由せずに資料を読み込める。")
     presentation_goal: str = Field(description="プレゼンテーションの目的。")
     audience_profile: AudienceProfile = Field(description="対象となる聴衆のプロファイル。")
     selected_configs: Dict[str, str] = Field(description="ユーザーが選択したAIレビューチームの編成設定。")
+    analysis_mode: AnalysisMode = Field(default="llm", description="資料解析の方式。llm: LLMで解析、local: ローカル抽出のみ、hybrid: ローカル抽出で不足するページのみLLMで解析。")
+    review_mode: ReviewMode = Field(default="standard", description="レビューの方式。standard: 資料全体を一度にレビュー、chunked: スライドのウィンドウごとにレビュー。レビューの再開時にエージェントの構成を選ぶために使う。")
+    previous_review: Optional[PreviousReview] = Field(default=None, description="改訂前の資料のレビュー結果。指定された場合、変更のあったスライドのみを解析・レビューする。")
 
     # --- 中間生成物 ---
     document_analysis: Optional[DocumentAnalysisResult] = Field(default=None, description="資料解析エージェントによる解析結果。")
+    local_document_analysis: Optional[DocumentAnalysisResult] = Field(default=None, description="hybridモードでのローカル抽出結果。LLMの解析結果とマージされる。")
+    llm_analysis_pages: Optional[List[int]] = Field(default=None, description="hybridモードでLLMに解析させるスライド番号。")
     logic_critic_review_text: Optional[str] = Field(default=None, description="ロジック批評家エージェントによる生レビューテキスト。")
     audience_persona_review_text: Optional[str] = Field(default=None, description="聴衆ペルソナエージェントによる生レビューテキスト。")
 
     # --- 最終成果物 ---
     final_report: Optional[FinalReport] = Field(default=None, description="最終的に生成されたレビューレポート。")
+    qna_result: Optional[QnAList] = Field(default=None, description="想定問答集。レポート統合と並行して生成され、最終レポートに統合される。")
     
     # PydanticモデルをADKのStateとして利用可能にするための設定
     class Config:
@@ -0,0 +1,171 @@
+import json
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pydantic import ValidationError
+
+from adk_logic.state_models import SlideReview
+
+logger = logging.getLogger(__name__)
+
+# ストリーミング中の応答からレポートを組み立てるエージェント（前方一致）
+STREAMED_REPORT_AGENT_PREFIXES = ("ReportSynthesizerAgent", "ReportReducerAgent", "ChunkReviewerAgent_")
+# 要素が1つ完成するごとに取り出す配列
+STREAMED_ARRAY_KEYS = ("slide_by_slide_reviews",)
+
+
+class IncrementalJsonParser:
+    """
+    少しずつ届くJSONオブジェクトの文字列から、完成した値を順に取り出すパーサー。
+
+    トップレベルのフィールドは値が閉じた時点で ("field", キー, 値) として、
+    stream_arrays に指定した配列の要素は要素ごとに ("item", キー, 要素) として返す。
+    走査位置と入れ子の状態を保持するため、届いた文字列はそれぞれ1度だけ走査される。
+    """
+
+    def __init__(self, stream_arrays: Iterable[str] = STREAMED_ARRAY_KEYS):
+        self.stream_arrays = set(stream_arrays)
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._expect_key = False
+        self._awaiting_value = False
+        self._key: Optional[str] = None
+        self._key_start: Optional[int] = None
+        self._value_start: Optional[int] = None
+        self._item_start: Optional[int] = None
+
+    def _decode(self, text: str) -> Tuple[bool, Any]:
+        try:
+            return True, json.loads(text)
+        except ValueError:
+            logger.debug(f"Skipping malformed JSON fragment: {text[:100]}")
+            return False, None
+
+    def _complete_value(self, end: int, events: List[Tuple[str, str, Any]]) -> None:
+        ok, value = self._decode(self._buffer[self._value_start:end].strip())
+        if ok:
+            events.append(("field", self._key, value))
+        self._value_start = None
+
+    def feed(self, chunk: str) -> List[Tuple[str, str, Any]]:
+        """文字列の続きを渡し、新たに完成した値を返す"""
+        self._buffer += chunk
+        buffer = self._buffer
+        events: List[Tuple[str, str, Any]] = []
+        for i in range(self._pos, len(buffer)):
+            char = buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._key_start is not None:
+                        ok, key = self._decode(buffer[self._key_start:i + 1])
+                        self._key = key if ok else None
+                        self._key_start = None
+                    elif self._depth == 1 and self._value_start is not None:
+                        self._complete_value(i + 1, events)
+                continue
+            if char.isspace():
+                continue
+            if self._depth == 1 and self._awaiting_value:
+                self._value_start = i
+                self._awaiting_value = False
+
+            if char == '"':
+                self._in_string = True
+                if self._depth == 1 and self._expect_key:
+                    self._key_start = i
+                    self._expect_key = False
+            elif char in "{[":
+                self._depth += 1
+                if self._depth == 1:
+                    self._expect_key = char == "{"
+                elif (
+                    self._depth == 3 and char == "{" and self._key in self.stream_arrays
+                    and buffer[self._value_start] == "["
+                ):
+                    self._item_start = i
+            elif char in "}]":
+                if self._depth == 1 and self._value_start is not None:
+                    # 数値・真偽値など、区切り文字で終わる値
+                    self._complete_value(i, events)
+                self._depth -= 1
+                if self._depth == 2 and self._item_start is not None:
+                    ok, item = self._decode(buffer[self._item_start:i + 1])
+                    if ok:
+                        events.append(("item", self._key, item))
+                    self._item_start = None
+                elif self._depth == 1 and self._value_start is not None:
+                    self._complete_value(i + 1, events)
+            elif char == ":" and self._depth == 1:
+                self._awaiting_value = True
+            elif char == "," and self._depth == 1:
+                if self._value_start is not None:
+                    self._complete_value(i, events)
+                self._expect_key = True
+        self._pos = len(buffer)
+        return events
+
+
+class PartialReportBuilder:
+    """
+    ストリーミング中のLLMの応答から、最終レポートの途中経過（総評・スライドごとのレビュー）を組み立てる。
+    エージェントごとにパーサーを持ち、応答の完了後は次の応答のために破棄する。
+    """
+
+    def __init__(self):
+        self._parsers: Dict[str, IncrementalJsonParser] = {}
+        self.summary_review: Optional[str] = None
+        self.storyline_review: Optional[str] = None
+        self._slide_reviews: Dict[int, Dict[str, Any]] = {}
+
+    @staticmethod
+    def is_streamed_agent(agent_name: str) -> bool:
+        return agent_name.startswith(STREAMED_REPORT_AGENT_PREFIXES)
+
+    def add_text(self, agent_name: str, text: str) -> bool:
+        """
+        エージェントの応答の続きを取り込む。
+
+        Returns:
+            途中経過に新しい内容が加わった場合はTrue。
+        """
+        parser = self._parsers.setdefault(agent_name, IncrementalJsonParser())
+        updated = False
+        for kind, key, value in parser.feed(text):
+            if kind == "item":
+                try:
+                    review = SlideReview.model_validate(value)
+                except ValidationError:
+                    continue
+                self._slide_reviews[review.slide_number] = review.model_dump()
+                updated = True
+            elif key == "summary_review" and isinstance(value, str):
+                self.summary_review = value
+                updated = True
+            elif key == "storyline_review" and isinstance(value, str):
+                self.storyline_review = value
+                updated = True
+        return updated
+
+    def end_response(self, agent_name: str) -> None:
+        """エージェントの応答が完了したことを記録する（同じエージェントの次の応答は新しいJSONとして読む）"""
+        self._parsers.pop(agent_name, None)
+
+    @property
+    def is_empty(self) -> bool:
+        return self.summary_review is None and self.storyline_review is None and not self._slide_reviews
+
+    def to_dict(self) -> Dict[str, Any]:
+        """FinalReport と同じキーを持つ途中経過を返す。まだ届いていない項目はNone / 空のリストになる。"""
+        return {
+            "summary_review": self.summary_review,
+            "storyline_review": self.storyline_review,
+            "slide_by_slide_reviews": [self._slide_reviews[number] for number in sorted(self._slide_reviews)],
+        }
@@ -1,35 +1,68 @@
 import io
+import logging
 import os
-from typing import Dict, Any, List
+import shutil
+import tempfile
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Any, List, Optional, Tuple, Iterator, Union, BinaryIO
 
 import pptx
 from pptx.exc import PackageNotFoundError
 import fitz  # PyMuPDF
-from google.cloud import storage
-
+from utils.storage import open_local_path
 from ..state_models import SlideContent, DocumentAnalysisResult
 
+logger = logging.getLogger(__name__)
+
+# hybridモードで「テキストが抽出できなかったページ」とみなす文字数の閾値（空白を除く）
+MIN_TEXT_DENSITY_CHARS = int(os.environ.get("HYBRID_MIN_TEXT_CHARS", "20"))
+
+# 並列抽出のワーカー数。0の場合はCPUコア数を使用し、1の場合は常に逐次抽出する
+EXTRACTION_WORKERS = int(os.environ.get("EXTRACTION_WORKERS", "0"))
+# このページ数未満の資料はプロセス起動のオーバーヘッドの方が大きいため逐次抽出する
+PARALLEL_EXTRACTION_MIN_PAGES = int(os.environ.get("PARALLEL_EXTRACTION_MIN_PAGES", "40"))
+
+_extraction_executor: Optional[ProcessPoolExecutor] = None
+_extraction_executor_workers = 0
+# Streamlitのスクリプトスレッドや asyncio.to_thread から同時に呼ばれるため、プールの生成・入れ替えと投入を排他する
+_extraction_executor_lock = threading.Lock()
+
+def _slide_content_from_pptx_slide(index: int, slide) -> SlideContent:
+    """python-pptxのスライド1枚からSlideContentを生成する"""
+    text_runs = []
+    # シェイプからテキストを抽出
+    for shape in slide.shapes:
+        if hasattr(shape, "text"):
+            text_runs.append(shape.text)
+    # ノートからテキストを抽出
+    notes_slide = slide.notes_slide
+    notes_text = notes_slide.notes_text_frame.text if notes_slide else ""
+
+    return SlideContent(
+        slide_number=index + 1,
+        text='\n'.join(text_runs),
+        notes=notes_text,
+        title=slide.shapes.title.text if slide.has_notes_slide and slide.shapes.title else None
+    )
+
+def _slide_content_from_pdf_page(index: int, page) -> SlideContent:
+    """PyMuPDFのページ1枚からSlideContentを生成する"""
+    return SlideContent(
+        slide_number=index + 1,
+        text=page.get_text("text")
+    )
+
 def _extract_text_from_pptx(blob: bytes) -> List[SlideContent]:
     """.pptxファイルからスライドごとのテキストを抽出する"""
     slides_content: List[SlideContent] = []
     try:
         prs = pptx.Presentation(io.BytesIO(blob))
         for i, slide in enumerate(prs.slides):
-            text_runs = []
-            # シェイプからテキストを抽出
-            for shape in slide.shapes:
-                if hasattr(shape, "text"):
-                    text_runs.append(shape.text)
-            # ノートからテキストを抽出
-            notes_slide = slide.notes_slide
-            notes_text = notes_slide.notes_text_frame.text if notes_slide else ""
-            
-            slides_content.append(SlideContent(
-                slide_number=i + 1,
-                text='\n'.join(text_runs),
-                notes=notes_text,
-                title=slide.shapes.title.text if slide.has_notes_slide and slide.shapes.title else None
-            ))
+            slides_content.append(_slide_content_from_pptx_slide(i, slide))
     except PackageNotFoundError:
         raise ValueError("無効なPowerPointファイル形式です。")
     return slides_content
@@ -39,63 +72,333 @@ def _extract_text_from_pdf(blob: bytes) -> List[SlideContent]:
     slides_content: List[SlideContent] = []
     with fitz.open(stream=blob, filetype="pdf") as doc:
         for i, page in enumerate(doc):
-            slides_content.append(SlideContent(
-                slide_number=i + 1,
-                text=page.get_text("text")
-            ))
+            slides_content.append(_slide_content_from_pdf_page(i, page))
     return slides_content
 
-def _download_from_gcs(gcs_path: str) -> bytes:
-    """GCSからファイルをダウンロードしてbytesとして返す"""
+def _extract_pptx_range(path: str, start: int, end: int) -> List[SlideContent]:
+    """[ワーカー] .pptxの指定範囲のスライドからテキストを抽出する"""
+    slides = list(pptx.Presentation(path).slides)
+    return [_slide_content_from_pptx_slide(i, slides[i]) for i in range(start, end)]
+
+def _extract_pdf_range(path: str, start: int, end: int) -> List[SlideContent]:
+    """[ワーカー] PDFの指定範囲のページからテキストを抽出する"""
+    with fitz.open(path, filetype="pdf") as doc:
+        return [_slide_content_from_pdf_page(i, doc[i]) for i in range(start, end)]
+
+def _count_pages(blob: bytes, file_type: str) -> int:
+    if file_type == "pptx":
+        try:
+            return len(pptx.Presentation(io.BytesIO(blob)).slides)
+        except PackageNotFoundError:
+            raise ValueError("無効なPowerPointファイル形式です。")
+    with fitz.open(stream=blob, filetype="pdf") as doc:
+        return doc.page_count
+
+def _shard_ranges(total: int, shards: int) -> List[Tuple[int, int]]:
+    """0..totalをできるだけ均等な連続区間に分割する"""
+    shards = max(1, min(shards, total))
+    base, remainder = divmod(total, shards)
+    ranges = []
+    start = 0
+    for i in range(shards):
+        end = start + base + (1 if i < remainder else 0)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+def _resolve_worker_count(max_workers: Optional[int]) -> int:
+    workers = max_workers if max_workers is not None else EXTRACTION_WORKERS
+    return workers if workers > 0 else (os.cpu_count() or 1)
+
+def _get_extraction_executor(workers: int) -> ProcessPoolExecutor:
+    """
+    ワーカー数ごとにプロセスプールを使い回す（起動コストを毎回払わないため）。_extraction_executor_lock を取得して呼ぶ。
+    ワーカー数が変わった場合の古いプールは、投入済みの抽出が終わるまで動かし続ける。
+    """
+    global _extraction_executor, _extraction_executor_workers
+    if _extraction_executor is None or _extraction_executor_workers != workers:
+        if _extraction_executor is not None:
+            _extraction_executor.shutdown(wait=False)
+        # Streamlitはスレッドを使うため、forkではなくspawnでワーカーを起動する
+        _extraction_executor = ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        )
+        _extraction_executor_workers = workers
+    return _extraction_executor
+
+def _submit_extraction(
+    workers: int,
+    range_extractor: Callable[[str, int, int], List[SlideContent]],
+    path: str,
+    ranges: List[Tuple[int, int]],
+) -> Tuple[ProcessPoolExecutor, List[Future]]:
+    """ページ範囲ごとの抽出をプロセスプールに投入する。投入が終わるまで、他のスレッドはプールを入れ替えられない。"""
+    global _extraction_executor
+    with _extraction_executor_lock:
+        executor = _get_extraction_executor(workers)
+        try:
+            return executor, [executor.submit(range_extractor, path, start, end) for start, end in ranges]
+        except BrokenProcessPool:
+            # 待機中にワーカーが異常終了していたプールは、作り直してから投入し直す
+            executor.shutdown(wait=False)
+            _extraction_executor = None
+            executor = _get_extraction_executor(workers)
+            return executor, [executor.submit(range_extractor, path, start, end) for start, end in ranges]
+
+def _discard_broken_executor(executor: ProcessPoolExecutor) -> None:
+    """抽出中にワーカーが異常終了して使えなくなったプロセスプールを破棄し、次の抽出で新しいプールを生成させる"""
+    global _extraction_executor
+    with _extraction_executor_lock:
+        if _extraction_executor is executor:
+            _extraction_executor = None
+    executor.shutdown(wait=False)
+
+def extract_slides(
+    blob: bytes,
+    file_type: str,
+    max_workers: Optional[int] = None,
+    min_parallel_pages: int = PARALLEL_EXTRACTION_MIN_PAGES,
+) -> List[SlideContent]:
+    """
+    資料のバイト列からスライドごとのテキストを抽出する。
+    ページ数が多い場合はページ範囲ごとにプロセスプールへ分配して並列に抽出する。
+
+    Args:
+        blob: 資料のバイト列。
+        file_type: "pptx" または "pdf"。
+        max_workers: ワーカー数。Noneの場合は EXTRACTION_WORKERS の設定に従う。
+        min_parallel_pages: 並列抽出に切り替えるページ数の下限。
+
+    Returns:
+        スライド番号順に並んだSlideContentのリスト。
+    """
+    if file_type not in ("pptx", "pdf"):
+        raise ValueError(f"サポートされていないファイル形式です: {file_type}")
+    serial_extractor = _extract_text_from_pptx if file_type == "pptx" else _extract_text_from_pdf
+
+    workers = _resolve_worker_count(max_workers)
+    if workers <= 1:
+        return serial_extractor(blob)
+    total_pages = _count_pages(blob, file_type)
+    if total_pages < max(min_parallel_pages, 2):
+        return serial_extractor(blob)
+
+    with _local_document(io.BytesIO(blob)) as path:
+        return list(_iter_slides_in_parallel(path, file_type, total_pages, workers))
+
+def _iter_slides_in_parallel(path: str, file_type: str, total_pages: int, workers: int) -> Iterator[SlideContent]:
+    """
+    ページ範囲ごとにプロセスプールで抽出し、先頭の区間から順にスライドを返す。
+    各ワーカーはローカルのファイルパスから資料を開くため、親プロセスは資料のデータをコピーしない。
+
+    抽出中にワーカーが異常終了した場合 (BrokenProcessPool) はプールを破棄し、残りの区間はこのプロセスで逐次抽出する。
+    """
+    range_extractor = _extract_pptx_range if file_type == "pptx" else _extract_pdf_range
+    ranges = _shard_ranges(total_pages, workers)
+    executor, futures = _submit_extraction(workers, range_extractor, path, ranges)
     try:
-        client = storage.Client()
-        # gcs_path is expected to be in "gs://bucket-name/path/to/object" format
-        bucket_name, blob_name = gcs_path.replace("gs://", "").split("/", 1)
-        bucket = client.bucket(bucket_name)
-        blob = bucket.blob(blob_name)
-        return blob.download_as_bytes()
-    except Exception as e:
-        # NOTE: In a real application, consider more specific exception handling
-        # and ensure the Cloud Run service account has "Storage Object Viewer" role.
-        raise RuntimeError(f"GCSからのファイルダウンロードに失敗しました: {gcs_path}. エラー: {e}")
+        # 区間は先頭から順に並んでいるため、順に返すだけでスライド順が保たれる
+        for index, future in enumerate(futures):
+            try:
+                slides = future.result()
+            except BrokenProcessPool:
+                logger.warning("Extraction worker terminated abruptly; extracting the remaining pages serially.")
+                _discard_broken_executor(executor)
+                for start, end in ranges[index:]:
+                    yield from range_extractor(path, start, end)
+                return
+            yield from slides
+    finally:
+        # 途中で読むのをやめた場合は、まだ始まっていない区間の抽出を取り消す
+        for future in futures:
+            future.cancel()
 
-def parse_presentation_document(file_path: str) -> Dict[str, Any]:
+def find_sparse_slides(slides: List[Dict[str, Any]], min_chars: int = MIN_TEXT_DENSITY_CHARS) -> List[int]:
     """
-    GCS上のプレゼンテーションファイル(.pptx, .pdf)を解析し、
-    テキストコンテンツをJSON形式で返す。
+    抽出テキストが空、または閾値未満のスライド番号を返す。
+    スキャンされた資料や画像のみのスライドはローカル抽出では内容が取れないため、LLMでの解析対象とする。
 
     Args:
-        file_path: GCS上のファイルパス (例: "gs://bucket/file.pptx")
+        slides: DocumentAnalysisResult.slides に対応する辞書のリスト。
+        min_chars: テキストとみなす最低文字数（タイトル・本文の空白を除いた合計）。
 
     Returns:
-        DocumentAnalysisResultモデルに対応する辞書。
+        LLMでの解析が必要なスライド番号のリスト。
+    """
+    sparse_slide_numbers: List[int] = []
+    for slide in slides:
+        visible_text = (slide.get("title") or "") + (slide.get("text") or "")
+        if len("".join(visible_text.split())) < min_chars:
+            sparse_slide_numbers.append(slide["slide_number"])
+    return sparse_slide_numbers
+
+def merge_analysis_results(local_result: Dict[str, Any], llm_result: Dict[str, Any], slide_numbers: List[int]) -> Dict[str, Any]:
     """
-    file_name = os.path.basename(file_path)
+    ローカル抽出の結果に、LLMで解析した指定スライドの結果を上書きマージする。
+
+    Args:
+        local_result: ローカル抽出によるDocumentAnalysisResultの辞書。
+        llm_result: LLMによるDocumentAnalysisResultの辞書（指定スライドのみを含む想定）。
+        slide_numbers: LLMの結果で置き換えるスライド番号。
+
+    Returns:
+        マージ後のDocumentAnalysisResultに対応する辞書。
+    """
+    llm_slides = {
+        slide["slide_number"]: slide
+        for slide in llm_result.get("slides", [])
+        if slide.get("slide_number") in slide_numbers
+    }
+    merged_slides = [
+        llm_slides.get(slide["slide_number"], slide) for slide in local_result["slides"]
+    ]
+    return DocumentAnalysisResult(
+        file_name=local_result["file_name"],
+        total_slides=len(merged_slides),
+        slides=merged_slides,
+    ).model_dump()
+
+def _detect_file_type(name: str) -> Optional[str]:
+    lowered = name.lower()
+    if lowered.endswith(".pptx"):
+        return "pptx"
+    if lowered.endswith(".pdf"):
+        return "pdf"
+    return None
+
+def count_presentation_slides(document: bytes, file_name: str) -> Optional[int]:
+    """資料のスライド数（PDFの場合はページ数）を返す。対応していない形式や、読み込めない資料の場合はNone。"""
+    file_type = _detect_file_type(file_name)
+    if file_type is None:
+        return None
     try:
-        file_blob = _download_from_gcs(file_path)
-        
-        if file_path.lower().endswith(".pptx"):
-            slides = _extract_text_from_pptx(file_blob)
-        elif file_path.lower().endswith(".pdf"):
-            slides = _extract_text_from_pdf(file_blob)
+        return _count_pages(document, file_type)
+    except Exception:
+        return None
+
+@contextmanager
+def _local_document(source: Union[str, BinaryIO]) -> Iterator[str]:
+    """
+    資料をローカルのファイルパスとして開けるようにする。
+    ストレージ上のファイルはストレージのバックエンドに任せ（GCSは一時ファイルへのストリーミング、ローカルはそのまま）、
+    ファイルオブジェクトは一時ファイルに書き出して、資料全体をメモリ上に保持しないようにする。
+    """
+    if isinstance(source, str):
+        with open_local_path(source) as local_path:
+            yield local_path
+        return
+
+    with tempfile.NamedTemporaryFile(suffix=".presenta") as tmp:
+        shutil.copyfileobj(source, tmp)
+        tmp.flush()
+        yield tmp.name
+
+@contextmanager
+def _open_document_source(source: Union[str, BinaryIO, bytes]) -> Iterator[Union[str, bytes]]:
+    """メモリ上のバイト列はそのまま、それ以外はローカルのファイルパスとして開けるようにする"""
+    if isinstance(source, bytes):
+        yield source
+        return
+    with _local_document(source) as local_path:
+        yield local_path
+
+def iter_presentation_slides(
+    source: Union[str, BinaryIO, bytes],
+    file_type: Optional[str] = None,
+    max_workers: Optional[int] = None,
+) -> Iterator[SlideContent]:
+    """
+    プレゼンテーション資料(.pptx, .pdf)を解析し、SlideContentを1枚ずつ返すジェネレーター。
+    後続の処理は資料全体の解析完了を待たずに開始でき、メモリ使用量もスライド数に比例しない。
+    ページ数が多い資料は並列抽出し、先頭の区間から完了した順に返す。
+
+    Args:
+        source: ストレージ上のファイルのURI (例: "gs://bucket/file.pptx"、ローカルストレージのパス)、
+            バイナリのファイルオブジェクト、またはメモリ上の資料のバイト列。
+        file_type: "pptx" または "pdf"。Noneの場合はファイル名の拡張子から判定する（バイト列の場合は必須）。
+        max_workers: 並列抽出のワーカー数。Noneの場合は EXTRACTION_WORKERS の設定に従う。
+
+    Yields:
+        スライド番号順のSlideContent。
+    """
+    if file_type is None and not isinstance(source, bytes):
+        file_type = _detect_file_type(source if isinstance(source, str) else getattr(source, "name", ""))
+    if file_type not in ("pptx", "pdf"):
+        raise ValueError("サポートされていないファイル形式です。.pptxまたは.pdfをアップロードしてください。")
+
+    workers = _resolve_worker_count(max_workers)
+    with _open_document_source(source) as document:
+        in_memory = isinstance(document, bytes)
+        if file_type == "pptx":
+            try:
+                prs = pptx.Presentation(io.BytesIO(document) if in_memory else document)
+            except PackageNotFoundError:
+                raise ValueError("無効なPowerPointファイル形式です。")
+            total_pages = len(prs.slides)
         else:
-            return DocumentAnalysisResult(
-                file_name=file_name,
-                total_slides=0,
-                slides=[],
-                error="サポートされていないファイル形式です。.pptxまたは.pdfをアップロードしてください。"
-            ).model_dump()
+            doc = fitz.open(stream=document, filetype="pdf") if in_memory else fitz.open(document, filetype="pdf")
+            total_pages = doc.page_count
+
+        if workers > 1 and total_pages >= max(PARALLEL_EXTRACTION_MIN_PAGES, 2):
+            # 親プロセス側で開いた資料は不要なので、抽出前に解放する
+            if file_type == "pdf":
+                doc.close()
+            else:
+                prs = None
+            if in_memory:
+                # ワーカーへはファイルパスで渡すため、メモリ上の資料は一時ファイルに書き出す（メモリ上に2つ目のコピーを作らない）
+                with _local_document(io.BytesIO(document)) as path:
+                    yield from _iter_slides_in_parallel(path, file_type, total_pages, workers)
+            else:
+                yield from _iter_slides_in_parallel(document, file_type, total_pages, workers)
+        elif file_type == "pptx":
+            for i, slide in enumerate(prs.slides):
+                yield _slide_content_from_pptx_slide(i, slide)
+        else:
+            with doc:
+                for i, page in enumerate(doc):
+                    yield _slide_content_from_pdf_page(i, page)
+
+def parse_presentation_document(
+    file_path: str, document: Optional[bytes] = None, file_name: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    ストレージ上のプレゼンテーションファイル(.pptx, .pdf)を解析し、
+    テキストコンテンツをJSON形式で返す。
+
+    Args:
+        file_path: ストレージ上のファイルのURI (例: "gs://bucket/file.pptx"、ローカルストレージのパス)
+        document: 資料のバイト列。プロセス内に保持されている場合に指定すると、ストレージから読み込まずに解析する。
+        file_name: 解析結果に記録するファイル名。省略した場合は file_path のファイル名を使う。
 
+    Returns:
+        DocumentAnalysisResultモデルに対応する辞書。
+    """
+    file_name = file_name or os.path.basename(file_path)
+    file_type = _detect_file_type(file_path)
+    if file_type is None:
         return DocumentAnalysisResult(
             file_name=file_name,
-            total_slides=len(slides),
-            slides=slides,
+            total_slides=0,
+            slides=[],
+            error="サポートされていないファイル形式です。.pptxまたは.pdfをアップロードしてください。"
         ).model_dump()
 
+    try:
+        # スライドごとに辞書化し、Pydanticモデルと辞書の両方を全件保持しないようにする
+        source = document if document is not None else file_path
+        slides = [slide.model_dump() for slide in iter_presentation_slides(source, file_type)]
+        return {
+            "file_name": file_name,
+            "total_slides": len(slides),
+            "slides": slides,
+            "error": None,
+        }
+
     except Exception as e:
         return DocumentAnalysisResult(
             file_name=file_name,
             total_slides=0,
             slides=[],
             error=f"ファイルの解析中にエラーが発生しました: {str(e)}"
-        ).model_dump()
\ No newline at end of file
+        ).model_dump()
@@ -0,0 +1,27 @@
+from typing import Any, Dict
+
+from google.adk.tools import ToolContext
+
+from adk_logic.slide_index import get_slide_index
+
+# 1回の検索で返すスライド数の上限
+SLIDE_SEARCH_MAX_RESULTS = 10
+
+
+def search_slides(query: str, top_k: int, tool_context: ToolContext) -> Dict[str, Any]:
+    """
+    レビュー対象のプレゼン資料から、質問やキーワードに関連するスライドを検索し、その内容を返す。
+    資料の全文はプロンプトに含まれていないため、スライドの記載内容を確認する必要がある場合はこのツールを使う。
+
+    Args:
+        query: 検索する質問やキーワード (例: "導入費用の回収期間")。
+        top_k: 返すスライドの最大数 (1〜10)。
+
+    Returns:
+        関連度の高い順に並んだスライド (slide_number, title, text, notes, score) のリスト。
+    """
+    analysis = tool_context.state.get("document_analysis")
+    if not isinstance(analysis, dict):
+        return {"status": "error", "error_message": "資料の解析結果がありません。"}
+    top_k = min(max(1, top_k), SLIDE_SEARCH_MAX_RESULTS)
+    return {"status": "success", "query": query, "slides": get_slide_index(analysis).search(query, top_k)}
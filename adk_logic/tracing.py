@@ -0,0 +1,276 @@
+import threading
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+from google.genai import types
+from pydantic import BaseModel, Field
+
+from adk_logic.cost_estimator import compute_cost_usd
+
+# OpenTelemetry形式でエクスポートする際のサービス名・スコープ名
+TRACE_SERVICE_NAME = "presenta-ai"
+TRACE_SCOPE_NAME = "presenta-ai.review"
+
+
+class TraceSpan(BaseModel):
+    """エージェントの実行1回、またはLLM呼び出し1回の記録"""
+    span_id: str = Field(default_factory=lambda: uuid.uuid4().hex[:16])
+    parent_span_id: Optional[str] = None
+    name: str
+    kind: str = Field(description="agent: エージェントの実行, llm: LLMの呼び出し")
+    agent_name: str
+    start_time: float
+    end_time: Optional[float] = None
+    status: str = Field(default="ok", description="ok / error / skipped / incomplete")
+    attributes: Dict[str, Any] = Field(default_factory=dict)
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_time or self.start_time) - self.start_time) * 1000
+
+
+class RunTrace:
+    """
+    1回のレビュー実行のタイムライン。
+    エージェントとLLM呼び出しの開始・終了時刻、トークン数、リトライ、キャッシュの利用状況をスパンとして記録する。
+    """
+
+    def __init__(self, session_id: str):
+        self.trace_id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.started_at = time.time()
+        self.spans: List[TraceSpan] = []
+        # 開始からの経過時間 (ミリ秒) で記録する、実行中の節目（最初の途中結果が届いた時刻など）
+        self.marks: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._open_agents: Dict[str, TraceSpan] = {}
+        self._open_models: Dict[str, TraceSpan] = {}
+        self._last_model_failed: Dict[str, bool] = {}
+
+    def mark(self, name: str) -> None:
+        """実行中の節目を記録する。同じ名前の節目は最初の1回のみ記録する。"""
+        with self._lock:
+            self.marks.setdefault(name, (time.time() - self.started_at) * 1000)
+
+    def start_agent(self, agent_name: str, parent_agent_name: Optional[str] = None) -> None:
+        with self._lock:
+            parent = self._open_agents.get(parent_agent_name) if parent_agent_name else None
+            span = TraceSpan(
+                name=agent_name,
+                kind="agent",
+                agent_name=agent_name,
+                parent_span_id=parent.span_id if parent else None,
+                start_time=time.time(),
+            )
+            self._open_agents[agent_name] = span
+            self.spans.append(span)
+
+    def end_agent(self, agent_name: str, status: str = "ok", **attributes: Any) -> None:
+        with self._lock:
+            span = self._open_agents.pop(agent_name, None)
+            if span is None:
+                return
+            span.end_time = time.time()
+            span.status = status
+            span.attributes.update(attributes)
+
+    def annotate_agent(self, agent_name: str, **attributes: Any) -> None:
+        """実行中のエージェントのスパンに属性を追加する"""
+        with self._lock:
+            span = self._open_agents.get(agent_name)
+            if span is not None:
+                span.attributes.update(attributes)
+
+    def start_model(self, agent_name: str, model: Optional[str]) -> None:
+        with self._lock:
+            parent = self._open_agents.get(agent_name)
+            span = TraceSpan(
+                name=f"llm {model or 'unknown'}",
+                kind="llm",
+                agent_name=agent_name,
+                parent_span_id=parent.span_id if parent else None,
+                start_time=time.time(),
+                attributes={"model": model, "retry": self._last_model_failed.get(agent_name, False)},
+            )
+            self._open_models[agent_name] = span
+            self.spans.append(span)
+
+    def end_model(
+        self,
+        agent_name: str,
+        usage: Optional[types.GenerateContentResponseUsageMetadata] = None,
+        error: Optional[BaseException] = None,
+        **attributes: Any,
+    ) -> None:
+        with self._lock:
+            span = self._open_models.pop(agent_name, None)
+            if span is None:
+                return
+            span.end_time = time.time()
+            span.attributes.update(attributes)
+            self._last_model_failed[agent_name] = error is not None
+            if error is not None:
+                span.status = "error"
+                span.attributes["error"] = f"{type(error).__name__}: {error}"
+            if usage is not None:
+                prompt_tokens = usage.prompt_token_count or 0
+                cached_tokens = usage.cached_content_token_count or 0
+                output_tokens = (usage.candidates_token_count or 0) + (usage.thoughts_token_count or 0)
+                span.attributes.update({
+                    "prompt_tokens": prompt_tokens,
+                    "cached_input_tokens": cached_tokens,
+                    "fresh_input_tokens": max(0, prompt_tokens - cached_tokens),
+                    "output_tokens": output_tokens,
+                    "cost_usd": compute_cost_usd(
+                        span.attributes.get("model"),
+                        fresh_input_tokens=max(0, prompt_tokens - cached_tokens),
+                        cached_input_tokens=cached_tokens,
+                        output_tokens=output_tokens,
+                    ),
+                })
+
+    def finish(self) -> None:
+        """終了していないスパン（エラーや中断で終了が記録されなかったもの）を閉じる"""
+        with self._lock:
+            now = time.time()
+            for span in list(self._open_models.values()) + list(self._open_agents.values()):
+                span.end_time = now
+                span.status = "incomplete"
+            self._open_models.clear()
+            self._open_agents.clear()
+
+    def summarize_agents(self) -> Dict[str, Dict[str, Any]]:
+        """エージェントごとの実行時間・LLM呼び出し回数・リトライ回数・順番待ちの時間・トークン数・コストを集計する"""
+        with self._lock:
+            spans = list(self.spans)
+        summary: Dict[str, Dict[str, Any]] = {}
+        for span in spans:
+            entry = summary.setdefault(span.agent_name, defaultdict(int, status="ok", duration_ms=0.0, cost_usd=0.0))
+            if span.kind == "agent":
+                entry["duration_ms"] += span.duration_ms
+                entry["status"] = span.status
+                if span.attributes.get("cache_hit"):
+                    entry["cache_hit"] = span.attributes["cache_hit"]
+                if span.attributes.get("reused_slide_reviews"):
+                    entry["reused_slide_reviews"] = span.attributes["reused_slide_reviews"]
+                if "revision_changed_slides" in span.attributes:
+                    entry["revision_changed_slides"] = span.attributes["revision_changed_slides"]
+                    entry["revision_unchanged_slides"] = span.attributes["revision_unchanged_slides"]
+                continue
+            entry["llm_calls"] += 1
+            entry["llm_duration_ms"] += span.duration_ms
+            # 流量制御の中で行ったリトライ (attempts - 1) も、リトライとして数える
+            entry["retries"] += int(bool(span.attributes.get("retry"))) + max(0, span.attributes.get("attempts", 1) - 1)
+            entry["queue_wait_ms"] += span.attributes.get("queue_wait_ms", 0.0)
+            entry["errors"] += int(span.status == "error")
+            for key in ("prompt_tokens", "cached_input_tokens", "fresh_input_tokens", "output_tokens", "cost_usd"):
+                entry[key] += span.attributes.get(key, 0)
+        return {agent_name: dict(entry) for agent_name, entry in summary.items()}
+
+    def to_dict(self) -> Dict[str, Any]:
+        """レビュー結果とともに保存する、JSONに変換可能なタイムラインを返す"""
+        agents = self.summarize_agents()
+        with self._lock:
+            spans = [span.model_dump() for span in self.spans]
+        end_time = max((span["end_time"] or span["start_time"] for span in spans), default=self.started_at)
+        llm_agents = [entry for entry in agents.values() if entry.get("llm_calls")]
+        return {
+            "trace_id": self.trace_id,
+            "session_id": self.session_id,
+            "started_at": self.started_at,
+            "duration_ms": (end_time - self.started_at) * 1000,
+            "marks": dict(self.marks),
+            "totals": {
+                key: sum(entry.get(key, 0) for entry in llm_agents)
+                for key in (
+                    "llm_calls", "retries", "errors", "queue_wait_ms",
+                    "prompt_tokens", "cached_input_tokens", "fresh_input_tokens", "output_tokens", "cost_usd",
+                )
+            },
+            "agents": agents,
+            "spans": spans,
+        }
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+# スパンの属性名を、OpenTelemetryのGenAIセマンティック規約の名前に対応付ける
+_OTLP_ATTRIBUTE_NAMES = {
+    "model": "gen_ai.request.model",
+    "prompt_tokens": "gen_ai.usage.input_tokens",
+    "output_tokens": "gen_ai.usage.output_tokens",
+}
+
+
+def trace_to_otlp(trace: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    RunTrace.to_dict() の結果を、OpenTelemetryのOTLP/JSON形式 (ExportTraceServiceRequest) に変換する。
+    出力はOTLPに対応したコレクターやトレースビューアにそのまま取り込める。
+    """
+    otlp_spans = []
+    for span in trace["spans"]:
+        attributes = {"gen_ai.agent.name": span["agent_name"], "presenta.session_id": trace["session_id"]}
+        for key, value in span["attributes"].items():
+            if value is not None:
+                attributes[_OTLP_ATTRIBUTE_NAMES.get(key, f"presenta.{key}")] = value
+        otlp_span = {
+            "traceId": trace["trace_id"],
+            "spanId": span["span_id"],
+            "name": span["name"],
+            # 1: SPAN_KIND_INTERNAL, 3: SPAN_KIND_CLIENT
+            "kind": 3 if span["kind"] == "llm" else 1,
+            "startTimeUnixNano": str(int(span["start_time"] * 1e9)),
+            "endTimeUnixNano": str(int((span["end_time"] or span["start_time"]) * 1e9)),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items()],
+            # 1: STATUS_CODE_OK, 2: STATUS_CODE_ERROR
+            "status": {"code": 2, "message": span["status"]} if span["status"] in ("error", "incomplete") else {"code": 1},
+        }
+        if span["parent_span_id"]:
+            otlp_span["parentSpanId"] = span["parent_span_id"]
+        otlp_spans.append(otlp_span)
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": TRACE_SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": TRACE_SCOPE_NAME}, "spans": otlp_spans}],
+        }]
+    }
+
+
+class TraceRecorder:
+    """実行中のレビューのタイムラインを、セッションIDごとに保持する"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._traces: Dict[str, RunTrace] = {}
+
+    def start(self, session_id: str) -> RunTrace:
+        trace = RunTrace(session_id)
+        with self._lock:
+            self._traces[session_id] = trace
+        return trace
+
+    def get(self, session_id: str) -> Optional[RunTrace]:
+        with self._lock:
+            return self._traces.get(session_id)
+
+    def pop(self, session_id: str) -> Optional[RunTrace]:
+        with self._lock:
+            return self._traces.pop(session_id, None)
+
+
+_trace_recorder = TraceRecorder()
+
+
+def get_trace_recorder() -> TraceRecorder:
+    """プロセス内で共有するタイムラインの記録先を返す"""
+    return _trace_recorder
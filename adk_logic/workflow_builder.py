@@ -0,0 +1,99 @@
+import re
+import logging
+from typing import List, Set, Tuple
+
+from google.adk.agents import BaseAgent, LlmAgent, SequentialAgent, ParallelAgent
+from adk_logic.callbacks import BeforeAgentCallback
+from adk_logic.document_serializer import DOCUMENT_CONTEXT_KEY_PREFIX, SLIDE_OUTLINE_KEY
+
+logger = logging.getLogger(__name__)
+
+# プロンプト中のStateプレースホルダ (例: {{document_analysis}}, {presentation_goal})
+_STATE_PLACEHOLDER_PATTERN = re.compile(r"{+\s*([A-Za-z_][A-Za-z0-9_]*)\??\s*}+")
+
+
+def get_state_io(agent: BaseAgent) -> Tuple[Set[str], Set[str]]:
+    """
+    エージェントが読み書きするStateのキーを推定する。
+
+    - LlmAgent: instruction中のプレースホルダを読み込み、output_key を書き込みとみなす。
+    - カスタムエージェント: クラス変数 state_reads / state_writes が宣言されていればそれを使う。
+    - ワークフローエージェント: サブエージェントの読み書きを合算する。
+    - document_context_* と slide_outline は document_analysis から実行時に生成されるため、document_analysis の読み込みとみなす。
+
+    Returns:
+        (読み込むキーの集合, 書き込むキーの集合)
+    """
+    reads: Set[str] = set(getattr(agent, "state_reads", ()) or ())
+    writes: Set[str] = set(getattr(agent, "state_writes", ()) or ())
+
+    if isinstance(agent, LlmAgent):
+        if isinstance(agent.instruction, str):
+            reads.update(_STATE_PLACEHOLDER_PATTERN.findall(agent.instruction))
+            if any(key.startswith(DOCUMENT_CONTEXT_KEY_PREFIX) or key == SLIDE_OUTLINE_KEY for key in reads):
+                reads.add("document_analysis")
+        if agent.output_key:
+            writes.add(agent.output_key)
+
+    for sub_agent in agent.sub_agents:
+        sub_reads, sub_writes = get_state_io(sub_agent)
+        reads.update(sub_reads)
+        writes.update(sub_writes)
+    return reads, writes
+
+
+def plan_stages(agents: List[BaseAgent]) -> List[List[BaseAgent]]:
+    """
+    宣言順に並んだエージェントを、Stateの依存関係に基づいてステージに分割する。
+    同じステージのエージェントは互いに依存しないため並行実行できる。
+
+    依存関係は宣言順で先に現れるエージェントとの間でのみ考慮する:
+    - 読み込むキーを先行エージェントが書き込む (read-after-write)
+    - 書き込むキーを先行エージェントが読み書きする (write-after-read / write-after-write)
+    """
+    levels: List[int] = []
+    state_io = [get_state_io(agent) for agent in agents]
+    for i, (reads, writes) in enumerate(state_io):
+        level = 0
+        for j in range(i):
+            prev_reads, prev_writes = state_io[j]
+            if (reads & prev_writes) or (writes & prev_writes) or (writes & prev_reads):
+                level = max(level, levels[j] + 1)
+        levels.append(level)
+
+    stages: List[List[BaseAgent]] = [[] for _ in range(max(levels, default=-1) + 1)]
+    for agent, level in zip(agents, levels):
+        stages[level].append(agent)
+    return stages
+
+
+def build_dag_workflow(
+    name: str,
+    agents: List[BaseAgent],
+    parallel_stage_callback: BeforeAgentCallback = None,
+) -> SequentialAgent:
+    """
+    エージェントの依存関係から、独立したエージェントを並行実行するワークフローを構築する。
+    各ステージはSequentialAgentで順に実行し、複数のエージェントを含むステージはParallelAgentにまとめる。
+
+    Args:
+        name: ルートとなるSequentialAgentの名前。
+        agents: 実行するエージェント。依存関係が同じなら宣言順に実行される。
+        parallel_stage_callback: 並行実行ステージに設定する before_agent_callback。
+
+    Returns:
+        ステージを順に実行するSequentialAgent。
+    """
+    stages = plan_stages(agents)
+    sub_agents: List[BaseAgent] = []
+    for level, stage_agents in enumerate(stages):
+        logger.debug(f"Stage {level}: {[agent.name for agent in stage_agents]}")
+        if len(stage_agents) == 1:
+            sub_agents.append(stage_agents[0])
+        else:
+            sub_agents.append(ParallelAgent(
+                name=f"ParallelStage{level}",
+                sub_agents=stage_agents,
+                before_agent_callback=parallel_stage_callback,
+            ))
+    return SequentialAgent(name=name, sub_agents=sub_agents)
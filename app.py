@@ -3,18 +3,29 @@ import os
 import uuid
 import json
 import asyncio
-from typing import Dict, Any
+import time
+from typing import Dict, Any, Optional
 from google import genai
 from google.genai import types
 
-from google.cloud import storage
-from google.api_core.exceptions import GoogleAPICallError
 import vertexai
 from vertexai.generative_models import GenerativeModel
 
 from utils.config_loader import load_config_options
-from adk_logic.prompts.auto_compose_prompt import get_auto_compose_prompt
-from adk_logic.main_runner import run_review_process
+from adk_logic.auto_compose import get_auto_composer
+from adk_logic.main_runner import (
+    build_previous_review,
+    prefetch_document_analysis,
+    DEFAULT_ANALYSIS_MODE,
+)
+from adk_logic.root_agent_factory import DEFAULT_REVIEW_MODE
+from adk_logic.job_queue import get_job_pool, JobStatus
+from adk_logic.resources import get_resource_registry
+from adk_logic.document_store import get_document_store
+from adk_logic.state_models import DocumentHandle
+from adk_logic.cost_estimator import get_cost_estimator
+from adk_logic.tracing import trace_to_otlp
+from adk_logic.tools.document_parser_tool import count_presentation_slides
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -26,19 +37,39 @@ st.set_page_config(page_title="Presenta-AI", page_icon="🤖", layout="wide")
 # NOTE: Cloud Runで実行する場合、これらの値は環境変数から取得するのが望ましい
 GCP_PROJECT_ID = os.environ.get("GCP_PROJECT_ID")
 GCP_LOCATION = os.environ.get("GCP_LOCATION", "us-central1")
-GCS_BUCKET_NAME = os.environ.get("GCS_BUCKET_NAME")
 
 # --- 状態管理の初期化 ---
 if 'page' not in st.session_state:
     st.session_state.page = 'input'
 if 'gcs_file_path' not in st.session_state:
     st.session_state.gcs_file_path = None
+if 'document_sha256' not in st.session_state:
+    st.session_state.document_sha256 = None
+if 'document' not in st.session_state:
+    st.session_state.document = None
 if 'review_result' not in st.session_state:
     st.session_state.review_result = None
 if 'selected_configs' not in st.session_state:
     st.session_state.selected_configs = {}
 if 'error_message' not in st.session_state:
     st.session_state.error_message = None
+if 'analysis_mode' not in st.session_state:
+    st.session_state.analysis_mode = DEFAULT_ANALYSIS_MODE
+if 'review_mode' not in st.session_state:
+    st.session_state.review_mode = DEFAULT_REVIEW_MODE
+if 'total_slides' not in st.session_state:
+    st.session_state.total_slides = None
+if 'job_id' not in st.session_state:
+    # ページを再読み込みしても実行中のレビューに戻れるよう、ジョブIDはURLにも保持する
+    st.session_state.job_id = st.query_params.get("job")
+    if st.session_state.job_id:
+        st.session_state.page = 'running'
+
+ANALYSIS_MODE_LABELS = {
+    "llm": "AIで解析（図表や画像も読み取る）",
+    "hybrid": "おまかせ（テキストは高速抽出、画像のみのページはAIで解析）",
+    "local": "高速抽出のみ（テキストベースの資料向け）",
+}
 
 print("dbg1")
 
@@ -59,54 +90,50 @@ print("dbg1")
 
 
 
-def upload_to_gcs(uploaded_file) -> str:
-    """アップロードされたファイルをGCSに保存し、GCSパスを返す"""
-    if not GCS_BUCKET_NAME:
-        st.error("GCSバケット名が設定されていません。環境変数 GCS_BUCKET_NAME を設定してください。")
-        return ""
+def register_document(uploaded_file) -> Optional[DocumentHandle]:
+    """
+    アップロードされたファイルを資料ストアに登録し、資料のハンドルを返す。
+    ストレージ（GCSまたはローカル）への保存はバックグラウンドで行うため、保存の完了は待たない。
+    """
     try:
-        storage_client = storage.Client()
-        bucket = storage_client.bucket(GCS_BUCKET_NAME)
-        
-        file_name = f"uploads/{uuid.uuid4()}-{uploaded_file.name}"
-        blob = bucket.blob(file_name)
-        
-        blob.upload_from_file(uploaded_file)
-        gcs_path = f"gs://{GCS_BUCKET_NAME}/{file_name}"
-        return gcs_path
-    except GoogleAPICallError as e:
-        st.error(f"GCSへのアップロードに失敗しました: {e}。GCSバケットが存在し、サービスアカウントに書き込み権限があるか確認してください。")
-        return ""
+        return get_document_store().register(uploaded_file.getvalue(), uploaded_file.name)
+    except ValueError as e:
+        st.error(str(e))
+        return None
     except Exception as e:
         st.error(f"予期せぬエラーが発生しました: {e}")
-        return ""
+        return None
 
-@st.cache_data
 def get_config():
-    """設定ファイルをキャッシュして読み込む"""
+    """設定ファイルを読み込む（読み込んだ内容はプロセス内でキャッシュされ、ファイルが変更されると読み込み直される）"""
     return load_config_options()
 
-async def get_auto_composed_config(goal, audience, config_yaml_str):
-    """LLMに最適なチーム編成を問い合わせる"""
-
-    prompt = get_auto_compose_prompt(goal, audience, config_yaml_str)
-    response = await client.aio.models.generate_content(
-        model='gemini-2.5-pro',
-        contents=prompt,
-        config=types.GenerateContentConfig(
-            temperature=0.4,
-            response_mime_type='application/json'
-            # response_schema=response_schema,
-        )
-    )
-    
-    try:
-        # LLMの出力からJSON部分を抽出
-        json_str = response.text.strip().lstrip("```json").rstrip("```")
-        return json.loads(json_str)
-    except (json.JSONDecodeError, AttributeError) as e:
-        st.error(f"AIによる編成案の解析に失敗しました: {e}\nLLMからの応答: {response.text}")
-        return None
+def get_document_slide_count() -> Optional[int]:
+    """アップロードされた資料のスライド数を返す（コストの見積もりに使う）。資料を読み込めない場合はNone。"""
+    document = st.session_state.document
+    if st.session_state.total_slides is None and document:
+        blob = get_document_store().get_bytes(document["sha256"])
+        if blob is not None:
+            st.session_state.total_slides = count_presentation_slides(blob, document["file_name"])
+    return st.session_state.total_slides
+
+def get_config_with_cost_estimates(total_slides: Optional[int]) -> Dict[str, Any]:
+    """チーム編成の選択肢に、その選択肢を選んだ場合の推定コスト (USD) を付与した設定を返す"""
+    option_costs = get_cost_estimator().estimate_option_costs(total_slides)
+    agent_options = {}
+    for agent_type, details in get_config()['agent_options'].items():
+        agent_options[agent_type] = {
+            **details,
+            "options": [
+                {**opt, "estimated_cost_usd": round(option_costs[agent_type][opt['id']], 4)}
+                for opt in details['options']
+            ],
+        }
+    return {"agent_options": agent_options}
+
+async def get_auto_composed_config(goal, audience, agent_options):
+    """プレゼン目的と聴衆に適したチーム編成を返す（キャッシュ・キーワードで決まらない場合のみLLMに問い合わせる）"""
+    return await get_auto_composer().compose(goal, audience, agent_options)
 
 # --- UI描画関数 ---
 
@@ -153,14 +180,30 @@ def draw_input_page():
             elif not st.session_state.audience_role or not st.session_state.audience_interests:
                 st.error("聴衆の情報を入力してください。")
             else:
-                with st.spinner("資料を安全にアップロード中..."):
-                    gcs_path = upload_to_gcs(st.session_state.uploaded_file)
-                    if gcs_path:
-                        st.session_state.gcs_file_path = gcs_path
-                        st.session_state.page = 'compose'
-                        st.rerun()
+                document = register_document(st.session_state.uploaded_file)
+                if document:
+                    st.session_state.document = document.model_dump()
+                    st.session_state.gcs_file_path = document.uri
+                    # 同一資料の再レビュー時に解析結果を再利用するため、内容のハッシュを保持する
+                    st.session_state.document_sha256 = document.sha256
+                    st.session_state.total_slides = None
+                    start_prefetch()
+                    st.session_state.page = 'compose'
+                    st.rerun()
         print("dbg4")
 
+def start_prefetch():
+    """
+    ユーザーがチーム編成を選んでいる間に、編成に依存しない資料の解析と「AIにおまかせ編成」の提案をバックグラウンドで始める。
+    レビューの開始時は実行中または完了済みの解析結果を使い、おまかせ編成のボタンは提案の完了を待つだけになる。
+    """
+    prefetch_document_analysis(st.session_state.document, st.session_state.analysis_mode)
+    audience = {"role": st.session_state.audience_role, "interests": st.session_state.audience_interests}
+    agent_options = get_config_with_cost_estimates(get_document_slide_count())['agent_options']
+    st.session_state.auto_compose_future = get_resource_registry().submit_coroutine(
+        get_auto_composed_config(st.session_state.presentation_goal, audience, agent_options)
+    )
+
 def draw_compose_page():
     """AIレビューチーム編成画面を描画する"""
     st.header("2. AIレビューチームを編成")
@@ -172,19 +215,19 @@ def draw_compose_page():
         st.info(f"**聴衆:**\n{st.session_state.audience_role} ({st.session_state.audience_interests})")
         st.button("← 入力に戻る", on_click=lambda: st.session_state.update(page='input'))
 
-    config = get_config()
+    total_slides = get_document_slide_count()
+    config = get_config_with_cost_estimates(total_slides)
 
     if st.button("🤖 AIにおまかせ編成"):
         with st.spinner("あなたに最適なチームをAIが編成中..."):
             goal = st.session_state.presentation_goal
             audience = {"role": st.session_state.audience_role, "interests": st.session_state.audience_interests}
-            config_str = json.dumps(config, ensure_ascii=False)
-            
-            # 非同期関数を実行
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            recommended_configs = loop.run_until_complete(get_auto_composed_config(goal, audience, config_str))
-            loop.close()
+            # 入力画面で始めた提案があれば、その完了を待つ
+            # 共有クライアントを使うため、非同期関数はバックグラウンドの共通イベントループで実行する
+            future = st.session_state.pop("auto_compose_future", None)
+            recommended_configs = future.result() if future is not None else get_resource_registry().run_coroutine(
+                get_auto_composed_config(goal, audience, config['agent_options'])
+            )
 
             if recommended_configs:
                 st.session_state.selected_configs = recommended_configs
@@ -230,81 +273,126 @@ def draw_compose_page():
             for opt in details['options']:
                 if opt['label'] == selected_label:
                     st.info(opt['description'])
+                    st.caption(f"推定コスト: ${opt['estimated_cost_usd']:.3f}")
                     break
     
+    with st.expander("詳細設定"):
+        analysis_modes = list(ANALYSIS_MODE_LABELS.keys())
+        st.session_state.analysis_mode = st.radio(
+            "資料の解析方式",
+            analysis_modes,
+            index=analysis_modes.index(st.session_state.analysis_mode) if st.session_state.analysis_mode in analysis_modes else 0,
+            format_func=lambda mode: ANALYSIS_MODE_LABELS[mode],
+        )
+        chunked = st.checkbox(
+            "長い資料向け: スライドを分割して並行レビューする",
+            value=st.session_state.review_mode == "chunked",
+            help="100枚を超えるような資料では、分割することでレビュー時間を短縮し、途中で途切れるのを防ぎます。",
+        )
+        st.session_state.review_mode = "chunked" if chunked else "standard"
+    # 解析方式を変更した場合は、変更後の方式で資料の解析を始め直す（同じ方式の解析は1度だけ実行される）
+    prefetch_document_analysis(st.session_state.document, st.session_state.analysis_mode)
+
+    estimate = get_cost_estimator().estimate_review(
+        st.session_state.selected_configs,
+        total_slides,
+        review_mode=st.session_state.review_mode,
+        analysis_mode=st.session_state.analysis_mode,
+    )
+    st.metric(
+        f"このチームでの推定コスト（{estimate['total_slides']}枚）",
+        f"${estimate['total_cost_usd']:.3f}",
+        help="モデルの料金表と、これまでのレビューで計測したトークン数から見積もっています。",
+    )
+
     st.markdown("---")
     if st.button("🚀 このチームでレビュー開始", type="primary", use_container_width=True):
-        st.session_state.page = 'running'
-        st.rerun()
+        submit_review_job()
+
+
+def submit_review_job(previous_review: Optional[Dict[str, Any]] = None):
+    """
+    入力内容とチーム編成でレビューのジョブを登録し、実行中画面に移る。
+    レビューはバックグラウンドのワーカーで実行し、実行中画面はジョブの状態をポーリングする。
+    """
+    job_id = get_job_pool().submit({
+        "gcs_file_path": st.session_state.gcs_file_path,
+        "presentation_goal": st.session_state.presentation_goal,
+        "audience_profile": {
+            "role": st.session_state.audience_role,
+            "interests": st.session_state.audience_interests
+        },
+        "selected_configs": st.session_state.selected_configs,
+        "document_sha256": st.session_state.document_sha256,
+        "analysis_mode": st.session_state.analysis_mode,
+        "review_mode": st.session_state.review_mode,
+        "document": st.session_state.document,
+        "previous_review": previous_review,
+    })
+    st.session_state.job_id = job_id
+    st.query_params["job"] = job_id
+    st.session_state.page = 'running'
+    st.rerun()
 
 
 def draw_running_page():
     """実行中画面を描画する"""
     st.header("3. AIレビュー実行中...")
-    st.info("AIチームがあなたのプレゼン資料を多角的にレビューしています。完了まで数分かかることがあります。")
-    
-    progress_bar = st.progress(0, text="レビューを開始しています...")
-    progress_text = st.empty()
-
-    def update_progress(message: str):
-        # この関数は別スレッドから呼ばれる可能性があるため、UI更新は慎重に
-        # 簡単な実装としてテキストを更新する
-        progress_text.info(message)
-        # NOTE: より洗練された進捗更新は、エージェントの数に基づいてバーを動かす
-        # ここでは単純化のため、テキスト更新のみ
-    
-    # ADKロジックを非同期で実行
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    
-    audience_profile = {
-        "role": st.session_state.audience_role,
-        "interests": st.session_state.audience_interests
-    }
+    st.info("AIチームがあなたのプレゼン資料を多角的にレビューしています。完了まで数分かかることがあります。このページを閉じたり再読み込みしても、レビューは継続されます。")
 
-    try:
-        result = loop.run_until_complete(run_review_process(
-            gcs_file_path=st.session_state.gcs_file_path,
-            presentation_goal=st.session_state.presentation_goal,
-            audience_profile=audience_profile,
-            selected_configs=st.session_state.selected_configs,
-            progress_callback=update_progress
-        ))
-        st.session_state.review_result = result
-        st.session_state.page = 'result'
-    except Exception as e:
-        st.session_state.error_message = f"レビュープロセスでエラーが発生しました: {e}"
+    job = get_job_pool().get(st.session_state.job_id) if st.session_state.job_id else None
+    if job is None:
+        st.session_state.error_message = "レビュージョブが見つかりませんでした。"
         st.session_state.page = 'error'
-    finally:
-        loop.close()
+        st.query_params.clear()
         st.rerun()
 
+    if job.status == JobStatus.SUCCEEDED:
+        st.session_state.review_result = job.result
+        st.session_state.page = 'result'
+        st.rerun()
+    elif job.status == JobStatus.FAILED:
+        st.session_state.error_message = f"レビュープロセスでエラーが発生しました: {job.error}"
+        st.session_state.page = 'error'
+        st.query_params.clear()
+        st.rerun()
 
-def draw_result_page():
-    """結果表示画面を描画する"""
-    st.header("4. レビュー結果")
-    
-    result = st.session_state.review_result
-    if not result or result.get("error"):
-        st.error(f"レビュー結果の取得に失敗しました: {result.get('error', '不明なエラー')}")
-        if st.button("最初からやり直す"):
-            st.session_state.clear()
-            st.rerun()
-        return
-
-    # タブで結果を表示
+    with st.spinner(job.progress_message or "レビューを開始しています..."):
+        elapsed = int(time.time() - job.created_at)
+        st.caption(f"経過時間: {elapsed // 60}分{elapsed % 60:02d}秒")
+        # 届いたレビューから順に表示する
+        if job.partial_result:
+            render_review_report(job.partial_result, partial=True)
+        # ジョブの状態を定期的に確認する。途中経過が届き始めたら、より短い間隔で更新する
+        time.sleep(1 if job.partial_result else 2)
+    st.rerun()
+
+
+def render_review_report(result: Dict[str, Any], partial: bool = False):
+    """
+    レビュー結果をタブで表示する。
+    partial=True の場合は実行中の途中経過として、届いている項目のみを表示する。
+    """
     tab1, tab2, tab3 = st.tabs(["📊 総合評価", "📄 スライドごと評価", "❓ 想定問答"])
 
     with tab1:
         st.subheader("全体サマリー")
-        st.success(result.get('summary_review', 'N/A'))
+        if partial and result.get('summary_review') is None:
+            st.caption("総評を作成中です...")
+        else:
+            st.success(result.get('summary_review', 'N/A'))
         st.subheader("構成・ストーリーライン")
-        st.write(result.get('storyline_review', 'N/A'))
+        if partial and result.get('storyline_review') is None:
+            st.caption("構成のレビューを作成中です...")
+        else:
+            st.write(result.get('storyline_review', 'N/A'))
 
     with tab2:
         st.subheader("スライドごとの詳細レビュー")
         reviews = result.get('slide_by_slide_reviews', [])
-        if not reviews:
+        if partial:
+            st.caption(f"{len(reviews)}枚分のレビューが届いています。残りのスライドは作成中です...")
+        elif not reviews:
             st.info("スライドごとのレビューはありません。")
         for review in reviews:
             with st.expander(f"**スライド {review.get('slide_number')}**"):
@@ -316,23 +404,125 @@ def draw_result_page():
     with tab3:
         st.subheader("想定される質疑応答 (Q&A)")
         qna_list = result.get('qna_list', [])
-        if not qna_list:
+        if partial:
+            st.caption("想定問答はレビューの完了時に表示されます。")
+        elif not qna_list:
             st.info("想定問答は生成されていません。（設定で無効になっている可能性があります）")
-        for i, qna in enumerate(qna_list):
+        for i, qna in enumerate(qna_list or []):
             st.markdown(f"**Q{i+1}: {qna.get('question', 'N/A')}**")
             st.info(f"A: {qna.get('answer', 'N/A')}")
             st.markdown("---")
 
+
+def draw_result_page():
+    """結果表示画面を描画する"""
+    st.header("4. レビュー結果")
+    
+    result = st.session_state.review_result
+    if not result or result.get("error"):
+        st.error(f"レビュー結果の取得に失敗しました: {result.get('error', '不明なエラー')}")
+        if st.button("最初からやり直す"):
+            st.session_state.clear()
+            st.query_params.clear()
+            st.rerun()
+        return
+
+    render_review_report(result)
+
+    draw_trace_summary(result.get("trace"))
+
+    draw_revision_form(result)
+
     if st.button("別のプレゼンをレビューする", type="primary"):
         # 状態をクリアして最初のページに戻る
         st.session_state.clear()
+        st.query_params.clear()
         st.rerun()
 
+def draw_trace_summary(trace: Optional[Dict[str, Any]]):
+    """レビュー実行の内訳（エージェントごとの実行時間・トークン数・コスト）を表示する"""
+    if not trace:
+        return
+    with st.expander("実行の内訳（時間・トークン・コスト）"):
+        totals = trace["totals"]
+        col1, col2, col3 = st.columns(3)
+        col1.metric("実行時間", f"{trace['duration_ms'] / 1000:.1f}秒")
+        col2.metric("入力 / 出力トークン", f"{totals['prompt_tokens']:,} / {totals['output_tokens']:,}")
+        col3.metric("コスト", f"${totals['cost_usd']:.4f}")
+        st.dataframe(
+            [
+                {
+                    "エージェント": agent_name,
+                    "実行時間(秒)": round(entry["duration_ms"] / 1000, 2),
+                    "LLM呼び出し": entry.get("llm_calls", 0),
+                    "リトライ": entry.get("retries", 0),
+                    "順番待ち(秒)": round(entry.get("queue_wait_ms", 0.0) / 1000, 2),
+                    "入力トークン": entry.get("prompt_tokens", 0),
+                    "うちキャッシュ": entry.get("cached_input_tokens", 0),
+                    "出力トークン": entry.get("output_tokens", 0),
+                    "コスト(USD)": round(entry.get("cost_usd", 0.0), 4),
+                    "状態": entry.get("cache_hit") or entry["status"],
+                }
+                for agent_name, entry in trace["agents"].items()
+            ],
+            use_container_width=True,
+        )
+        col1, col2 = st.columns(2)
+        col1.download_button(
+            "タイムラインをJSONでダウンロード",
+            json.dumps(trace, ensure_ascii=False, indent=2),
+            file_name=f"trace-{trace['trace_id']}.json",
+            mime="application/json",
+        )
+        col2.download_button(
+            "OpenTelemetry形式でダウンロード",
+            json.dumps(trace_to_otlp(trace)),
+            file_name=f"trace-{trace['trace_id']}.otlp.json",
+            mime="application/json",
+        )
+
+def draw_revision_form(result: Dict[str, Any]):
+    """
+    レビュー結果を踏まえて修正した資料を、同じ条件で再レビューするフォームを描画する。
+    変更のないスライドは今回の解析結果とレビューを引き継ぎ、変更のあったスライドのみをレビューする。
+    """
+    previous_review = build_previous_review(result)
+    # ページの再読み込み後など、レビューの入力内容が残っていない場合は同じ条件で再レビューできない
+    if previous_review is None or "presentation_goal" not in st.session_state:
+        return
+    st.markdown("---")
+    st.subheader("修正版の資料を再レビューする")
+    revised_file = st.file_uploader(
+        "修正した資料 (.pptx, .pdf)", type=['pptx', 'pdf'], key="revised_file",
+        help="変更のないスライドは今回のレビューを引き継ぎ、変更・追加されたスライドのみをレビューします。",
+    )
+    if revised_file is not None and st.button("修正版をレビューする"):
+        handle = register_document(revised_file)
+        if handle is None:
+            return
+        st.session_state.document = handle.model_dump()
+        st.session_state.gcs_file_path = handle.uri
+        st.session_state.document_sha256 = handle.sha256
+        st.session_state.total_slides = None
+        st.session_state.review_result = None
+        submit_review_job(previous_review)
+
+
 def draw_error_page():
     """エラー画面"""
     st.error(f"エラーが発生しました: {st.session_state.error_message}")
+    job_id = st.session_state.get("job_id")
+    # 失敗したレビューは、完了済みの段階（資料解析・各レビュー）を再利用して再開できる
+    if job_id and st.button("失敗した段階から再開する", type="primary"):
+        if get_job_pool().retry(job_id):
+            st.session_state.error_message = None
+            st.query_params["job"] = job_id
+            st.session_state.page = 'running'
+            st.rerun()
+        st.warning("このレビューは再開できません。最初からやり直してください。")
     if st.button("最初からやり直す"):
         st.session_state.clear()
+        st.query_params.clear()
         st.rerun()
 
 # --- メインロジック ---
@@ -342,8 +532,7 @@ st.title("🤖 AIプレゼンレビューアプリ「Presenta-AI」")
 # if not init_vertexai():
 #     st.error("GCPプロジェクトまたはGCSバケットが設定されていません。環境変数を確認してください。")
 #     st.stop()
-client = genai.Client(vertexai=True,
-                    project=GCP_PROJECT_ID, location=GCP_LOCATION)
+# genaiクライアントはリソースレジストリで1度だけ生成し、再実行のたびに作り直さない
 
 # ページルーター
 if st.session_state.page == 'input':
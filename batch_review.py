@@ -0,0 +1,102 @@
+"""
+フォルダ内の資料、またはマニフェストに列挙した資料をまとめてレビューし、資料ごとのレポートをJSONで書き出すコマンド。
+
+マニフェストはJSON Lines形式で、1行に1件の資料を
+{"file_path": ..., "presentation_goal": ..., "audience_profile": {"role": ..., "interests": ...},
+ "selected_configs": {...}, "output_name": ...} の形で記述する。行に無い項目はコマンドの引数の値を使う。
+
+使い方:
+    python batch_review.py decks/ --goal "新サービスの導入の承認を得る" --audience-role 経営層 --audience-interests 費用対効果
+    python batch_review.py --manifest decks.jsonl --output-dir reports --concurrency 16 --skip-existing
+    python batch_review.py decks/ --goal "..." --audience-role 営業 --audience-interests 事例 --batch-prediction vertex
+"""
+import argparse
+import asyncio
+import sys
+
+from dotenv import load_dotenv
+
+# アプリのモジュールは読み込み時に環境変数を参照するため、先に .env を読み込む
+load_dotenv()
+
+from adk_logic.batch_runner import (  # noqa: E402
+    BATCH_REVIEW_CONCURRENCY,
+    default_selected_configs,
+    items_from_directory,
+    load_manifest,
+    run_batch_review,
+)
+from adk_logic.main_runner import DEFAULT_ANALYSIS_MODE  # noqa: E402
+from adk_logic.root_agent_factory import DEFAULT_REVIEW_MODE  # noqa: E402
+
+
+def _parse_configs(values) -> dict:
+    configs = default_selected_configs()
+    for value in values or []:
+        agent_type, _, selection_id = value.partition("=")
+        configs[agent_type] = selection_id
+    return configs
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", nargs="?", help="レビューする資料 (.pptx, .pdf) のあるディレクトリ")
+    parser.add_argument("--manifest", help="資料ごとの条件を記述したJSON Linesファイル")
+    parser.add_argument("--goal", help="プレゼンの目的")
+    parser.add_argument("--audience-role", help="聴衆の役職や立場")
+    parser.add_argument("--audience-interests", help="聴衆の主な関心事や知識レベル")
+    parser.add_argument(
+        "--config", action="append", metavar="AGENT=OPTION",
+        help="チーム編成 (例: logic_critic=strict)。指定しないエージェントは最初の選択肢を使う",
+    )
+    parser.add_argument("--output-dir", default="reports", help="レポートの出力先")
+    parser.add_argument("--concurrency", type=int, default=BATCH_REVIEW_CONCURRENCY, help="同時に実行するレビューの数")
+    parser.add_argument("--analysis-mode", default=DEFAULT_ANALYSIS_MODE, choices=["llm", "hybrid", "local"])
+    parser.add_argument("--review-mode", default=DEFAULT_REVIEW_MODE, choices=["standard", "chunked"])
+    parser.add_argument("--skip-existing", action="store_true", help="レポートが既にある資料はレビューしない")
+    parser.add_argument(
+        "--batch-prediction", choices=["vertex", "local"],
+        help="LLM呼び出しをバッチ予測にまとめる (vertex: Vertex AIのバッチ予測、local: ローカルで代替する検証用)",
+    )
+    args = parser.parse_args()
+
+    if bool(args.directory) == bool(args.manifest):
+        parser.error("ディレクトリとマニフェストのどちらか一方を指定してください。")
+    defaults = {}
+    if args.goal:
+        defaults["presentation_goal"] = args.goal
+    if args.audience_role or args.audience_interests:
+        defaults["audience_profile"] = {"role": args.audience_role or "", "interests": args.audience_interests or ""}
+    defaults["selected_configs"] = _parse_configs(args.config)
+
+    if args.manifest:
+        items = load_manifest(args.manifest, defaults)
+    else:
+        if "presentation_goal" not in defaults or "audience_profile" not in defaults:
+            parser.error("ディレクトリを指定する場合は --goal と --audience-role / --audience-interests が必要です。")
+        items = items_from_directory(
+            args.directory, defaults["presentation_goal"], defaults["audience_profile"], defaults["selected_configs"]
+        )
+
+    summary = asyncio.run(run_batch_review(
+        items,
+        args.output_dir,
+        concurrency=args.concurrency,
+        analysis_mode=args.analysis_mode,
+        review_mode=args.review_mode,
+        skip_existing=args.skip_existing,
+        batch_prediction=args.batch_prediction,
+    ))
+    print(
+        f"{summary.succeeded}/{summary.total} succeeded, {summary.failed} failed, {summary.skipped} skipped, "
+        f"{summary.deduplicated} deduplicated / {summary.wall_seconds:.1f}s, "
+        f"{summary.throughput_per_min:.1f} decks/min, {summary.llm_calls} LLM calls, ${summary.cost_usd:.4f}"
+    )
+    for outcome in summary.outcomes:
+        if outcome.status == "failed":
+            print(f"FAILED {outcome.file_path}: {outcome.error}")
+    return 1 if summary.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
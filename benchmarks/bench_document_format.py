@@ -0,0 +1,45 @@
+"""
+プロンプトに埋め込む資料情報の形式ごとに、文字数と推定トークン数を比較するベンチマーク。
+比較の基準は、Stateの辞書をそのままプレースホルダに展開した場合（従来の埋め込み方）とする。
+
+使い方:
+    python -m benchmarks.bench_document_format --slides 20 60 150
+"""
+import argparse
+
+from adk_logic.document_serializer import DOCUMENT_FORMATS, estimate_tokens, serialize_document_analysis
+from adk_logic.state_models import DocumentAnalysisResult
+from adk_logic.tools.document_parser_tool import extract_slides
+from benchmarks.synthetic_decks import generate_pptx_deck, generate_pdf_deck
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--slides", type=int, nargs="+", default=[20, 60, 150])
+    parser.add_argument("--types", nargs="+", default=["pptx", "pdf"], choices=["pdf", "pptx"])
+    args = parser.parse_args()
+
+    generators = {"pptx": generate_pptx_deck, "pdf": generate_pdf_deck}
+    print(f"{'type':<5} {'slides':>6} {'format':<17} {'chars':>9} {'est. tokens':>12} {'reduction':>10}")
+    for file_type in args.types:
+        for num_slides in args.slides:
+            slides = extract_slides(generators[file_type](num_slides), file_type, max_workers=1)
+            analysis = DocumentAnalysisResult(
+                file_name=f"synthetic.{file_type}", total_slides=len(slides), slides=slides
+            ).model_dump()
+
+            # ADKはStateの辞書をstr()でプレースホルダに展開する
+            baseline_tokens = estimate_tokens(str(analysis))
+            rows = [("state (str)", str(analysis))]
+            rows += [(document_format, serialize_document_analysis(analysis, document_format))
+                     for document_format in DOCUMENT_FORMATS]
+            for label, text in rows:
+                tokens = estimate_tokens(text)
+                print(
+                    f"{file_type:<5} {num_slides:>6} {label:<17} {len(text):>9} {tokens:>12} "
+                    f"{1 - tokens / baseline_tokens:>9.1%}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""
+LLMをスタブに置き換えて、レビューのパイプライン全体 (create_root_agent / run_review_process) の性能を計測するベンチマーク。
+Vertex AIへの接続は不要で、ストレージ・解析キャッシュは一時ディレクトリを使う。
+
+合成したPPTX/PDF資料ごと・同時実行数ごとに、以下を計測する。
+- レビュー1件あたりのエンドツーエンドの所要時間（中央値・最大）
+- エージェントごとの実行時間（レビューのタイムラインから集計）
+- メインプロセスのピークRSS（並列抽出のワーカープロセスは含まない）
+- 同時実行時のスループット（件/分）
+- --stream 指定時は、最初の途中結果（総評またはスライドのレビュー）が届くまでの時間
+- 流量制御によるリトライ回数と、レビュー1件あたりの順番待ちの時間
+
+使い方:
+    python -m benchmarks.bench_review_pipeline --slides 10 100 500 --concurrency 1 4
+    python -m benchmarks.bench_review_pipeline --latency 0.5 --tokens-per-second 200 --failure-rate 0.05 --json result.json
+    python -m benchmarks.bench_review_pipeline --failure-rate 0.3 --retry-base-delay 0.1 --rate-limit-rpm 600
+    python -m benchmarks.bench_review_pipeline --stream --tokens-per-second 100 --review-mode chunked
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List
+
+from benchmarks.stub_llm import install_stub_llm
+from benchmarks.synthetic_decks import generate_pdf_deck, generate_pptx_deck
+
+SELECTED_CONFIGS: Dict[str, str] = {
+    "logic_critic": "strict",
+    "audience_persona": "skeptical",
+    "qna_generator": "enabled",
+}
+# タイムラインのうち、レビュー全体を表すスパン（エンドツーエンドの所要時間と重複するため集計しない）
+_ROOT_AGENT_NAME = "PresentaAiRootAgent"
+
+
+class PeakRssSampler:
+    """計測区間中のメインプロセスのRSSを定期的に取得し、最大値を記録する"""
+
+    def __init__(self, interval_seconds: float = 0.02):
+        self.interval_seconds = interval_seconds
+        self.peak_bytes = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @staticmethod
+    def current_rss_bytes() -> int:
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except OSError:
+            # /proc が無い環境では、プロセス開始以来の最大RSSで代用する (macOSはバイト、Linuxはキロバイト)
+            max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.peak_bytes = max(self.peak_bytes, self.current_rss_bytes())
+            self._stop.wait(self.interval_seconds)
+
+    def __enter__(self) -> "PeakRssSampler":
+        self.peak_bytes = self.current_rss_bytes()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.peak_bytes = max(self.peak_bytes, self.current_rss_bytes())
+
+
+async def run_scenario(args: argparse.Namespace, file_type: str, num_slides: int, concurrency: int) -> Dict[str, Any]:
+    """同じ枚数の資料 concurrency 件を同時にレビューし、計測結果を返す"""
+    from adk_logic.analysis_cache import get_analysis_cache
+    from adk_logic.cost_estimator import agent_profile_key
+    from adk_logic.document_store import get_document_store
+    from adk_logic.main_runner import run_review_process
+    from benchmarks.stub_llm import StubLlm
+
+    generate = generate_pptx_deck if file_type == "pptx" else generate_pdf_deck
+    # シードを変えて内容の異なる資料にし、同時実行中のレビュー同士で解析結果のキャッシュが効かないようにする
+    documents = [
+        get_document_store().register(generate(num_slides, seed=args.seed + i), f"bench-{i}.{file_type}").model_dump()
+        for i in range(concurrency)
+    ]
+    StubLlm.configure(
+        latency_seconds=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        failure_rate=args.failure_rate,
+        num_slides=num_slides,
+        seed=args.seed,
+    )
+    get_analysis_cache().clear()
+
+    async def review(document: Dict[str, Any]):
+        start = time.perf_counter()
+        result = await run_review_process(
+            gcs_file_path=None,
+            presentation_goal="新サービスの導入について経営層の承認を得る",
+            audience_profile={"role": "経営層", "interests": "費用対効果"},
+            selected_configs=SELECTED_CONFIGS,
+            progress_callback=lambda message: None,
+            analysis_mode=args.analysis_mode,
+            review_mode=args.review_mode,
+            document=document,
+            partial_result_callback=(lambda partial: None) if args.stream else None,
+        )
+        return time.perf_counter() - start, result
+
+    # エージェントの進捗メッセージは標準出力に書かれるため、計測中は抑制する
+    output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with output, PeakRssSampler() as rss:
+        wall_start = time.perf_counter()
+        outcomes = await asyncio.gather(*(review(document) for document in documents))
+        wall_seconds = time.perf_counter() - wall_start
+
+    latencies = [seconds for seconds, _ in outcomes]
+    first_outputs = [
+        result["trace"]["marks"]["first_partial_result"] / 1000
+        for _, result in outcomes
+        if "first_partial_result" in ((result.get("trace") or {}).get("marks") or {})
+    ]
+    stage_durations: Dict[str, List[float]] = defaultdict(list)
+    llm_calls = retries = 0
+    queue_wait_ms: List[float] = []
+    for _, result in outcomes:
+        trace = result.get("trace") or {}
+        totals = trace.get("totals") or {}
+        llm_calls += totals.get("llm_calls", 0)
+        retries += totals.get("retries", 0)
+        queue_wait_ms.append(totals.get("queue_wait_ms", 0.0))
+        # チャンクごとのエージェントは種別ごとにまとめ、レビュー1件あたりの合計時間として集計する
+        per_review: Dict[str, float] = defaultdict(float)
+        for agent_name, entry in (trace.get("agents") or {}).items():
+            if agent_name != _ROOT_AGENT_NAME:
+                per_review[agent_profile_key(agent_name)] += entry["duration_ms"]
+        for stage, duration_ms in per_review.items():
+            stage_durations[stage].append(duration_ms)
+
+    return {
+        "file_type": file_type,
+        "slides": num_slides,
+        "concurrency": concurrency,
+        "failures": sum(1 for _, result in outcomes if result.get("error")),
+        "latency_p50_s": statistics.median(latencies),
+        "latency_max_s": max(latencies),
+        "first_output_p50_s": statistics.median(first_outputs) if first_outputs else None,
+        "wall_s": wall_seconds,
+        "throughput_per_min": concurrency / wall_seconds * 60,
+        "peak_rss_mb": rss.peak_bytes / 1024 / 1024,
+        "llm_calls": llm_calls,
+        "retries": retries,
+        "queue_wait_p50_s": statistics.median(queue_wait_ms) / 1000,
+        "stages_ms": {stage: statistics.mean(durations) for stage, durations in stage_durations.items()},
+    }
+
+
+def _print_results(results: List[Dict[str, Any]]) -> None:
+    print(
+        f"{'type':<5} {'slides':>6} {'conc':>5} {'fail':>5} {'p50 (s)':>8} {'max (s)':>8} {'first (s)':>9} "
+        f"{'reviews/min':>12} {'peak RSS MB':>12} {'LLM calls':>10} {'retries':>8} {'queued (s)':>10}"
+    )
+    for r in results:
+        first_output = f"{r['first_output_p50_s']:.2f}" if r["first_output_p50_s"] is not None else "-"
+        print(
+            f"{r['file_type']:<5} {r['slides']:>6} {r['concurrency']:>5} {r['failures']:>5} "
+            f"{r['latency_p50_s']:>8.2f} {r['latency_max_s']:>8.2f} {first_output:>9} {r['throughput_per_min']:>12.1f} "
+            f"{r['peak_rss_mb']:>12.1f} {r['llm_calls']:>10} {r['retries']:>8} {r['queue_wait_p50_s']:>10.2f}"
+        )
+
+    print("\nmean stage time per review (ms)")
+    for r in results:
+        stages = ", ".join(f"{stage}={duration:.0f}" for stage, duration in r["stages_ms"].items())
+        print(f"{r['file_type']:<5} {r['slides']:>6} {r['concurrency']:>5}  {stages}")
+
+
+async def _run_all(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    results = []
+    for file_type in args.types:
+        for num_slides in args.slides:
+            for concurrency in args.concurrency:
+                results.append(await run_scenario(args, file_type, num_slides, concurrency))
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--slides", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--types", nargs="+", default=["pptx", "pdf"], choices=["pdf", "pptx"])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4], help="同時に実行するレビューの件数")
+    parser.add_argument("--analysis-mode", default="local", choices=["llm", "hybrid", "local"])
+    parser.add_argument("--review-mode", default="standard", choices=["standard", "chunked"])
+    parser.add_argument("--latency", type=float, default=0.2, help="LLM呼び出し1回あたりの固定の遅延（秒）")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="スタブの出力トークンの生成速度（0で無制限）")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="LLM呼び出しが失敗する確率")
+    parser.add_argument("--stream", action="store_true", help="LLMの応答をストリーミングで受け取り、途中経過を組み立てる")
+    parser.add_argument("--rate-limit-rpm", type=float, help="モデルごとのリクエスト数の上限（1分あたり、0で無制限）")
+    parser.add_argument("--max-concurrency", type=int, help="モデルごとの同時実行数の上限")
+    parser.add_argument("--retry-base-delay", type=float, help="リトライまでの待ち時間の基準値（秒）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="計測結果をJSONで書き出すファイルのパス")
+    parser.add_argument("--verbose", action="store_true", help="パイプラインのログと進捗メッセージを表示する")
+    args = parser.parse_args()
+
+    # 実行環境のストレージ・キャッシュを汚さないよう、アプリのモジュールを読み込む前に一時ディレクトリを設定する
+    work_dir = tempfile.mkdtemp(prefix="presenta-bench-")
+    os.environ["STORAGE_BACKEND"] = "local"
+    os.environ["LOCAL_STORAGE_DIR"] = os.path.join(work_dir, "storage")
+    os.environ["ANALYSIS_CACHE_DIR"] = os.path.join(work_dir, "analysis_cache")
+    os.environ["SESSION_DB_PATH"] = os.path.join(work_dir, "sessions.sqlite3")
+    # 同じシードの資料は毎回同じプロンプトになるため、エージェントの応答のキャッシュとスライドのレビューの再利用は使わずに毎回LLMを呼び出す
+    os.environ["RESULT_CACHE_ENABLED"] = "false"
+    os.environ["SLIDE_REVIEW_REUSE_ENABLED"] = "false"
+    for env_name, value in (
+        ("MODEL_RATE_LIMIT_RPM", args.rate_limit_rpm),
+        ("MODEL_MAX_CONCURRENCY", args.max_concurrency),
+        ("MODEL_RETRY_BASE_DELAY_SECONDS", args.retry_base_delay),
+    ):
+        if value is not None:
+            os.environ[env_name] = str(value)
+    # スタブの登録後に読み込み、エージェントがスタブを解決するようにする
+    install_stub_llm()
+    import adk_logic.main_runner  # noqa: F401  (ログ設定の初期化)
+    if not args.verbose:
+        # 模擬した失敗のスタックトレースなどは表示せず、失敗件数のみを集計する
+        logging.getLogger().setLevel(logging.CRITICAL)
+
+    results = asyncio.run(_run_all(args))
+    _print_results(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"settings": vars(args), "results": results}, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
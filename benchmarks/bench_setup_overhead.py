@@ -0,0 +1,81 @@
+"""
+レビュー1回あたりのセットアップコストを、毎回生成する場合と共有リソースを再利用する場合とで比較するベンチマーク。
+LLMは呼び出さず、エージェントツリー・Runner・セッションサービス・genaiクライアントの生成のみを計測する。
+
+使い方:
+    python -m benchmarks.bench_setup_overhead --iterations 50
+"""
+import argparse
+import os
+import statistics
+import time
+from typing import Callable, Dict, List
+
+from google import genai
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+
+from adk_logic.root_agent_factory import create_root_agent
+from adk_logic.resources import APP_NAME, ResourceRegistry
+
+SELECTED_CONFIGS: Dict[str, str] = {
+    "logic_critic": "strict",
+    "audience_persona": "newbie",
+    "qna_generator": "enabled",
+}
+
+
+def _per_review_setup(review_mode: str) -> None:
+    """従来の実装: レビューのたびにすべてを生成する"""
+    client = genai.Client(api_key="dummy")
+    runner = Runner(
+        app_name=APP_NAME,
+        session_service=InMemorySessionService(),
+        agent=create_root_agent(SELECTED_CONFIGS, review_mode=review_mode),
+    )
+    assert client and runner
+
+
+def _make_shared_setup(registry: ResourceRegistry) -> Callable[[str], None]:
+    def _shared_setup(review_mode: str) -> None:
+        runner = registry.get_runner(SELECTED_CONFIGS, review_mode)
+        client = registry.get_genai_client()
+        assert client and runner
+    return _shared_setup
+
+
+def _measure(setup: Callable[[str], None], review_mode: str, iterations: int) -> List[float]:
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        setup(review_mode)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--modes", nargs="+", default=["standard", "chunked"], choices=["standard", "chunked"])
+    args = parser.parse_args()
+
+    # 計測ではVertex AIに接続しないため、ダミーの設定でクライアントを生成する
+    os.environ.setdefault("GCP_PROJECT_ID", "benchmark-project")
+    registry = ResourceRegistry()
+    shared_setup = _make_shared_setup(registry)
+
+    print(f"{'mode':<9} {'per-review p50[ms]':>19} {'shared p50[ms]':>15} {'speedup':>8}")
+    for review_mode in args.modes:
+        # 共有側は初回の生成を計測から除外する
+        shared_setup(review_mode)
+        per_review = statistics.median(_measure(_per_review_setup, review_mode, args.iterations))
+        shared = statistics.median(_measure(shared_setup, review_mode, args.iterations))
+        print(
+            f"{review_mode:<9} {per_review * 1000:>19.3f} {shared * 1000:>15.3f} "
+            f"{per_review / max(shared, 1e-9):>7.0f}x"
+        )
+    registry.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+スライド検索インデックスの作成時間と検索のレイテンシ、QnAエージェントに渡す資料情報のトークン数を合成資料で計測するベンチマーク。
+
+使い方:
+    python -m benchmarks.bench_slide_index --slides 100 500 1000 --queries 200 --top-k 5
+"""
+import argparse
+import random
+import statistics
+import time
+
+from adk_logic.document_serializer import build_slide_outline, estimate_tokens, serialize_document_analysis
+from adk_logic.slide_index import SlideIndex
+from adk_logic.tools.document_parser_tool import extract_slides
+from benchmarks.synthetic_decks import generate_pptx_deck
+
+_QUERIES = [
+    "価格戦略の施策", "競合分析の前年比", "市場規模はどのくらい", "KPIの目標", "リスクと対策",
+    "予算計画の内訳", "開発体制の説明", "収益モデル", "製品ロードマップの要点", "ターゲット顧客の定義",
+]
+
+
+def _percentile(values, ratio: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * ratio))]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--slides", type=int, nargs="+", default=[100, 500, 1000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    print(
+        f"{'slides':>6} {'chunks':>7} {'build[ms]':>10} {'p50[ms]':>8} {'p95[ms]':>8} "
+        f"{'full[tok]':>10} {'outline+top-k[tok]':>19} {'ratio':>6}"
+    )
+    for num_slides in args.slides:
+        slides = [slide.model_dump() for slide in extract_slides(generate_pptx_deck(num_slides), "pptx")]
+        analysis = {"slides": slides}
+
+        build = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            index = SlideIndex(slides)
+            build = min(build, time.perf_counter() - start)
+
+        latencies = []
+        retrieved_tokens = []
+        for _ in range(args.queries):
+            query = rng.choice(_QUERIES)
+            start = time.perf_counter()
+            results = index.search(query, args.top_k)
+            latencies.append(time.perf_counter() - start)
+            assert results, query
+            retrieved_tokens.append(estimate_tokens(serialize_document_analysis({"slides": results})))
+
+        full_tokens = estimate_tokens(serialize_document_analysis(analysis))
+        # 検索を使う場合、プロンプトには資料の構成と、検索結果のスライドだけが含まれる
+        retrieval_tokens = estimate_tokens(build_slide_outline(analysis)) + statistics.mean(retrieved_tokens)
+        print(
+            f"{num_slides:>6} {index.num_chunks:>7} {build * 1000:>10.1f} "
+            f"{_percentile(latencies, 0.5) * 1000:>8.3f} {_percentile(latencies, 0.95) * 1000:>8.3f} "
+            f"{full_tokens:>10} {retrieval_tokens:>19.0f} {retrieval_tokens / full_tokens:>6.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+レビューエージェントのプロンプトが、共通の資料情報をバイト単位で同一の先頭部分として共有していることを検証する。
+LLMはスタブに置き換えるため、Vertex AIへの接続は不要。
+
+使い方:
+    python -m benchmarks.check_prompt_prefix --slides 30
+"""
+import argparse
+import asyncio
+import os
+import sys
+from collections import defaultdict
+from typing import Dict
+
+from benchmarks.stub_llm import CHARS_PER_TOKEN, install_stub_llm
+from adk_logic.prompts.base_prompts import SHARED_CONTEXT_END_MARKER
+
+SELECTED_CONFIGS: Dict[str, str] = {
+    "logic_critic": "strict",
+    "audience_persona": "skeptical",
+    "qna_generator": "enabled",
+}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--slides", type=int, default=30, help="スタブが返す資料のスライド数")
+    args = parser.parse_args()
+
+    # 過去の実行で保存した応答を使うとLLMが呼ばれずプロンプトを検証できないため、応答のキャッシュは使わない
+    # 再利用するスライドの一覧も実行ごとに変わらないよう、スライドのレビューの再利用も使わない
+    os.environ["RESULT_CACHE_ENABLED"] = "false"
+    os.environ["SLIDE_REVIEW_REUSE_ENABLED"] = "false"
+    stub = install_stub_llm()
+    stub.num_slides = args.slides
+    # スタブの登録後に読み込み、エージェントがスタブを解決するようにする
+    from adk_logic.main_runner import run_review_process
+
+    result = asyncio.run(run_review_process(
+        gcs_file_path="gs://stub-bucket/stub.pdf",
+        presentation_goal="新サービスの導入について経営層の承認を得る",
+        audience_profile={"role": "経営層", "interests": "費用対効果"},
+        selected_configs=SELECTED_CONFIGS,
+        progress_callback=lambda message: None,
+    ))
+    if result.get("error"):
+        print(f"Review failed: {result['error']}")
+        return 1
+
+    prefixes = {}
+    usage = defaultdict(lambda: [0, 0])
+    for request in stub.requests:
+        prompt_tokens = len(request.prompt_text) // CHARS_PER_TOKEN
+        usage[request.agent_name][0] += prompt_tokens
+        if SHARED_CONTEXT_END_MARKER in request.system_instruction:
+            prefix = request.system_instruction.split(SHARED_CONTEXT_END_MARKER, 1)[0]
+            prefixes[request.agent_name] = prefix
+            usage[request.agent_name][1] += len(prefix) // CHARS_PER_TOKEN
+
+    print(f"{'agent':<24} {'prompt tokens':>14} {'shared prefix tokens':>21}")
+    for agent_name, (prompt_tokens, prefix_tokens) in usage.items():
+        print(f"{agent_name:<24} {prompt_tokens:>14} {prefix_tokens:>21}")
+
+    distinct_prefixes = set(prefixes.values())
+    if len(prefixes) < 2 or len(distinct_prefixes) != 1:
+        print(f"NG: shared prefix differs across agents {sorted(prefixes)}")
+        return 1
+    print(f"OK: {len(prefixes)} agents share a byte-identical prefix of {len(distinct_prefixes.pop())} chars")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,230 @@
+"""
+Vertex AIに接続せずにワークフローを実行するためのLLMスタブ。
+
+LLMRegistry に登録すると、"gemini-" で始まるモデルの呼び出しがすべてこのスタブに置き換わる。
+リクエストを記録し、出力スキーマに合わせた固定のJSONを返す。
+ツールを持つエージェントには、まだツールの結果を受け取っていなければ各ツールを1回ずつ呼び出し、
+出力スキーマとツールを併用するエージェント（ADKが set_model_response ツールを追加する）には、
+スキーマに合わせたJSONを set_model_response の呼び出しとして返す。
+トークン使用量は、過去のリクエストと一致する先頭部分をキャッシュ済みとみなす暗黙キャッシュを模擬して返す。
+応答までの時間（固定の遅延 + 出力トークン数 / 生成速度）と失敗率を設定でき、失敗は乱数のシードで再現できる。
+"""
+import asyncio
+import json
+import random
+import re
+from dataclasses import dataclass
+from typing import AsyncGenerator, ClassVar, List, Optional
+
+from google.adk.models import BaseLlm, LlmRequest, LlmResponse, LLMRegistry
+from google.genai import types
+
+_AGENT_NAME_PATTERN = re.compile(r'Your internal name is "([^"]+)"')
+# 日本語の文章ではおよそ1〜2文字が1トークンになるため、検証用に2文字を1トークンとして扱う
+CHARS_PER_TOKEN = 2
+# ストリーミング時に1回の partial な応答で返す文字数
+STREAM_CHUNK_CHARS = 32
+# 出力スキーマとツールを併用するエージェントに、ADKが追加する最終応答用のツール
+SET_MODEL_RESPONSE_TOOL_NAME = "set_model_response"
+# ツールの呼び出しで、型ごとに渡す固定の引数
+_STUB_TOOL_ARGUMENTS = {"string": "スライド", "integer": 3, "number": 3, "boolean": True}
+
+
+@dataclass
+class RecordedRequest:
+    agent_name: str
+    response_schema: Optional[str]
+    system_instruction: str
+    contents_text: str
+
+    @property
+    def prompt_text(self) -> str:
+        return self.system_instruction + self.contents_text
+
+
+def _common_prefix_length(a: str, b: str) -> int:
+    # 文字単位で比較すると長いプロンプトでスタブ自体が遅くなるため、スライスの比較で二分探索する
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        mid = (low + high + 1) // 2
+        if a[:mid] == b[:mid]:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+
+class StubLlmError(RuntimeError):
+    """スタブが模擬するLLM呼び出しの失敗（レート制限など）"""
+
+
+class StubLlm(BaseLlm):
+    """出力スキーマに応じた固定の応答を返すLLMスタブ"""
+
+    requests: ClassVar[List[RecordedRequest]] = []
+    # 1回の呼び出しで、応答の生成を始めるまでにかかる時間（秒）。並行実行の効果を確認する場合に指定する
+    latency_seconds: ClassVar[float] = 0.0
+    # 出力トークンの生成速度（トークン/秒）。0の場合、出力量による時間はかからない
+    tokens_per_second: ClassVar[float] = 0.0
+    # 呼び出しが StubLlmError で失敗する確率
+    failure_rate: ClassVar[float] = 0.0
+    # 資料解析の応答に含めるスライド数
+    num_slides: ClassVar[int] = 3
+    _rng: ClassVar[random.Random] = random.Random(0)
+
+    @classmethod
+    def supported_models(cls) -> List[str]:
+        return [r"gemini-.*"]
+
+    @classmethod
+    def reset(cls) -> None:
+        cls.requests = []
+
+    @classmethod
+    def configure(
+        cls,
+        latency_seconds: float = 0.0,
+        tokens_per_second: float = 0.0,
+        failure_rate: float = 0.0,
+        num_slides: int = 3,
+        seed: int = 0,
+    ) -> None:
+        """応答の遅延・生成速度・失敗率を設定し、記録したリクエストと乱数の状態をリセットする"""
+        cls.latency_seconds = latency_seconds
+        cls.tokens_per_second = tokens_per_second
+        cls.failure_rate = failure_rate
+        cls.num_slides = num_slides
+        cls._rng = random.Random(seed)
+        cls.reset()
+
+    def _render_response(self, schema_name: Optional[str], request: LlmRequest) -> str:
+        slides = range(1, self.num_slides + 1)
+        if schema_name == "DocumentAnalysisResult":
+            return json.dumps({
+                "file_name": "stub.pdf",
+                "total_slides": self.num_slides,
+                "slides": [
+                    {"slide_number": n, "title": f"スライド{n}", "text": f"スライド{n}の本文です。", "notes": ""}
+                    for n in slides
+                ],
+            }, ensure_ascii=False)
+        if schema_name == "FinalReport":
+            return json.dumps({
+                "summary_review": "総評です。",
+                "storyline_review": "構成のレビューです。",
+                "slide_by_slide_reviews": [
+                    {"slide_number": n, "evaluation": "評価です。", "suggestion": "改善案です。"} for n in slides
+                ],
+            }, ensure_ascii=False)
+        if schema_name == "ChunkReview":
+            target = re.search(r"['\"]review_target_slides['\"]:\s*\[([0-9,\s]*)\]", request.config.system_instruction or "")
+            numbers = [int(n) for n in target.group(1).split(",") if n.strip()] if target else []
+            return json.dumps({
+                "slide_by_slide_reviews": [
+                    {"slide_number": n, "evaluation": "評価です。", "suggestion": "改善案です。"} for n in numbers
+                ],
+                "storyline_notes": "チャンクの気付きです。",
+            }, ensure_ascii=False)
+        if schema_name == "ReportOverview":
+            return json.dumps({"summary_review": "総評です。", "storyline_review": "構成のレビューです。"}, ensure_ascii=False)
+        if schema_name == "QnAList":
+            return json.dumps({"qna_list": [{"question": "質問です。", "answer": "回答です。"}]}, ensure_ascii=False)
+        return "レビューコメントです。"
+
+    @staticmethod
+    def _stub_function_call(tool) -> types.FunctionCall:
+        """ツールの宣言の引数の型に合わせた固定の引数で、ツールの呼び出しを組み立てる"""
+        declaration = tool._get_declaration()
+        properties = {}
+        if declaration is not None and declaration.parameters_json_schema:
+            properties = declaration.parameters_json_schema.get("properties", {})
+        elif declaration is not None and declaration.parameters is not None:
+            properties = {
+                name: {"type": schema.type.value.lower() if schema.type else "string"}
+                for name, schema in (declaration.parameters.properties or {}).items()
+            }
+        args = {name: _STUB_TOOL_ARGUMENTS.get(schema.get("type"), "") for name, schema in properties.items()}
+        return types.FunctionCall(name=tool.name, args=args)
+
+    def _usage(self, recorded: RecordedRequest, output_tokens: int) -> types.GenerateContentResponseUsageMetadata:
+        prompt_text = recorded.prompt_text
+        cached_chars = max(
+            (_common_prefix_length(prompt_text, previous.prompt_text) for previous in self.requests[:-1]),
+            default=0,
+        )
+        return types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=len(prompt_text) // CHARS_PER_TOKEN,
+            cached_content_token_count=cached_chars // CHARS_PER_TOKEN,
+            candidates_token_count=output_tokens,
+        )
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        config = llm_request.config
+        schema = config.response_schema if config else None
+        tools = dict(llm_request.tools_dict)
+        set_model_response = tools.pop(SET_MODEL_RESPONSE_TOOL_NAME, None)
+        if schema is None and set_model_response is not None:
+            schema = set_model_response.output_schema
+        schema_name = getattr(schema, "__name__", None)
+        system_instruction = config.system_instruction if config and isinstance(config.system_instruction, str) else ""
+        agent_match = _AGENT_NAME_PATTERN.search(system_instruction)
+        contents_text = "".join(
+            part.text or "" for content in llm_request.contents for part in (content.parts or [])
+        )
+        recorded = RecordedRequest(
+            agent_name=agent_match.group(1) if agent_match else "",
+            response_schema=schema_name,
+            system_instruction=system_instruction,
+            contents_text=contents_text,
+        )
+        self.requests.append(recorded)
+
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds)
+        if self.failure_rate and self._rng.random() < self.failure_rate:
+            raise StubLlmError(f"429 RESOURCE_EXHAUSTED (simulated failure for {recorded.agent_name or 'unknown agent'})")
+
+        called_tools = {
+            part.function_response.name
+            for content in llm_request.contents for part in (content.parts or []) if part.function_response
+        }
+        pending_tools = [tool for name, tool in tools.items() if name not in called_tools]
+        text = self._render_response(schema_name, llm_request)
+        if pending_tools or set_model_response is not None:
+            # ツールの呼び出しは、ストリーミングでも partial を挟まずに1回で返す
+            if pending_tools:
+                function_calls = [self._stub_function_call(tool) for tool in pending_tools]
+            else:
+                function_calls = [types.FunctionCall(name=SET_MODEL_RESPONSE_TOOL_NAME, args=json.loads(text))]
+            output_tokens = max(1, sum(len(json.dumps(call.args, ensure_ascii=False)) for call in function_calls) // CHARS_PER_TOKEN)
+            if self.tokens_per_second:
+                await asyncio.sleep(output_tokens / self.tokens_per_second)
+            yield LlmResponse(
+                content=types.Content(role="model", parts=[types.Part(function_call=call) for call in function_calls]),
+                usage_metadata=self._usage(recorded, output_tokens),
+            )
+            return
+
+        output_tokens = max(1, len(text) // CHARS_PER_TOKEN)
+        if stream:
+            # ストリーミングでは、生成速度に合わせて応答を少しずつ partial として返し、最後に全体を返す
+            for start in range(0, len(text), STREAM_CHUNK_CHARS):
+                chunk = text[start:start + STREAM_CHUNK_CHARS]
+                if self.tokens_per_second:
+                    await asyncio.sleep(len(chunk) / CHARS_PER_TOKEN / self.tokens_per_second)
+                yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=chunk)]), partial=True)
+        elif self.tokens_per_second:
+            await asyncio.sleep(output_tokens / self.tokens_per_second)
+        yield LlmResponse(
+            content=types.Content(role="model", parts=[types.Part(text=text)]),
+            usage_metadata=self._usage(recorded, output_tokens),
+        )
+
+
+def install_stub_llm() -> type:
+    """スタブをLLMRegistryに登録し、以降の "gemini-" モデルの呼び出しを置き換える"""
+    LLMRegistry.register(StubLlm)
+    StubLlm.reset()
+    return StubLlm
@@ -0,0 +1,58 @@
+import io
+import random
+from typing import Optional
+
+import pptx
+from pptx.util import Inches, Pt
+import fitz  # PyMuPDF
+
+_TOPICS = [
+    "市場規模", "競合分析", "ターゲット顧客", "製品ロードマップ", "価格戦略",
+    "収益モデル", "開発体制", "リスクと対策", "KPI", "予算計画",
+]
+
+
+def _slide_lines(index: int, rng: random.Random, lines_per_slide: int):
+    topic = _TOPICS[index % len(_TOPICS)]
+    title = f"{index + 1}. {topic}について"
+    body = [
+        f"{topic}の観点{j + 1}: 前年比{rng.randint(90, 180)}%で推移しており、"
+        f"施策{rng.randint(1, 9)}の効果が見込まれる。"
+        for j in range(lines_per_slide)
+    ]
+    notes = f"ここでは{topic}の要点を{rng.randint(1, 3)}分で説明する。"
+    return title, body, notes
+
+
+def generate_pptx_deck(num_slides: int, lines_per_slide: int = 6, seed: Optional[int] = 0) -> bytes:
+    """ベンチマーク用に、タイトル・本文・ノートを持つ合成の.pptx資料を生成する"""
+    rng = random.Random(seed)
+    prs = pptx.Presentation()
+    layout = prs.slide_layouts[1]  # タイトルとコンテンツ
+    for i in range(num_slides):
+        title, body, notes = _slide_lines(i, rng, lines_per_slide)
+        slide = prs.slides.add_slide(layout)
+        slide.shapes.title.text = title
+        slide.placeholders[1].text = "\n".join(body)
+        textbox = slide.shapes.add_textbox(Inches(0.5), Inches(6.8), Inches(9), Inches(0.5))
+        textbox.text_frame.text = "Confidential - Presenta-AI Benchmark"
+        textbox.text_frame.paragraphs[0].runs[0].font.size = Pt(10)
+        slide.notes_slide.notes_text_frame.text = notes
+    buffer = io.BytesIO()
+    prs.save(buffer)
+    return buffer.getvalue()
+
+
+def generate_pdf_deck(num_pages: int, lines_per_slide: int = 6, seed: Optional[int] = 0) -> bytes:
+    """ベンチマーク用に、テキストを含む合成のPDF資料を生成する"""
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for i in range(num_pages):
+        title, body, _ = _slide_lines(i, rng, lines_per_slide)
+        page = doc.new_page(width=960, height=540)
+        page.insert_text((40, 60), title, fontsize=24, fontname="japan")
+        page.insert_text((40, 110), "\n".join(body), fontsize=14, fontname="japan")
+        page.insert_text((40, 520), "Confidential - Presenta-AI Benchmark", fontsize=9)
+    data = doc.tobytes()
+    doc.close()
+    return data
@@ -0,0 +1,67 @@
+import json
+import os
+
+import pytest
+
+from adk_logic import callbacks
+from adk_logic.analysis_cache import ANALYZER_PROMPT_VERSION, build_analysis_cache_key
+from utils.persistent_cache import PersistentLRUCache
+
+ANALYSIS = {"file_name": "deck.pdf", "total_slides": 1, "slides": [{"slide_number": 1, "title": "表紙"}]}
+
+
+class _FakeCallbackContext:
+    def __init__(self, state):
+        self.state = state
+        self.agent_name = "DocumentAnalyzerAgent"
+        self.session = type("Session", (), {"id": "no-trace"})()
+
+
+@pytest.fixture
+def analysis_cache(tmp_path, monkeypatch):
+    cache = PersistentLRUCache(str(tmp_path), max_entries=2)
+    monkeypatch.setattr(callbacks, "get_analysis_cache", lambda: cache)
+    return cache
+
+
+def test_cache_key_separates_documents_modes_and_prompt_versions():
+    key = build_analysis_cache_key("abc", "llm")
+    assert key.endswith(ANALYZER_PROMPT_VERSION)
+    assert key == build_analysis_cache_key("abc")
+    assert key != build_analysis_cache_key("abc", "local")
+    assert key != build_analysis_cache_key("abd", "llm")
+
+
+def test_stored_analysis_is_restored_for_the_same_document_and_mode(analysis_cache):
+    state = {"document_sha256": "abc", "analysis_mode": "local", "document_analysis": ANALYSIS}
+    assert callbacks.restore_cached_analysis_callback(_FakeCallbackContext(state)) is None
+
+    callbacks.store_analysis_in_cache_callback(_FakeCallbackContext(state))
+
+    content = callbacks.restore_cached_analysis_callback(_FakeCallbackContext(state))
+    assert json.loads(content.parts[0].text) == ANALYSIS
+    # 解析方式が違えば、同じ資料でも再利用しない
+    other_mode = {**state, "analysis_mode": "llm"}
+    assert callbacks.restore_cached_analysis_callback(_FakeCallbackContext(other_mode)) is None
+    assert analysis_cache.stats()["hits"] == 1
+
+
+def test_failed_analysis_is_not_cached(analysis_cache):
+    state = {"document_sha256": "abc", "document_analysis": {"error": "解析に失敗しました"}}
+    callbacks.store_analysis_in_cache_callback(_FakeCallbackContext(state))
+
+    assert callbacks.restore_cached_analysis_callback(_FakeCallbackContext(state)) is None
+
+
+def test_least_recently_used_entry_is_evicted(analysis_cache):
+    analysis_cache.put("a", 1)
+    analysis_cache.put("b", 2)
+    # ファイルの更新時刻の分解能に依存しないよう、保存時刻を過去にずらす
+    os.utime(analysis_cache._entry_path("a"), (100, 100))
+    os.utime(analysis_cache._entry_path("b"), (200, 200))
+    # 参照した "a" は残り、参照されていない "b" が追い出される
+    assert analysis_cache.get("a") == 1
+    analysis_cache.put("c", 3)
+
+    assert analysis_cache.get("b") is None
+    assert analysis_cache.get("a") == 1 and analysis_cache.get("c") == 3
@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+from google.adk.models import LlmRequest, LlmResponse
+from google.genai import types
+
+from adk_logic.batch_prediction import BatchPredictionBackend, BatchPredictionError, BatchPredictor
+
+
+def test_backend_without_predict_cannot_be_instantiated():
+    class IncompleteBackend(BatchPredictionBackend):
+        pass
+
+    with pytest.raises(TypeError, match="predict"):
+        IncompleteBackend()
+
+
+class _EchoBackend(BatchPredictionBackend):
+    """リクエストのテキストをそのまま返し、"fail" のリクエストは失敗させるバックエンド"""
+
+    def __init__(self):
+        self.batches = []
+
+    async def predict(self, model, requests):
+        self.batches.append(len(requests))
+        results = []
+        for request in requests:
+            text = request.contents[0].parts[0].text
+            if text == "fail":
+                results.append(BatchPredictionError(text))
+            else:
+                results.append(LlmResponse(content=types.Content(role="model", parts=[types.Part(text=text)])))
+        return results
+
+
+def make_request(text: str) -> LlmRequest:
+    return LlmRequest(contents=[types.Content(role="user", parts=[types.Part(text=text)])])
+
+
+def test_predictor_batches_requests_and_routes_each_result():
+    backend = _EchoBackend()
+    predictor = BatchPredictor(backend, max_requests=3, window_seconds=60)
+
+    async def run():
+        return await asyncio.gather(
+            *(predictor.generate("gemini-2.5-flash", make_request(text)) for text in ("a", "fail", "b")),
+            return_exceptions=True,
+        )
+
+    first, failed, second = asyncio.run(run())
+    # max_requests 件が集まった時点で、待たずに1つのバッチとして投入する
+    assert backend.batches == [3]
+    assert first.content.parts[0].text == "a" and second.content.parts[0].text == "b"
+    assert isinstance(failed, BatchPredictionError)
@@ -0,0 +1,29 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize("review_mode", ["standard", "chunked"])
+def test_stub_pipeline_completes(tmp_path, review_mode):
+    """LLMをスタブに置き換えたパイプライン全体が、失敗なく完了する（ベンチマークのスモークテスト）"""
+    result_path = tmp_path / "result.json"
+    completed = subprocess.run(
+        [
+            sys.executable, "-m", "benchmarks.bench_review_pipeline",
+            "--review-mode", review_mode, "--types", "pdf", "--slides", "10", "--concurrency", "1",
+            "--latency", "0", "--failure-rate", "0", "--json", str(result_path),
+        ],
+        cwd=REPO_ROOT,
+        env={**os.environ, "PYTHONPATH": REPO_ROOT, "QNA_DOCUMENT_ACCESS": "auto"},
+        capture_output=True,
+        text=True,
+        timeout=600,
+    )
+    assert completed.returncode == 0, completed.stderr[-2000:]
+    results = json.loads(result_path.read_text())["results"]
+    assert results and all(result["failures"] == 0 for result in results)
@@ -0,0 +1,95 @@
+import asyncio
+from typing import Optional
+
+import pytest
+from pydantic import BaseModel
+
+from adk_logic.agents.chunked_review_agent import ChunkedReviewAgent, split_slides_into_windows
+
+
+def make_slides(count: int):
+    return [{"slide_number": number, "text": f"スライド{number}"} for number in range(1, count + 1)]
+
+
+def test_windows_cover_every_slide_with_overlap_context():
+    windows = split_slides_into_windows(make_slides(7), chunk_size=3, overlap=1)
+
+    assert [targets for targets, _ in windows] == [[1, 2, 3], [4, 5, 6], [7]]
+    # 文脈には前後 overlap 枚のスライドを含めるが、資料の範囲外には広げない
+    assert [[slide["slide_number"] for slide in context] for _, context in windows] == [
+        [1, 2, 3, 4], [3, 4, 5, 6, 7], [6, 7],
+    ]
+
+
+def test_windows_review_only_target_slides():
+    windows = split_slides_into_windows(make_slides(10), chunk_size=2, overlap=1, target_numbers={2, 3, 9})
+
+    assert [targets for targets, _ in windows] == [[2, 3], [9]]
+    # 対象外のスライドも、対象のスライドの前後であれば文脈として含める
+    assert [[slide["slide_number"] for slide in context] for _, context in windows] == [[1, 2, 3, 4], [8, 9, 10]]
+
+
+def test_windows_without_targets_are_empty():
+    assert split_slides_into_windows(make_slides(5), chunk_size=2, overlap=1, target_numbers=set()) == []
+    assert split_slides_into_windows([], chunk_size=2, overlap=1) == []
+
+
+class _FakeContext(BaseModel):
+    branch: Optional[str] = None
+
+
+class _FakeReviewer:
+    """指定した時間だけ待ってからイベントを1つ返す、チャンクのレビューエージェントの代わり"""
+
+    def __init__(self, name: str, delay: float, running: dict, error: Optional[Exception] = None):
+        self.name = name
+        self.delay = delay
+        self.running = running
+        self.error = error
+
+    async def run_async(self, ctx: _FakeContext):
+        self.running["now"] += 1
+        self.running["max"] = max(self.running["max"], self.running["now"])
+        self.running["started"].append(self.name)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.error is not None:
+                raise self.error
+            yield (self.name, ctx.branch)
+        finally:
+            self.running["now"] -= 1
+
+
+async def collect(agent: ChunkedReviewAgent, reviewers):
+    return [event async for event in agent._run_chunk_reviewers(_FakeContext(branch="Root"), reviewers)]
+
+
+def test_chunk_reviewers_start_as_soon_as_a_slot_frees_up():
+    running = {"now": 0, "max": 0, "started": []}
+    reviewers = [
+        _FakeReviewer("slow", 0.3, running),
+        _FakeReviewer("fast_0", 0.01, running),
+        _FakeReviewer("fast_1", 0.01, running),
+    ]
+    agent = ChunkedReviewAgent(name="ChunkedReviewAgent", selected_configs={}, max_concurrency=2)
+
+    events = asyncio.run(collect(agent, reviewers))
+
+    assert running["max"] == 2
+    # 遅いチャンクの完了を待たずに、空いた枠で次のチャンクを開始する
+    assert [name for name, _ in events] == ["fast_0", "fast_1", "slow"]
+    assert ("fast_0", "Root.ChunkedReviewAgent.fast_0") in events
+
+
+def test_chunk_reviewer_failure_cancels_the_rest():
+    running = {"now": 0, "max": 0, "started": []}
+    reviewers = [
+        _FakeReviewer("broken", 0.01, running, error=RuntimeError("boom")),
+        _FakeReviewer("slow", 1.0, running),
+        _FakeReviewer("queued", 0.01, running),
+    ]
+    agent = ChunkedReviewAgent(name="ChunkedReviewAgent", selected_configs={}, max_concurrency=2)
+
+    with pytest.raises(RuntimeError, match="boom"):
+        asyncio.run(collect(agent, reviewers))
+    assert running["now"] == 0
@@ -0,0 +1,80 @@
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+from adk_logic.tools import document_parser_tool as parser
+from benchmarks.synthetic_decks import generate_pdf_deck, generate_pptx_deck
+
+NUM_PAGES = parser.PARALLEL_EXTRACTION_MIN_PAGES + 5
+
+
+def slide_texts(slides):
+    return [(slide.slide_number, slide.text, slide.notes) for slide in slides]
+
+
+def test_parallel_extraction_matches_serial_extraction():
+    for file_type, generate in (("pdf", generate_pdf_deck), ("pptx", generate_pptx_deck)):
+        blob = generate(NUM_PAGES, seed=1)
+        serial = parser.extract_slides(blob, file_type, max_workers=1)
+        parallel = list(parser.iter_presentation_slides(blob, file_type, max_workers=2))
+        assert slide_texts(parallel) == slide_texts(serial)
+        assert [slide.slide_number for slide in parallel] == list(range(1, NUM_PAGES + 1))
+
+
+def test_executor_is_created_once_for_concurrent_callers():
+    executors = []
+    barrier = threading.Barrier(8)
+
+    def get_executor():
+        barrier.wait()
+        executor, futures = parser._submit_extraction(3, parser._extract_pdf_range, "unused.pdf", [])
+        executors.append(executor)
+
+    threads = [threading.Thread(target=get_executor) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({id(executor) for executor in executors}) == 1
+
+
+def test_broken_pool_during_extraction_falls_back_to_serial(monkeypatch):
+    blob = generate_pdf_deck(NUM_PAGES, seed=2)
+    expected = slide_texts(parser.extract_slides(blob, "pdf", max_workers=1))
+
+    class BrokenExecutor:
+        shut_down = False
+
+        def shutdown(self, wait=True):
+            self.shut_down = True
+
+    broken = BrokenExecutor()
+
+    def submit_to_broken_pool(workers, range_extractor, path, ranges):
+        futures = [Future() for _ in ranges]
+        futures[0].set_result(range_extractor(path, *ranges[0]))
+        for future in futures[1:]:
+            future.set_exception(BrokenProcessPool("worker died"))
+        return broken, futures
+
+    monkeypatch.setattr(parser, "_submit_extraction", submit_to_broken_pool)
+    slides = list(parser.iter_presentation_slides(blob, "pdf", max_workers=3))
+    assert slide_texts(slides) == expected
+    assert broken.shut_down
+
+
+def test_pool_broken_while_idle_is_replaced():
+    blob = generate_pdf_deck(NUM_PAGES, seed=3)
+    expected = slide_texts(parser.extract_slides(blob, "pdf", max_workers=1))
+    assert slide_texts(parser.iter_presentation_slides(blob, "pdf", max_workers=2)) == expected
+
+    executor = parser._extraction_executor
+    for process in list(executor._processes.values()):
+        process.kill()
+    deadline = time.monotonic() + 30
+    while not executor._broken and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    assert slide_texts(parser.iter_presentation_slides(blob, "pdf", max_workers=2)) == expected
+    assert parser._extraction_executor is not executor
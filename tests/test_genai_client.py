@@ -0,0 +1,23 @@
+import asyncio
+
+from adk_logic.genai_client import PooledGemini, get_genai_client_pool
+from adk_logic.rate_governor import governed_model
+
+
+def test_agent_models_share_one_client_per_event_loop(monkeypatch):
+    monkeypatch.setenv("GCP_PROJECT_ID", "test-project")
+    pro, flash = governed_model("gemini-2.5-pro"), governed_model("gemini-2.5-flash")
+
+    async def clients():
+        return pro.inner.api_client, flash.inner.api_client, get_genai_client_pool().get()
+
+    try:
+        first = asyncio.run(clients())
+        second = asyncio.run(clients())
+        assert isinstance(pro.inner, PooledGemini)
+        # 同じループではエージェントのモデルとその他の呼び出しが同じクライアントを使う
+        assert first[0] is first[1] is first[2]
+        # 非同期クライアントのコネクションはループに結び付くため、別のループでは別のクライアントを使う
+        assert second[0] is not first[0]
+    finally:
+        get_genai_client_pool().close()
@@ -0,0 +1,107 @@
+import sqlite3
+import time
+
+from adk_logic.job_queue import JobStatus, JobStore, JobUpdateWriter
+
+
+def make_stale(store: JobStore, job_id: str) -> None:
+    with store._connect() as conn:
+        conn.execute("UPDATE review_jobs SET updated_at = ? WHERE job_id = ?", (time.time() - 3600, job_id))
+
+
+def test_claim_next_returns_oldest_job_once(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    first = store.submit({"n": 1})
+    second = store.submit({"n": 2})
+
+    job = store.claim_next()
+    assert job.job_id == first and job.status == JobStatus.RUNNING and job.attempts == 1
+    assert store.claim_next().job_id == second
+    assert store.claim_next() is None
+
+
+def test_stale_job_is_requeued_and_resumed_in_the_same_session(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    job_id = store.submit({"n": 1})
+    store.claim_next()
+    store.update_partial_result(job_id, {"summary_review": "途中"})
+
+    # ハートビートが続いている間は戻さない
+    assert store.requeue_stale_jobs(stale_seconds=60) == 0
+    make_stale(store, job_id)
+    assert store.requeue_stale_jobs(stale_seconds=60) == 1
+
+    job = store.get(job_id)
+    assert job.status == JobStatus.QUEUED and job.partial_result is None
+    resumed = store.claim_next()
+    # ジョブIDはセッションIDとして使われるため、同じジョブIDのまま再実行される
+    assert resumed.job_id == job_id and resumed.attempts == 2
+
+
+def test_job_interrupted_too_often_is_marked_failed(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    job_id = store.submit({"n": 1})
+    store.claim_next()
+    make_stale(store, job_id)
+    assert store.requeue_stale_jobs(stale_seconds=60, max_attempts=2) == 1
+
+    store.claim_next()
+    make_stale(store, job_id)
+    assert store.requeue_stale_jobs(stale_seconds=60, max_attempts=2) == 0
+    job = store.get(job_id)
+    assert job.status == JobStatus.FAILED and job.attempts == 2
+    assert "中断" in job.error
+
+    # ユーザーによる再実行では、実行回数を数え直す
+    assert store.requeue_failed_job(job_id)
+    job = store.claim_next()
+    assert job.job_id == job_id and job.attempts == 1
+
+
+def test_existing_database_gets_attempts_column(tmp_path):
+    db_path = str(tmp_path / "jobs.sqlite3")
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        "CREATE TABLE review_jobs (job_id TEXT PRIMARY KEY, status TEXT NOT NULL, request TEXT NOT NULL, "
+        "progress_message TEXT, result TEXT, error TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+    )
+    conn.execute("INSERT INTO review_jobs VALUES ('old', 'queued', '{}', NULL, NULL, NULL, 0, 0)")
+    conn.commit()
+    conn.close()
+
+    store = JobStore(db_path)
+    assert store.get("old").attempts == 0
+    assert store.claim_next().attempts == 1
+
+
+def test_update_writer_coalesces_and_flushes(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    job_id = store.submit({"n": 1})
+    writer = JobUpdateWriter(store)
+    for i in range(50):
+        writer.update_progress(job_id, f"進捗{i}")
+        writer.update_partial_result(job_id, {"summary_review": f"途中{i}"})
+    writer.flush(job_id)
+
+    job = store.get(job_id)
+    assert job.progress_message == "進捗49"
+    assert job.partial_result == {"summary_review": "途中49"}
+
+
+class _FakeCallbackContext:
+    def __init__(self, state):
+        self.state = state
+        self.agent_name = "ReportSynthesizerAgent"
+        self.session = type("Session", (), {"id": "no-trace"})()
+
+
+def test_checkpoint_skips_only_completed_stages():
+    from adk_logic.callbacks import create_checkpoint_callback
+
+    restore = create_checkpoint_callback(("final_report",))
+    assert restore(_FakeCallbackContext({})) is None
+    # 資料解析などの失敗を表す成果物は、完了とみなさない
+    assert restore(_FakeCallbackContext({"final_report": {"error": "失敗"}})) is None
+
+    content = restore(_FakeCallbackContext({"final_report": {"summary_review": "総評"}}))
+    assert content is not None and '"summary_review"' in content.parts[0].text
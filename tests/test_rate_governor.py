@@ -0,0 +1,119 @@
+import asyncio
+import time
+
+import pytest
+
+from adk_logic.rate_governor import (
+    AdaptiveConcurrencyLimiter,
+    GovernedCallRecord,
+    ModelRateGovernor,
+    RateGovernorDeadlineExceeded,
+)
+
+MODEL = "gemini-2.5-flash"
+
+
+class _ApiError(Exception):
+    def __init__(self, code: int):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+
+def make_governor(**options) -> ModelRateGovernor:
+    defaults = dict(rate_limit_rpm=0, base_delay_seconds=0.001, max_delay_seconds=0.01)
+    return ModelRateGovernor(**{**defaults, **options})
+
+
+def failing_then(results):
+    """呼び出しごとに results の先頭から取り出し、例外であれば送出する request を返す"""
+    results = list(results)
+
+    async def request():
+        result = results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    return request
+
+
+def test_backoff_delay_grows_exponentially_up_to_the_cap():
+    governor = ModelRateGovernor(base_delay_seconds=1.0, max_delay_seconds=5.0)
+    for attempt, upper in [(1, 1.0), (2, 2.0), (3, 4.0), (4, 5.0), (10, 5.0)]:
+        delays = [governor.backoff_delay(attempt) for _ in range(200)]
+        assert 0 <= min(delays) and max(delays) <= upper
+
+
+def test_retryable_errors_are_retried_until_success():
+    governor = make_governor()
+    record = GovernedCallRecord()
+
+    result = asyncio.run(governor.call(MODEL, failing_then([_ApiError(429), _ApiError(503), "ok"]), record))
+
+    assert result == "ok" and record.attempts == 3
+    stats = governor.stats()[MODEL]
+    assert stats["retries"] == 2 and stats["throttled"] == 1 and stats["succeeded"] == 1
+
+
+def test_non_retryable_error_and_exhausted_attempts_fail():
+    governor = make_governor(max_attempts=2)
+
+    with pytest.raises(_ApiError, match="400"):
+        asyncio.run(governor.call(MODEL, failing_then([_ApiError(400), "ok"])))
+    with pytest.raises(_ApiError, match="503"):
+        asyncio.run(governor.call(MODEL, failing_then([_ApiError(503), _ApiError(503), "ok"])))
+    stats = governor.stats()[MODEL]
+    assert stats["failed"] == 2 and stats["retries"] == 1
+
+
+def test_stream_is_not_retried_after_a_response_was_yielded():
+    governor = make_governor()
+    opened = []
+
+    async def open_stream():
+        opened.append(1)
+        yield "partial"
+        raise _ApiError(503)
+
+    async def consume():
+        return [response async for response in governor.stream(MODEL, open_stream)]
+
+    with pytest.raises(_ApiError):
+        asyncio.run(consume())
+    # 応答が重複して届かないよう、途中で失敗したストリームは開き直さない
+    assert len(opened) == 1
+
+
+def test_deadline_bounds_waiting_for_a_slot():
+    governor = make_governor(max_concurrency=1, deadline_seconds=0.05)
+
+    async def run():
+        async def slow():
+            await asyncio.sleep(0.3)
+            return "slow"
+
+        first = asyncio.create_task(governor.call(MODEL, slow))
+        await asyncio.sleep(0)
+        with pytest.raises(RateGovernorDeadlineExceeded, match="waiting"):
+            await governor.call(MODEL, failing_then(["late"]))
+        # 枠を占有していた呼び出しも、応答を待つ間に期限を過ぎる
+        with pytest.raises(RateGovernorDeadlineExceeded, match="did not finish"):
+            await first
+
+    asyncio.run(run())
+    assert governor.stats()[MODEL]["deadline_exceeded"] == 2
+
+
+def test_concurrency_limit_is_halved_once_per_burst_and_recovers():
+    limiter = AdaptiveConcurrencyLimiter(max_limit=8, min_limit=1)
+    started_at = time.monotonic()
+    # 同時に送った呼び出しがまとめてレート制限を受けても、下げるのは1回だけ
+    limiter.on_throttled(started_at)
+    limiter.on_throttled(started_at)
+    assert limiter.limit == 4
+
+    limiter.on_throttled(time.monotonic())
+    assert limiter.limit == 2
+    for _ in range(10):
+        limiter.on_success()
+    assert 2 < limiter.limit <= 8
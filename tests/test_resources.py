@@ -0,0 +1,61 @@
+import asyncio
+import sqlite3
+import time
+
+import pytest
+
+from adk_logic.resources import APP_NAME, ResourceRegistry
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "sessions.sqlite3")
+
+
+@pytest.fixture
+def registry(db_path, monkeypatch):
+    monkeypatch.setenv("SESSION_BACKEND", "sqlite")
+    monkeypatch.setenv("SESSION_DB_PATH", db_path)
+    monkeypatch.setenv("SESSION_TTL_SECONDS", "3600")
+    registry = ResourceRegistry()
+    yield registry
+    registry.close()
+
+
+def age_session(db_path: str, session_id: str, seconds: float) -> None:
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("UPDATE sessions SET update_time = ? WHERE id = ?", (time.time() - seconds, session_id))
+
+
+async def session_ids(registry: ResourceRegistry):
+    response = await registry.session_service.list_sessions(app_name=APP_NAME)
+    return {session.id for session in response.sessions}
+
+
+def test_sessions_past_the_ttl_are_pruned(registry, db_path):
+    async def run():
+        service = registry.session_service
+        for session_id in ("abandoned", "recent"):
+            await service.create_session(app_name=APP_NAME, user_id="u", session_id=session_id, state={})
+        age_session(db_path, "abandoned", 2 * 3600)
+
+        assert await registry.prune_expired_sessions() == 1
+        assert await session_ids(registry) == {"recent"}
+
+    asyncio.run(run())
+
+
+def test_pruning_before_a_run_is_throttled(registry, db_path):
+    async def run():
+        await registry.session_service.create_session(app_name=APP_NAME, user_id="u", session_id="first", state={})
+        age_session(db_path, "first", 2 * 3600)
+        # プロセスの起動後、最初のレビューの開始時は必ず削除する
+        assert await registry.prune_expired_sessions_if_due() == 1
+
+        await registry.session_service.create_session(app_name=APP_NAME, user_id="u", session_id="second", state={})
+        age_session(db_path, "second", 2 * 3600)
+        # 間隔内の呼び出しでは一覧を取得しない
+        assert await registry.prune_expired_sessions_if_due() == 0
+        assert await session_ids(registry) == {"second"}
+
+    asyncio.run(run())
@@ -0,0 +1,77 @@
+import pytest
+from google.adk.models import LlmRequest, LlmResponse
+from google.genai import types
+from pydantic import BaseModel
+
+from adk_logic import callbacks
+from adk_logic.result_cache import build_result_cache_key
+from utils.persistent_cache import PersistentLRUCache
+
+
+class _Review(BaseModel):
+    summary: str
+
+
+class _OtherReview(BaseModel):
+    summary: str
+    score: int
+
+
+def make_request(text="資料の内容", model="gemini-2.5-flash", **config) -> LlmRequest:
+    config.setdefault("system_instruction", "あなたはレビュアーです。")
+    return LlmRequest(
+        model=model,
+        contents=[types.Content(role="user", parts=[types.Part(text=text)])],
+        config=types.GenerateContentConfig(**config),
+    )
+
+
+def test_key_changes_when_any_input_of_the_agent_changes():
+    key = build_result_cache_key(make_request())
+    assert key == build_result_cache_key(make_request())
+    assert key != build_result_cache_key(make_request(text="改訂した資料の内容"))
+    assert key != build_result_cache_key(make_request(model="gemini-2.5-pro"))
+    assert key != build_result_cache_key(make_request(system_instruction="あなたは辛口のレビュアーです。"))
+    assert key != build_result_cache_key(make_request(temperature=0.2))
+    assert build_result_cache_key(make_request(response_schema=_Review)) != build_result_cache_key(
+        make_request(response_schema=_OtherReview)
+    )
+
+
+def test_key_ignores_session_specific_settings():
+    key = build_result_cache_key(make_request())
+    assert key == build_result_cache_key(make_request(labels={"session": "a"}))
+    assert key == build_result_cache_key(make_request(cached_content="projects/p/cachedContents/1"))
+
+
+def test_requests_with_files_are_not_cached():
+    request = make_request()
+    request.contents[0].parts.append(types.Part.from_uri(file_uri="gs://bucket/deck.pdf", mime_type="application/pdf"))
+    assert build_result_cache_key(request) is None
+
+
+class _FakeCallbackContext:
+    def __init__(self, state):
+        self.state = state
+        self.agent_name = "LogicCriticAgent"
+        self.session = type("Session", (), {"id": "no-trace"})()
+
+
+@pytest.fixture
+def result_cache(tmp_path, monkeypatch):
+    cache = PersistentLRUCache(str(tmp_path))
+    monkeypatch.setattr(callbacks, "get_result_cache", lambda: cache)
+    return cache
+
+
+def test_response_is_memoized_per_rendered_request(result_cache):
+    state = {}
+    assert callbacks.restore_memoized_result_callback(_FakeCallbackContext(state), make_request()) is None
+    response = LlmResponse(content=types.Content(role="model", parts=[types.Part(text="レビュー結果")]))
+    callbacks.store_memoized_result_callback(_FakeCallbackContext(state), response)
+
+    cached = callbacks.restore_memoized_result_callback(_FakeCallbackContext({}), make_request())
+    assert cached.content.parts[0].text == "レビュー結果"
+    # 入力が変わったエージェントは、保存済みの応答を使わずにLLMを呼び出す
+    changed = make_request(text="改訂した資料の内容")
+    assert callbacks.restore_memoized_result_callback(_FakeCallbackContext({}), changed) is None
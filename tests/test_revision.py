@@ -0,0 +1,61 @@
+from adk_logic.revision import align_revised_slides, build_revised_analysis, carry_over_slide_reviews, slide_content_hash
+
+
+def make_slide(number: int, topic: str, notes: str = "") -> dict:
+    return {
+        "slide_number": number,
+        "title": f"{topic}について",
+        "text": f"{topic}の現状と課題を整理し、今後の取り組みの方針を説明します。",
+        "notes": notes,
+    }
+
+
+def renumber(slides):
+    return [{**slide, "slide_number": number} for number, slide in enumerate(slides, start=1)]
+
+
+OLD = [make_slide(1, "市場"), make_slide(2, "競合"), make_slide(3, "製品"), make_slide(4, "価格"), make_slide(5, "体制")]
+
+
+def test_unchanged_slides_are_aligned_across_insertions_and_deletions():
+    # 「競合」を削除し、「製品」の後に「販売計画」を挿入する
+    new = renumber([OLD[0], OLD[2], make_slide(0, "販売計画"), OLD[3], OLD[4]])
+
+    assert align_revised_slides(OLD, new) == {1: 1, 2: 3, 4: 4, 5: 5}
+
+
+def test_edited_slides_are_reviewed_again_and_moved_slides_are_matched():
+    edited = {**OLD[1], "text": OLD[1]["text"] + "競合の新製品の発表を踏まえて更新しました。"}
+    # 発表者ノートだけを変えたスライドも変更として扱う
+    new_notes = make_slide(0, "価格", notes="価格は税込みで説明する")
+    new = renumber([OLD[4], OLD[0], edited, OLD[2], new_notes])
+
+    assert align_revised_slides(OLD, new) == {1: 5, 2: 1, 4: 3}
+
+
+def test_slides_with_little_text_are_never_carried_over():
+    blank = {"slide_number": 1, "title": "", "text": "図のみ"}
+    assert slide_content_hash(blank) is None
+    assert align_revised_slides([blank], [blank]) == {}
+
+
+def test_reviews_and_analysis_follow_the_new_slide_numbers():
+    new = renumber([make_slide(0, "概要"), *OLD[:3]])
+    previous_review = {
+        "document_analysis": {"slides": OLD},
+        "final_report": {"slide_by_slide_reviews": [
+            {"slide_number": 1, "evaluation": "市場の評価", "suggestion": ""},
+            {"slide_number": 3, "evaluation": "製品の評価", "suggestion": ""},
+        ]},
+    }
+
+    assert carry_over_slide_reviews(previous_review, new) == {
+        2: {"slide_number": 2, "evaluation": "市場の評価", "suggestion": ""},
+        4: {"slide_number": 4, "evaluation": "製品の評価", "suggestion": ""},
+    }
+    previous_analysis = {"slides": [{**slide, "summary": "改訂前の解析"} for slide in OLD]}
+    new_analysis = {"file_name": "v2.pdf", "slides": new}
+    revised = build_revised_analysis(previous_analysis, new_analysis, align_revised_slides(OLD, new))
+    assert [slide.get("summary") for slide in revised["slides"]] == [None, "改訂前の解析", "改訂前の解析", "改訂前の解析"]
+    assert [slide["slide_number"] for slide in revised["slides"]] == [1, 2, 3, 4]
+    assert revised["total_slides"] == 4 and revised["file_name"] == "v2.pdf"
@@ -0,0 +1,37 @@
+from adk_logic.slide_index import SlideIndex, chunk_slides, tokenize
+
+SLIDES = [
+    {"slide_number": 1, "title": "はじめに", "text": "本日の発表の目的を説明します。", "notes": ""},
+    {"slide_number": 2, "title": "導入費用", "text": "初期費用は500万円、回収期間は2年です。", "notes": ""},
+    {"slide_number": 3, "title": "運用体制", "text": "運用はSREチームが担当します。", "notes": "障害時の連絡先は別紙を参照"},
+    {"slide_number": 4, "title": "まとめ", "text": "費用対効果が高いことを示しました。", "notes": ""},
+]
+
+
+def test_tokenize_ignores_width_and_case():
+    assert tokenize("ＳＲＥ Team") == tokenize("sre team") == ["sre", "team"]
+    assert tokenize("回収期間") == ["回収", "収期", "期間"]
+
+
+def test_search_ranks_matching_slide_first():
+    results = SlideIndex(SLIDES).search("導入費用の回収期間", top_k=2)
+    assert [result["slide_number"] for result in results][0] == 2
+    assert len(results) <= 2
+    assert results[0]["score"] >= results[-1]["score"]
+    assert results[0]["title"] == "導入費用"
+
+
+def test_search_matches_notes():
+    results = SlideIndex(SLIDES).search("障害時の連絡先", top_k=5)
+    assert results[0]["slide_number"] == 3
+
+
+def test_search_without_matches_returns_empty_list():
+    assert SlideIndex(SLIDES).search("xyz", top_k=3) == []
+
+
+def test_long_slide_is_split_into_chunks_that_keep_the_title():
+    slide = {"slide_number": 1, "title": "詳細", "text": "\n".join(["あ" * 40] * 10), "notes": ""}
+    chunks = chunk_slides([slide], chunk_chars=100)
+    assert len(chunks) > 1
+    assert all(chunk.text.startswith("詳細") for chunk in chunks)
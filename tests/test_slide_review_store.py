@@ -0,0 +1,64 @@
+from adk_logic.document_serializer import normalize_slide_text
+from adk_logic.slide_review_store import MINHASH_PERMUTATIONS, SlideReviewStore, compute_minhash
+
+BODY = (
+    "当社の新製品は、既存の製品と比べて導入にかかる期間を半分に短縮し、運用の手間を大幅に減らします。"
+    "第一四半期には主要な顧客三社で検証を行い、いずれも目標の効果を確認しました。"
+    "次の四半期からは販売代理店を通じた展開を始め、年度末までに五十社への導入を目指します。"
+)
+SCOPE = "scope"
+
+
+def make_slide(number: int, text: str, title: str = "新製品の導入計画") -> dict:
+    return {"slide_number": number, "title": title, "text": text}
+
+
+def make_review(number: int, evaluation: str = "論点が明確です。") -> dict:
+    return {"slide_number": number, "evaluation": evaluation, "suggestion": "数値の根拠を示しましょう。"}
+
+
+def estimated_similarity(a: dict, b: dict) -> float:
+    signatures = [compute_minhash(normalize_slide_text(slide)) for slide in (a, b)]
+    return float((signatures[0] == signatures[1]).sum()) / MINHASH_PERMUTATIONS
+
+
+def test_identical_and_near_duplicate_slides_reuse_the_stored_review(tmp_path):
+    store = SlideReviewStore(str(tmp_path / "reviews.sqlite3"))
+    assert store.save_reviews(SCOPE, [make_slide(3, BODY)], [make_review(3)]) == 1
+
+    # 表記ゆれ（全角・半角、空白）のみの違いは同じスライドとみなす
+    exact = make_slide(1, BODY.replace("。", "。 \n"))
+    # 数字を1か所だけ書き換えたスライドは、類似度がしきい値を上回る
+    near = make_slide(2, BODY.replace("五十社", "六十社"))
+    reused = store.find_reusable_reviews(SCOPE, [exact, near])
+
+    # スライド番号は今回の資料の番号に置き換える
+    assert reused == {
+        1: {**make_review(1), "slide_number": 1},
+        2: {**make_review(2), "slide_number": 2},
+    }
+
+
+def test_different_or_short_slides_are_reviewed_again(tmp_path):
+    store = SlideReviewStore(str(tmp_path / "reviews.sqlite3"))
+    short = make_slide(2, "ご清聴ありがとうございました", title="")
+    store.save_reviews(SCOPE, [make_slide(1, BODY), short], [make_review(1), make_review(2)])
+
+    # 短いスライドは内容が違っても一致してしまうため、保存も再利用もしない
+    assert store.find_reusable_reviews(SCOPE, [short]) == {}
+    half_rewritten = BODY[:len(BODY) // 2] + "一方で、競合他社も同様の製品を発表しており、価格面での優位性は限定的です。"
+    assert estimated_similarity(make_slide(1, BODY), make_slide(1, half_rewritten)) < 0.9
+    assert store.find_reusable_reviews(SCOPE, [make_slide(1, half_rewritten)]) == {}
+    # プレゼン目的や聴衆が違う範囲のレビューは使わない
+    assert store.find_reusable_reviews("other-scope", [make_slide(1, BODY)]) == {}
+
+
+def test_similarity_threshold_controls_near_duplicate_reuse(tmp_path):
+    db_path = str(tmp_path / "reviews.sqlite3")
+    SlideReviewStore(db_path).save_reviews(SCOPE, [make_slide(1, BODY)], [make_review(1)])
+    edited = make_slide(1, BODY.replace("半分に短縮し", "三分の一に短縮し").replace("三社", "四社"))
+    similarity = estimated_similarity(make_slide(1, BODY), edited)
+
+    assert SlideReviewStore(db_path, similarity_threshold=0.5).find_reusable_reviews(SCOPE, [edited])
+    assert SlideReviewStore(db_path, similarity_threshold=1.0).find_reusable_reviews(SCOPE, [edited]) == {}
+    assert 0.5 <= similarity < 1.0
@@ -0,0 +1,31 @@
+import io
+
+import pytest
+
+from utils.storage import LocalStorageBackend, StorageBackend
+
+
+def test_backend_without_transfer_methods_cannot_be_instantiated():
+    class UploadOnlyBackend(StorageBackend):
+        def uri_for(self, object_name: str) -> str:
+            return object_name
+
+        def upload(self, file_obj, object_name, content_type=None) -> str:
+            return object_name
+
+    with pytest.raises(TypeError, match="download_to_file"):
+        UploadOnlyBackend()
+
+
+def test_local_backend_round_trip(tmp_path):
+    backend = LocalStorageBackend(str(tmp_path))
+    uri = backend.upload(io.BytesIO(b"slides"), "deck/a.pdf")
+
+    downloaded = io.BytesIO()
+    backend.download_to_file(uri, downloaded)
+    assert downloaded.getvalue() == b"slides"
+    with backend.local_path(uri) as path:
+        assert path == uri
+    # ストレージのディレクトリ外は指せない
+    with pytest.raises(ValueError):
+        backend.uri_for("../outside.pdf")
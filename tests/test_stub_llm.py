@@ -0,0 +1,58 @@
+import asyncio
+from typing import Dict
+
+import pytest
+from google.adk.agents import LlmAgent
+from google.adk.models import registry as llm_registry
+from google.adk.runners import InMemoryRunner
+from google.adk.tools import FunctionTool
+from google.genai import types
+
+from adk_logic.state_models import QnAList
+from benchmarks.stub_llm import install_stub_llm
+
+calls = []
+
+
+def lookup_slide(query: str, top_k: int) -> Dict[str, str]:
+    """スライドを検索する（テスト用）"""
+    calls.append((query, top_k))
+    return {"status": "success"}
+
+
+@pytest.fixture(autouse=True)
+def restore_llm_registry():
+    """スタブの登録を他のテストに持ち越さない"""
+    saved = dict(llm_registry._llm_registry_dict)
+    yield
+    llm_registry._llm_registry_dict.clear()
+    llm_registry._llm_registry_dict.update(saved)
+    llm_registry.LLMRegistry.resolve.cache_clear()
+
+
+def test_stub_answers_tool_calls_and_set_model_response():
+    """ツールと出力スキーマを併用するエージェントでも、スタブはツールを呼び出した後にスキーマどおりの応答を返す"""
+    stub = install_stub_llm()
+    calls.clear()
+    agent = LlmAgent(
+        name="ToolAgent",
+        model="gemini-2.5-pro",
+        instruction="テスト",
+        tools=[FunctionTool(lookup_slide)],
+        output_schema=QnAList,
+        output_key="qna_result",
+    )
+
+    async def run() -> dict:
+        runner = InMemoryRunner(agent=agent, app_name="test")
+        session = await runner.session_service.create_session(app_name="test", user_id="user")
+        message = types.Content(role="user", parts=[types.Part(text="開始")])
+        async for _ in runner.run_async(user_id="user", session_id=session.id, new_message=message):
+            pass
+        session = await runner.session_service.get_session(app_name="test", user_id="user", session_id=session.id)
+        return session.state
+
+    state = asyncio.run(run())
+    assert calls == [("スライド", 3)]
+    assert QnAList.model_validate(state["qna_result"]).qna_list
+    assert len(stub.requests) == 2
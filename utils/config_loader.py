@@ -1,31 +1,188 @@
 import yaml
-from typing import Dict, Any, List
+import hashlib
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Tuple
 import os
 
+from pydantic import BaseModel, Field, ValidationError, model_validator
+
 CONFIG_PATH = os.path.join(os.path.dirname(__file__), '..', 'config', 'agent_config_options.yaml')
+# 設定ファイルの更新を確認する間隔（秒）。この間隔でファイルの更新時刻を確認し、変更されていれば読み込み直す
+CONFIG_RELOAD_INTERVAL_SECONDS = float(os.environ.get("CONFIG_RELOAD_INTERVAL_SECONDS", "2"))
 
-_config_cache: Dict[str, Any] = {}
+logger = logging.getLogger(__name__)
 
-def load_config_options() -> Dict[str, Any]:
+
+class AgentOptionConfig(BaseModel):
+    """エージェントの選択肢1つ分の設定"""
+    id: str
+    label: str
+    description: str = ""
+    prompt_fragment: Optional[str] = ""
+    # 「AIにおまかせ編成」で、プレゼン目的・聴衆情報に含まれていればこの選択肢を選ぶ手がかりにするキーワード
+    keywords: List[str] = Field(default_factory=list)
+
+
+class AgentTypeConfig(BaseModel):
+    """エージェント1種類分の設定"""
+    name: str
+    description: str = ""
+    options: List[AgentOptionConfig] = Field(min_length=1)
+    # 「AIにおまかせ編成」で、どの選択肢のキーワードも一致しない場合に選ぶ選択肢のID（省略時はLLMに選ばせる）
+    default_option: Optional[str] = None
+
+    @model_validator(mode="after")
+    def _check_unique_ids(self) -> "AgentTypeConfig":
+        ids = [option.id for option in self.options]
+        if len(ids) != len(set(ids)):
+            raise ValueError(f"選択肢のIDが重複しています: {ids}")
+        if self.default_option is not None and self.default_option not in ids:
+            raise ValueError(f"default_option が選択肢にありません: {self.default_option}")
+        return self
+
+
+class CostEstimationConfig(BaseModel):
+    default_slides: int = 20
+    token_profiles: Dict[str, Dict[str, float]] = Field(default_factory=dict)
+
+
+class AgentConfigOptions(BaseModel):
+    """agent_config_options.yaml のスキーマ"""
+    agent_options: Dict[str, AgentTypeConfig]
+    model_pricing: Dict[str, Dict[str, float]] = Field(default_factory=dict)
+    cost_estimation: CostEstimationConfig = Field(default_factory=CostEstimationConfig)
+
+
+@dataclass
+class CompiledConfig:
     """
-    agent_config_options.yamlを読み込み、内容を辞書として返す。
-    一度読み込んだ内容はキャッシュする。
+    検証済みの設定ファイルと、(エージェントの種類, 選択肢のID) をキーとしたプロンプト断片の索引。
+    1度作成したインスタンスは変更せず、設定ファイルが変わった場合は新しいインスタンスに差し替える。
     """
-    global _config_cache
-    if not _config_cache:
+    raw: Dict[str, Any]
+    version: str
+    prompt_fragments: Dict[Tuple[str, str], str]
+    # エージェントの種類ごとの選択肢のID（設定ファイルの順）
+    option_ids: Dict[str, List[str]]
+    _instructions: Dict[Tuple[str, str, str], str] = field(default_factory=dict)
+
+    @classmethod
+    def compile(cls, text: str) -> "CompiledConfig":
+        """設定ファイルの内容を検証し、索引を作成する。不正な設定の場合は ValueError を送出する。"""
         try:
-            with open(CONFIG_PATH, 'r', encoding='utf-8') as f:
-                _config_cache = yaml.safe_load(f)
-        except FileNotFoundError:
-            raise RuntimeError(f"設定ファイルが見つかりません: {CONFIG_PATH}")
+            raw = yaml.safe_load(text)
         except yaml.YAMLError as e:
-            raise RuntimeError(f"設定ファイルの解析に失敗しました: {e}")
-    return _config_cache
+            raise ValueError(f"設定ファイルの解析に失敗しました: {e}") from e
+        try:
+            options = AgentConfigOptions.model_validate(raw)
+        except ValidationError as e:
+            raise ValueError(f"設定ファイルの内容が不正です: {e}") from e
+        prompt_fragments = {
+            (agent_type, option.id): option.prompt_fragment or ""
+            for agent_type, details in options.agent_options.items()
+            for option in details.options
+        }
+        return cls(
+            raw=raw,
+            version=hashlib.sha256(text.encode("utf-8")).hexdigest()[:12],
+            prompt_fragments=prompt_fragments,
+            option_ids={
+                agent_type: [option.id for option in details.options]
+                for agent_type, details in options.agent_options.items()
+            },
+        )
+
+    def render_instruction(self, agent_type: str, selection_id: str, base_prompt: str) -> str:
+        """基本プロンプトに、選択肢のレビュー方針を加えた指示を返す。同じ組み合わせは1度だけ組み立てる。"""
+        key = (agent_type, selection_id, base_prompt)
+        instruction = self._instructions.get(key)
+        if instruction is None:
+            prompt_fragment = self.prompt_fragments.get((agent_type, selection_id), "")
+            instruction = f"{base_prompt}\n\n# あなたの今回のレビュー方針\n{prompt_fragment}"
+            self._instructions[key] = instruction
+        return instruction
+
+
+class ConfigRegistry:
+    """
+    設定ファイルを読み込んで CompiledConfig を保持し、ファイルが変更されたら読み込み直して差し替える。
+
+    変更の確認は、最後の確認から reload_interval_seconds 以上経ってからアクセスされた時に更新時刻とサイズで行う。
+    読み込み直した設定が不正な場合は、エラーをログに出力して直前の設定を使い続ける。
+    """
+
+    def __init__(self, path: str = CONFIG_PATH, reload_interval_seconds: float = CONFIG_RELOAD_INTERVAL_SECONDS):
+        self.path = path
+        self.reload_interval_seconds = reload_interval_seconds
+        self._lock = threading.Lock()
+        self._compiled: Optional[CompiledConfig] = None
+        self._file_signature: Optional[Tuple[int, int]] = None
+        self._checked_at = 0.0
+
+    def current(self) -> CompiledConfig:
+        """最新の設定を返す"""
+        compiled = self._compiled
+        if compiled is not None and time.monotonic() - self._checked_at < self.reload_interval_seconds:
+            return compiled
+        with self._lock:
+            self._reload_if_changed()
+            return self._compiled
+
+    def _reload_if_changed(self) -> None:
+        self._checked_at = time.monotonic()
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            if self._compiled is None:
+                raise RuntimeError(f"設定ファイルが見つかりません: {self.path}")
+            logger.error(f"Config file {self.path} is missing; keeping version {self._compiled.version}.")
+            return
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature == self._file_signature:
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            text = f.read()
+        self._file_signature = signature
+        try:
+            compiled = CompiledConfig.compile(text)
+        except ValueError as e:
+            if self._compiled is None:
+                raise RuntimeError(str(e)) from e
+            logger.error(f"Ignoring invalid config change; keeping version {self._compiled.version}: {e}")
+            return
+        if self._compiled is not None and compiled.version != self._compiled.version:
+            logger.info(f"Reloaded {self.path}: version {self._compiled.version} -> {compiled.version}")
+        # 参照の代入で差し替えるため、読み込み中の呼び出し元は古い設定か新しい設定のどちらか一方を一貫して使う
+        self._compiled = compiled
+
+
+_config_registry: Optional[ConfigRegistry] = None
+_config_registry_lock = threading.Lock()
+
+
+def get_config_registry() -> ConfigRegistry:
+    """プロセス内で共有する設定のレジストリを返す"""
+    global _config_registry
+    with _config_registry_lock:
+        if _config_registry is None:
+            _config_registry = ConfigRegistry()
+    return _config_registry
+
+
+def load_config_options() -> Dict[str, Any]:
+    """
+    agent_config_options.yamlを読み込み、内容を辞書として返す。
+    読み込んだ内容はキャッシュし、ファイルが変更されると読み込み直す。
+    """
+    return get_config_registry().current().raw
 
 def get_prompt_fragment(agent_type: str, selection_id: str) -> str:
     """
     指定されたエージェントタイプと選択IDに対応するプロンプト断片を取得する。
-    
+
     Args:
         agent_type: エージェントの種類 (例: "logic_critic")。
         selection_id: ユーザーが選択した方針のID (例: "strict")。
@@ -33,12 +190,66 @@ def get_prompt_fragment(agent_type: str, selection_id: str) -> str:
     Returns:
         対応するプロンプト断片の文字列。
     """
+    return get_config_registry().current().prompt_fragments.get((agent_type, selection_id), "")
+
+
+def render_agent_instruction(agent_type: str, selection_id: str, base_prompt: str) -> str:
+    """
+    基本プロンプトに、ユーザーが選択した方針のプロンプト断片を加えたエージェントの指示を返す。
+
+    Args:
+        agent_type: エージェントの種類 (例: "logic_critic")。
+        selection_id: ユーザーが選択した方針のID (例: "strict")。
+        base_prompt: エージェントの基本プロンプト。
+
+    Returns:
+        エージェントの指示の文字列。
+    """
+    return get_config_registry().current().render_instruction(agent_type, selection_id, base_prompt)
+
+
+def validate_selected_configs(selected_configs: Dict[str, str]) -> Dict[str, str]:
+    """
+    チーム編成が設定ファイルの選択肢に沿っているか検証する。省略されたエージェントの種類は各エージェントの既定値を使う。
+
+    Args:
+        selected_configs: エージェントの種類をキー、選択肢のIDを値とした辞書。
+
+    Returns:
+        検証済みの selected_configs。
+
+    Raises:
+        ValueError: 設定ファイルにないエージェントの種類、または選択肢のIDが含まれる場合。
+    """
+    option_ids = get_config_registry().current().option_ids
+    for agent_type, selection_id in selected_configs.items():
+        if agent_type not in option_ids:
+            raise ValueError(f"不明なエージェントの種類です: {agent_type}")
+        if selection_id not in option_ids[agent_type]:
+            raise ValueError(f"{agent_type} の選択肢にないIDです: {selection_id} (選択肢: {option_ids[agent_type]})")
+    return selected_configs
+
+
+def get_config_version() -> str:
+    """現在の設定の版（設定ファイルの内容のハッシュ）を返す"""
+    return get_config_registry().current().version
+
+
+def get_model_pricing(model: str) -> Dict[str, float]:
+    """
+    指定されたモデルの料金表 (USD / 100万トークン) を取得する。
+
+    Args:
+        model: モデル名 (例: "gemini-2.5-pro")。
+
+    Returns:
+        料金表の辞書。設定されていないモデルの場合は空の辞書。
+    """
+    config = load_config_options()
+    return config.get('model_pricing', {}).get(model, {})
+
+
+def get_cost_estimation_settings() -> Dict[str, Any]:
+    """実行前のコスト見積もりに使う設定（エージェントごとのトークン数の目安など）を取得する。"""
     config = load_config_options()
-    try:
-        options: List[Dict[str, Any]] = config['agent_options'][agent_type]['options']
-        for option in options:
-            if option['id'] == selection_id:
-                return option.get('prompt_fragment', '')
-        return ""
-    except KeyError:
-        return ""
+    return config.get('cost_estimation', {})
@@ -0,0 +1,91 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from typing import Any, Dict, Optional
+
+
+class PersistentLRUCache:
+    """
+    JSONシリアライズ可能な値をディレクトリ配下に永続化する、件数上限付きのLRUキャッシュ。
+
+    1エントリ = 1ファイルとして保存し、ファイルの更新時刻を最終アクセス時刻として扱う。
+    上限件数を超えた場合は、最も古くアクセスされたエントリから削除する。
+    """
+
+    def __init__(self, directory: str, max_entries: int = 256):
+        self.directory = directory
+        self.max_entries = max(1, max_entries)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _entry_path(self, key: str) -> str:
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{digest}.json")
+
+    def get(self, key: str) -> Optional[Any]:
+        """キーに対応する値を返す。存在しない場合はNoneを返す。"""
+        path = self._entry_path(key)
+        with self._lock:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    value = json.load(f)
+                # アクセス時刻を更新し、LRUの順序に反映する
+                os.utime(path, None)
+            except (FileNotFoundError, json.JSONDecodeError):
+                self.misses += 1
+                return None
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value: Any) -> None:
+        """値を保存し、必要であれば古いエントリを追い出す。"""
+        path = self._entry_path(key)
+        with self._lock:
+            # 書き込み途中のファイルを読まれないよう、一時ファイル経由で置き換える
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(value, f, ensure_ascii=False)
+                os.replace(tmp_path, path)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            self._evict_if_needed()
+
+    def _evict_if_needed(self) -> None:
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                entries.append((os.path.getmtime(path), path))
+            except FileNotFoundError:
+                continue
+        overflow = len(entries) - self.max_entries
+        if overflow <= 0:
+            return
+        entries.sort()
+        for _, path in entries[:overflow]:
+            try:
+                os.remove(path)
+                self.evictions += 1
+            except FileNotFoundError:
+                pass
+
+    def clear(self) -> None:
+        """全てのエントリを削除する。"""
+        with self._lock:
+            for name in os.listdir(self.directory):
+                if name.endswith(".json"):
+                    os.remove(os.path.join(self.directory, name))
+
+    def stats(self) -> Dict[str, int]:
+        """ヒット数・ミス数・追い出し数を返す。"""
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
@@ -0,0 +1,164 @@
+import abc
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import BinaryIO, Dict, Iterator, Optional
+
+LOCAL_STORAGE_DIR = os.environ.get(
+    "LOCAL_STORAGE_DIR",
+    os.path.join(tempfile.gettempdir(), "presenta-ai", "storage"),
+)
+# GCSとのチャンク転送のサイズ。resumable uploadの仕様上、256KBの倍数である必要がある
+GCS_CHUNK_SIZE = int(os.environ.get("GCS_CHUNK_SIZE_MB", "8")) * 1024 * 1024
+
+_COPY_BUFFER_SIZE = 1024 * 1024
+
+
+class StorageBackend(abc.ABC):
+    """資料ファイルの保存先の共通インターフェース"""
+
+    @abc.abstractmethod
+    def uri_for(self, object_name: str) -> str:
+        """オブジェクト名に対応する保存先のURIを返す（保存の完了前にURIを決めるために使う）"""
+
+    @abc.abstractmethod
+    def upload(self, file_obj: BinaryIO, object_name: str, content_type: Optional[str] = None) -> str:
+        """ファイルオブジェクトの内容を先頭からストリーミングで保存し、保存先のURIを返す"""
+
+    @abc.abstractmethod
+    def download_to_file(self, uri: str, file_obj: BinaryIO) -> None:
+        """URIのファイルをストリーミングでファイルオブジェクトに書き込む"""
+
+    @contextmanager
+    def local_path(self, uri: str) -> Iterator[str]:
+        """
+        URIのファイルをローカルのファイルパスとして開けるようにする。
+        既定の実装は一時ファイルにダウンロードし、コンテキストを抜けると削除する。
+        """
+        with tempfile.NamedTemporaryFile(suffix=".presenta") as tmp:
+            self.download_to_file(uri, tmp)
+            tmp.flush()
+            yield tmp.name
+
+
+class GCSStorageBackend(StorageBackend):
+    """
+    Google Cloud Storage を保存先とするバックエンド。
+    クライアント（HTTPコネクションプール）はプロセス内で使い回し、転送はチャンク単位のresumable転送で行う。
+    """
+
+    def __init__(self, bucket_name: Optional[str] = None, chunk_size: int = GCS_CHUNK_SIZE):
+        self.bucket_name = bucket_name
+        self.chunk_size = chunk_size
+
+    @staticmethod
+    def parse_uri(uri: str):
+        bucket_name, blob_name = uri[len("gs://"):].split("/", 1)
+        return bucket_name, blob_name
+
+    def _blob(self, bucket_name: str, blob_name: str):
+        return _get_gcs_client().bucket(bucket_name).blob(blob_name, chunk_size=self.chunk_size)
+
+    def uri_for(self, object_name: str) -> str:
+        if not self.bucket_name:
+            raise ValueError("GCSバケット名が設定されていません。環境変数 GCS_BUCKET_NAME を設定してください。")
+        return f"gs://{self.bucket_name}/{object_name}"
+
+    def upload(self, file_obj: BinaryIO, object_name: str, content_type: Optional[str] = None) -> str:
+        uri = self.uri_for(object_name)
+        # chunk_size を指定すると、ファイル全体を読み込まずにチャンクごとに送信する
+        self._blob(self.bucket_name, object_name).upload_from_file(
+            file_obj, content_type=content_type, rewind=True
+        )
+        return uri
+
+    def download_to_file(self, uri: str, file_obj: BinaryIO) -> None:
+        try:
+            self._blob(*self.parse_uri(uri)).download_to_file(file_obj)
+        except Exception as e:
+            raise RuntimeError(f"GCSからのファイルダウンロードに失敗しました: {uri}. エラー: {e}")
+
+
+class LocalStorageBackend(StorageBackend):
+    """
+    ローカルディスクを保存先とするバックエンド（オンプレミス環境や動作確認用）。
+    URIはファイルの絶対パスで、読み込み時はダウンロードせずにファイルをそのまま開く。
+    資料の解析ではワーカープロセスがこのパスを直接開くため、メモリマップやメモリ上へのコピーは行わない。
+    """
+
+    def __init__(self, root_dir: str = LOCAL_STORAGE_DIR):
+        self.root_dir = os.path.abspath(root_dir)
+
+    def uri_for(self, object_name: str) -> str:
+        path = os.path.abspath(os.path.join(self.root_dir, object_name))
+        if os.path.commonpath([self.root_dir, path]) != self.root_dir:
+            raise ValueError(f"保存先がストレージのディレクトリ外を指しています: {object_name}")
+        return path
+
+    def upload(self, file_obj: BinaryIO, object_name: str, content_type: Optional[str] = None) -> str:
+        path = self.uri_for(object_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        file_obj.seek(0)
+        # 書き込み途中のファイルが読まれないよう、一時ファイルに書き出してから置き換える
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                shutil.copyfileobj(file_obj, f, _COPY_BUFFER_SIZE)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return path
+
+    def download_to_file(self, uri: str, file_obj: BinaryIO) -> None:
+        with open(uri, "rb") as f:
+            shutil.copyfileobj(f, file_obj, _COPY_BUFFER_SIZE)
+
+    @contextmanager
+    def local_path(self, uri: str) -> Iterator[str]:
+        yield uri
+
+
+_gcs_client = None
+_gcs_client_lock = threading.Lock()
+_backends: Dict[str, StorageBackend] = {}
+
+
+def _get_gcs_client():
+    """プロセス内で共有するGCSクライアントを返す"""
+    global _gcs_client
+    with _gcs_client_lock:
+        if _gcs_client is None:
+            from google.cloud import storage
+
+            _gcs_client = storage.Client()
+        return _gcs_client
+
+
+def get_storage_backend(backend: Optional[str] = None) -> StorageBackend:
+    """アップロードに使うバックエンド ("gcs" / "local") を返す。省略時は環境変数 STORAGE_BACKEND の設定に従う。"""
+    # app.py では load_dotenv() がモジュールのimport後に呼ばれるため、設定は呼び出し時に読む
+    backend = backend or os.environ.get("STORAGE_BACKEND", "gcs")
+    if backend not in _backends:
+        if backend == "gcs":
+            _backends[backend] = GCSStorageBackend(os.environ.get("GCS_BUCKET_NAME"))
+        elif backend == "local":
+            _backends[backend] = LocalStorageBackend()
+        else:
+            raise ValueError(f"Unsupported storage backend: {backend}")
+    return _backends[backend]
+
+
+def storage_for_uri(uri: str) -> StorageBackend:
+    """URIの形式から、そのファイルを読み込むためのバックエンドを返す"""
+    return get_storage_backend("gcs" if uri.startswith("gs://") else "local")
+
+
+@contextmanager
+def open_local_path(uri: str) -> Iterator[str]:
+    """URIのファイルをローカルのファイルパスとして開けるようにする"""
+    with storage_for_uri(uri).local_path(uri) as path:
+        yield path